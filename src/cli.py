@@ -0,0 +1,348 @@
+"""
+命令行批量扫描（不启动 Web 服务，适用于 CI 流水线）
+Headless command-line batch scanner
+
+使用方法:
+    python -m src.cli scan tools.txt
+    cat requirements.txt | python -m src.cli scan --format requirements --workers 4
+    python -m src.cli replay logs/scan-trace.ndjson --speed 20 --max-concurrent 5 10 20
+
+- 从文件或标准输入读取工具名（默认每行一个或逗号分隔，也可按 SBOM/依赖清单格式解析）
+- 与服务端相同的扫描流水线；--workers 个工作进程各自运行独立的事件循环，进程内并发受 --concurrency 约束
+- 每个工具完成后向标准输出写一行 JSON（NDJSON），日志与提示信息写到标准错误
+- 退出码：0 全部通过；1 有工具不符合合规要求；2 参数或输入错误；3 有工具扫描失败
+- replay：按倍速将 scanning.trace 记录的负载轨迹回放到模拟 AI 服务，每组调度配置输出一行 JSON 结果
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import queue as queue_module
+import sys
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+EXIT_OK = 0
+EXIT_POLICY_FAILURE = 1
+EXIT_USAGE = 2
+EXIT_SCAN_ERROR = 3
+
+# 输入格式：text 为每行一个或逗号分隔的工具名，sbom 按内容推断清单格式，其余为指定的清单格式
+INPUT_FORMATS = ("text", "sbom", "cyclonedx", "spdx", "requirements", "package-json", "package-lock")
+
+
+def read_tool_names(content: str, fmt: str = "text") -> List[str]:
+    """
+    解析输入中的工具名（不区分大小写去重，保持顺序）
+
+    Args:
+        content: 输入文本
+        fmt: 输入格式（见 INPUT_FORMATS）
+
+    Returns:
+        List[str]: 工具名
+
+    Raises:
+        ValueError: 清单格式无法识别或内容无法解析
+    """
+    if fmt == "text":
+        from src.services.tool_service import parse_tool_names
+        names = parse_tool_names(content)
+    else:
+        from src.services.sbom_service import parse_sbom
+        _, components = parse_sbom(content, None if fmt == "sbom" else fmt)
+        names = [name for name, _ in components]
+    seen = set()
+    unique = []
+    for name in names:
+        if name.lower() not in seen:
+            seen.add(name.lower())
+            unique.append(name)
+    return unique
+
+
+def is_policy_failure(result: Dict[str, Any]) -> bool:
+    """扫描结果是否违反合规要求（报告判定为不合规；未评估的报告不视为违反）"""
+    report = result.get("report") or {}
+    return (report.get("compliance_report") or {}).get("is_compliant") is False
+
+
+def prepare_database() -> None:
+    """初始化或迁移数据库（与服务启动时相同）"""
+    from src.database import check_database_exists, init_database, migrate_database
+    if check_database_exists():
+        migrate_database()
+    else:
+        init_database()
+
+
+async def scan_names(
+    names: List[str],
+    concurrency: Optional[int],
+    force_refresh: bool,
+    emit: Callable[[Dict[str, Any]], None],
+) -> None:
+    """
+    在当前事件循环中扫描工具，每完成一个调用一次 emit
+
+    Args:
+        names: 工具名
+        concurrency: 并发上限（默认 scanning.max_concurrent）
+        force_refresh: 是否忽略新鲜度策略，强制重新扫描
+        emit: 扫描结果回调
+    """
+    from src.config import get_config
+    from src.services.scan_scheduler import ScanPriority
+    from src.services.scan_service import get_scan_service
+
+    if get_config().scanning.budget.enabled:
+        # 恢复当日 AI 用量（各进程分别计数，进程内的预算判断以启动时的用量为基础）
+        from src.database import session_scope
+        from src.services.budget_service import get_token_budget
+        with session_scope() as db:
+            get_token_budget().load(db)
+    results = get_scan_service().scan_many(
+        names, concurrency=concurrency, force_refresh=force_refresh, priority=ScanPriority.BATCH
+    )
+    async for result in results:
+        emit(result)
+
+
+def _worker(names: List[str], concurrency: Optional[int], force_refresh: bool, results: Any) -> None:
+    """工作进程入口：在独立的事件循环中扫描分配到的工具，结果放入队列，结束时放入 None"""
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            asyncio.run(scan_names(names, concurrency, force_refresh, results.put))
+        except Exception as e:
+            results.put({"worker_error": f"{type(e).__name__}: {e}", "tool_names": names})
+        finally:
+            results.put(None)
+
+
+def run_scan(
+    names: List[str],
+    out: TextIO,
+    workers: int = 1,
+    concurrency: Optional[int] = None,
+    force_refresh: bool = False,
+) -> int:
+    """
+    扫描工具并以 NDJSON 写出结果
+
+    Args:
+        names: 工具名
+        out: 结果输出流
+        workers: 工作进程数（1 时在当前进程中执行）
+        concurrency: 每个进程的并发上限
+        force_refresh: 是否忽略新鲜度策略，强制重新扫描
+
+    Returns:
+        int: 退出码
+    """
+    summary = {"total": 0, "non_compliant": 0, "failed": 0}
+
+    def emit(result: Dict[str, Any]) -> None:
+        if "worker_error" in result:
+            summary["failed"] += len(result["tool_names"])
+            print(f"工作进程扫描失败（{len(result['tool_names'])} 个工具）: {result['worker_error']}", file=sys.stderr)
+            return
+        summary["total"] += 1
+        if result["status"] != "completed":
+            summary["failed"] += 1
+        elif is_policy_failure(result):
+            summary["non_compliant"] += 1
+        out.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+        out.flush()
+
+    workers = max(1, min(workers, len(names)))
+    if workers == 1:
+        asyncio.run(scan_names(names, concurrency, force_refresh, emit))
+    else:
+        # spawn：每个工作进程从头初始化配置、数据库连接与事件循环，不继承父进程的状态
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        processes = [
+            context.Process(target=_worker, args=(names[i::workers], concurrency, force_refresh, results))
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        finished = 0
+        while finished < workers:
+            try:
+                result = results.get(timeout=1)
+            except queue_module.Empty:
+                if not any(process.is_alive() for process in processes):
+                    # 工作进程异常退出，没有放入结束标记
+                    summary["failed"] += 1
+                    print("工作进程异常退出", file=sys.stderr)
+                    break
+                continue
+            if result is None:
+                finished += 1
+            else:
+                emit(result)
+        for process in processes:
+            process.join()
+
+    print(
+        f"扫描完成: {summary['total']} 个工具，不合规 {summary['non_compliant']} 个，失败 {summary['failed']} 个",
+        file=sys.stderr,
+    )
+    if summary["non_compliant"]:
+        return EXIT_POLICY_FAILURE
+    if summary["failed"]:
+        return EXIT_SCAN_ERROR
+    return EXIT_OK
+
+
+def run_replay(
+    entries: List[Dict[str, Any]],
+    out: TextIO,
+    speed: float,
+    provider_capacity: int,
+    max_concurrent: Optional[List[int]] = None,
+    overrides: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    回放负载轨迹，每组并发上限输出一行 JSON 结果
+
+    Args:
+        entries: 轨迹记录
+        out: 结果输出流
+        speed: 回放倍速
+        provider_capacity: 模拟 AI 服务同时处理的请求数上限
+        max_concurrent: 依次回放的并发上限（默认 scanning.max_concurrent）
+        overrides: 覆盖的扫描配置（键为 max_in_flight_scans / interactive_reserved_slots /
+            adaptive / max_attempts / backoff_factor，值为 None 时沿用配置文件）
+
+    Returns:
+        int: 退出码
+    """
+    from src.config import get_config
+    from src.services.replay_service import replay_trace
+
+    overrides = overrides or {}
+    base = get_config().scanning
+    for limit in max_concurrent or [base.max_concurrent]:
+        scanning = base.model_copy(deep=True)
+        scanning.max_concurrent = limit
+        if overrides.get("max_in_flight_scans") is not None:
+            scanning.bulkheads.max_in_flight_scans = overrides["max_in_flight_scans"]
+        if overrides.get("interactive_reserved_slots") is not None:
+            scanning.scheduler.interactive_reserved_slots = overrides["interactive_reserved_slots"]
+        if overrides.get("adaptive") is not None:
+            scanning.adaptive_concurrency.enabled = overrides["adaptive"]
+        if overrides.get("max_attempts") is not None:
+            scanning.retry.max_attempts = overrides["max_attempts"]
+        if overrides.get("backoff_factor") is not None:
+            scanning.retry.backoff_factor = overrides["backoff_factor"]
+        result = asyncio.run(replay_trace(entries, scanning, speed, provider_capacity))
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+        print(
+            f"回放完成: max_concurrent={limit}，{result['scans']} 个扫描，"
+            f"吞吐量 {result['throughput_per_minute']}/分钟，排队 p95 {result['queue_delay']['p95']} 秒，"
+            f"429 {result['provider']['rate_limited']} 次",
+            file=sys.stderr,
+        )
+    return EXIT_OK
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """命令行参数"""
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="工具合规扫描命令行")
+    parser.add_argument("--config", help="配置文件路径（默认按 CONFIG_PATH 与 config/config.yaml 查找）")
+    commands = parser.add_subparsers(dest="command", required=True)
+    scan = commands.add_parser("scan", help="批量扫描工具，以 NDJSON 输出报告")
+    scan.add_argument("input", nargs="?", default="-", help="工具清单文件，- 或省略时从标准输入读取")
+    scan.add_argument("--format", choices=INPUT_FORMATS, default="text", help="输入格式（默认 text：每行一个或逗号分隔）")
+    scan.add_argument("--workers", type=int, default=1, help="工作进程数（默认 1）")
+    scan.add_argument("--concurrency", type=int, default=None, help="每个进程的并发上限（默认 scanning.max_concurrent）")
+    scan.add_argument("--force-refresh", action="store_true", help="忽略有效期内的已有报告，强制重新扫描")
+    replay = commands.add_parser("replay", help="按倍速回放负载轨迹，评估不同调度配置下的吞吐量、排队时间与 429 次数")
+    replay.add_argument("trace", help="负载轨迹文件（scanning.trace.path）")
+    replay.add_argument("--speed", type=float, default=10.0, help="回放倍速（默认 10）")
+    replay.add_argument("--provider-capacity", type=int, default=5, help="模拟 AI 服务同时处理的请求数上限，超过时返回 429（默认 5）")
+    replay.add_argument("--max-concurrent", type=int, nargs="+", help="并发上限，给出多个值时依次回放（默认 scanning.max_concurrent）")
+    replay.add_argument("--max-in-flight-scans", type=int, help="同时执行的扫描数（启用资源隔离时）")
+    replay.add_argument("--interactive-reserved-slots", type=int, help="为交互式扫描保留的槽位数")
+    replay.add_argument("--adaptive", action=argparse.BooleanOptionalAction, default=None, help="是否启用自适应并发")
+    replay.add_argument("--max-attempts", type=int, help="AI 请求最多尝试次数")
+    replay.add_argument("--backoff-factor", type=int, help="重试退避倍数")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    命令行入口
+
+    Args:
+        argv: 命令行参数（默认 sys.argv[1:]）
+
+    Returns:
+        int: 退出码
+    """
+    args = build_parser().parse_args(argv)
+    if args.config:
+        # 通过环境变量传递，工作进程加载相同的配置
+        os.environ["CONFIG_PATH"] = args.config
+    if args.command == "replay":
+        return _main_replay(args)
+    if args.workers < 1 or (args.concurrency is not None and args.concurrency < 1):
+        print("--workers 与 --concurrency 必须为正整数", file=sys.stderr)
+        return EXIT_USAGE
+
+    out = sys.stdout
+    # 配置与日志初始化时的提示信息写到标准错误，标准输出只保留 NDJSON 结果
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            if args.input == "-":
+                content = sys.stdin.read()
+            else:
+                with open(args.input, encoding="utf-8-sig") as f:
+                    content = f.read()
+            names = read_tool_names(content, args.format)
+        except (OSError, ValueError) as e:
+            print(f"读取工具清单失败: {e}", file=sys.stderr)
+            return EXIT_USAGE
+        if not names:
+            print("工具清单为空", file=sys.stderr)
+            return EXIT_USAGE
+        prepare_database()
+        return run_scan(names, out, args.workers, args.concurrency, args.force_refresh)
+
+
+def _main_replay(args: argparse.Namespace) -> int:
+    """replay 子命令"""
+    numbers = [args.provider_capacity, args.max_in_flight_scans, args.max_attempts, args.backoff_factor]
+    numbers += args.max_concurrent or []
+    if args.speed <= 0 or any(value is not None and value < 1 for value in numbers):
+        print("--speed 与各数量参数必须为正数", file=sys.stderr)
+        return EXIT_USAGE
+    out = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        from src.services.trace_service import load_trace
+        try:
+            with open(args.trace, encoding="utf-8") as f:
+                entries = load_trace(f)
+        except OSError as e:
+            print(f"读取负载轨迹失败: {e}", file=sys.stderr)
+            return EXIT_USAGE
+        if not entries:
+            print("负载轨迹为空", file=sys.stderr)
+            return EXIT_USAGE
+        overrides = {
+            "max_in_flight_scans": args.max_in_flight_scans,
+            "interactive_reserved_slots": args.interactive_reserved_slots,
+            "adaptive": args.adaptive,
+            "max_attempts": args.max_attempts,
+            "backoff_factor": args.backoff_factor,
+        }
+        return run_replay(entries, out, args.speed, args.provider_capacity, args.max_concurrent, overrides)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
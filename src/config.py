@@ -5,6 +5,7 @@ Configuration management module
 
 import os
 from pathlib import Path
+from datetime import datetime
 from typing import Optional, List, Dict, Any
 import yaml
 from pydantic import BaseModel, Field, validator
@@ -198,11 +199,245 @@ class RetryConfig(BaseModel):
     backoff_factor: int = 2
 
 
+class FreshnessConfig(BaseModel):
+    """扫描结果新鲜度策略：在有效期内的报告直接复用，不重复调用 AI"""
+    enabled: bool = True
+    default_ttl_hours: int = 24
+    # 按工具来源（Tool.source: internal/external/unknown）覆盖有效期，0 表示总是重新扫描
+    ttl_hours_by_source: Dict[str, int] = Field(default_factory=dict)
+
+
+class KnowledgeBaseOnlyConfig(BaseModel):
+    """仅知识库扫描策略：可信且近期更新的知识库条目直接生成报告，跳过全部 AI 阶段"""
+    enabled: bool = False
+    # 视为可信的知识库条目来源（ToolKnowledgeBase.source）
+    trusted_sources: List[str] = Field(default_factory=lambda: ["user"])
+    # 知识库条目的最长有效天数，0 表示不限制
+    max_age_days: int = 90
+
+
+class SchedulerConfig(BaseModel):
+    """扫描队列调度配置（按优先级加权公平调度）"""
+    # 各优先级权重：interactive（交互式）/ batch（批量）/ background（后台重扫）
+    weights: Dict[str, int] = Field(default_factory=lambda: {"interactive": 6, "batch": 3, "background": 1})
+    # 为交互式扫描保留的并发槽位数
+    interactive_reserved_slots: int = 1
+    # 未指定优先级时，工具数不超过该值的请求视为交互式，否则视为批量
+    interactive_max_tools: int = 3
+
+
+class AdaptiveConcurrencyConfig(BaseModel):
+    """自适应并发（AIMD）配置：AI 接口健康时加性增加并发上限，限流或超时时乘性减少"""
+    enabled: bool = True
+    min_concurrent: int = 1
+    max_concurrent: int = 20
+    # 单次 AI 调用耗时超过该值（秒）视为不健康，不再增加并发
+    latency_threshold: float = 30.0
+    # 收到限流/超时信号时并发上限乘以该系数
+    decrease_factor: float = 0.5
+    # 两次减少之间的最短间隔（秒），避免同一波限流被重复惩罚
+    decrease_cooldown: float = 5.0
+
+
+class BulkheadConfig(BaseModel):
+    """资源隔离（bulkhead）配置：AI 调用、TOS 网页获取与数据库写入分别限制并发，慢的资源不再占用其他资源的槽位"""
+    enabled: bool = True
+    # 同时执行的扫描数上限（启用后替代 max_concurrent 作为扫描队列的并发上限，实际资源并发由各资源池限制）
+    max_in_flight_scans: int = 20
+    # AI 接口并发调用数，0 表示使用 max_concurrent；启用自适应并发时由自适应并发调整
+    llm: int = 0
+    # 并发获取 TOS 网页数
+    tos_fetch: int = 5
+    # 同时等待提交的数据库写入数（写入由结果写入任务合并提交，不宜小于 result_writer.max_batch_size）
+    db_write: int = 50
+    # 统计排队等待时间分位数的最近样本数
+    wait_samples: int = 1000
+
+
+class TaskRegistryConfig(BaseModel):
+    """内存扫描任务表配置：已结束的任务超过数量或保留时间后归档到数据库"""
+    # 内存中最多保留的任务数（执行中和排队中的任务不会被淘汰）
+    max_tasks: int = 1000
+    # 内存中最多保留的批次数（仅淘汰已结束的批次）
+    max_batches: int = 200
+    # 已结束的任务/批次在内存中的保留时间（秒）
+    terminal_ttl_seconds: int = 3600
+    # 按保留时间清理的最短间隔（秒）
+    sweep_interval_seconds: int = 30
+
+
+class CheckpointConfig(BaseModel):
+    """扫描阶段检查点配置：失败的扫描重试时复用已完成阶段（TOS 链接、TOS 内容、TOS 分析、替代方案）的输出"""
+    enabled: bool = True
+    # 检查点有效期（小时），过期后重新计算
+    ttl_hours: int = 24
+
+
+class ResultWriterConfig(BaseModel):
+    """扫描结果写入配置：各扫描任务的数据库写入由单个写入任务合并到批量事务中提交"""
+    enabled: bool = True
+    # 收集写入的最长等待时间（毫秒），到期后提交已收集的写入
+    flush_interval_ms: int = 50
+    # 单个事务最多合并的写入数，达到后立即提交
+    max_batch_size: int = 50
+
+
+class AdmissionConfig(BaseModel):
+    """扫描准入控制配置：未结束的扫描任务数超过上限时拒绝提交（429 + Retry-After）"""
+    enabled: bool = True
+    # 全局最多未结束（排队中与执行中）的扫描任务数，0 表示不限制
+    max_queued_tasks: int = 10000
+    # 每个客户端（按 X-API-Key 区分，未提供时共用 anonymous）最多未结束的扫描任务数，0 表示不限制
+    max_queued_per_client: int = 2000
+    # 没有已完成任务可参考时，估算等待时间使用的单个扫描耗时（秒）
+    default_scan_seconds: int = 30
+    # Retry-After 的上限（秒）
+    max_retry_after_seconds: int = 3600
+    # 流式导入时队列饱和：每隔 ingest_poll_seconds 秒重新检查，累计暂停超过 ingest_max_wait_seconds 后停止导入
+    ingest_poll_seconds: int = 5
+    ingest_max_wait_seconds: int = 1800
+
+
+class IdempotencyConfig(BaseModel):
+    """幂等提交配置：携带 Idempotency-Key 的重复提交直接重放首次响应，不再创建工具或扫描任务"""
+    enabled: bool = True
+    # 首次响应保留时间（小时），过期后同一 Key 视为新请求
+    ttl_hours: int = 24
+    # Idempotency-Key 的最大长度
+    max_key_length: int = 255
+    # 同一 Key 的首次请求仍在处理时，重复请求最多等待的时间（秒），超时返回 409
+    in_flight_wait_seconds: int = 30
+
+
+class BudgetConfig(BaseModel):
+    """AI 每日用量预算配置：按 AI 接口返回的实际 usage 统计，接近用尽时推迟或降级低优先级扫描"""
+    enabled: bool = False
+    # 每日 token 上限与费用上限（0 表示不按该项限制，两项都设置时先达到者为准）
+    daily_tokens: int = 0
+    daily_cost: float = 0.0
+    # 每千 token 的价格（用于按费用统计）
+    prompt_price_per_1k: float = 0.0
+    completion_price_per_1k: float = 0.0
+    # 每个客户端（按 X-API-Key 区分）的每日上限，0 表示不单独限制；定期重扫与失败重试不计入客户端
+    per_client_daily_tokens: int = 0
+    per_client_daily_cost: float = 0.0
+    # 为交互式扫描保留的预算比例：用量超过 1 - interactive_reserve_ratio 后批量与后台扫描按 low_priority_action 处理
+    interactive_reserve_ratio: float = 0.2
+    # defer：留在队列中，预算重置后再执行；kb_only：降级为知识库/已有报告结果
+    low_priority_action: str = "defer"
+    # 每日预算重置的时刻（UTC 小时，如 16 表示北京时间 0 点）
+    reset_hour: int = 0
+    # 推迟的扫描重新检查预算的间隔（秒）
+    recheck_seconds: int = 60
+
+    @validator('low_priority_action')
+    def validate_low_priority_action(cls, v):
+        allowed = ['defer', 'kb_only']
+        if v not in allowed:
+            raise ValueError(f'low_priority_action must be one of {allowed}')
+        return v
+
+
+class OfflineConfig(BaseModel):
+    """离线模式配置：AI 服务不可用时扫描只使用知识库与已缓存的分析结果，服务恢复后自动补全 AI 阶段"""
+    enabled: bool = True
+    # 启动时即进入离线模式（也可通过接口手动切换）
+    manual: bool = False
+    # 连续多少次 AI 调用失败（5xx、超时、网络错误）后熔断，自动进入离线模式
+    failure_threshold: int = 5
+    # 熔断后保持离线的时间（秒），之后放行一个请求试探 AI 服务是否恢复
+    open_seconds: int = 120
+    # 试探请求超过该时间（秒）仍未返回结果时，放行新的试探
+    probe_timeout_seconds: int = 120
+    # 检查待补全报告的间隔（秒）与每次最多提交的工具数
+    reconcile_interval_seconds: int = 60
+    reconcile_batch_size: int = 20
+
+
+class RetryQueueConfig(BaseModel):
+    """失败扫描的重试队列配置：可重试的失败按指数退避自动重新扫描，其余进入死信列表"""
+    enabled: bool = True
+    # 连续失败达到该次数后进入死信列表
+    max_attempts: int = 5
+    # 退避：第 n 次失败后等待 base_delay_seconds * backoff_factor^(n-1) 秒，最多 max_delay_seconds
+    base_delay_seconds: int = 60
+    backoff_factor: float = 2.0
+    max_delay_seconds: int = 3600
+    # 退避时间随机增加的比例，避免大量失败的工具同时重试
+    jitter_ratio: float = 0.1
+    # 可重试的错误类型（internal 等其他类型直接进入死信列表）
+    retryable_kinds: List[str] = Field(
+        default_factory=lambda: ["rate_limited", "provider_down", "fetch_failure", "parse_failure"]
+    )
+    # 检查到期重试的间隔（秒）与每次最多提交的工具数
+    check_interval_seconds: int = 30
+    batch_size: int = 50
+
+
+class RescanWindowConfig(BaseModel):
+    """定期重扫的低峰时间窗口（服务器本地时间，结束时间早于开始时间表示跨越午夜）"""
+    start: str = "01:00"
+    end: str = "06:00"
+    # 单个窗口内最多提交的重扫工具数
+    quota: int = 500
+
+    @validator('start', 'end')
+    def validate_time(cls, v):
+        """验证时间格式（HH:MM）"""
+        try:
+            datetime.strptime(v, "%H:%M")
+        except ValueError:
+            raise ValueError(f"时间格式必须为 HH:MM: {v}")
+        return v
+
+
+class RescanConfig(BaseModel):
+    """定期重扫配置：在低峰窗口内按配额分散地重扫报告过旧的工具（后台优先级）"""
+    enabled: bool = False
+    # 最新报告早于该时长（小时）的工具需要重扫
+    stale_after_hours: int = 168
+    # 检查间隔（秒），每次检查额外加上 0~jitter_seconds 的随机抖动
+    check_interval_seconds: int = 300
+    jitter_seconds: int = 60
+    windows: List[RescanWindowConfig] = Field(default_factory=lambda: [RescanWindowConfig()])
+
+
+class TraceConfig(BaseModel):
+    """负载轨迹记录配置：按扫描记录提交时间、优先级、排队时间与各阶段耗时（不含工具名与扫描内容），供容量规划回放使用"""
+    enabled: bool = False
+    # 轨迹文件（NDJSON，每个扫描一行）
+    path: str = "./logs/scan-trace.ndjson"
+    # 轨迹文件超过该大小（MB）后轮转为 .1 文件，0 表示不轮转
+    max_size: int = 100
+    # 记录的扫描比例（0-1）
+    sample_rate: float = 1.0
+
+
 class ScanningConfig(BaseModel):
     """扫描任务配置"""
     max_concurrent: int = 5
     timeout: int = 300  # 秒
     retry: RetryConfig = Field(default_factory=RetryConfig)
+    # 扫描流水线单个阶段的默认超时（秒），可按阶段名覆盖
+    stage_timeout: int = 120
+    stage_timeouts: Dict[str, int] = Field(default_factory=dict)
+    freshness: FreshnessConfig = Field(default_factory=FreshnessConfig)
+    kb_only: KnowledgeBaseOnlyConfig = Field(default_factory=KnowledgeBaseOnlyConfig)
+    scheduler: SchedulerConfig = Field(default_factory=SchedulerConfig)
+    adaptive_concurrency: AdaptiveConcurrencyConfig = Field(default_factory=AdaptiveConcurrencyConfig)
+    bulkheads: BulkheadConfig = Field(default_factory=BulkheadConfig)
+    task_registry: TaskRegistryConfig = Field(default_factory=TaskRegistryConfig)
+    checkpoint: CheckpointConfig = Field(default_factory=CheckpointConfig)
+    result_writer: ResultWriterConfig = Field(default_factory=ResultWriterConfig)
+    retry_queue: RetryQueueConfig = Field(default_factory=RetryQueueConfig)
+    admission: AdmissionConfig = Field(default_factory=AdmissionConfig)
+    idempotency: IdempotencyConfig = Field(default_factory=IdempotencyConfig)
+    budget: BudgetConfig = Field(default_factory=BudgetConfig)
+    offline: OfflineConfig = Field(default_factory=OfflineConfig)
+    rescan: RescanConfig = Field(default_factory=RescanConfig)
+    trace: TraceConfig = Field(default_factory=TraceConfig)
+    # 流式导入工具清单时每批创建工具并提交扫描的行数
+    ingest_chunk_size: int = 500
 
 
 class ReportingConfig(BaseModel):
@@ -11,9 +11,10 @@ Database connection, initialization, and auto-migration module
 
 import os
 import shutil
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Callable, Iterator, Optional, List, Dict, Any
 from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, DateTime
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, Session
@@ -27,9 +28,11 @@ from src.models import Base
 
 _engine: Optional[Engine] = None
 _SessionLocal: Optional[sessionmaker] = None
+# 绑定其他引擎（如测试使用的内存数据库）的会话工厂，按引擎缓存
+_bound_sessions: Dict[Engine, sessionmaker] = {}
 
 # 当前 schema 版本（每次有 schema 变更时递增）
-SCHEMA_VERSION = 2
+SCHEMA_VERSION = 11
 
 
 # ==================== 连接与引擎 ====================
@@ -128,6 +131,30 @@ def get_session() -> sessionmaker:
     return _SessionLocal
 
 
+def get_session_for(db: Optional[Session] = None) -> sessionmaker:
+    """
+    获取会话所绑定数据库的会话工厂
+    
+    同一数据库总是返回同一个会话工厂（全局数据库即 get_session() 的工厂），
+    扫描结果写入任务按会话工厂分组合并提交，来自不同调用的写入因此可以共用一个事务
+    
+    Args:
+        db: 数据库会话（默认使用全局会话工厂）
+    
+    Returns:
+        sessionmaker: SQLAlchemy 会话工厂
+    """
+    if db is None:
+        return get_session()
+    bind = db.get_bind()
+    if bind is _engine:
+        return get_session()
+    factory = _bound_sessions.get(bind)
+    if factory is None:
+        factory = _bound_sessions.setdefault(bind, sessionmaker(autocommit=False, autoflush=False, bind=bind))
+    return factory
+
+
 # ==================== 数据库备份 ====================
 
 
@@ -238,7 +265,7 @@ def _get_column_ddl_type(column: Column, db_type: str) -> str:
         column: SQLAlchemy Column 对象
         db_type: 数据库类型 (sqlite/mysql)
     """
-    from sqlalchemy import String, Integer, Float, Boolean, Text, DateTime, JSON
+    from sqlalchemy import Float, Boolean, Text, JSON
     col_type = type(column.type)
     
     if col_type == String:
@@ -416,6 +443,31 @@ def get_db() -> Session:
         db.close()
 
 
+@contextmanager
+def session_scope(session_factory: Optional[Callable[[], Session]] = None) -> Iterator[Session]:
+    """
+    短事务会话（工作单元）：正常结束时提交，异常时回滚，最后关闭会话
+    
+    用于扫描流水线等异步流程：会话只覆盖一段同步的数据库读写，
+    不跨越对外部服务（AI 接口、网页抓取）的 await
+    
+    Args:
+        session_factory: 会话工厂（默认使用全局会话工厂）
+    
+    Yields:
+        Session: 数据库会话
+    """
+    db = (session_factory or get_session())()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
 def check_database_exists() -> bool:
     """
     检查数据库文件是否存在
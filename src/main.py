@@ -47,7 +47,7 @@ async def api_auth_guard(x_api_key: Optional[str] = Header(None)):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """应用生命周期管理：启动时初始化或迁移数据库"""
+    """应用生命周期管理：启动时初始化或迁移数据库，恢复当日 AI 用量，按配置启动失败重试、离线报告补全与定期重扫"""
     try:
         if not check_database_exists():
             logger.info("数据库不存在，开始初始化...")
@@ -69,7 +69,41 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"数据库初始化/迁移失败: {e}")
         raise
+    
+    if get_config().scanning.budget.enabled:
+        # 恢复当日 AI 用量（预算按天累计，不因重启清零）
+        from src.database import session_scope
+        from src.services.budget_service import get_token_budget
+        with session_scope() as db:
+            get_token_budget().load(db)
+    
+    rescan_scheduler = None
+    if get_config().scanning.rescan.enabled:
+        from src.services.rescan_service import get_rescan_scheduler
+        rescan_scheduler = get_rescan_scheduler()
+        rescan_scheduler.start()
+    retry_scheduler = None
+    if get_config().scanning.retry_queue.enabled:
+        from src.services.retry_service import get_retry_scheduler
+        retry_scheduler = get_retry_scheduler()
+        retry_scheduler.start()
+    enrichment_reconciler = None
+    if get_config().scanning.offline.enabled:
+        from src.services.offline_service import get_enrichment_reconciler
+        enrichment_reconciler = get_enrichment_reconciler()
+        enrichment_reconciler.start()
     yield
+    if rescan_scheduler is not None:
+        rescan_scheduler.stop()
+    if retry_scheduler is not None:
+        retry_scheduler.stop()
+    if enrichment_reconciler is not None:
+        enrichment_reconciler.stop()
+    # 归档等待清理的已结束任务，并提交结果写入任务中剩余的写入
+    from src.services.scan_service import get_scan_service
+    scan_service = get_scan_service()
+    scan_service.registry.flush()
+    scan_service.writer.stop()
 
 
 # 创建 FastAPI 应用
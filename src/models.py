@@ -7,7 +7,7 @@ from datetime import datetime
 from typing import Optional
 from sqlalchemy import (
     Column, Integer, String, Float, Boolean, Text, 
-    ForeignKey, DateTime, JSON, create_engine
+    ForeignKey, DateTime, JSON, UniqueConstraint, create_engine
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
@@ -55,6 +55,12 @@ class ComplianceReport(Base):
     recommendations = Column(Text, nullable=True, comment="合规建议（JSON格式）")
     references = Column(JSON, nullable=True, comment="合规性参考（JSON格式）")
     tos_analysis = Column(Text, nullable=True, comment="TOS 分析结果（JSON格式）")
+    # 两阶段扫描：先由知识库生成临时报告，AI 分析完成后更新为正式报告并递增修订号
+    provisional = Column(Boolean, nullable=True, default=False, comment="是否为知识库生成的临时报告")
+    revision = Column(Integer, nullable=True, default=1, comment="报告修订号（每次更新递增）")
+    kb_updated_at = Column(DateTime, nullable=True, comment="临时报告所用知识库条目的更新时间")
+    stage_timings = Column(JSON(none_as_null=True), nullable=True, comment="生成该报告的扫描各阶段耗时（JSON格式）")
+    needs_enrichment = Column(Boolean, nullable=True, default=False, comment="是否为离线模式生成、待 AI 服务恢复后补全的报告")
     created_at = Column(DateTime, default=func.now(), comment="创建时间")
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), comment="更新时间")
     
@@ -115,3 +121,115 @@ class ToolKnowledgeBase(Base):
     
     def __repr__(self):
         return f"<ToolKnowledgeBase(id={self.id}, tool_name='{self.tool_name}', source='{self.source}')>"
+
+
+class ProjectComponent(Base):
+    """项目组件表（每个项目最近一次提交的 SBOM / 依赖清单组件集合）"""
+    __tablename__ = "project_components"
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    project = Column(String(255), nullable=False, index=True, comment="项目标识")
+    name = Column(String(255), nullable=False, comment="组件名称")
+    version = Column(String(100), nullable=True, comment="组件版本（或版本约束）")
+    tool_id = Column(Integer, ForeignKey("tools.id", ondelete="CASCADE"), nullable=True, index=True, comment="对应工具ID")
+    created_at = Column(DateTime, default=func.now(), comment="提交时间")
+    
+    def __repr__(self):
+        return f"<ProjectComponent(project='{self.project}', name='{self.name}', version='{self.version}')>"
+
+
+class ScanTaskRecord(Base):
+    """扫描任务归档表（已结束的任务从内存任务表淘汰后保存于此）"""
+    __tablename__ = "scan_task_records"
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    tool_id = Column(Integer, nullable=False, index=True, comment="工具ID")
+    tool_name = Column(String(255), nullable=False, comment="工具名称")
+    batch_id = Column(String(32), nullable=True, index=True, comment="扫描批次ID")
+    status = Column(String(20), nullable=False, comment="任务状态: completed/failed/cancelled")
+    priority = Column(String(20), nullable=True, comment="扫描优先级")
+    cached = Column(Boolean, nullable=True, default=False, comment="是否复用了已有报告")
+    report_id = Column(Integer, nullable=True, comment="生成或复用的报告ID")
+    error = Column(Text, nullable=True, comment="失败原因")
+    timed_out_stages = Column(JSON, nullable=True, comment="超时阶段列表（JSON格式）")
+    created_at = Column(DateTime, nullable=True, comment="任务创建时间")
+    started_at = Column(DateTime, nullable=True, comment="任务开始时间")
+    completed_at = Column(DateTime, nullable=True, comment="任务结束时间")
+    archived_at = Column(DateTime, default=func.now(), comment="归档时间")
+    
+    def __repr__(self):
+        return f"<ScanTaskRecord(id={self.id}, tool_id={self.tool_id}, status='{self.status}')>"
+
+
+class ScanCheckpoint(Base):
+    """扫描阶段检查点表（重试或重启后的扫描从最后完成的阶段继续）"""
+    __tablename__ = "scan_checkpoints"
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    tool_id = Column(Integer, ForeignKey("tools.id", ondelete="CASCADE"), nullable=False, index=True, comment="工具ID")
+    stage = Column(String(50), nullable=False, comment="阶段名称")
+    input_hash = Column(String(64), nullable=False, comment="阶段输入的哈希（输入变化时检查点失效）")
+    output_hash = Column(String(64), nullable=True, comment="阶段输出的哈希")
+    output = Column(JSON, nullable=True, comment="阶段输出（JSON格式）")
+    created_at = Column(DateTime, default=func.now(), comment="创建时间")
+    
+    def __repr__(self):
+        return f"<ScanCheckpoint(tool_id={self.tool_id}, stage='{self.stage}')>"
+
+
+class ScanRetry(Base):
+    """扫描重试表（失败的扫描按错误类型退避重试；不可重试或超过重试次数的工具进入死信列表）"""
+    __tablename__ = "scan_retries"
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    tool_id = Column(Integer, ForeignKey("tools.id", ondelete="CASCADE"), nullable=False, unique=True, index=True, comment="工具ID")
+    status = Column(String(20), nullable=False, default="scheduled", index=True, comment="状态: scheduled（等待重试）/dead（死信）")
+    error_kind = Column(String(30), nullable=True, comment="错误类型: rate_limited/provider_down/fetch_failure/parse_failure/internal")
+    error = Column(Text, nullable=True, comment="最近一次失败原因")
+    failed_stage = Column(String(50), nullable=True, comment="最近一次失败的阶段")
+    attempts = Column(Integer, nullable=False, default=0, comment="连续失败次数")
+    priority = Column(String(20), nullable=True, comment="重试时使用的扫描优先级")
+    next_attempt_at = Column(DateTime, nullable=True, index=True, comment="下次重试时间（死信为空）")
+    created_at = Column(DateTime, default=func.now(), comment="首次失败时间")
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), comment="最近一次失败时间")
+    
+    tool = relationship("Tool")
+    
+    def __repr__(self):
+        return f"<ScanRetry(tool_id={self.tool_id}, status='{self.status}', attempts={self.attempts})>"
+
+
+class IdempotencyRecord(Base):
+    """幂等请求记录表（按客户端、接口与 Idempotency-Key 保存首次成功响应，过期前重复请求直接重放）"""
+    __tablename__ = "idempotency_records"
+    __table_args__ = (UniqueConstraint("client", "endpoint", "key", name="uq_idempotency_client_endpoint_key"),)
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    client = Column(String(64), nullable=False, comment="客户端标识（API Key 哈希前缀）")
+    endpoint = Column(String(100), nullable=False, comment="接口标识")
+    key = Column(String(255), nullable=False, comment="请求头 Idempotency-Key")
+    request_hash = Column(String(64), nullable=False, comment="请求内容哈希（同一 Key 不能用于不同请求）")
+    status_code = Column(Integer, nullable=False, comment="首次响应状态码")
+    response = Column(JSON, nullable=False, comment="首次响应内容")
+    created_at = Column(DateTime, default=func.now(), comment="首次请求时间")
+    expires_at = Column(DateTime, nullable=False, index=True, comment="过期时间（过期后同一 Key 视为新请求）")
+    
+    def __repr__(self):
+        return f"<IdempotencyRecord(endpoint='{self.endpoint}', key='{self.key}')>"
+
+
+class LLMUsage(Base):
+    """AI 用量表（按预算日与客户端累计 AI 接口返回的 token 用量，服务重启后用于恢复当日预算）"""
+    __tablename__ = "llm_usage"
+    __table_args__ = (UniqueConstraint("day", "client", name="uq_llm_usage_day_client"),)
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    day = Column(String(10), nullable=False, index=True, comment="预算日（YYYY-MM-DD）")
+    client = Column(String(64), nullable=False, comment="客户端标识（system 表示定期重扫与失败重试）")
+    prompt_tokens = Column(Integer, nullable=False, default=0, comment="输入 token 数")
+    completion_tokens = Column(Integer, nullable=False, default=0, comment="输出 token 数")
+    requests = Column(Integer, nullable=False, default=0, comment="AI 调用次数")
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), comment="更新时间")
+    
+    def __repr__(self):
+        return f"<LLMUsage(day='{self.day}', client='{self.client}')>"
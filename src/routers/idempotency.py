@@ -0,0 +1,152 @@
+"""
+提交接口共用的幂等处理（Idempotency-Key 请求头）
+Idempotency-Key handling shared by the submission routes
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+
+from src.config import get_config
+from src.logger import get_logger
+from src.services.idempotency_service import (
+    REPLAY_HEADER,
+    IdempotencyConflict,
+    IdempotencyKeyError,
+    check_key,
+    find_response,
+    get_in_flight_keys,
+    save_response,
+)
+
+logger = get_logger()
+
+
+def _replay(db: Session, client: str, endpoint: str, key: Optional[str], fingerprint: str) -> Optional[JSONResponse]:
+    """查找可重放的首次响应（Key 无效时 400，Key 已用于内容不同的请求时 422）"""
+    try:
+        record = find_response(db, get_config().scanning.idempotency, client, endpoint, key, fingerprint)
+    except IdempotencyConflict as e:
+        raise HTTPException(
+            status_code=422,  # Unprocessable Content
+            detail=str(e),
+        )
+    except IdempotencyKeyError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if record is None:
+        return None
+    return JSONResponse(status_code=record.status_code, content=record.response, headers={REPLAY_HEADER: "true"})
+
+
+class IdempotentSubmission:
+    """
+    提交接口的幂等处理（async with）：
+
+    - 同一 Idempotency-Key 的重复提交直接重放首次响应（不创建工具、不提交扫描、不占用准入额度），见 replay
+    - 否则在处理期间保留该 Key，退出时释放；并发的重复请求等待首次请求结束后重放其响应，
+      首次请求失败时由等待中的请求重新处理，等待超过 in_flight_wait_seconds 秒返回 409
+    """
+
+    def __init__(self, db: Session, client: str, endpoint: str, key: Optional[str], fingerprint: str):
+        """
+        Args:
+            db: 数据库会话
+            client: 客户端标识
+            endpoint: 接口标识
+            key: 请求头 Idempotency-Key
+            fingerprint: 请求内容哈希
+        """
+        self.db = db
+        self.client = client
+        self.endpoint = endpoint
+        self.key = key
+        self.fingerprint = fingerprint
+        self.replay: Optional[JSONResponse] = None
+        self._reserved: Optional[str] = None  # 本请求保留的 Key（规范化后）
+
+    async def __aenter__(self) -> "IdempotentSubmission":
+        self.replay = _replay(self.db, self.client, self.endpoint, self.key, self.fingerprint)
+        config = get_config().scanning.idempotency
+        if self.replay is not None or self.key is None or not config.enabled:
+            return self
+        key = check_key(config, self.key)
+        in_flight = get_in_flight_keys()
+        deadline = time.monotonic() + config.in_flight_wait_seconds
+        while True:
+            try:
+                pending = in_flight.reserve(self.client, self.endpoint, key, self.fingerprint)
+            except IdempotencyConflict as e:
+                raise HTTPException(status_code=422, detail=str(e))
+            if pending is None:
+                self._reserved = key
+                # 保留之前首次请求可能刚好结束并保存了响应
+                self.replay = _replay(self.db, self.client, self.endpoint, self.key, self.fingerprint)
+                if self.replay is not None:
+                    self._release()
+                return self
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not await asyncio.get_running_loop().run_in_executor(None, pending.wait, remaining):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="同一 Idempotency-Key 的请求正在处理中，请稍后重试",
+                    headers={"Retry-After": "1"},
+                )
+            # 首次请求已结束：成功时其响应已保存，结束当前读事务后重新查找
+            self.db.rollback()
+            self.replay = _replay(self.db, self.client, self.endpoint, self.key, self.fingerprint)
+            if self.replay is not None:
+                return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self._release()
+
+    def _release(self) -> None:
+        if self._reserved is not None:
+            get_in_flight_keys().release(self.client, self.endpoint, self._reserved)
+            self._reserved = None
+
+    def remember(self, status_code: int, response: Dict[str, Any]) -> None:
+        """
+        保存首次成功响应（保存失败只记录日志，不影响已完成的提交）
+
+        Args:
+            status_code: 响应状态码
+            response: 响应内容
+        """
+        remember_response(self.db, self.client, self.endpoint, self.key, self.fingerprint, status_code, response)
+
+
+def remember_response(
+    db: Session,
+    client: str,
+    endpoint: str,
+    key: Optional[str],
+    fingerprint: str,
+    status_code: int,
+    response: Dict[str, Any],
+) -> None:
+    """
+    保存首次成功响应（保存失败只记录日志，不影响已完成的提交）
+
+    Args:
+        db: 数据库会话
+        client: 客户端标识
+        endpoint: 接口标识
+        key: 请求头 Idempotency-Key
+        fingerprint: 请求内容哈希
+        status_code: 响应状态码
+        response: 响应内容
+    """
+    if key is None:
+        return
+    try:
+        save_response(
+            db, get_config().scanning.idempotency, client, endpoint, key, fingerprint, status_code, response
+        )
+    except Exception as e:
+        db.rollback()
+        logger.error(f"保存幂等请求记录失败: {endpoint} - {e}")
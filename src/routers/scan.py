@@ -4,22 +4,38 @@ Scan & report API routes
 """
 
 import json
-from fastapi import APIRouter, Depends, HTTPException, status
+import tempfile
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, status
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
-from typing import Dict, Any
-from src.database import get_db
+from typing import Dict, Any, Optional
+from src.database import get_db, get_session
 from src.logger import get_logger
-from src.models import Tool, ComplianceReport
+from src.models import Tool, ComplianceReport, ScanRetry
 from src.schemas import (
     ScanRequest,
     ScanResponse,
     ScanTaskStatusResponse,
     ComplianceScanRequest,
+    ScanUploadResponse,
+    SbomScanResponse,
+    DeadLetterReplayRequest,
+    OfflineModeRequest,
 )
 from src.services.scan_service import get_scan_service
+from src.services.concurrency_limiter import get_concurrency_limiter
 from src.services.tool_service import batch_create_tools
+from src.services.scan_scheduler import ScanPriority
+from src.services.tool_import_service import SUPPORTED_FORMATS, IngestStopped, detect_format, ingest_tool_stream
+from src.services.sbom_service import submit_sbom_scan
+from src.services.rescan_service import get_rescan_scheduler
+from src.services.admission_service import AdmissionRejected, client_key
+from src.services.idempotency_service import request_fingerprint
+from src.services.retry_service import get_retry_scheduler, list_dead_letters, replay_dead_letters, retry_info
+from src.services.offline_service import get_enrichment_reconciler, get_provider_circuit
+from src.services.stage_stats_service import get_stage_timing_stats
 from src.services.report_service import get_report_service
+from src.routers.idempotency import IdempotentSubmission
 
 logger = get_logger()
 router = APIRouter(tags=["scan"])
@@ -28,27 +44,96 @@ router = APIRouter(tags=["scan"])
 # ==================== 扫描 ====================
 
 
+def _task_info(task) -> Dict[str, Any]:
+    """扫描任务摘要（用于扫描响应）"""
+    return {
+        "tool_id": task.tool_id,
+        "tool_name": task.tool_name,
+        "status": task.status.value,
+        "report_id": task.result.get("report_id") if task.result else None,
+        "cached": task.cached,
+        "priority": task.priority.value,
+        "provisional": task.provisional,
+        "kb_only": bool(task.result and task.result.get("kb_only")),
+        "needs_enrichment": bool(task.result and task.result.get("needs_enrichment")),
+        # 该任务同时服务于其他扫描请求（同一工具同时只执行一次扫描）
+        "shared": task.subscribers > 0,
+        "error_kind": task.error_kind.value if task.error_kind else None,
+    }
+
+
+def _admit(x_api_key: Optional[str], requested: int) -> str:
+    """
+    扫描准入检查
+    
+    Args:
+        x_api_key: 请求头 X-API-Key
+        requested: 本次提交的工具数
+    
+    Returns:
+        str: 客户端标识（提交后用于登记批次）
+    
+    Raises:
+        HTTPException: 队列饱和时 429（附 Retry-After 与排队位置），单次提交超过上限时 413
+    """
+    client = client_key(x_api_key)
+    try:
+        get_scan_service().admission.admit(client, requested)
+    except AdmissionRejected as e:
+        if e.requested > e.limit:
+            raise HTTPException(
+                status_code=413,  # Content Too Large
+                detail=f"单次提交的工具数（{e.requested}）超过扫描排队上限（{e.limit}），请拆分后提交",
+            )
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=e.to_dict(),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    return client
+
+
 @router.post("/api/v1/scan/start", response_model=ScanResponse, status_code=status.HTTP_202_ACCEPTED)
 async def start_scan(
     scan_request: ScanRequest,
     db: Session = Depends(get_db),
+    x_api_key: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
 ):
-    """启动合规扫描任务"""
+    """启动合规扫描任务（队列饱和时返回 429 与 Retry-After；携带 Idempotency-Key 的重复提交重放首次响应）"""
     try:
-        scan_service = get_scan_service()
-        tools = db.query(Tool).filter(Tool.id.in_(scan_request.tool_ids)).all()
-        if len(tools) != len(scan_request.tool_ids):
-            found_ids = {tool.id for tool in tools}
-            missing_ids = set(scan_request.tool_ids) - found_ids
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"工具不存在: {missing_ids}")
-        tasks = scan_service.create_scan_tasks(scan_request.tool_ids, db)
-        scan_service.start()
-        logger.info(f"扫描任务已启动: {len(tasks)} 个任务")
-        tasks_info = [
-            {"tool_id": t.tool_id, "tool_name": t.tool_name, "status": t.status.value, "report_id": None}
-            for t in tasks
-        ]
-        return ScanResponse(message="扫描任务已启动", task_count=len(tasks), tool_ids=scan_request.tool_ids, tasks=tasks_info)
+        fingerprint = request_fingerprint(scan_request.model_dump(mode="json"))
+        async with IdempotentSubmission(
+            db, client_key(x_api_key), "scan.start", idempotency_key, fingerprint
+        ) as submission:
+            if submission.replay is not None:
+                return submission.replay
+            client = _admit(x_api_key, len(set(scan_request.tool_ids)))
+            scan_service = get_scan_service()
+            tools = db.query(Tool).filter(Tool.id.in_(scan_request.tool_ids)).all()
+            if len(tools) != len(scan_request.tool_ids):
+                found_ids = {tool.id for tool in tools}
+                missing_ids = set(scan_request.tool_ids) - found_ids
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"工具不存在: {missing_ids}")
+            priority = scan_service.resolve_priority(scan_request.priority, len(scan_request.tool_ids))
+            batch = await scan_service.submit_scan_async(
+                scan_request.tool_ids, db, force_refresh=scan_request.force_refresh, priority=priority,
+                kb_only=scan_request.kb_only, client=client
+            )
+            scan_service.admission.track(client, batch)
+            tasks = batch.tasks
+            cached_count = sum(1 for t in tasks if t.cached)
+            logger.info(f"扫描任务已启动: {len(tasks)} 个任务（复用已有报告 {cached_count} 个）")
+            response = ScanResponse(
+                message="扫描任务已启动",
+                task_count=len(tasks),
+                tool_ids=scan_request.tool_ids,
+                tasks=[_task_info(t) for t in tasks],
+                cached_count=cached_count,
+                batch_id=batch.batch_id,
+            )
+            submission.remember(status.HTTP_202_ACCEPTED, response.model_dump(mode="json"))
+            return response
     except HTTPException:
         raise
     except Exception as e:
@@ -60,27 +145,47 @@ async def start_scan(
 async def compliance_scan(
     request: ComplianceScanRequest,
     db: Session = Depends(get_db),
+    x_api_key: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
 ):
-    """一体化合规扫描接口（工具名称列表）"""
+    """一体化合规扫描接口（工具名称列表；队列饱和时返回 429 与 Retry-After；携带 Idempotency-Key 的重复提交重放首次响应）"""
     try:
         tool_names = [t.strip() for t in (request.tools or []) if t and t.strip()]
         if not tool_names:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="tools 列表不能为空")
-        tools, existing_count = batch_create_tools(db, tool_names)
-        tool_ids = [tool.id for tool in tools]
-        scan_service = get_scan_service()
-        tasks = scan_service.create_scan_tasks(tool_ids, db)
-        scan_service.start()
-        tasks_info = [
-            {"tool_id": t.tool_id, "tool_name": t.tool_name, "status": t.status.value, "report_id": None}
-            for t in tasks
-        ]
-        return ScanResponse(
-            message=f"扫描任务已启动（共 {len(tasks)} 个工具，其中已存在 {existing_count} 个）",
-            task_count=len(tasks),
-            tool_ids=tool_ids,
-            tasks=tasks_info,
-        )
+        fingerprint = request_fingerprint(request.model_dump(mode="json"))
+        async with IdempotentSubmission(
+            db, client_key(x_api_key), "compliance.scan", idempotency_key, fingerprint
+        ) as submission:
+            if submission.replay is not None:
+                return submission.replay
+            # 在创建工具之前检查准入，被拒绝的提交不写入任何数据
+            client = _admit(x_api_key, len(set(tool_names)))
+            tools, existing_count = batch_create_tools(db, tool_names)
+            tool_ids = [tool.id for tool in tools]
+            scan_service = get_scan_service()
+            priority = scan_service.resolve_priority(request.priority, len(tool_ids))
+            batch = await scan_service.submit_scan_async(
+                tool_ids, db, force_refresh=request.force_refresh, priority=priority,
+                provisional=request.provisional, kb_only=request.kb_only, client=client
+            )
+            scan_service.admission.track(client, batch)
+            tasks = batch.tasks
+            cached_count = sum(1 for t in tasks if t.cached)
+            provisional_count = sum(1 for t in tasks if t.provisional)
+            response = ScanResponse(
+                message=(
+                    f"扫描任务已启动（共 {len(tasks)} 个工具，其中已存在 {existing_count} 个，"
+                    f"复用已有报告 {cached_count} 个，知识库临时报告 {provisional_count} 个）"
+                ),
+                task_count=len(tasks),
+                tool_ids=tool_ids,
+                tasks=[_task_info(t) for t in tasks],
+                cached_count=cached_count,
+                batch_id=batch.batch_id,
+            )
+            submission.remember(status.HTTP_202_ACCEPTED, response.model_dump(mode="json"))
+            return response
     except HTTPException:
         raise
     except Exception as e:
@@ -88,6 +193,136 @@ async def compliance_scan(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="一体化合规扫描失败，请查看服务端日志")
 
 
+# 上传内容超过该大小时转存到临时文件
+UPLOAD_SPOOL_MAX_MEMORY = 1024 * 1024
+
+
+@router.post(
+    "/api/v1/compliance/scan/upload", response_model=ScanUploadResponse, status_code=status.HTTP_202_ACCEPTED
+)
+async def upload_compliance_scan(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    format: Optional[str] = Query(None, description="上传格式: csv/ndjson，默认按 Content-Type 判断"),
+    priority: Optional[ScanPriority] = Query(None, description="扫描优先级，默认 batch"),
+    force_refresh: bool = Query(False, description="忽略有效期内的已有报告，强制重新扫描"),
+    source: str = Query("unknown", description="新建工具的来源: internal/external/unknown"),
+    name_column: Optional[str] = Query(
+        None, max_length=255,
+        description="CSV 中工具名所在的列名，默认识别 name/tool/tool_name/component/component_name/package/package_name"
+    ),
+    x_api_key: Optional[str] = Header(None),
+):
+    """
+    流式上传工具清单（CSV 或 NDJSON）并扫描（队列已饱和时返回 429，工具数在导入前未知，不做预估）
+
+    请求体边接收边写入临时文件，随即返回批次ID；后台逐块解析、去重、批量创建工具并提交扫描，
+    每块提交前重新做准入检查：队列饱和时导入暂停（status=throttled），持续饱和时停止（status=stopped）。
+    导入进度可通过 GET /api/v1/scan/batches/{batch_id} 查询。
+    """
+    fmt = (format or detect_format(request.headers.get("content-type")) or "").lower()
+    if fmt not in SUPPORTED_FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无法识别的上传格式，请指定 format=csv 或 format=ndjson")
+    client = _admit(x_api_key, 1)
+    try:
+        spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_MEMORY)
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+
+        scan_service = get_scan_service()
+        batch = scan_service.create_batch(priority or ScanPriority.BATCH, client=client)
+        batch.ingest = {"status": "pending"}
+        scan_service.admission.track(client, batch)
+
+        def throttled(rejected: AdmissionRejected):
+            batch.ingest["status"] = "throttled"
+            batch.ingest["throttled"] = rejected.to_dict()
+
+        def enqueue(tool_ids, db):
+            # 每块提交前都做准入检查：队列饱和时暂停导入，持续饱和时停止导入
+            step = scan_service.admission.max_request() or len(tool_ids)
+            for start in range(0, len(tool_ids), step):
+                piece = tool_ids[start:start + step]
+                try:
+                    scan_service.admission.admit_waiting(client, len(piece), on_throttled=throttled)
+                except AdmissionRejected as e:
+                    batch.ingest["throttled"] = e.to_dict()
+                    raise IngestStopped(f"扫描队列持续饱和，已停止导入: {e}")
+                batch.ingest["status"] = "running"
+                batch.ingest.pop("throttled", None)
+                scan_service.extend_batch(batch, piece, db, force_refresh=force_refresh)
+
+        background_tasks.add_task(
+            ingest_tool_stream,
+            spool,
+            fmt,
+            get_session(),
+            enqueue,
+            chunk_size=scan_service.config.scanning.ingest_chunk_size,
+            source=source,
+            stats=batch.ingest,
+            name_column=name_column,
+        )
+        logger.info(f"工具清单上传完成，开始后台导入: batch_id={batch.batch_id}, format={fmt}")
+        return ScanUploadResponse(message="工具清单已接收，正在后台导入并扫描", batch_id=batch.batch_id)
+    except Exception as e:
+        logger.error(f"上传工具清单失败: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="上传工具清单失败，请查看服务端日志")
+
+
+@router.post("/api/v1/compliance/scan/sbom", response_model=SbomScanResponse, status_code=status.HTTP_202_ACCEPTED)
+async def sbom_compliance_scan(
+    request: Request,
+    project: str = Query(..., min_length=1, max_length=255, description="项目标识（用于与上次提交的组件集合比较）"),
+    format: Optional[str] = Query(
+        None, description="清单格式: cyclonedx/spdx/requirements/package-json/package-lock，默认按内容判断"
+    ),
+    priority: Optional[ScanPriority] = Query(None, description="扫描优先级，默认按需要扫描的组件数判断"),
+    source: str = Query("unknown", description="新建工具的来源: internal/external/unknown"),
+    db: Session = Depends(get_db),
+    x_api_key: Optional[str] = Header(None),
+):
+    """
+    SBOM / 依赖清单差异扫描（队列已饱和时返回 429 与 Retry-After，需要扫描的组件数超过上限时返回 413）
+
+    请求体为 CycloneDX/SPDX JSON、requirements.txt、package.json 或 package-lock.json。
+    只扫描相对项目上次提交新增或版本变更的组件，未变更的组件直接复用已有报告。
+    准入按新增与版本变更的组件数检查，被拒绝的提交不创建工具、不更新项目组件记录。
+    """
+    client = client_key(x_api_key)
+    try:
+        content = (await request.body()).decode("utf-8-sig")
+        result = await submit_sbom_scan(
+            db, get_scan_service(), project, content, fmt=format, priority=priority, source=source, client=client,
+            admit=lambda requested: _admit(x_api_key, requested),
+        )
+        get_scan_service().admission.track(client, result["batch"])
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="清单必须为 UTF-8 编码")
+    except Exception as e:
+        logger.error(f"SBOM 差异扫描失败: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="SBOM 差异扫描失败，请查看服务端日志")
+
+    batch, delta = result["batch"], result["delta"]
+    cached_count = sum(1 for t in batch.tasks if t.cached)
+    return SbomScanResponse(
+        message=f"差异扫描已提交（新增 {len(delta['added'])} 个，变更 {len(delta['changed'])} 个，未变更 {len(delta['unchanged'])} 个）",
+        project=project,
+        format=result["format"],
+        batch_id=batch.batch_id,
+        task_count=len(batch.tasks),
+        cached_count=cached_count,
+        tasks=[_task_info(t) for t in batch.tasks],
+        skipped=result["skipped"],
+        **delta,
+    )
+
+
 @router.get("/api/v1/scan/status/{tool_id}", response_model=ScanTaskStatusResponse)
 async def get_scan_status(tool_id: int, db: Session = Depends(get_db)):
     """获取扫描任务状态"""
@@ -99,6 +334,7 @@ async def get_scan_status(tool_id: int, db: Session = Depends(get_db)):
         tool = db.query(Tool).filter(Tool.id == tool_id).first()
         if not tool:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"工具不存在: ID {tool_id}")
+        retry = db.query(ScanRetry).filter(ScanRetry.tool_id == tool_id).first()
         return ScanTaskStatusResponse(
             tool_id=tool_id,
             tool_name=tool.name,
@@ -107,6 +343,12 @@ async def get_scan_status(tool_id: int, db: Session = Depends(get_db)):
             current_step=getattr(task, "current_step", None),
             result=task.result,
             error=getattr(task, "error", None) or getattr(task, "error_message", None),
+            stages=[stage.to_dict() for stage in task.stages.values()],
+            batch_id=task.batch_id,
+            timed_out_stages=task.timed_out_stages,
+            provisional=task.provisional,
+            error_kind=task.error_kind.value if task.error_kind else None,
+            retry=retry_info(retry) if retry else None,
         )
     except HTTPException:
         raise
@@ -115,6 +357,146 @@ async def get_scan_status(tool_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="获取扫描状态失败，请查看服务端日志")
 
 
+@router.get("/api/v1/scan/queue", response_model=Dict[str, Any])
+async def get_scan_queue():
+    """获取扫描队列状态（各优先级排队数与执行数）"""
+    return get_scan_service().scheduler.stats()
+
+
+@router.get("/api/v1/scan/metrics", response_model=Dict[str, Any])
+async def get_scan_metrics():
+    """获取扫描指标（当前自适应并发上限、限流/超时信号计数、队列、内存任务表、结果写入、失败重试、准入控制、AI 预算、离线模式、定期重扫、资源隔离与负载轨迹记录状态）"""
+    return {
+        "concurrency": get_concurrency_limiter().stats(),
+        "scheduler": get_scan_service().scheduler.stats(),
+        "tasks": get_scan_service().registry.stats(),
+        "result_writer": get_scan_service().writer.stats(),
+        "retry_queue": get_retry_scheduler().stats(),
+        "admission": get_scan_service().admission.stats(),
+        "budget": get_scan_service().budget.stats(),
+        "offline": _offline_info(),
+        "rescan": get_rescan_scheduler().stats(),
+        "bulkheads": get_scan_service().bulkheads.stats(),
+        "trace": get_scan_service().trace.stats(),
+    }
+
+
+def _offline_info() -> Dict[str, Any]:
+    """离线模式状态（熔断器与补全器）"""
+    return {**get_provider_circuit().stats(), "reconciler": get_enrichment_reconciler().stats()}
+
+
+@router.get("/api/v1/scan/offline", response_model=Dict[str, Any])
+async def get_offline_mode():
+    """查看离线模式状态（是否离线、熔断器状态、连续失败次数与补全器状态）"""
+    return _offline_info()
+
+
+@router.put("/api/v1/scan/offline", response_model=Dict[str, Any])
+async def set_offline_mode(request: OfflineModeRequest):
+    """手动进入或退出离线模式（离线模式下扫描只使用知识库与已缓存的分析结果，报告待 AI 服务恢复后补全）"""
+    circuit = get_provider_circuit()
+    if not circuit.config.enabled:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="离线模式未启用（scanning.offline.enabled）")
+    circuit.set_manual(request.offline)
+    return _offline_info()
+
+
+@router.get("/api/v1/scan/stage-stats", response_model=Dict[str, Any])
+async def get_scan_stage_stats(
+    limit: int = Query(200, ge=1, le=5000, description="统计的最近扫描数"),
+    db: Session = Depends(get_db),
+):
+    """按阶段统计最近扫描的耗时分位数（p50/p95）、外部请求次数与缓存命中率"""
+    try:
+        return get_stage_timing_stats(db, limit)
+    except Exception as e:
+        logger.error(f"统计扫描阶段耗时失败: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="统计扫描阶段耗时失败，请查看服务端日志")
+
+
+@router.get("/api/v1/scan/dead-letters", response_model=Dict[str, Any])
+async def get_dead_letters(
+    skip: int = Query(0, ge=0, description="跳过的记录数"),
+    limit: int = Query(100, ge=1, le=1000, description="返回的最大记录数"),
+    db: Session = Depends(get_db),
+):
+    """查看死信列表：不可重试或连续失败达到上限的工具（含错误类型、失败阶段与失败次数）"""
+    try:
+        return list_dead_letters(db, skip, limit)
+    except Exception as e:
+        logger.error(f"查询死信列表失败: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="查询死信列表失败，请查看服务端日志")
+
+
+@router.post("/api/v1/scan/dead-letters/replay", response_model=Dict[str, Any], status_code=status.HTTP_202_ACCEPTED)
+async def replay_scan_dead_letters(request: DeadLetterReplayRequest, db: Session = Depends(get_db)):
+    """批量重放死信：重置失败次数并立即重新扫描（不指定 tool_ids 时重放全部死信）"""
+    try:
+        result = await replay_dead_letters(db, get_scan_service(), request.tool_ids)
+        batch = result["batch"]
+        return {
+            "message": f"已重放 {len(result['replayed'])} 个死信工具",
+            "tool_ids": result["replayed"],
+            "batch_id": batch.batch_id if batch else None,
+            "tasks": [_task_info(t) for t in batch.tasks] if batch else [],
+        }
+    except Exception as e:
+        logger.error(f"重放死信失败: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="重放死信失败，请查看服务端日志")
+
+
+@router.delete("/api/v1/scan/tasks/{tool_id}", response_model=Dict[str, Any])
+async def cancel_scan_task(tool_id: int):
+    """取消单个工具的扫描任务（排队中或执行中）"""
+    try:
+        scan_service = get_scan_service()
+        task = scan_service.get_task_status(tool_id)
+        if not task:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"扫描任务不存在: tool_id={tool_id}")
+        cancelled = scan_service.cancel_tasks([task])
+        return {"cancelled": cancelled, "task": _task_info(task)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"取消扫描任务失败: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="取消扫描任务失败，请查看服务端日志")
+
+
+@router.get("/api/v1/scan/batches/{batch_id}", response_model=Dict[str, Any])
+async def get_scan_batch(batch_id: str):
+    """获取扫描批次状态"""
+    batch = get_scan_service().get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"扫描批次不存在: {batch_id}")
+    return {
+        "batch_id": batch.batch_id,
+        "priority": batch.priority.value,
+        "created_at": batch.created_at.isoformat(),
+        "finished": batch.finished,
+        "status_counts": batch.status_counts(),
+        "ingest": batch.ingest,
+        "tasks": [_task_info(t) for t in batch.tasks],
+    }
+
+
+@router.delete("/api/v1/scan/batches/{batch_id}", response_model=Dict[str, Any])
+async def cancel_scan_batch(batch_id: str):
+    """取消整个扫描批次：排队中的任务移出队列，执行中的任务立即中止并释放并发槽位"""
+    try:
+        scan_service = get_scan_service()
+        cancelled = scan_service.cancel_batch(batch_id)
+        if cancelled is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"扫描批次不存在: {batch_id}")
+        batch = scan_service.get_batch(batch_id)
+        return {"batch_id": batch_id, "cancelled": cancelled, "status_counts": batch.status_counts()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"取消扫描批次失败: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="取消扫描批次失败，请查看服务端日志")
+
+
 # ==================== 报告 ====================
 
 
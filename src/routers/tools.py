@@ -3,12 +3,16 @@
 Tool management API routes
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from sqlalchemy.orm import Session
 from src.database import get_db
 from src.logger import get_logger
 from src.schemas import ToolRequest, ToolResponse, BatchToolRequest, BatchToolResponse
 from src.services.tool_service import get_or_create_tool, parse_tool_names, batch_create_tools
+from src.services.admission_service import client_key
+from src.services.idempotency_service import request_fingerprint
+from src.routers.idempotency import IdempotentSubmission
 
 logger = get_logger()
 router = APIRouter(prefix="/api/v1/tools", tags=["tools"])
@@ -46,32 +50,44 @@ async def create_tool(
 async def batch_create_tools_endpoint(
     batch_request: BatchToolRequest,
     db: Session = Depends(get_db),
+    x_api_key: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
 ):
     """
     批量创建工具
 
     - **tools**: 工具名称列表（支持换行分隔或逗号分隔）
+    - 携带 Idempotency-Key 请求头的重复提交直接重放首次响应
     """
     try:
-        tool_names = parse_tool_names("\n".join(batch_request.tools))
-        logger.info(f"批量创建工具请求，解析后工具数量: {len(tool_names)}")
-        created_tools, existing_count = batch_create_tools(db, tool_names)
-        logger.info(f"批量创建工具完成: 创建 {len(created_tools)} 个，已存在 {existing_count} 个")
-        return BatchToolResponse(
-            total=len(tool_names),
-            created=len(created_tools),
-            existing=existing_count,
-            tools=[
-                ToolResponse(
-                    id=tool.id,
-                    name=tool.name,
-                    version=tool.version,
-                    source=tool.source,
-                    created_at=tool.created_at.isoformat() if tool.created_at else None,
-                )
-                for tool in created_tools
-            ],
-        )
+        client = client_key(x_api_key)
+        fingerprint = request_fingerprint(batch_request.model_dump(mode="json"))
+        async with IdempotentSubmission(db, client, "tools.batch", idempotency_key, fingerprint) as submission:
+            if submission.replay is not None:
+                return submission.replay
+            tool_names = parse_tool_names("\n".join(batch_request.tools))
+            logger.info(f"批量创建工具请求，解析后工具数量: {len(tool_names)}")
+            created_tools, existing_count = batch_create_tools(db, tool_names)
+            logger.info(f"批量创建工具完成: 创建 {len(created_tools)} 个，已存在 {existing_count} 个")
+            response = BatchToolResponse(
+                total=len(tool_names),
+                created=len(created_tools),
+                existing=existing_count,
+                tools=[
+                    ToolResponse(
+                        id=tool.id,
+                        name=tool.name,
+                        version=tool.version,
+                        source=tool.source,
+                        created_at=tool.created_at.isoformat() if tool.created_at else None,
+                    )
+                    for tool in created_tools
+                ],
+            )
+            submission.remember(status.HTTP_201_CREATED, response.model_dump(mode="json"))
+            return response
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"批量创建工具失败: {e}")
         raise HTTPException(
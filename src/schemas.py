@@ -5,6 +5,7 @@ Pydantic request/response schemas
 
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
+from src.services.scan_scheduler import ScanPriority
 
 
 # ==================== 工具管理 ====================
@@ -42,6 +43,9 @@ class BatchToolResponse(BaseModel):
 class ScanRequest(BaseModel):
     """扫描请求"""
     tool_ids: List[int] = Field(..., description="工具ID列表", min_length=1)
+    force_refresh: bool = Field(False, description="忽略有效期内的已有报告，强制重新扫描")
+    priority: Optional[ScanPriority] = Field(None, description="扫描优先级: interactive/batch/background，默认按工具数量判断")
+    kb_only: Optional[bool] = Field(None, description="可信且近期更新的知识库条目直接生成报告、跳过 AI 分析，默认按 scanning.kb_only 配置")
 
 
 class ScanResponse(BaseModel):
@@ -50,6 +54,30 @@ class ScanResponse(BaseModel):
     task_count: int
     tool_ids: List[int]
     tasks: List[Dict[str, Any]] = Field(default_factory=list, description="扫描任务列表")
+    cached_count: int = Field(0, description="直接复用已有报告的任务数")
+    batch_id: Optional[str] = Field(None, description="扫描批次ID（可用于查询或取消整个批次）")
+
+
+class ScanUploadResponse(BaseModel):
+    """工具清单上传响应"""
+    message: str
+    batch_id: str = Field(..., description="扫描批次ID（导入进度与扫描状态见批次查询接口）")
+
+
+class SbomScanResponse(BaseModel):
+    """SBOM / 依赖清单差异扫描响应"""
+    message: str
+    project: str
+    format: str = Field(..., description="识别出的清单格式")
+    batch_id: str
+    task_count: int
+    cached_count: int = Field(0, description="直接复用已有报告的任务数")
+    tasks: List[Dict[str, Any]] = Field(default_factory=list, description="扫描任务列表")
+    added: List[str] = Field(default_factory=list, description="新增组件")
+    changed: List[str] = Field(default_factory=list, description="版本变更的组件")
+    unchanged: List[str] = Field(default_factory=list, description="未变更的组件")
+    removed: List[str] = Field(default_factory=list, description="相对上次提交移除的组件")
+    skipped: List[str] = Field(default_factory=list, description="名称无效而跳过的组件")
 
 
 class ScanTaskStatusResponse(BaseModel):
@@ -61,8 +89,32 @@ class ScanTaskStatusResponse(BaseModel):
     current_step: Optional[str] = None
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    stages: List[Dict[str, Any]] = Field(default_factory=list, description="流水线各阶段执行结果")
+    batch_id: Optional[str] = Field(None, description="所属扫描批次ID")
+    timed_out_stages: List[str] = Field(default_factory=list, description="任务超时时仍在执行的阶段")
+    provisional: Optional[Dict[str, Any]] = Field(
+        None, description="由知识库即时生成的临时结果（report_id、revision、kb_source、kb_updated_at）"
+    )
+    error_kind: Optional[str] = Field(
+        None, description="失败时的错误类型: rate_limited/provider_down/fetch_failure/parse_failure/internal"
+    )
+    retry: Optional[Dict[str, Any]] = Field(None, description="工具的重试记录（等待重试或已进入死信列表时）")
+
+
+class DeadLetterReplayRequest(BaseModel):
+    """死信重放请求"""
+    tool_ids: Optional[List[int]] = Field(None, description="要重放的工具ID，不指定时重放全部死信")
+
+
+class OfflineModeRequest(BaseModel):
+    """手动切换离线模式请求"""
+    offline: bool = Field(..., description="true 进入离线模式（扫描不调用 AI），false 退出离线模式并重置熔断器")
 
 
 class ComplianceScanRequest(BaseModel):
     """一体化合规扫描请求（工具名列表）"""
     tools: List[str] = Field(..., description="工具名称列表", min_length=1)
+    force_refresh: bool = Field(False, description="忽略有效期内的已有报告，强制重新扫描")
+    priority: Optional[ScanPriority] = Field(None, description="扫描优先级: interactive/batch/background，默认按工具数量判断")
+    kb_only: Optional[bool] = Field(None, description="可信且近期更新的知识库条目直接生成报告、跳过 AI 分析，默认按 scanning.kb_only 配置")
+    provisional: bool = Field(True, description="知识库已收录的工具立即返回临时报告，AI 分析完成后更新为新的报告修订")
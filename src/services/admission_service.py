@@ -0,0 +1,220 @@
+"""
+扫描准入控制：按排队深度限制扫描提交，队列饱和时让客户端退避
+Scan admission control: bounds queued scan work globally and per API key
+
+- 全局与每个客户端（按 X-API-Key 区分）未结束的扫描任务数都有上限
+- 超过上限的提交被拒绝（429），并给出预计可重试的等待时间与当前排队位置
+- 等待时间按最近完成任务的平均扫描耗时与并发上限估算
+"""
+
+import hashlib
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from src.config import AdmissionConfig
+from src.logger import get_logger
+
+logger = get_logger()
+
+# 未提供 API Key 的请求共用的客户端标识
+ANONYMOUS_CLIENT = "anonymous"
+
+
+def client_key(api_key: Optional[str]) -> str:
+    """
+    由 API Key 得到客户端标识（只保留哈希前缀，不在内存和指标中保存原始密钥）
+
+    Args:
+        api_key: 请求头 X-API-Key 的值
+
+    Returns:
+        str: 客户端标识
+    """
+    if not api_key:
+        return ANONYMOUS_CLIENT
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class AdmissionRejected(Exception):
+    """扫描提交因队列饱和被拒绝"""
+
+    def __init__(self, scope: str, queued: int, limit: int, requested: int, retry_after: int):
+        """
+        Args:
+            scope: 触发限制的范围（global / client）
+            queued: 该范围内当前未结束的任务数
+            limit: 该范围的上限
+            requested: 本次提交的工具数
+            retry_after: 建议的重试等待时间（秒）
+        """
+        self.scope = scope
+        self.queued = queued
+        self.limit = limit
+        self.requested = requested
+        self.retry_after = retry_after
+        super().__init__(f"扫描队列已满（{scope}: {queued}/{limit}），请 {retry_after} 秒后重试")
+
+    @property
+    def queue_position(self) -> int:
+        """本次提交若被接受时在队列中的位置（排在当前所有未结束任务之后）"""
+        return self.queued + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为响应内容"""
+        return {
+            "message": str(self),
+            "scope": self.scope,
+            "queued": self.queued,
+            "limit": self.limit,
+            "requested": self.requested,
+            "queue_position": self.queue_position,
+            "retry_after": self.retry_after,
+        }
+
+
+class AdmissionController:
+    """扫描准入控制器"""
+
+    def __init__(self, config: AdmissionConfig, registry: Any, max_concurrent: int):
+        """
+        Args:
+            config: 准入控制配置
+            registry: 扫描任务表（统计未结束的任务与最近的扫描耗时）
+            max_concurrent: 扫描并发上限（估算等待时间）
+        """
+        self.config = config
+        self.registry = registry
+        self.max_concurrent = max(1, max_concurrent)
+        self._client_batches: Dict[str, List[Any]] = {}  # 客户端 -> 未结束的批次
+        self._lock = threading.Lock()
+        self.rejected_total = 0
+
+    def _client_queued(self, client: str) -> int:
+        """客户端未结束的任务数（同时清理已结束的批次）"""
+        batches = [batch for batch in self._client_batches.get(client, []) if not batch.finished]
+        if batches:
+            self._client_batches[client] = batches
+        else:
+            self._client_batches.pop(client, None)
+        return sum(1 for batch in batches for task in batch.tasks if not task.is_terminal)
+
+    def _global_queued(self) -> int:
+        return sum(1 for task in self.registry.active() if not task.is_terminal)
+
+    def _avg_scan_seconds(self) -> float:
+        """最近完成的（非复用）扫描的平均耗时，没有样本时使用配置的默认值"""
+        durations = [
+            (task.completed_at - task.started_at).total_seconds()
+            for task in self.registry.active()
+            if task.is_terminal and task.started_at and task.completed_at and not task.cached
+        ]
+        return sum(durations) / len(durations) if durations else float(self.config.default_scan_seconds)
+
+    def retry_after(self, excess: int) -> int:
+        """
+        估算队列腾出 excess 个位置所需的时间（秒）
+
+        Args:
+            excess: 超出上限的任务数
+
+        Returns:
+            int: 建议的重试等待时间（秒，至少1秒，最多 max_retry_after_seconds）
+        """
+        seconds = math.ceil(excess / self.max_concurrent * self._avg_scan_seconds())
+        return max(1, min(self.config.max_retry_after_seconds, seconds))
+
+    def admit(self, client: str, requested: int) -> None:
+        """
+        检查是否接受提交
+
+        Args:
+            client: 客户端标识
+            requested: 本次提交的工具数（按可能新增的任务数上限估算）
+
+        Raises:
+            AdmissionRejected: 全局或客户端未结束的任务数加上本次提交超过上限
+        """
+        if not self.config.enabled or requested <= 0:
+            return
+        with self._lock:
+            checks = (
+                ("global", self._global_queued(), self.config.max_queued_tasks),
+                ("client", self._client_queued(client), self.config.max_queued_per_client),
+            )
+            for scope, queued, limit in checks:
+                if limit > 0 and queued + requested > limit:
+                    self.rejected_total += 1
+                    rejected = AdmissionRejected(
+                        scope, queued, limit, requested, self.retry_after(queued + requested - limit)
+                    )
+                    logger.warning(f"拒绝扫描提交: 客户端 {client} - {rejected}")
+                    raise rejected
+
+    def max_request(self) -> Optional[int]:
+        """单次提交最多可被接受的工具数（取已配置的上限中较小者，未启用或不限制时为None）"""
+        if not self.config.enabled:
+            return None
+        limits = [limit for limit in (self.config.max_queued_tasks, self.config.max_queued_per_client) if limit > 0]
+        return min(limits) if limits else None
+
+    def admit_waiting(
+        self,
+        client: str,
+        requested: int,
+        on_throttled: Optional[Callable[[AdmissionRejected], None]] = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """
+        长时间运行的提交（如流式导入）的准入检查：队列饱和时暂停，按 ingest_poll_seconds 重新检查（阻塞调用线程）
+
+        Args:
+            client: 客户端标识
+            requested: 本次提交的工具数
+            on_throttled: 每次因饱和暂停前的回调（参数为本次拒绝）
+            sleep: 暂停函数
+
+        Raises:
+            AdmissionRejected: 单次提交超过上限，或累计暂停超过 ingest_max_wait_seconds
+        """
+        waited = 0.0
+        while True:
+            try:
+                self.admit(client, requested)
+                return
+            except AdmissionRejected as e:
+                if e.requested > e.limit or waited >= self.config.ingest_max_wait_seconds:
+                    raise
+                delay = max(0.0, min(e.retry_after, self.config.ingest_poll_seconds,
+                                     self.config.ingest_max_wait_seconds - waited))
+                if on_throttled is not None:
+                    on_throttled(e)
+                sleep(delay)
+                waited += delay
+
+    def track(self, client: str, batch: Any) -> None:
+        """
+        登记客户端提交的批次（用于统计客户端未结束的任务数）
+
+        Args:
+            client: 客户端标识
+            batch: 扫描批次
+        """
+        if not self.config.enabled:
+            return
+        with self._lock:
+            self._client_batches.setdefault(client, []).append(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        """准入控制状态"""
+        with self._lock:
+            clients = {client: self._client_queued(client) for client in list(self._client_batches)}
+            return {
+                "enabled": self.config.enabled,
+                "queued": self._global_queued(),
+                "max_queued_tasks": self.config.max_queued_tasks,
+                "max_queued_per_client": self.config.max_queued_per_client,
+                "clients": clients,
+                "rejected_total": self.rejected_total,
+            }
@@ -6,14 +6,23 @@ AI client module for unified AI service interface
 import json
 import re
 import asyncio
+import time
 import httpx
 from typing import Optional, Dict, Any, List
 from abc import ABC, abstractmethod
 from src.config import get_config
 from src.logger import get_logger
+from src.services.scan_pipeline import record_stage_attempt
+from src.services.concurrency_limiter import get_concurrency_limiter
+from src.services.budget_service import get_token_budget
+from src.services.offline_service import get_provider_circuit
+from src.services.bulkhead import get_bulkheads
 
 logger = get_logger()
 
+# 429 限流、超时与网络错误重试的基础退避时间（秒），第 n 次重试等待 RETRY_BASE_DELAY * backoff_factor ** n
+RETRY_BASE_DELAY = 2
+
 
 class AIClientBase(ABC):
     """AI客户端基类"""
@@ -108,7 +117,7 @@ class GLMClient(AIClientBase):
         config = get_config()
         max_retries = config.scanning.retry.max_attempts
         backoff_factor = config.scanning.retry.backoff_factor
-        base_delay = 2  # 基础延迟（秒）
+        base_delay = RETRY_BASE_DELAY
         
         url = f"{self.api_base}/chat/completions"
         headers = {
@@ -123,15 +132,25 @@ class GLMClient(AIClientBase):
             "max_tokens": self.max_tokens
         }
         
+        # 限流、超时与耗时信号上报给自适应并发上限；服务不可用（5xx、超时、网络错误）上报给熔断器
+        limiter = get_concurrency_limiter()
+        circuit = get_provider_circuit()
+        # 每次请求占用 AI 调用资源池的一个槽位（退避等待期间不占用）
+        llm_pool = get_bulkheads().llm
+        
         # 重试机制：处理429速率限制错误
         last_exception = None
         for attempt in range(max_retries):
+            record_stage_attempt()
             try:
                 async with httpx.AsyncClient(timeout=self.timeout) as client:
-                    response = await client.post(url, headers=headers, json=data)
+                    async with llm_pool:
+                        started = time.monotonic()
+                        response = await client.post(url, headers=headers, json=data)
                     
                     # 检查429错误（速率限制）
                     if response.status_code == 429:
+                        limiter.on_rate_limited()
                         error_detail = None
                         try:
                             error_json = response.json()
@@ -166,7 +185,11 @@ class GLMClient(AIClientBase):
                     
                     # 其他HTTP错误
                     response.raise_for_status()
+                    limiter.on_success(time.monotonic() - started)
+                    circuit.on_success()
                     result = response.json()
+                    # 按实际用量计入 AI 预算
+                    get_token_budget().record(result.get("usage"))
                     
                     # 提取响应内容
                     if "choices" in result and len(result["choices"]) > 0:
@@ -187,10 +210,13 @@ class GLMClient(AIClientBase):
                 else:
                     # 其他HTTP错误，不重试
                     logger.error(f"GLM API调用失败 (HTTP {e.response.status_code}): {e}")
+                    if e.response.status_code >= 500:
+                        circuit.on_failure()
                     raise
                     
             except httpx.TimeoutException as e:
                 last_exception = e
+                limiter.on_timeout()
                 if attempt < max_retries - 1:
                     delay = base_delay * (backoff_factor ** attempt)
                     logger.warning(f"GLM API请求超时，等待 {delay} 秒后重试...")
@@ -201,6 +227,7 @@ class GLMClient(AIClientBase):
                         f"GLM API请求超时，已重试 {max_retries} 次。"
                         "（若频繁出现，可检查网络或 GLM 服务状态；额度限制会显示 429/速率限制）"
                     )
+                    circuit.on_failure()
                     raise
                     
             except httpx.RequestError as e:
@@ -213,6 +240,7 @@ class GLMClient(AIClientBase):
                     continue
                 else:
                     logger.error(f"GLM API网络错误，已重试 {max_retries} 次: {e}")
+                    circuit.on_failure()
                     raise
                     
             except Exception as e:
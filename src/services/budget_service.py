@@ -0,0 +1,312 @@
+"""
+AI 预算服务：按 AI 接口返回的实际 usage 统计每日 token / 费用，预算接近用尽时限制低优先级扫描
+AI budget service: daily token / cost budget tracked from actual API usage, optionally per API key
+
+- 用量按预算日（reset_hour 点重置）与客户端累计，随扫描结果写入数据库，服务重启后恢复当日用量
+- 用量超过 1 - interactive_reserve_ratio 后，批量与后台扫描被推迟（留在队列中）或降级为知识库结果，剩余预算留给交互式扫描
+- 预算完全用尽或客户端超过自己的上限时，扫描一律降级为知识库/已有报告结果，不再调用 AI
+"""
+
+import threading
+from contextvars import ContextVar, Token
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.config import BudgetConfig, get_config
+from src.logger import get_logger
+from src.models import LLMUsage
+from src.services.freshness_service import db_now
+from src.services.scan_scheduler import ScanPriority
+
+logger = get_logger()
+
+# 定期重扫、失败重试等非客户端提交的扫描使用的客户端标识
+SYSTEM_CLIENT = "system"
+
+# 当前扫描的提交客户端（AI 调用的用量计入该客户端）
+_current_client: ContextVar[Optional[str]] = ContextVar("budget_client", default=None)
+
+
+def bind_client(client: Optional[str]) -> Token:
+    """设置当前扫描的提交客户端，返回用于恢复的令牌"""
+    return _current_client.set(client)
+
+
+def unbind_client(token: Token) -> None:
+    """恢复 bind_client 之前的客户端"""
+    _current_client.reset(token)
+
+
+class BudgetDecision(str, Enum):
+    """预算检查结果"""
+    RUN = "run"  # 正常执行（调用 AI）
+    DEFER = "defer"  # 留在队列中，预算重置后再执行
+    KB_ONLY = "kb_only"  # 降级为知识库/已有报告结果
+
+
+class _Usage:
+    """累计用量"""
+
+    __slots__ = ("prompt_tokens", "completion_tokens", "requests")
+
+    def __init__(self, prompt_tokens: int = 0, completion_tokens: int = 0, requests: int = 0):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.requests = requests
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, other: "_Usage") -> None:
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.requests += other.requests
+
+    def cost(self, config: BudgetConfig) -> float:
+        return (
+            self.prompt_tokens * config.prompt_price_per_1k + self.completion_tokens * config.completion_price_per_1k
+        ) / 1000
+
+
+class TokenBudget:
+    """AI 每日用量预算"""
+
+    def __init__(self, config: BudgetConfig):
+        """
+        Args:
+            config: AI 预算配置
+        """
+        self.config = config
+        self._day: Optional[str] = None
+        self._totals: Dict[str, _Usage] = {}  # 客户端 -> 当日用量
+        self._pending: Dict[Tuple[str, str], _Usage] = {}  # (预算日, 客户端) -> 尚未写入数据库的用量
+        self._lock = threading.Lock()
+        self.degraded_total = 0  # 因预算降级为知识库结果的扫描数
+
+    # ---------- 预算日 ----------
+
+    def budget_day(self, now: Optional[datetime] = None) -> str:
+        """当前预算日（UTC 时间减去 reset_hour 后的日期）"""
+        now = now or db_now()
+        return (now - timedelta(hours=self.config.reset_hour)).date().isoformat()
+
+    def resets_at(self, now: Optional[datetime] = None) -> datetime:
+        """下次预算重置时间（数据库时间）"""
+        now = now or db_now()
+        day = datetime.fromisoformat(self.budget_day(now))
+        return day + timedelta(days=1, hours=self.config.reset_hour)
+
+    def _roll(self, now: Optional[datetime]) -> None:
+        # 调用方需持有锁
+        day = self.budget_day(now)
+        if day != self._day:
+            self._day = day
+            self._totals = {}
+
+    # ---------- 用量 ----------
+
+    def record(self, usage: Optional[Dict[str, Any]], client: Optional[str] = None, now: Optional[datetime] = None) -> None:
+        """
+        记录一次 AI 调用的实际用量
+
+        Args:
+            usage: AI 接口响应中的 usage（prompt_tokens / completion_tokens）
+            client: 客户端标识（默认为当前扫描的提交客户端）
+            now: 当前时间（数据库时间，默认 db_now()）
+        """
+        if not self.config.enabled or not usage:
+            return
+        client = client or _current_client.get() or SYSTEM_CLIENT
+        used = _Usage(int(usage.get("prompt_tokens") or 0), int(usage.get("completion_tokens") or 0), 1)
+        with self._lock:
+            self._roll(now)
+            self._totals.setdefault(client, _Usage()).add(used)
+            self._pending.setdefault((self._day, client), _Usage()).add(used)
+
+    def _ratio(self, usage: _Usage, tokens_limit: int, cost_limit: float) -> float:
+        """用量占上限的比例（取 token 与费用中较高者，未设置上限时为0）"""
+        ratios = [0.0]
+        if tokens_limit > 0:
+            ratios.append(usage.tokens / tokens_limit)
+        if cost_limit > 0:
+            ratios.append(usage.cost(self.config) / cost_limit)
+        return max(ratios)
+
+    def _global_usage(self) -> _Usage:
+        total = _Usage()
+        for usage in self._totals.values():
+            total.add(usage)
+        return total
+
+    def usage_ratio(self, client: Optional[str] = None, now: Optional[datetime] = None) -> float:
+        """
+        当日用量占预算的比例
+
+        Args:
+            client: 客户端标识（None 表示全局）
+            now: 当前时间（数据库时间，默认 db_now()）
+
+        Returns:
+            float: 用量比例（1 表示已用尽）
+        """
+        with self._lock:
+            self._roll(now)
+            if client is None:
+                return self._ratio(self._global_usage(), self.config.daily_tokens, self.config.daily_cost)
+            return self._ratio(
+                self._totals.get(client, _Usage()),
+                self.config.per_client_daily_tokens,
+                self.config.per_client_daily_cost,
+            )
+
+    # ---------- 决策 ----------
+
+    def decide(self, priority: ScanPriority, client: Optional[str] = None, now: Optional[datetime] = None) -> BudgetDecision:
+        """
+        检查扫描是否可以调用 AI
+
+        Args:
+            priority: 扫描优先级
+            client: 提交扫描的客户端（None 或 system 时不检查客户端上限）
+            now: 当前时间（数据库时间，默认 db_now()）
+
+        Returns:
+            BudgetDecision: 正常执行、推迟或降级为知识库结果
+        """
+        if not self.config.enabled:
+            return BudgetDecision.RUN
+        ratio = self.usage_ratio(now=now)
+        # 预算用尽与客户端上限对所有优先级生效，先于低优先级保留线检查
+        if ratio >= 1:
+            return BudgetDecision.KB_ONLY
+        if client and client != SYSTEM_CLIENT and self.usage_ratio(client, now=now) >= 1:
+            return BudgetDecision.KB_ONLY
+        if priority != ScanPriority.INTERACTIVE and ratio >= 1 - self.config.interactive_reserve_ratio:
+            return BudgetDecision(self.config.low_priority_action)
+        return BudgetDecision.RUN
+
+    def allows_dispatch(self, priority: ScanPriority) -> bool:
+        """扫描调度器的出队检查：low_priority_action 为 defer 时，超过保留线（包括预算用尽）的低优先级扫描留在队列中"""
+        if not self.config.enabled or priority == ScanPriority.INTERACTIVE:
+            return True
+        if self.config.low_priority_action != BudgetDecision.DEFER.value:
+            return True
+        return self.usage_ratio() < 1 - self.config.interactive_reserve_ratio
+
+    # ---------- 持久化 ----------
+
+    def load(self, db: Session, now: Optional[datetime] = None) -> None:
+        """
+        从数据库恢复当日用量（服务启动时调用）
+
+        Args:
+            db: 数据库会话
+            now: 当前时间（数据库时间，默认 db_now()）
+        """
+        if not self.config.enabled:
+            return
+        day = self.budget_day(now)
+        rows = db.query(LLMUsage).filter(LLMUsage.day == day).all()
+        with self._lock:
+            self._day = day
+            self._totals = {
+                row.client: _Usage(row.prompt_tokens or 0, row.completion_tokens or 0, row.requests or 0) for row in rows
+            }
+            # 尚未写入的当日用量（启动前已记录的）一并计入
+            for (pending_day, client), usage in self._pending.items():
+                if pending_day == day:
+                    self._totals.setdefault(client, _Usage()).add(usage)
+
+    def flush(self, db: Session) -> None:
+        """
+        将尚未写入的用量累加到数据库（不提交事务）
+
+        所在事务回滚时（如合并提交的批量事务失败）用量放回待写入，下次写入（包括逐条重试）时再写
+
+        Args:
+            db: 数据库会话
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            for (day, client), usage in pending.items():
+                row = db.query(LLMUsage).filter(LLMUsage.day == day, LLMUsage.client == client).first()
+                if row is None:
+                    row = LLMUsage(day=day, client=client, prompt_tokens=0, completion_tokens=0, requests=0)
+                    db.add(row)
+                row.prompt_tokens += usage.prompt_tokens
+                row.completion_tokens += usage.completion_tokens
+                row.requests += usage.requests
+            db.flush()
+        except Exception:
+            # 写入失败时保留用量，下次再写
+            self._restore(pending)
+            raise
+        self._restore_on_rollback(db, pending)
+
+    def _restore(self, pending: Dict[Tuple[str, str], _Usage]) -> None:
+        with self._lock:
+            for key, usage in pending.items():
+                self._pending.setdefault(key, _Usage()).add(usage)
+
+    def _restore_on_rollback(self, db: Session, pending: Dict[Tuple[str, str], _Usage]) -> None:
+        """所在事务提交前回滚时放回用量（只处理当前事务，提交后不再监听）"""
+        def on_commit(session: Session) -> None:
+            event.remove(db, "after_rollback", on_rollback)
+
+        def on_rollback(session: Session) -> None:
+            event.remove(db, "after_commit", on_commit)
+            self._restore(pending)
+
+        event.listen(db, "after_commit", on_commit, once=True)
+        event.listen(db, "after_rollback", on_rollback, once=True)
+
+    def stats(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """预算状态（now 为当前时间，默认 db_now()）"""
+        now = now or db_now()
+        with self._lock:
+            self._roll(now)
+            total = self._global_usage()
+            clients = {
+                client: {"tokens": usage.tokens, "cost": round(usage.cost(self.config), 4), "requests": usage.requests}
+                for client, usage in self._totals.items()
+            }
+            day = self._day
+        return {
+            "enabled": self.config.enabled,
+            "day": day,
+            "resets_at": self.resets_at(now).isoformat(),
+            "tokens": total.tokens,
+            "cost": round(total.cost(self.config), 4),
+            "requests": total.requests,
+            "daily_tokens": self.config.daily_tokens,
+            "daily_cost": self.config.daily_cost,
+            "usage_ratio": round(self.usage_ratio(now=now), 4),
+            "decisions": {priority.value: self.decide(priority, now=now).value for priority in ScanPriority},
+            "degraded_total": self.degraded_total,
+            "clients": clients,
+        }
+
+
+# 全局预算实例
+_budget: Optional[TokenBudget] = None
+
+
+def get_token_budget() -> TokenBudget:
+    """
+    获取 AI 预算实例（单例模式）
+
+    Returns:
+        TokenBudget: 预算实例
+    """
+    global _budget
+    if _budget is None:
+        _budget = TokenBudget(get_config().scanning.budget)
+    return _budget
@@ -0,0 +1,187 @@
+"""
+资源隔离（bulkhead）模块：按资源类型分别限制并发，并统计排队等待时间
+Bulkhead module: independent concurrency pools per resource class with queue-wait metrics
+
+- llm：AI 接口调用（每次 HTTP 请求占用一个槽位，重试退避期间不占用）；启用自适应并发时上限由 AIMD 调整
+- tos_fetch：TOS 网页获取
+- db_write：等待提交的扫描结果写入
+- 资源池不绑定事件循环：扫描调度器线程的事件循环、测试与命令行中的 asyncio.run 可共用同一组资源池
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set
+
+from src.config import BulkheadConfig, get_config
+from src.logger import get_logger
+from src.services.stage_stats_service import percentile
+
+logger = get_logger()
+
+
+def _grant(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class Bulkhead:
+    """单个资源池（可调整上限的异步信号量，先到先得）"""
+
+    def __init__(self, name: str, limit: Optional[int], samples: int = 1000):
+        """
+        Args:
+            name: 资源池名称
+            limit: 并发上限（None 表示不限制，只统计）
+            samples: 统计等待时间分位数的最近样本数
+        """
+        self.name = name
+        self.limit = limit
+        self._in_use = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._granted: Set[int] = set()  # 已分配槽位、尚未被等待方取走的 future
+        self._lock = threading.Lock()
+        self._waits: Deque[float] = deque(maxlen=max(1, samples))
+        self.acquired = 0
+        self.queued = 0  # 需要排队的获取次数
+        self.wait_seconds_total = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _has_slot(self) -> bool:
+        return self.limit is None or self._in_use < self.limit
+
+    def set_limit(self, limit: int) -> None:
+        """调整并发上限（线程安全；降低时不中断占用中的槽位）"""
+        with self._lock:
+            self.limit = max(1, limit)
+            self._wake()
+
+    def _wake(self) -> None:
+        # 调用方需持有锁
+        while self._waiters and self._has_slot():
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            try:
+                future.get_loop().call_soon_threadsafe(_grant, future)
+            except RuntimeError:
+                # 等待方的事件循环已关闭
+                continue
+            self._in_use += 1
+            self._granted.add(id(future))
+
+    async def acquire(self) -> None:
+        """获取一个槽位（没有空闲槽位时排队等待）"""
+        started = time.monotonic()
+        with self._lock:
+            if self._has_slot() and not self._waiters:
+                self._in_use += 1
+                self._record(0.0)
+                return
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+            self.queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if id(future) in self._granted:
+                    # 槽位已分配但等待方已取消：归还
+                    self._granted.discard(id(future))
+                    self._in_use -= 1
+                    self._wake()
+                else:
+                    try:
+                        self._waiters.remove(future)
+                    except ValueError:
+                        pass
+            raise
+        with self._lock:
+            self._granted.discard(id(future))
+            self._record(time.monotonic() - started)
+
+    def release(self) -> None:
+        """归还槽位"""
+        with self._lock:
+            self._in_use -= 1
+            self._wake()
+
+    def _record(self, wait: float) -> None:
+        # 调用方需持有锁
+        self.acquired += 1
+        self.wait_seconds_total += wait
+        self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        self._waits.append(wait)
+
+    async def __aenter__(self) -> "Bulkhead":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """资源池指标（等待时间单位：秒）"""
+        with self._lock:
+            waits = list(self._waits)
+            return {
+                "limit": self.limit,
+                "in_use": self._in_use,
+                "waiting": len(self._waiters),
+                "acquired": self.acquired,
+                "queued": self.queued,
+                "wait_avg": round(self.wait_seconds_total / self.acquired, 4) if self.acquired else None,
+                "wait_p50": percentile(waits, 50),
+                "wait_p95": percentile(waits, 95),
+                "wait_max": round(self.max_wait_seconds, 4),
+            }
+
+
+class Bulkheads:
+    """各资源类型的资源池"""
+
+    def __init__(self, config: BulkheadConfig, max_concurrent: int):
+        """
+        Args:
+            config: 资源隔离配置
+            max_concurrent: 扫描并发上限（AI 调用池未配置上限时使用）
+        """
+        self.config = config
+
+        def limit(value: int) -> Optional[int]:
+            # 未启用资源隔离时只统计等待时间，不限制并发
+            return max(1, value) if config.enabled else None
+
+        self.llm = Bulkhead("llm", limit(config.llm or max_concurrent), config.wait_samples)
+        self.tos_fetch = Bulkhead("tos_fetch", limit(config.tos_fetch), config.wait_samples)
+        self.db_write = Bulkhead("db_write", limit(config.db_write), config.wait_samples)
+
+    def stats(self) -> Dict[str, Any]:
+        """资源隔离指标"""
+        return {
+            "enabled": self.config.enabled,
+            "max_in_flight_scans": self.config.max_in_flight_scans if self.config.enabled else None,
+            "pools": {pool.name: pool.stats() for pool in (self.llm, self.tos_fetch, self.db_write)},
+        }
+
+
+# 全局资源池实例
+_bulkheads: Optional[Bulkheads] = None
+
+
+def get_bulkheads() -> Bulkheads:
+    """
+    获取资源池实例（单例模式；启用自适应并发时 AI 调用池的上限跟随自适应并发上限）
+
+    Returns:
+        Bulkheads: 资源池实例
+    """
+    global _bulkheads
+    if _bulkheads is None:
+        scanning = get_config().scanning
+        _bulkheads = Bulkheads(scanning.bulkheads, scanning.max_concurrent)
+        if scanning.bulkheads.enabled and scanning.adaptive_concurrency.enabled:
+            from src.services.concurrency_limiter import get_concurrency_limiter
+            get_concurrency_limiter().add_listener(_bulkheads.llm.set_limit)
+    return _bulkheads
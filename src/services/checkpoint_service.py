@@ -0,0 +1,94 @@
+"""
+扫描检查点服务：按工具保存扫描流水线各阶段的输出
+Scan checkpoint service: persists per-tool stage outputs so retried scans resume mid-pipeline
+
+检查点以阶段输入的哈希为键：上游输出变化（如 TOS 链接或 TOS 内容变化）时检查点自动失效。
+扫描成功生成报告后清除该工具的检查点。
+"""
+
+import copy
+import hashlib
+import json
+from datetime import timedelta
+from typing import Any, Callable, Dict, Tuple
+
+from sqlalchemy.orm import Session
+
+from src.config import CheckpointConfig
+from src.database import session_scope
+from src.logger import get_logger
+from src.models import ScanCheckpoint
+from src.services.freshness_service import db_now
+
+logger = get_logger()
+
+
+def stable_hash(value: Any) -> str:
+    """计算 JSON 可序列化值的稳定哈希（SHA-256）"""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ScanCheckpointStore:
+    """单个工具的检查点存储（实现 scan_pipeline.CheckpointStore）"""
+
+    def __init__(self, session_factory: Callable[[], Session], tool_id: int, config: CheckpointConfig):
+        """
+        Args:
+            session_factory: 数据库会话工厂（每次读写使用独立的短会话）
+            tool_id: 工具ID
+            config: 检查点配置
+        """
+        self.session_factory = session_factory
+        self.tool_id = tool_id
+        self.config = config
+        self._checkpoints: Dict[str, Tuple[str, Any]] = {}  # 阶段 -> (输入哈希, 输出)
+        expire_before = db_now() - timedelta(hours=config.ttl_hours)
+        with session_scope(session_factory) as db:
+            rows = db.query(ScanCheckpoint).filter(
+                ScanCheckpoint.tool_id == tool_id,
+                ScanCheckpoint.created_at >= expire_before,
+            ).all()
+            for row in rows:
+                self._checkpoints[row.stage] = (row.input_hash, row.output)
+
+    def __len__(self) -> int:
+        return len(self._checkpoints)
+
+    def load(self, stage: str, inputs: Dict[str, Any]) -> Tuple[bool, Any]:
+        """读取与当前输入匹配的检查点"""
+        checkpoint = self._checkpoints.get(stage)
+        if checkpoint is None or checkpoint[0] != stable_hash(inputs):
+            return False, None
+        # 返回副本，避免下游阶段修改检查点对象
+        return True, copy.deepcopy(checkpoint[1])
+
+    def save(self, stage: str, inputs: Dict[str, Any], value: Any) -> None:
+        """保存阶段输出（同一阶段只保留最新的检查点）"""
+        input_hash = stable_hash(inputs)
+        try:
+            with session_scope(self.session_factory) as db:
+                db.query(ScanCheckpoint).filter(
+                    ScanCheckpoint.tool_id == self.tool_id, ScanCheckpoint.stage == stage
+                ).delete(synchronize_session=False)
+                db.add(ScanCheckpoint(
+                    tool_id=self.tool_id,
+                    stage=stage,
+                    input_hash=input_hash,
+                    output_hash=stable_hash(value),
+                    output=value,
+                ))
+            self._checkpoints[stage] = (input_hash, copy.deepcopy(value))
+        except Exception as e:
+            logger.warning(f"保存扫描检查点失败: tool_id={self.tool_id}, stage={stage} - {e}")
+
+    def clear(self) -> None:
+        """清除该工具的全部检查点"""
+        try:
+            with session_scope(self.session_factory) as db:
+                db.query(ScanCheckpoint).filter(
+                    ScanCheckpoint.tool_id == self.tool_id
+                ).delete(synchronize_session=False)
+            self._checkpoints.clear()
+        except Exception as e:
+            logger.warning(f"清除扫描检查点失败: tool_id={self.tool_id} - {e}")
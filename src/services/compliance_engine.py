@@ -4,6 +4,7 @@ Compliance rule engine for multi-dimensional compliance assessment
 """
 
 import json
+from datetime import datetime
 from typing import Dict, Any, Optional
 from sqlalchemy.orm import Session
 from src.models import Tool, ComplianceReport
@@ -281,10 +282,30 @@ class ComplianceEngine:
         Returns:
             ComplianceReport: 合规报告对象
         """
-        # 检查是否启用多维度评估
-        enable_assessment = self.compliance_config.enable_multi_dimension_assessment
+        evaluation = await self.evaluate_report(tool, tool_info, tos_analysis)
+        return self.save_report(tool, db, evaluation, tos_analysis)
+    
+    async def evaluate_report(
+        self,
+        tool: Tool,
+        tool_info: Dict[str, Any],
+        tos_analysis: Optional[Dict[str, Any]] = None,
+        offline: bool = False
+    ) -> Dict[str, Any]:
+        """
+        评估报告内容（可能调用AI，不访问数据库）
         
-        if enable_assessment:
+        Args:
+            tool: 工具对象（只读取 name 等已加载的字段）
+            tool_info: 工具信息
+            tos_analysis: TOS分析结果
+            offline: 是否处于离线模式（不调用AI，按简化模式生成）
+        
+        Returns:
+            Dict[str, Any]: dimension_scores / overall_score / is_compliant / recommendations / reasons
+        """
+        # 检查是否启用多维度评估（离线模式下多维度评估无法调用AI，使用简化模式）
+        if self.compliance_config.enable_multi_dimension_assessment and not offline:
             # 评估所有维度
             dimension_scores = await self.assess_all_dimensions(tool, tool_info, tos_analysis)
             
@@ -306,46 +327,131 @@ class ComplianceEngine:
             recommendations = {"recommendations": [], "alternative_tools": []}
             reasons = {"is_compliant": None, "reasons": []}
         
-        # 获取或创建报告
+        return {
+            "dimension_scores": dimension_scores,
+            "overall_score": overall_score,
+            "is_compliant": is_compliant,
+            "recommendations": recommendations,
+            "reasons": reasons,
+        }
+    
+    def save_report(
+        self,
+        tool: Tool,
+        db: Session,
+        evaluation: Dict[str, Any],
+        tos_analysis: Optional[Dict[str, Any]] = None,
+        commit: bool = True
+    ) -> ComplianceReport:
+        """
+        保存评估结果为正式报告（同步，只访问数据库）
+        
+        Args:
+            tool: 工具对象
+            db: 数据库会话
+            evaluation: evaluate_report 的结果
+            tos_analysis: TOS分析结果
+            commit: 是否立即提交；为False时只 flush（报告ID可用），由调用方（如批量写入任务）统一提交
+        
+        Returns:
+            ComplianceReport: 合规报告对象
+        """
+        dimension_scores = evaluation["dimension_scores"]
+        
+        # 获取或创建报告（正式报告覆盖知识库生成的报告，修订号递增）
+        report = self._get_or_create_report(tool, db)
+        report.provisional = False
+        report.kb_updated_at = None
+        
+        # 更新报告（简化模式下评分字段均为None）
+        report.score_overall = evaluation["overall_score"]
+        report.score_security = dimension_scores.get("security")
+        report.score_license = dimension_scores.get("license")
+        report.score_maintenance = dimension_scores.get("maintenance")
+        report.score_performance = dimension_scores.get("performance")
+        report.score_tos = dimension_scores.get("tos")
+        report.is_compliant = evaluation["is_compliant"]
+        
+        report.reasons = json.dumps(evaluation["reasons"], ensure_ascii=False)
+        report.recommendations = json.dumps(evaluation["recommendations"], ensure_ascii=False)
+        report.tos_analysis = json.dumps(tos_analysis or {}, ensure_ascii=False)
+        report.references = json.dumps({}, ensure_ascii=False)
+        
+        if commit:
+            db.commit()
+            db.refresh(report)
+        else:
+            db.flush()
+        
+        if dimension_scores:
+            logger.info(f"合规报告生成完成: {tool.name} - 综合评分: {evaluation['overall_score']}")
+        else:
+            logger.info(f"合规报告生成完成: {tool.name} - 简化模式（仅TOS分析）")
+        return report
+    
+    def _get_or_create_report(self, tool: Tool, db: Session) -> ComplianceReport:
+        """获取工具的合规报告（不存在时创建），已有报告的修订号递增"""
         report = db.query(ComplianceReport).filter(
             ComplianceReport.tool_id == tool.id
         ).first()
         
         if not report:
-            report = ComplianceReport(tool_id=tool.id)
+            report = ComplianceReport(tool_id=tool.id, revision=1)
             db.add(report)
-        
-        # 更新报告
-        if enable_assessment:
-            report.score_overall = overall_score
-            report.score_security = dimension_scores.get("security")
-            report.score_license = dimension_scores.get("license")
-            report.score_maintenance = dimension_scores.get("maintenance")
-            report.score_performance = dimension_scores.get("performance")
-            report.score_tos = dimension_scores.get("tos")
-            report.is_compliant = is_compliant
         else:
-            # 简化模式：评分字段设为None
-            report.score_overall = None
-            report.score_security = None
-            report.score_license = None
-            report.score_maintenance = None
-            report.score_performance = None
-            report.score_tos = None
-            report.is_compliant = None
-        
-        report.reasons = json.dumps(reasons, ensure_ascii=False)
-        report.recommendations = json.dumps(recommendations, ensure_ascii=False)
+            report.revision = (report.revision or 1) + 1
+        return report
+    
+    def save_kb_report(
+        self,
+        tool: Tool,
+        db: Session,
+        tos_analysis: Dict[str, Any],
+        kb_updated_at: Optional[datetime] = None,
+        provisional: bool = True,
+        commit: bool = True
+    ) -> ComplianceReport:
+        """
+        由知识库信息直接生成报告（同步，不调用AI）
+        
+        报告只包含知识库中的TOS分析与替代方案，评分字段为空；
+        临时报告在后台扫描完成后由 generate_compliance_report 更新为正式报告，
+        仅知识库扫描（可信条目）生成的报告直接作为正式报告
+        
+        Args:
+            tool: 工具对象
+            db: 数据库会话
+            tos_analysis: 由知识库信息合并得到的TOS分析结果
+            kb_updated_at: 知识库条目的更新时间（内置知识库为None）
+            provisional: 是否为临时报告
+            commit: 是否立即提交；为False时只 flush（报告ID可用），由调用方（如批量写入任务）统一提交
+        
+        Returns:
+            ComplianceReport: 报告对象
+        """
+        report = self._get_or_create_report(tool, db)
+        report.provisional = provisional
+        report.kb_updated_at = kb_updated_at
+        report.stage_timings = None
+        report.score_overall = None
+        report.score_security = None
+        report.score_license = None
+        report.score_maintenance = None
+        report.score_performance = None
+        report.score_tos = None
+        report.is_compliant = None
+        report.reasons = json.dumps({"is_compliant": None, "reasons": []}, ensure_ascii=False)
+        report.recommendations = json.dumps({"recommendations": [], "alternative_tools": []}, ensure_ascii=False)
         report.tos_analysis = json.dumps(tos_analysis or {}, ensure_ascii=False)
         report.references = json.dumps({}, ensure_ascii=False)
         
-        db.commit()
-        db.refresh(report)
-        
-        if enable_assessment:
-            logger.info(f"合规报告生成完成: {tool.name} - 综合评分: {overall_score}")
+        if commit:
+            db.commit()
+            db.refresh(report)
         else:
-            logger.info(f"合规报告生成完成: {tool.name} - 简化模式（仅TOS分析）")
+            db.flush()
+        kind = "临时报告" if provisional else "报告（仅知识库）"
+        logger.info(f"已由知识库生成{kind}: {tool.name} (报告ID: {report.id}, 修订号: {report.revision})")
         return report
     
     def _generate_recommendations(
@@ -0,0 +1,132 @@
+"""
+自适应并发模块：基于 AIMD（加性增、乘性减）的扫描并发上限
+Adaptive concurrency module: AIMD limit for concurrent scans
+
+- AI 调用成功且耗时健康：每累计「当前上限」次健康调用，上限 +1（约每轮并发 +1）
+- AI 调用遇到 429 限流或超时：上限乘以 decrease_factor（冷却期内只减一次）
+- 上限始终限制在 [min_concurrent, max_concurrent] 之间
+
+信号由 AI 客户端的 _call_api 上报，上限变化通过监听器通知扫描调度器。
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from src.config import get_config, AdaptiveConcurrencyConfig
+from src.logger import get_logger
+
+logger = get_logger()
+
+
+class AIMDLimiter:
+    """AIMD 并发上限"""
+
+    def __init__(self, initial: int, config: AdaptiveConcurrencyConfig):
+        """
+        Args:
+            initial: 初始并发上限
+            config: 自适应并发配置
+        """
+        self.config = config
+        self.min_limit = max(1, config.min_concurrent)
+        self.max_limit = max(self.min_limit, config.max_concurrent)
+        self._limit = self._clamp(initial)
+        self._healthy_streak = 0
+        self._last_decrease = 0.0
+        self._listeners: List[Callable[[int], None]] = []
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"success": 0, "slow": 0, "rate_limited": 0, "timeout": 0}
+
+    def _clamp(self, value: float) -> int:
+        return int(max(self.min_limit, min(self.max_limit, value)))
+
+    @property
+    def limit(self) -> int:
+        """当前并发上限"""
+        return self._limit
+
+    def add_listener(self, listener: Callable[[int], None]) -> None:
+        """注册上限变化监听器（参数为新的上限）"""
+        self._listeners.append(listener)
+        listener(self._limit)
+
+    def _set_limit(self, value: int, reason: str) -> None:
+        # 调用方需持有锁
+        if value == self._limit:
+            return
+        logger.info(f"扫描并发上限调整: {self._limit} -> {value}（{reason}）")
+        self._limit = value
+        for listener in self._listeners:
+            try:
+                listener(value)
+            except Exception as e:
+                logger.error(f"并发上限监听器执行失败: {e}")
+
+    def on_success(self, latency: float) -> None:
+        """
+        上报一次成功的 AI 调用
+
+        Args:
+            latency: 调用耗时（秒）
+        """
+        if not self.config.enabled:
+            return
+        with self._lock:
+            if latency > self.config.latency_threshold:
+                self.counters["slow"] += 1
+                self._healthy_streak = 0
+                return
+            self.counters["success"] += 1
+            self._healthy_streak += 1
+            if self._healthy_streak >= self._limit:
+                self._healthy_streak = 0
+                self._set_limit(self._clamp(self._limit + 1), "AI 接口健康，加性增加")
+
+    def on_rate_limited(self) -> None:
+        """上报一次 429 限流"""
+        self._on_congestion("rate_limited", "AI 接口限流，乘性减少")
+
+    def on_timeout(self) -> None:
+        """上报一次 AI 调用超时"""
+        self._on_congestion("timeout", "AI 调用超时，乘性减少")
+
+    def _on_congestion(self, counter: str, reason: str) -> None:
+        if not self.config.enabled:
+            return
+        with self._lock:
+            self.counters[counter] += 1
+            self._healthy_streak = 0
+            now = time.monotonic()
+            if self._last_decrease and now - self._last_decrease < self.config.decrease_cooldown:
+                return
+            self._last_decrease = now
+            self._set_limit(self._clamp(self._limit * self.config.decrease_factor), reason)
+
+    def stats(self) -> Dict[str, Any]:
+        """并发上限指标"""
+        return {
+            "enabled": self.config.enabled,
+            "limit": self._limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "signals": dict(self.counters),
+        }
+
+
+# 全局并发上限实例
+_limiter: Optional[AIMDLimiter] = None
+
+
+def get_concurrency_limiter() -> AIMDLimiter:
+    """
+    获取自适应并发上限实例（单例模式）
+
+    Returns:
+        AIMDLimiter: 并发上限实例
+    """
+    global _limiter
+    if _limiter is None:
+        scanning = get_config().scanning
+        _limiter = AIMDLimiter(scanning.max_concurrent, scanning.adaptive_concurrency)
+    return _limiter
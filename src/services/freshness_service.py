@@ -0,0 +1,124 @@
+"""
+扫描结果新鲜度服务：判断已有合规报告是否可以直接复用
+Scan freshness service: decides whether an existing compliance report can be reused
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy.orm import Session
+from src.models import Tool, ComplianceReport
+from src.config import FreshnessConfig, KnowledgeBaseOnlyConfig
+from src.services.tool_knowledge_base import get_tool_kb_entry
+
+
+def db_now() -> datetime:
+    """
+    获取与数据库时间戳可比较的当前时间
+
+    模型的 created_at/updated_at 由 func.now() 生成，SQLite 中为 UTC 时间
+    """
+    return datetime.utcnow()
+
+
+def get_ttl(tool: Tool, freshness: FreshnessConfig) -> timedelta:
+    """
+    获取工具报告的有效期
+
+    Args:
+        tool: 工具对象
+        freshness: 新鲜度配置
+
+    Returns:
+        timedelta: 有效期（按工具来源覆盖默认值）
+    """
+    hours = freshness.ttl_hours_by_source.get(tool.source, freshness.default_ttl_hours)
+    return timedelta(hours=max(0, hours))
+
+
+def get_latest_report(db: Session, tool_id: int) -> Optional[ComplianceReport]:
+    """
+    获取工具最新的合规报告
+
+    Args:
+        db: 数据库会话
+        tool_id: 工具ID
+
+    Returns:
+        Optional[ComplianceReport]: 最新报告，不存在返回None
+    """
+    return db.query(ComplianceReport).filter(
+        ComplianceReport.tool_id == tool_id
+    ).order_by(ComplianceReport.updated_at.desc(), ComplianceReport.id.desc()).first()
+
+
+def get_fresh_report(
+    db: Session,
+    tool: Tool,
+    freshness: FreshnessConfig,
+    now: Optional[datetime] = None
+) -> Optional[ComplianceReport]:
+    """
+    获取仍在有效期内的合规报告
+
+    只有在工具已有 TOS 分析快照（Tool.tos_info）且最新报告未过期时才视为新鲜，
+    避免把 AI 分析失败后仅含知识库降级数据的报告当作完整结果复用
+
+    Args:
+        db: 数据库会话
+        tool: 工具对象
+        freshness: 新鲜度配置
+        now: 当前时间（默认 db_now()）
+
+    Returns:
+        Optional[ComplianceReport]: 可复用的报告，没有则返回None
+    """
+    if not freshness.enabled or not tool.tos_info:
+        return None
+
+    ttl = get_ttl(tool, freshness)
+    if ttl.total_seconds() <= 0:
+        return None
+
+    report = get_latest_report(db, tool.id)
+    if not report or report.provisional or report.needs_enrichment:
+        # 知识库生成的临时报告、离线模式生成的待补全报告不视为完整结果
+        return None
+
+    generated_at = report.updated_at or report.created_at
+    if generated_at is None or generated_at < (now or db_now()) - ttl:
+        return None
+    return report
+
+
+def get_trusted_kb_entry(
+    db: Session,
+    tool: Tool,
+    policy: KnowledgeBaseOnlyConfig,
+    now: Optional[datetime] = None
+) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    获取可直接用于生成报告的可信知识库条目
+
+    只有数据库知识库中来源可信（默认 source = user）且在有效天数内更新过的条目才满足条件，
+    内置知识库没有更新时间，不参与仅知识库扫描
+
+    Args:
+        db: 数据库会话
+        tool: 工具对象
+        policy: 仅知识库扫描策略
+        now: 当前时间（默认 db_now()）
+
+    Returns:
+        Optional[Tuple[Dict[str, Any], Dict[str, Any]]]: (工具基本信息, 元数据)，不满足条件返回None
+    """
+    entry = get_tool_kb_entry(tool.name, db)
+    if entry is None:
+        return None
+    _, meta = entry
+    if meta["source"] not in policy.trusted_sources or not meta["updated_at"]:
+        return None
+    if policy.max_age_days > 0:
+        updated_at = datetime.fromisoformat(meta["updated_at"])
+        if updated_at < (now or db_now()) - timedelta(days=policy.max_age_days):
+            return None
+    return entry
@@ -0,0 +1,233 @@
+"""
+幂等提交服务：按 Idempotency-Key 保存提交接口的首次成功响应，重复提交直接重放
+Idempotency service: stores the first successful response per Idempotency-Key and replays it for retries
+
+- 记录按（客户端、接口、Key）区分，不同 API Key 的客户端使用相同的 Key 互不影响
+- 同时保存请求内容哈希，同一 Key 用于不同的请求内容时拒绝（避免误用 Key 丢失提交）
+- 只保存成功响应；失败（如 429、404）的请求可用同一 Key 重试
+- 首次请求处理期间在进程内保留该 Key：并发的重复请求等待首次请求结束后重放其响应，等待超时返回 409
+- 记录在 ttl_hours 后过期，保存新记录时顺带清理过期记录
+"""
+
+import hashlib
+import json
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from src.config import IdempotencyConfig
+from src.logger import get_logger
+from src.models import IdempotencyRecord
+from src.services.freshness_service import db_now
+
+logger = get_logger()
+
+# 重放的响应附带的响应头
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+class IdempotencyKeyError(Exception):
+    """Idempotency-Key 无效"""
+
+
+class IdempotencyConflict(IdempotencyKeyError):
+    """Idempotency-Key 已用于内容不同的请求"""
+
+
+class IdempotencyInProgress(IdempotencyKeyError):
+    """同一 Idempotency-Key 的首次请求仍在处理中"""
+
+
+def request_fingerprint(payload: Any) -> str:
+    """
+    计算请求内容哈希
+
+    Args:
+        payload: 请求内容（可 JSON 序列化）
+
+    Returns:
+        str: 十六进制 sha256
+    """
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def check_key(config: IdempotencyConfig, key: str) -> str:
+    """
+    校验并规范化 Idempotency-Key（去除首尾空白）
+
+    Args:
+        config: 幂等提交配置
+        key: 请求头 Idempotency-Key
+
+    Returns:
+        str: 规范化后的 Key
+
+    Raises:
+        IdempotencyKeyError: Key 为空或过长
+    """
+    key = key.strip()
+    if not key:
+        raise IdempotencyKeyError("Idempotency-Key 不能为空")
+    if len(key) > config.max_key_length:
+        raise IdempotencyKeyError(f"Idempotency-Key 长度不能超过 {config.max_key_length}")
+    return key
+
+
+def find_response(
+    db: Session,
+    config: IdempotencyConfig,
+    client: str,
+    endpoint: str,
+    key: Optional[str],
+    fingerprint: str,
+    now: Optional[datetime] = None,
+) -> Optional[IdempotencyRecord]:
+    """
+    查找可重放的首次响应
+
+    Args:
+        db: 数据库会话
+        config: 幂等提交配置
+        client: 客户端标识
+        endpoint: 接口标识
+        key: 请求头 Idempotency-Key（未提供时不做幂等处理）
+        fingerprint: 请求内容哈希
+        now: 当前时间（数据库时间，默认 db_now()）
+
+    Returns:
+        Optional[IdempotencyRecord]: 未过期的首次响应记录，没有时为None
+
+    Raises:
+        IdempotencyKeyError: Key 为空或过长
+        IdempotencyConflict: Key 已用于内容不同的请求
+    """
+    if not config.enabled or key is None:
+        return None
+    key = check_key(config, key)
+    now = now or db_now()
+    record = db.query(IdempotencyRecord).filter(
+        IdempotencyRecord.client == client,
+        IdempotencyRecord.endpoint == endpoint,
+        IdempotencyRecord.key == key,
+        IdempotencyRecord.expires_at > now,
+    ).first()
+    if record is None:
+        return None
+    if record.request_hash != fingerprint:
+        raise IdempotencyConflict("Idempotency-Key 已用于内容不同的请求，请更换 Key")
+    logger.info(f"重放幂等请求: {endpoint} (Key: {key})")
+    return record
+
+
+def save_response(
+    db: Session,
+    config: IdempotencyConfig,
+    client: str,
+    endpoint: str,
+    key: Optional[str],
+    fingerprint: str,
+    status_code: int,
+    response: Dict[str, Any],
+    now: Optional[datetime] = None,
+) -> None:
+    """
+    保存首次成功响应（并清理过期记录）
+
+    并发的重复请求已先保存时保留先保存的记录
+
+    Args:
+        db: 数据库会话
+        config: 幂等提交配置
+        client: 客户端标识
+        endpoint: 接口标识
+        key: 请求头 Idempotency-Key（未提供时不保存）
+        fingerprint: 请求内容哈希
+        status_code: 响应状态码
+        response: 响应内容（可 JSON 序列化）
+        now: 当前时间（数据库时间，默认 db_now()）
+    """
+    if not config.enabled or key is None:
+        return
+    key = check_key(config, key)
+    now = now or db_now()
+    try:
+        db.query(IdempotencyRecord).filter(IdempotencyRecord.expires_at <= now).delete(synchronize_session=False)
+        db.add(IdempotencyRecord(
+            client=client,
+            endpoint=endpoint,
+            key=key,
+            request_hash=fingerprint,
+            status_code=status_code,
+            response=response,
+            created_at=now,
+            expires_at=now + timedelta(hours=config.ttl_hours),
+        ))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        logger.warning(f"幂等请求记录已存在: {endpoint} (Key: {key})")
+
+
+class InFlightKeys:
+    """进程内正在处理的 Idempotency-Key（首次请求处理完成前，同一 Key 的重复请求等待其结束）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str, str], Tuple[str, threading.Event]] = {}
+
+    def reserve(self, client: str, endpoint: str, key: str, fingerprint: str) -> Optional[threading.Event]:
+        """
+        保留 Key
+
+        Args:
+            client: 客户端标识
+            endpoint: 接口标识
+            key: 规范化后的 Idempotency-Key
+            fingerprint: 请求内容哈希
+
+        Returns:
+            Optional[threading.Event]: 保留成功时为None；Key 已被保留时为首次请求结束时触发的事件
+
+        Raises:
+            IdempotencyConflict: 处理中的首次请求内容不同
+        """
+        with self._lock:
+            entry = self._entries.get((client, endpoint, key))
+            if entry is None:
+                self._entries[(client, endpoint, key)] = (fingerprint, threading.Event())
+                return None
+        if entry[0] != fingerprint:
+            raise IdempotencyConflict("Idempotency-Key 已用于内容不同的请求，请更换 Key")
+        return entry[1]
+
+    def release(self, client: str, endpoint: str, key: str) -> None:
+        """首次请求结束（成功或失败）：释放 Key 并唤醒等待的重复请求"""
+        with self._lock:
+            entry = self._entries.pop((client, endpoint, key), None)
+        if entry is not None:
+            entry[1].set()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# 全局处理中 Key 实例
+_in_flight_keys: Optional[InFlightKeys] = None
+
+
+def get_in_flight_keys() -> InFlightKeys:
+    """
+    获取处理中的 Idempotency-Key 集合（单例模式）
+
+    Returns:
+        InFlightKeys: 处理中的 Key
+    """
+    global _in_flight_keys
+    if _in_flight_keys is None:
+        _in_flight_keys = InFlightKeys()
+    return _in_flight_keys
@@ -0,0 +1,295 @@
+"""
+离线模式服务：AI 服务熔断与离线报告的自动补全
+Offline mode service: provider circuit breaker and deferred AI enrichment of offline reports
+
+- 连续多次 AI 调用失败（5xx、超时、网络错误）后熔断，进入离线模式；也可手动进入或退出
+- 离线模式下扫描不调用 AI，只使用知识库、已缓存的分析结果与检查点立即完成，报告标记为待补全（needs_enrichment）
+- 熔断 open_seconds 秒后只放行一个试探请求，试探结束前其余调用方仍按离线处理；调用成功即恢复在线，
+  失败则重新熔断；补全任务本身也起到试探作用
+- 恢复在线后，后台线程按间隔以后台优先级重新扫描待补全的工具；离线时已完成（包括使用缓存结果）的阶段保存在检查点中，
+  只重新执行离线时跳过的 AI 阶段
+"""
+
+import threading
+import time
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from src.config import OfflineConfig, get_config
+from src.logger import get_logger
+from src.models import ComplianceReport
+from src.services.scan_scheduler import ScanPriority
+
+logger = get_logger()
+
+
+class CircuitState(str, Enum):
+    """熔断器状态"""
+    CLOSED = "closed"  # 在线
+    OPEN = "open"  # 熔断（离线）
+    HALF_OPEN = "half_open"  # 熔断时间已过，放行一个请求试探
+
+
+class ProviderCircuit:
+    """AI 服务熔断器"""
+
+    def __init__(self, config: OfflineConfig):
+        """
+        Args:
+            config: 离线模式配置
+        """
+        self.config = config
+        self.manual = config.manual
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None  # 试探请求的放行时间（没有进行中的试探时为None）
+        self._lock = threading.Lock()
+        self.trips = 0  # 熔断次数
+
+    @property
+    def state(self) -> CircuitState:
+        """熔断器状态（熔断时间已过时为 half_open）"""
+        if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.config.open_seconds:
+            return CircuitState.HALF_OPEN
+        return self._state
+
+    def _probing(self, now: float) -> bool:
+        # 试探请求超过 probe_timeout_seconds 仍未上报结果（如未实际调用 AI）时，允许放行新的试探
+        return self._probe_started is not None and now - self._probe_started < self.config.probe_timeout_seconds
+
+    @property
+    def is_offline(self) -> bool:
+        """是否处于离线模式（手动进入、熔断中，或熔断时间已过但试探请求尚未返回）"""
+        if not self.config.enabled:
+            return False
+        if self.manual:
+            return True
+        state = self.state
+        if state == CircuitState.HALF_OPEN:
+            return self._probing(time.monotonic())
+        return state == CircuitState.OPEN
+
+    def allow_request(self) -> bool:
+        """
+        即将调用 AI 前检查是否放行（half_open 时只放行一个试探请求）
+
+        Returns:
+            bool: 是否可以调用 AI（False 时调用方按离线处理）
+        """
+        if not self.config.enabled:
+            return True
+        if self.manual:
+            return False
+        with self._lock:
+            state = self.state
+            if state != CircuitState.HALF_OPEN:
+                return state == CircuitState.CLOSED
+            now = time.monotonic()
+            if self._probing(now):
+                return False
+            self._probe_started = now
+            logger.info("熔断时间已过，放行一个请求试探 AI 服务")
+            return True
+
+    def set_manual(self, offline: bool) -> None:
+        """
+        手动进入或退出离线模式（退出时同时重置熔断器）
+
+        Args:
+            offline: 是否进入离线模式
+        """
+        with self._lock:
+            self.manual = offline
+            if not offline:
+                self._state = CircuitState.CLOSED
+                self._failures = 0
+                self._probe_started = None
+        logger.info(f"离线模式已手动{'进入' if offline else '退出'}")
+
+    def on_success(self) -> None:
+        """上报一次成功的 AI 调用"""
+        with self._lock:
+            self._failures = 0
+            self._probe_started = None
+            if self._state != CircuitState.CLOSED:
+                self._state = CircuitState.CLOSED
+                logger.info("AI 服务已恢复，退出离线模式")
+
+    def on_failure(self) -> None:
+        """上报一次 AI 服务不可用（重试后仍失败的 5xx、超时或网络错误）"""
+        if not self.config.enabled:
+            return
+        with self._lock:
+            self._failures += 1
+            # 试探失败时重新熔断；在线时连续失败达到阈值后熔断
+            if self.state == CircuitState.HALF_OPEN or (
+                self._state == CircuitState.CLOSED and self._failures >= self.config.failure_threshold
+            ):
+                self._state = CircuitState.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_started = None
+                self.trips += 1
+                logger.warning(f"AI 服务连续 {self._failures} 次调用失败，熔断并进入离线模式（{self.config.open_seconds} 秒后试探）")
+
+    def stats(self) -> Dict[str, Any]:
+        """熔断器状态"""
+        return {
+            "enabled": self.config.enabled,
+            "offline": self.is_offline,
+            "manual": self.manual,
+            "state": self.state.value,
+            "probing": self.state == CircuitState.HALF_OPEN and self._probing(time.monotonic()),
+            "consecutive_failures": self._failures,
+            "trips": self.trips,
+        }
+
+
+def find_reports_needing_enrichment(db: Session, limit: int, exclude: List[int]) -> List[ComplianceReport]:
+    """
+    查找待补全的离线报告（最早生成的在前）
+
+    Args:
+        db: 数据库会话
+        limit: 最多返回的记录数
+        exclude: 需要跳过的工具ID（如正在扫描中的工具）
+
+    Returns:
+        List[ComplianceReport]: 报告
+    """
+    if limit <= 0:
+        return []
+    query = db.query(ComplianceReport).filter(ComplianceReport.needs_enrichment.is_(True))
+    if exclude:
+        query = query.filter(ComplianceReport.tool_id.notin_(exclude))
+    return query.order_by(ComplianceReport.updated_at, ComplianceReport.id).limit(limit).all()
+
+
+class EnrichmentReconciler:
+    """离线报告补全器（在后台线程中按间隔提交待补全的工具）"""
+
+    def __init__(
+        self,
+        config: OfflineConfig,
+        scan_service: Any,
+        circuit: ProviderCircuit,
+        session_factory: Optional[Callable[[], Session]] = None,
+    ):
+        """
+        Args:
+            config: 离线模式配置
+            scan_service: 扫描服务
+            circuit: AI 服务熔断器
+            session_factory: 数据库会话工厂（默认使用全局会话工厂）
+        """
+        self.config = config
+        self.scan_service = scan_service
+        self.circuit = circuit
+        self._session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_tick: Optional[datetime] = None
+        self.submitted_total = 0
+
+    def _new_session(self) -> Session:
+        if self._session_factory is None:
+            from src.database import get_session
+            self._session_factory = get_session()
+        return self._session_factory()
+
+    def tick(self) -> int:
+        """
+        执行一次检查：在线时以后台优先级重新扫描待补全的工具
+        （不强制刷新、不使用仅知识库扫描：待补全的报告不视为有效期内的报告，检查点中已完成的阶段直接复用）
+
+        Returns:
+            int: 本次提交的工具数
+        """
+        self.last_tick = datetime.now()
+        if self.circuit.is_offline:
+            return 0
+        busy = [task.tool_id for task in self.scan_service.registry.active() if not task.is_terminal]
+        db = self._new_session()
+        try:
+            tool_ids = [
+                report.tool_id for report in find_reports_needing_enrichment(db, self.config.reconcile_batch_size, busy)
+            ]
+            if not tool_ids:
+                return 0
+            batch = self.scan_service.create_batch(ScanPriority.BACKGROUND)
+            tasks = self.scan_service.extend_batch(batch, tool_ids, db, kb_only=False)
+            logger.info(f"已提交离线报告补全扫描: {len(tasks)} 个工具（批次 {batch.batch_id}）")
+        except Exception as e:
+            logger.error(f"提交离线报告补全扫描失败: {e}")
+            return 0
+        finally:
+            db.close()
+        self.submitted_total += len(tasks)
+        return len(tasks)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"离线报告补全检查异常: {e}")
+            self._stop.wait(self.config.reconcile_interval_seconds)
+
+    def start(self) -> None:
+        """启动后台检查线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="enrichment-reconciler", daemon=True)
+        self._thread.start()
+        logger.info("离线报告补全器已启动")
+
+    def stop(self) -> None:
+        """停止后台检查线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        """补全器状态"""
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "last_tick": self.last_tick.isoformat() if self.last_tick else None,
+            "submitted_total": self.submitted_total,
+        }
+
+
+# 全局熔断器与补全器实例
+_circuit: Optional[ProviderCircuit] = None
+_reconciler: Optional[EnrichmentReconciler] = None
+
+
+def get_provider_circuit() -> ProviderCircuit:
+    """
+    获取 AI 服务熔断器实例（单例模式）
+
+    Returns:
+        ProviderCircuit: 熔断器实例
+    """
+    global _circuit
+    if _circuit is None:
+        _circuit = ProviderCircuit(get_config().scanning.offline)
+    return _circuit
+
+
+def get_enrichment_reconciler() -> EnrichmentReconciler:
+    """
+    获取离线报告补全器实例（单例模式）
+
+    Returns:
+        EnrichmentReconciler: 补全器实例
+    """
+    global _reconciler
+    if _reconciler is None:
+        from src.services.scan_service import get_scan_service
+        _reconciler = EnrichmentReconciler(get_config().scanning.offline, get_scan_service(), get_provider_circuit())
+    return _reconciler
@@ -0,0 +1,287 @@
+"""
+负载轨迹回放服务：按 N 倍速将记录的扫描负载重新提交给模拟 AI 服务，评估不同调度配置下的容量
+Trace replay service: re-drives a recorded workload against a mock AI provider at N× speed
+
+- 使用实际的扫描调度器（加权公平队列、交互式保留槽位）、流水线阶段依赖、自适应并发与资源隔离
+- 各阶段按轨迹中的耗时等待；调用 AI 的阶段向模拟 AI 服务发起请求，
+  模拟服务同时处理的请求数超过容量时返回 429，按 scanning.retry 退避重试（与 GLM 客户端一致）
+- 所有等待按倍速缩短，结果中的时间均已换算回轨迹时间（秒）
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from src.config import ScanningConfig
+from src.logger import get_logger
+from src.services.ai_client import RETRY_BASE_DELAY
+from src.services.bulkhead import Bulkhead
+from src.services.concurrency_limiter import AIMDLimiter
+from src.services.scan_pipeline import PipelineStage, PipelineStageError, ScanPipeline, StageStatus
+from src.services.scan_scheduler import ScanPriority, ScanScheduler
+from src.services.stage_stats_service import percentile
+
+logger = get_logger()
+
+# 调用 AI 接口的扫描阶段（其余阶段按轨迹耗时等待）
+AI_STAGES = frozenset({"tos_url", "tos_analysis", "alternatives"})
+
+
+class RateLimited(Exception):
+    """模拟 AI 服务返回 429"""
+
+
+class MockProvider:
+    """模拟 AI 服务：同时处理的请求数超过容量时立即返回 429"""
+
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity: 同时处理的请求数上限
+        """
+        self.capacity = max(1, capacity)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.calls = 0
+        self.rate_limited = 0
+
+    async def call(self, seconds: float) -> None:
+        """
+        处理一次请求
+
+        Args:
+            seconds: 请求处理时间（已按倍速换算）
+
+        Raises:
+            RateLimited: 同时处理的请求数已达容量
+        """
+        self.calls += 1
+        if self.in_flight >= self.capacity:
+            self.rate_limited += 1
+            raise RateLimited("模拟 AI 服务限流（429）")
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """模拟 AI 服务指标"""
+        return {
+            "capacity": self.capacity,
+            "calls": self.calls,
+            "rate_limited": self.rate_limited,
+            "peak_in_flight": self.peak_in_flight,
+        }
+
+
+class _ReplayScan:
+    """回放中的单个扫描"""
+
+    __slots__ = ("entry", "stages", "submitted", "started", "finished", "status", "degraded")
+
+    def __init__(self, entry: Dict[str, Any]):
+        self.entry = entry
+        self.stages = {stage["name"]: stage for stage in entry.get("stages") or []}
+        self.submitted: Optional[float] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.status: Optional[str] = None
+        self.degraded = False  # AI 阶段重试用尽（扫描以降级结果完成或失败）
+
+
+def _summary(values: List[float]) -> Dict[str, Optional[float]]:
+    """耗时汇总（秒）"""
+    if not values:
+        return {"avg": None, "p50": None, "p95": None, "max": None}
+    return {
+        "avg": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "max": round(max(values), 3),
+    }
+
+
+class TraceReplay:
+    """按倍速回放负载轨迹"""
+
+    def __init__(self, entries: List[Dict[str, Any]], scanning: ScanningConfig, speed: float = 10.0,
+                 provider_capacity: int = 5):
+        """
+        Args:
+            entries: 轨迹记录（按提交时间排序，见 trace_service.load_trace）
+            scanning: 回放使用的扫描配置（并发上限、调度权重、自适应并发、资源隔离与重试）
+            speed: 回放倍速
+            provider_capacity: 模拟 AI 服务同时处理的请求数上限
+        """
+        from src.services.scan_service import build_scan_pipeline
+
+        self.entries = entries
+        self.scanning = scanning
+        self.speed = max(speed, 1e-6)
+        self.provider = MockProvider(provider_capacity)
+        self.exhausted = 0  # 重试用尽的 AI 请求数
+        self._remaining = 0
+        self._done: Optional[asyncio.Event] = None
+
+        # 沿用实际流水线的阶段依赖关系，阶段本身替换为按轨迹耗时回放
+        self.pipeline = ScanPipeline([
+            PipelineStage(stage.name, self._stage(stage.name), inputs=stage.inputs, required=stage.required)
+            for stage in build_scan_pipeline(scanning).stages.values()
+        ])
+
+        # 与 ScanService 相同的并发控制：启用资源隔离时扫描数受 max_in_flight_scans 约束、AI 请求受 llm 资源池约束
+        bulkheads = scanning.bulkheads
+        scan_slots = bulkheads.max_in_flight_scans if bulkheads.enabled else scanning.max_concurrent
+        self.llm_pool = Bulkhead("llm", max(1, bulkheads.llm or scanning.max_concurrent) if bulkheads.enabled else None)
+        self.scheduler = ScanScheduler(
+            runner=self._run_scan,
+            max_concurrent=scan_slots,
+            weights=scanning.scheduler.weights,
+            interactive_reserved_slots=scanning.scheduler.interactive_reserved_slots,
+        )
+        # 冷却时间按倍速缩短；上报的耗时已换算回轨迹时间，latency_threshold 不变
+        adaptive = scanning.adaptive_concurrency.model_copy(
+            update={"decrease_cooldown": scanning.adaptive_concurrency.decrease_cooldown / self.speed}
+        )
+        self.limiter = AIMDLimiter(scanning.max_concurrent, adaptive)
+        if adaptive.enabled:
+            self.limiter.add_listener(self.llm_pool.set_limit if bulkheads.enabled else self.scheduler.set_max_concurrent)
+
+    def _stage(self, name: str):
+        """按轨迹回放单个阶段"""
+        async def run(context: Dict[str, Any], inputs: Dict[str, Any]) -> Any:
+            record = context["stages"].get(name)
+            if record is None:
+                # 原扫描未执行到该阶段
+                return None
+            duration = record.get("duration") or 0.0
+            attempts = record.get("attempts") or 0
+            if name in AI_STAGES and attempts and not record.get("hit"):
+                # 轨迹中的耗时包含重试与退避，按单次请求平均估算处理时间
+                try:
+                    await self._call_provider(duration / attempts)
+                except RateLimited:
+                    context["scan"].degraded = True
+                    raise
+            else:
+                await asyncio.sleep(duration / self.speed)
+            if record.get("status") != StageStatus.SUCCEEDED.value:
+                raise RuntimeError(f"轨迹中该阶段未成功: {record.get('status')}")
+            return True
+        return run
+
+    async def _call_provider(self, seconds: float) -> None:
+        """向模拟 AI 服务发起请求（429 时按 scanning.retry 退避重试，信号上报给自适应并发上限）"""
+        retry = self.scanning.retry
+        loop = asyncio.get_running_loop()
+        for attempt in range(retry.max_attempts):
+            try:
+                async with self.llm_pool:
+                    started = loop.time()
+                    await self.provider.call(seconds / self.speed)
+                self.limiter.on_success((loop.time() - started) * self.speed)
+                return
+            except RateLimited:
+                self.limiter.on_rate_limited()
+                if attempt < retry.max_attempts - 1:
+                    await asyncio.sleep(RETRY_BASE_DELAY * (retry.backoff_factor ** attempt) / self.speed)
+        self.exhausted += 1
+        raise RateLimited(f"模拟 AI 服务限流，已重试 {retry.max_attempts} 次")
+
+    async def _run_scan(self, scan: _ReplayScan) -> None:
+        """调度器分配槽位后回放一个扫描"""
+        loop = asyncio.get_running_loop()
+        scan.started = loop.time()
+        try:
+            await self.pipeline.run({"stages": scan.stages, "scan": scan})
+            scan.status = "completed"
+        except PipelineStageError:
+            scan.status = "failed"
+        finally:
+            scan.finished = loop.time()
+            self._remaining -= 1
+            if self._remaining <= 0:
+                self._done.set()
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        回放全部轨迹记录并等待所有扫描结束
+
+        Returns:
+            Dict[str, Any]: 回放结果（吞吐量、排队时间、429 次数等，时间单位为轨迹时间的秒）
+        """
+        loop = asyncio.get_running_loop()
+        self.scheduler.attach(loop)
+        scans = [_ReplayScan(entry) for entry in self.entries]
+        self._remaining = len(scans)
+        self._done = asyncio.Event()
+        started = loop.time()
+        if scans:
+            origin = scans[0].entry["submitted_at"]
+            for scan in scans:
+                delay = started + (scan.entry["submitted_at"] - origin) / self.speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                scan.submitted = loop.time()
+                try:
+                    priority = ScanPriority(scan.entry.get("priority"))
+                except ValueError:
+                    priority = ScanPriority.BATCH
+                self.scheduler.submit(scan, priority)
+            await self._done.wait()
+        return self._report(scans, started)
+
+    def _report(self, scans: List[_ReplayScan], started: float) -> Dict[str, Any]:
+        """汇总回放结果"""
+        speed = self.speed
+        elapsed = (max(scan.finished for scan in scans) - started) * speed if scans else 0.0
+        queue_delays: Dict[str, List[float]] = {}
+        for scan in scans:
+            queue_delays.setdefault(scan.entry.get("priority") or ScanPriority.BATCH.value, []).append(
+                (scan.started - scan.submitted) * speed
+            )
+        bulkheads = self.scanning.bulkheads
+        return {
+            "settings": {
+                "speed": speed,
+                "max_concurrent": self.scanning.max_concurrent,
+                "max_in_flight_scans": bulkheads.max_in_flight_scans if bulkheads.enabled else None,
+                "interactive_reserved_slots": self.scanning.scheduler.interactive_reserved_slots,
+                "adaptive_concurrency": self.scanning.adaptive_concurrency.enabled,
+                "retry_max_attempts": self.scanning.retry.max_attempts,
+                "retry_backoff_factor": self.scanning.retry.backoff_factor,
+                "provider_capacity": self.provider.capacity,
+            },
+            "scans": len(scans),
+            "completed": sum(1 for scan in scans if scan.status == "completed"),
+            "failed": sum(1 for scan in scans if scan.status == "failed"),
+            "degraded": sum(1 for scan in scans if scan.degraded),
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_per_minute": round(len(scans) / elapsed * 60, 3) if elapsed else None,
+            "queue_delay": _summary([delay for delays in queue_delays.values() for delay in delays]),
+            "queue_delay_by_priority": {priority: _summary(delays) for priority, delays in queue_delays.items()},
+            "recorded_queue_delay": _summary(
+                [scan.entry["queue_wait"] for scan in scans if scan.entry.get("queue_wait") is not None]
+            ),
+            "scan_seconds": _summary([(scan.finished - scan.started) * speed for scan in scans]),
+            "provider": {**self.provider.stats(), "exhausted": self.exhausted},
+            "concurrency": self.limiter.stats(),
+        }
+
+
+async def replay_trace(entries: List[Dict[str, Any]], scanning: ScanningConfig, speed: float = 10.0,
+                       provider_capacity: int = 5) -> Dict[str, Any]:
+    """
+    按倍速回放负载轨迹
+
+    Args:
+        entries: 轨迹记录
+        scanning: 回放使用的扫描配置
+        speed: 回放倍速
+        provider_capacity: 模拟 AI 服务同时处理的请求数上限
+
+    Returns:
+        Dict[str, Any]: 回放结果
+    """
+    return await TraceReplay(entries, scanning, speed, provider_capacity).run()
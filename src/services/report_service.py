@@ -171,7 +171,13 @@ class ReportService:
             },
             "metadata": {
                 "generated_at": report.created_at.isoformat() if hasattr(report, 'created_at') else None,
-                "report_version": "1.0"
+                "report_version": "1.0",
+                # 两阶段扫描：临时报告由知识库生成，AI 分析完成后修订号递增
+                "provisional": bool(report.provisional),
+                "revision": report.revision or 1,
+                "kb_updated_at": report.kb_updated_at.isoformat() if report.kb_updated_at else None,
+                # 生成该报告的扫描各阶段耗时、外部请求次数与缓存命中情况
+                "stage_timings": report.stage_timings or []
             },
             # 知识库更新信息
             "knowledge_base_update": self._prepare_kb_update_info(tool, tos_analysis, db)
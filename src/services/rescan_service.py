@@ -0,0 +1,235 @@
+"""
+定期重扫服务：在配置的低峰时间窗口内，按配额分散地重扫报告过旧的工具
+Rescan service: periodically rescans tools with stale reports, spread across off-peak windows
+
+- 只在低峰窗口内提交重扫，窗口外不产生任何 AI 调用
+- 每个窗口有提交配额，并按窗口已过去的比例逐步释放配额，避免窗口开始时集中提交
+- 检查间隔带随机抖动，多个实例不会在同一时刻同时提交
+- 重扫任务使用后台（background）优先级，不会挤占交互式扫描
+"""
+
+import math
+import random
+import threading
+from datetime import datetime, timedelta, time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from src.config import RescanConfig, RescanWindowConfig, get_config
+from src.logger import get_logger
+from src.models import ComplianceReport
+from src.services.freshness_service import db_now
+from src.services.scan_scheduler import ScanPriority
+
+logger = get_logger()
+
+
+def _parse_time(value: str) -> time:
+    return datetime.strptime(value, "%H:%M").time()
+
+
+def window_bounds(window: RescanWindowConfig, now: datetime) -> Optional[Tuple[datetime, datetime]]:
+    """
+    计算当前时间所在的窗口区间
+
+    Args:
+        window: 窗口配置
+        now: 当前时间（服务器本地时间）
+
+    Returns:
+        Optional[Tuple[datetime, datetime]]: (窗口开始, 窗口结束)，当前不在窗口内返回None
+    """
+    start_t, end_t = _parse_time(window.start), _parse_time(window.end)
+    # 跨越午夜的窗口可能从前一天开始
+    for offset in (0, -1):
+        start = datetime.combine(now.date() + timedelta(days=offset), start_t)
+        end = datetime.combine(start.date(), end_t)
+        if end <= start:
+            end += timedelta(days=1)
+        if start <= now < end:
+            return start, end
+    return None
+
+
+def find_stale_tool_ids(db: Session, cutoff: datetime, limit: int, exclude: Set[int]) -> List[int]:
+    """
+    查找最新报告早于截止时间的工具（最旧的在前）
+
+    Args:
+        db: 数据库会话
+        cutoff: 截止时间（与数据库时间戳可比较）
+        limit: 最多返回的工具数
+        exclude: 需要跳过的工具ID（如正在扫描中的工具）
+
+    Returns:
+        List[int]: 工具ID列表
+    """
+    if limit <= 0:
+        return []
+    latest = func.max(func.coalesce(ComplianceReport.updated_at, ComplianceReport.created_at))
+    rows = db.query(ComplianceReport.tool_id, latest.label("latest")).group_by(
+        ComplianceReport.tool_id
+    ).having(latest < cutoff).order_by(latest).limit(limit + len(exclude)).all()
+    return [tool_id for tool_id, _ in rows if tool_id not in exclude][:limit]
+
+
+class RescanScheduler:
+    """定期重扫调度器（在后台线程中按检查间隔运行）"""
+
+    def __init__(
+        self,
+        config: RescanConfig,
+        scan_service: Any,
+        session_factory: Optional[Callable[[], Session]] = None,
+    ):
+        """
+        Args:
+            config: 定期重扫配置
+            scan_service: 扫描服务
+            session_factory: 数据库会话工厂（默认使用全局会话工厂）
+        """
+        self.config = config
+        self.scan_service = scan_service
+        self._session_factory = session_factory
+        self._used: Dict[Tuple[int, str], int] = {}  # (窗口序号, 窗口开始时间) -> 已提交数
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_tick: Optional[datetime] = None
+        self.submitted_total = 0
+
+    def _new_session(self) -> Session:
+        if self._session_factory is None:
+            from src.database import get_session
+            self._session_factory = get_session()
+        return self._session_factory()
+
+    # ---------- 配额 ----------
+
+    def current_window(self, now: datetime) -> Optional[Tuple[int, datetime, datetime]]:
+        """当前所在的窗口：(窗口序号, 开始, 结束)，不在任何窗口内返回None"""
+        for index, window in enumerate(self.config.windows):
+            bounds = window_bounds(window, now)
+            if bounds:
+                return index, bounds[0], bounds[1]
+        return None
+
+    def allowance(self, now: datetime) -> int:
+        """
+        当前可提交的重扫数量
+
+        配额按窗口已过去的比例逐步释放（提前释放一个检查间隔的份额，保证窗口结束前能用完），
+        减去本窗口已提交的数量
+        """
+        current = self.current_window(now)
+        if current is None:
+            return 0
+        index, start, end = current
+        quota = self.config.windows[index].quota
+        span = (end - start).total_seconds()
+        elapsed = (now - start).total_seconds() + self.config.check_interval_seconds
+        target = math.ceil(quota * min(1.0, elapsed / span))
+        return max(0, target - self._used.get((index, start.isoformat()), 0))
+
+    def _record(self, now: datetime, count: int) -> None:
+        index, start, _ = self.current_window(now)
+        key = (index, start.isoformat())
+        self._used[key] = self._used.get(key, 0) + count
+        # 只保留最近两天内开始的窗口的计数
+        expire_before = (now - timedelta(days=2)).isoformat()
+        self._used = {k: v for k, v in self._used.items() if k[1] >= expire_before}
+
+    # ---------- 执行 ----------
+
+    def tick(self, now: Optional[datetime] = None) -> int:
+        """
+        执行一次检查：在配额内提交报告过旧的工具
+
+        Args:
+            now: 当前时间（服务器本地时间，默认 datetime.now()）
+
+        Returns:
+            int: 本次提交的重扫工具数
+        """
+        now = now or datetime.now()
+        self.last_tick = now
+        allowed = self.allowance(now)
+        if allowed <= 0:
+            return 0
+
+        busy = {task.tool_id for task in self.scan_service.registry.active() if not task.is_terminal}
+        cutoff = db_now() - timedelta(hours=self.config.stale_after_hours)
+        db = self._new_session()
+        try:
+            tool_ids = find_stale_tool_ids(db, cutoff, allowed, busy)
+            if not tool_ids:
+                return 0
+            batch = self.scan_service.create_batch(ScanPriority.BACKGROUND)
+            tasks = self.scan_service.extend_batch(batch, tool_ids, db, force_refresh=True)
+        except Exception as e:
+            logger.error(f"提交定期重扫失败: {e}")
+            return 0
+        finally:
+            db.close()
+
+        self._record(now, len(tasks))
+        self.submitted_total += len(tasks)
+        logger.info(f"已提交定期重扫: {len(tasks)} 个工具（批次 {batch.batch_id}）")
+        return len(tasks)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"定期重扫检查异常: {e}")
+            delay = self.config.check_interval_seconds + random.uniform(0, self.config.jitter_seconds)
+            self._stop.wait(delay)
+
+    def start(self) -> None:
+        """启动后台检查线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rescan-scheduler", daemon=True)
+        self._thread.start()
+        logger.info("定期重扫调度器已启动")
+
+    def stop(self) -> None:
+        """停止后台检查线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        """定期重扫状态"""
+        now = datetime.now()
+        current = self.current_window(now)
+        return {
+            "enabled": self.config.enabled,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "in_window": current is not None,
+            "allowance": self.allowance(now),
+            "last_tick": self.last_tick.isoformat() if self.last_tick else None,
+            "submitted_total": self.submitted_total,
+        }
+
+
+# 全局定期重扫调度器实例
+_rescan_scheduler: Optional[RescanScheduler] = None
+
+
+def get_rescan_scheduler() -> RescanScheduler:
+    """
+    获取定期重扫调度器实例（单例模式）
+
+    Returns:
+        RescanScheduler: 定期重扫调度器实例
+    """
+    global _rescan_scheduler
+    if _rescan_scheduler is None:
+        from src.services.scan_service import get_scan_service
+        _rescan_scheduler = RescanScheduler(get_config().scanning.rescan, get_scan_service())
+    return _rescan_scheduler
@@ -0,0 +1,349 @@
+"""
+扫描结果写入服务：由单个写入任务收集各扫描任务的数据库写入，合并到批量事务中提交
+Result writer service: a single writer task group-commits database mutations from all scan workers
+
+- 扫描任务提交写入操作后等待确认（awaitable），写入所在事务提交后返回操作结果
+- 写入按时间间隔或数量阈值合并为一个事务，减少 SQLite 文件锁竞争（database is locked）
+- 批量事务失败时逐条重试，单条写入失败只影响对应的扫描任务
+- 写入任务运行在独立的后台线程事件循环中：调度器线程、请求线程与命令行等任意事件循环提交的写入
+  都转交给该循环串行执行（SQLite 使用单连接，不能跨线程并发使用会话），确认结果再转回提交方的事件循环
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from src.config import ResultWriterConfig
+from src.database import session_scope
+from src.logger import get_logger
+from src.services.bulkhead import Bulkhead
+
+logger = get_logger()
+
+# 写入操作：在批量事务的会话中执行，不自行提交；返回值（应为普通数据而非 ORM 对象）作为确认结果
+WriteOp = Callable[[Session], Any]
+
+
+class _PendingWrite:
+    """等待写入的操作"""
+
+    __slots__ = ("op", "session_factory", "future", "loop")
+
+    def __init__(
+        self,
+        op: WriteOp,
+        session_factory: Callable[[], Session],
+        future: Any,
+        loop: Optional[asyncio.AbstractEventLoop],
+    ):
+        self.op = op
+        self.session_factory = session_factory
+        self.future = future  # asyncio.Future，同步提交时为 concurrent.futures.Future
+        self.loop = loop  # 提交写入的事件循环（future 所属的循环），同步提交时为None
+
+    def resolve(self, ok: bool, value: Any) -> None:
+        """在提交方的事件循环中设置确认结果（提交方的事件循环已关闭时写入结果无人等待，忽略）"""
+        if self.loop is None:
+            _set_outcome(self.future, ok, value)
+            return
+        try:
+            self.loop.call_soon_threadsafe(_set_outcome, self.future, ok, value)
+        except RuntimeError:
+            pass
+
+
+def _set_outcome(future: asyncio.Future, ok: bool, value: Any) -> None:
+    if future.done():
+        return
+    if ok:
+        future.set_result(value)
+    else:
+        future.set_exception(value)
+
+
+class ResultWriter:
+    """合并提交扫描结果的写入任务（在自己的后台线程事件循环中运行，可从任意事件循环提交写入）"""
+
+    def __init__(self, config: ResultWriterConfig, bulkhead: Optional[Bulkhead] = None):
+        """
+        Args:
+            config: 扫描结果写入配置
+            bulkhead: 限制同时等待提交的写入数的资源池（可选）
+        """
+        self.config = config
+        self.bulkhead = bulkhead
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # 以下状态只在写入任务的事件循环中访问
+        self._pending: List[_PendingWrite] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self.flushes = 0  # 已提交的事务数
+        self.writes = 0  # 已完成的写入数
+        self.fallbacks = 0  # 批量事务失败后逐条重试的次数
+
+    async def submit(self, session_factory: Callable[[], Session], op: WriteOp) -> Any:
+        """
+        提交写入操作并等待其所在事务提交
+
+        调用方被取消时写入仍会完成，只是不再等待确认
+
+        Args:
+            session_factory: 数据库会话工厂
+            op: 写入操作
+
+        Returns:
+            Any: 写入操作的返回值
+
+        Raises:
+            Exception: 写入操作本身抛出的异常（单独重试后仍失败）
+        """
+        if self.bulkhead is None:
+            return await self._submit(session_factory, op)
+        async with self.bulkhead:
+            return await self._submit(session_factory, op)
+
+    async def _submit(self, session_factory: Callable[[], Session], op: WriteOp) -> Any:
+        if not self.config.enabled:
+            with session_scope(session_factory) as db:
+                result = op(db)
+            self.flushes += 1
+            self.writes += 1
+            return result
+
+        loop = asyncio.get_running_loop()
+        item = _PendingWrite(op, session_factory, loop.create_future(), loop)
+        with self._lock:
+            # 持锁转交：stop() 之后的写入进入新的写入循环，不会落在已停止的循环中
+            self._ensure_started().call_soon_threadsafe(self._enqueue, item)
+        return await asyncio.shield(item.future)
+
+    async def submit_many(
+        self, session_factory: Callable[[], Session], ops: List[WriteOp]
+    ) -> List[Tuple[bool, Any]]:
+        """
+        提交一组写入并等待其所在事务提交（同一组写入一起交给写入任务，通常在同一个事务中提交）
+
+        Args:
+            session_factory: 数据库会话工厂
+            ops: 写入操作
+
+        Returns:
+            List[Tuple[bool, Any]]: 每个写入的 (是否成功, 返回值或异常)
+        """
+        if not ops:
+            return []
+        if not self.config.enabled:
+            return self._write_each(session_factory, ops)
+
+        loop = asyncio.get_running_loop()
+        items = [_PendingWrite(op, session_factory, loop.create_future(), loop) for op in ops]
+        with self._lock:
+            self._ensure_started().call_soon_threadsafe(self._enqueue_many, items)
+        results = await asyncio.shield(asyncio.gather(*(item.future for item in items), return_exceptions=True))
+        return [(not isinstance(value, Exception), value) for value in results]
+
+    def submit_many_blocking(
+        self, session_factory: Callable[[], Session], ops: List[WriteOp]
+    ) -> List[Tuple[bool, Any]]:
+        """
+        从非协程代码（如调度器线程与命令行中创建扫描任务）提交一组写入，阻塞等待其所在事务提交
+
+        同一组写入一起交给写入任务，通常在同一个事务中提交；协程中应使用 submit_many()，避免阻塞事件循环
+
+        Args:
+            session_factory: 数据库会话工厂
+            ops: 写入操作
+
+        Returns:
+            List[Tuple[bool, Any]]: 每个写入的 (是否成功, 返回值或异常)
+        """
+        if not ops:
+            return []
+        if not self.config.enabled:
+            return self._write_each(session_factory, ops)
+
+        outcomes = []
+        for future in self._submit_threadsafe(session_factory, ops):
+            try:
+                outcomes.append((True, future.result()))
+            except Exception as e:
+                outcomes.append((False, e))
+        return outcomes
+
+    def submit_nowait(self, session_factory: Callable[[], Session], op: WriteOp) -> concurrent.futures.Future:
+        """
+        从非协程代码提交写入，不等待确认（如任务表归档：调用方持有锁或在请求路径上，不能阻塞）
+
+        Args:
+            session_factory: 数据库会话工厂
+            op: 写入操作
+
+        Returns:
+            concurrent.futures.Future: 写入所在事务提交后完成（未启用合并提交时已完成）
+        """
+        if self.config.enabled:
+            return self._submit_threadsafe(session_factory, [op])[0]
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        ok, value = self._write_each(session_factory, [op])[0]
+        _set_outcome(future, ok, value)
+        return future
+
+    def _submit_threadsafe(
+        self, session_factory: Callable[[], Session], ops: List[WriteOp]
+    ) -> List[concurrent.futures.Future]:
+        items = [_PendingWrite(op, session_factory, concurrent.futures.Future(), None) for op in ops]
+        with self._lock:
+            self._ensure_started().call_soon_threadsafe(self._enqueue_many, items)
+        return [item.future for item in items]
+
+    def _write_each(self, session_factory: Callable[[], Session], ops: List[WriteOp]) -> List[Tuple[bool, Any]]:
+        """未启用合并提交时逐条提交"""
+        outcomes = []
+        for op in ops:
+            try:
+                with session_scope(session_factory) as db:
+                    outcomes.append((True, op(db)))
+                self.flushes += 1
+                self.writes += 1
+            except Exception as e:
+                outcomes.append((False, e))
+        return outcomes
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """启动写入任务的后台线程事件循环（调用方需持有锁）"""
+        if self._loop is not None:
+            return self._loop
+        loop = asyncio.new_event_loop()
+        # 写入任务的第一步排在所有转交的写入之前执行
+        flusher = loop.create_task(self._run())
+
+        def run_loop():
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_forever()
+            finally:
+                flusher.cancel()
+                loop.run_until_complete(asyncio.gather(flusher, return_exceptions=True))
+                loop.close()
+
+        self._thread = threading.Thread(target=run_loop, name="result-writer", daemon=True)
+        self._thread.start()
+        self._loop = loop
+        return loop
+
+    def stop(self, timeout: float = 10) -> None:
+        """提交所有已收到的写入后停止写入任务（之后的写入会重新启动写入任务）"""
+        # 持锁等待旧的写入循环结束，新的写入循环不会与其同时运行
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+            if loop is None:
+                return
+            # 排在此前所有转交的写入之后执行
+            loop.call_soon_threadsafe(self._drain_and_stop, loop)
+            thread.join(timeout)
+
+    def _drain_and_stop(self, loop: asyncio.AbstractEventLoop) -> None:
+        while self._pending:
+            batch, self._pending = self._pending[:self._max_batch], self._pending[self._max_batch:]
+            self._complete(batch)
+        loop.stop()
+
+    @property
+    def _max_batch(self) -> int:
+        return max(1, self.config.max_batch_size)
+
+    def _enqueue(self, item: _PendingWrite) -> None:
+        self._pending.append(item)
+        self._wakeup.set()
+
+    def _enqueue_many(self, items: List[_PendingWrite]) -> None:
+        self._pending.extend(items)
+        self._wakeup.set()
+
+    def _complete(self, batch: List[_PendingWrite]) -> None:
+        """提交一批写入并把结果转回各提交方"""
+        try:
+            outcomes = self._flush(batch)
+        except Exception as e:
+            logger.error(f"提交扫描结果失败: {e}")
+            outcomes = [(False, e)] * len(batch)
+        for item, (ok, value) in zip(batch, outcomes):
+            item.resolve(ok, value)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        interval = self.config.flush_interval_ms / 1000
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # 在间隔内继续收集写入，数量达到阈值时立即提交
+            deadline = loop.time() + interval
+            while len(self._pending) < self._max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch, self._pending = self._pending[:self._max_batch], self._pending[self._max_batch:]
+            self._complete(batch)
+
+    def _flush(self, batch: List[_PendingWrite]) -> List[Tuple[bool, Any]]:
+        """提交一批写入（按会话工厂分组，每组一个事务），返回每个写入的 (是否成功, 结果或异常)"""
+        outcomes: Dict[int, Tuple[bool, Any]] = {}
+        groups: Dict[int, List[int]] = {}
+        for index, item in enumerate(batch):
+            groups.setdefault(id(item.session_factory), []).append(index)
+
+        for indexes in groups.values():
+            session_factory = batch[indexes[0]].session_factory
+            try:
+                with session_scope(session_factory) as db:
+                    values = []
+                    for index in indexes:
+                        values.append(batch[index].op(db))
+                        db.flush()
+                self.flushes += 1
+                for index, value in zip(indexes, values):
+                    outcomes[index] = (True, value)
+            except Exception as e:
+                logger.warning(f"批量写入扫描结果失败，改为逐条提交: {e}")
+                self.fallbacks += 1
+                for index in indexes:
+                    outcomes[index] = self._write_one(session_factory, batch[index].op)
+
+        self.writes += sum(1 for ok, _ in outcomes.values() if ok)
+        return [outcomes[index] for index in range(len(batch))]
+
+    def _write_one(self, session_factory: Callable[[], Session], op: WriteOp) -> Tuple[bool, Any]:
+        try:
+            with session_scope(session_factory) as db:
+                value = op(db)
+            self.flushes += 1
+            return True, value
+        except Exception as e:
+            logger.error(f"写入扫描结果失败: {e}")
+            return False, e
+
+    def stats(self) -> Dict[str, Any]:
+        """写入统计"""
+        return {
+            "enabled": self.config.enabled,
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "fallbacks": self.fallbacks,
+            "avg_batch_size": round(self.writes / self.flushes, 2) if self.flushes else None,
+        }
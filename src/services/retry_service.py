@@ -0,0 +1,375 @@
+"""
+扫描重试服务：失败扫描的错误分类、持久化的指数退避重试与死信列表
+Scan retry service: error classification, persisted exponential-backoff retries and dead-lettering
+
+- 扫描失败时按错误类型分类：限流、AI 服务不可用、TOS 获取失败、解析失败、内部错误
+- 可重试的失败写入重试表，按指数退避计算下次重试时间；重试由后台线程按检查间隔提交，不占用请求路径
+- 不可重试或连续失败达到上限的工具进入死信列表，可通过接口查看并批量重放
+- 扫描成功后清除该工具的重试记录
+"""
+
+import asyncio
+import json
+import random
+import threading
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import httpx
+from sqlalchemy.orm import Session
+
+from src.config import RetryQueueConfig, get_config
+from src.logger import get_logger
+from src.models import ScanRetry
+from src.services.freshness_service import db_now
+from src.services.scan_scheduler import ScanPriority
+
+logger = get_logger()
+
+# 访问外部网页（而非 AI 接口）的阶段
+FETCH_STAGES = {"tos_fetch"}
+
+
+class ScanErrorKind(str, Enum):
+    """扫描失败的错误类型"""
+    RATE_LIMITED = "rate_limited"
+    PROVIDER_DOWN = "provider_down"
+    FETCH_FAILURE = "fetch_failure"
+    PARSE_FAILURE = "parse_failure"
+    BUDGET_EXHAUSTED = "budget_exhausted"
+    INTERNAL = "internal"
+
+
+class RetryStatus(str, Enum):
+    """重试记录状态"""
+    SCHEDULED = "scheduled"
+    DEAD = "dead"
+
+
+def classify_error(exc: Optional[BaseException], stage: Optional[str] = None) -> ScanErrorKind:
+    """
+    对扫描失败的异常分类
+
+    Args:
+        exc: 失败的异常（阶段超时等没有异常对象时为None）
+        stage: 失败的阶段名称
+
+    Returns:
+        ScanErrorKind: 错误类型
+    """
+    fetching = stage in FETCH_STAGES
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        if code == 429:
+            return ScanErrorKind.RATE_LIMITED
+        if fetching:
+            return ScanErrorKind.FETCH_FAILURE
+        if code >= 500:
+            return ScanErrorKind.PROVIDER_DOWN
+        return ScanErrorKind.INTERNAL
+    if exc is None or isinstance(exc, (httpx.TransportError, asyncio.TimeoutError)):
+        # 超时与网络错误：取决于访问的是网页还是 AI 接口
+        return ScanErrorKind.FETCH_FAILURE if fetching else ScanErrorKind.PROVIDER_DOWN
+    if isinstance(exc, json.JSONDecodeError):
+        return ScanErrorKind.PARSE_FAILURE
+    return ScanErrorKind.INTERNAL
+
+
+def backoff_delay(config: RetryQueueConfig, attempts: int) -> float:
+    """
+    第 attempts 次失败后的退避时间（秒，含随机抖动）
+
+    Args:
+        config: 重试队列配置
+        attempts: 连续失败次数（从1开始）
+
+    Returns:
+        float: 退避时间（秒）
+    """
+    delay = min(config.max_delay_seconds, config.base_delay_seconds * config.backoff_factor ** max(0, attempts - 1))
+    return delay * (1 + random.uniform(0, config.jitter_ratio))
+
+
+def record_failure(
+    db: Session,
+    tool_id: int,
+    kind: ScanErrorKind,
+    error: str,
+    config: RetryQueueConfig,
+    stage: Optional[str] = None,
+    priority: Optional[ScanPriority] = None,
+    now: Optional[datetime] = None,
+    retry_at: Optional[datetime] = None,
+) -> ScanRetry:
+    """
+    记录一次扫描失败：可重试时安排下次重试，否则进入死信列表（不提交事务）
+
+    Args:
+        db: 数据库会话
+        tool_id: 工具ID
+        kind: 错误类型
+        error: 失败原因
+        config: 重试队列配置
+        stage: 失败的阶段
+        priority: 重试时使用的扫描优先级
+        now: 当前时间（数据库时间，默认 db_now()）
+        retry_at: 指定的重试时间（如 AI 预算重置时间；不计入连续失败次数，也不进入死信列表）
+
+    Returns:
+        ScanRetry: 重试记录
+    """
+    now = now or db_now()
+    retry = db.query(ScanRetry).filter(ScanRetry.tool_id == tool_id).first()
+    if retry is None:
+        retry = ScanRetry(tool_id=tool_id, attempts=0)
+        db.add(retry)
+    if retry_at is None:
+        retry.attempts = (retry.attempts or 0) + 1
+    retry.error_kind = kind.value
+    retry.error = error
+    retry.failed_stage = stage
+    if priority is not None:
+        retry.priority = ScanPriority(priority).value
+    if retry_at is not None:
+        retry.status = RetryStatus.SCHEDULED.value
+        retry.next_attempt_at = retry_at
+    elif kind.value in config.retryable_kinds and retry.attempts < config.max_attempts:
+        retry.status = RetryStatus.SCHEDULED.value
+        retry.next_attempt_at = now + timedelta(seconds=backoff_delay(config, retry.attempts))
+    else:
+        retry.status = RetryStatus.DEAD.value
+        retry.next_attempt_at = None
+    db.flush()
+    return retry
+
+
+def clear_retry(db: Session, tool_id: int) -> None:
+    """扫描成功后删除工具的重试记录（不提交事务）"""
+    db.query(ScanRetry).filter(ScanRetry.tool_id == tool_id).delete(synchronize_session=False)
+
+
+def defer_retry(db: Session, tool_id: int, retry_at: datetime) -> Optional[ScanRetry]:
+    """
+    推迟工具已有的重试记录（不提交事务，不计入失败次数）
+
+    用于降级完成的扫描（如 AI 预算不足时使用已有报告）：完整扫描仍需重试，但在指定时间之前不再提交
+
+    Args:
+        db: 数据库会话
+        tool_id: 工具ID
+        retry_at: 下次重试时间（数据库时间）
+
+    Returns:
+        Optional[ScanRetry]: 重试记录（工具没有重试记录时为None）
+    """
+    retry = db.query(ScanRetry).filter(ScanRetry.tool_id == tool_id).first()
+    if retry is None:
+        return None
+    retry.status = RetryStatus.SCHEDULED.value
+    retry.next_attempt_at = retry_at
+    db.flush()
+    return retry
+
+
+def retry_info(retry: ScanRetry) -> Dict[str, Any]:
+    """重试记录摘要"""
+    return {
+        "tool_id": retry.tool_id,
+        "tool_name": retry.tool.name if retry.tool else None,
+        "status": retry.status,
+        "error_kind": retry.error_kind,
+        "error": retry.error,
+        "failed_stage": retry.failed_stage,
+        "attempts": retry.attempts,
+        "priority": retry.priority,
+        "next_attempt_at": retry.next_attempt_at.isoformat() if retry.next_attempt_at else None,
+        "first_failed_at": retry.created_at.isoformat() if retry.created_at else None,
+        "last_failed_at": retry.updated_at.isoformat() if retry.updated_at else None,
+    }
+
+
+def list_dead_letters(db: Session, skip: int = 0, limit: int = 100) -> Dict[str, Any]:
+    """
+    查询死信列表（最近失败的在前）
+
+    Args:
+        db: 数据库会话
+        skip: 跳过的记录数
+        limit: 返回的最大记录数
+
+    Returns:
+        Dict[str, Any]: total（死信总数）与 items（死信记录）
+    """
+    query = db.query(ScanRetry).filter(ScanRetry.status == RetryStatus.DEAD.value)
+    items = query.order_by(ScanRetry.updated_at.desc(), ScanRetry.id.desc()).offset(skip).limit(limit).all()
+    return {"total": query.count(), "items": [retry_info(retry) for retry in items]}
+
+
+def find_due_retries(db: Session, now: datetime, limit: int, exclude: Set[int]) -> List[ScanRetry]:
+    """
+    查找到期的重试（最早到期的在前）
+
+    Args:
+        db: 数据库会话
+        now: 当前时间（数据库时间）
+        limit: 最多返回的记录数
+        exclude: 需要跳过的工具ID（如正在扫描中的工具）
+
+    Returns:
+        List[ScanRetry]: 重试记录
+    """
+    if limit <= 0:
+        return []
+    rows = db.query(ScanRetry).filter(
+        ScanRetry.status == RetryStatus.SCHEDULED.value,
+        ScanRetry.next_attempt_at <= now,
+    ).order_by(ScanRetry.next_attempt_at).limit(limit + len(exclude)).all()
+    return [retry for retry in rows if retry.tool_id not in exclude][:limit]
+
+
+async def replay_dead_letters(db: Session, scan_service: Any, tool_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    重放死信：重置失败次数并以批量优先级立即重新扫描
+
+    Args:
+        db: 数据库会话
+        scan_service: 扫描服务
+        tool_ids: 要重放的工具ID，None 表示全部死信
+
+    Returns:
+        Dict[str, Any]: replayed（重放的工具ID）与 batch（扫描批次，没有可重放的工具时为None）
+    """
+    query = db.query(ScanRetry).filter(ScanRetry.status == RetryStatus.DEAD.value)
+    if tool_ids is not None:
+        query = query.filter(ScanRetry.tool_id.in_(tool_ids))
+    retries = query.all()
+    if not retries:
+        return {"replayed": [], "batch": None}
+
+    replayed = [retry.tool_id for retry in retries]
+    for retry in retries:
+        # 重放后再次失败时重新按退避策略重试
+        retry.status = RetryStatus.SCHEDULED.value
+        retry.attempts = 0
+        retry.next_attempt_at = None
+    db.commit()
+
+    batch = scan_service.create_batch(ScanPriority.BATCH)
+    await scan_service.extend_batch_async(batch, replayed, db, force_refresh=True)
+    logger.info(f"已重放死信扫描: {len(replayed)} 个工具（批次 {batch.batch_id}）")
+    return {"replayed": replayed, "batch": batch}
+
+
+class RetryScheduler:
+    """失败扫描的重试调度器（在后台线程中按检查间隔提交到期的重试）"""
+
+    def __init__(
+        self,
+        config: RetryQueueConfig,
+        scan_service: Any,
+        session_factory: Optional[Callable[[], Session]] = None,
+    ):
+        """
+        Args:
+            config: 重试队列配置
+            scan_service: 扫描服务
+            session_factory: 数据库会话工厂（默认使用全局会话工厂）
+        """
+        self.config = config
+        self.scan_service = scan_service
+        self._session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_tick: Optional[datetime] = None
+        self.submitted_total = 0
+
+    def _new_session(self) -> Session:
+        if self._session_factory is None:
+            from src.database import get_session
+            self._session_factory = get_session()
+        return self._session_factory()
+
+    def tick(self, now: Optional[datetime] = None) -> int:
+        """
+        执行一次检查：提交到期的重试（按记录的优先级分批）
+
+        Args:
+            now: 当前时间（数据库时间，默认 db_now()）
+
+        Returns:
+            int: 本次提交的工具数
+        """
+        now = now or db_now()
+        self.last_tick = now
+        busy = {task.tool_id for task in self.scan_service.registry.active() if not task.is_terminal}
+        db = self._new_session()
+        submitted = 0
+        try:
+            by_priority: Dict[ScanPriority, List[int]] = {}
+            for retry in find_due_retries(db, now, self.config.batch_size, busy):
+                priority = ScanPriority(retry.priority or ScanPriority.BATCH)
+                by_priority.setdefault(priority, []).append(retry.tool_id)
+            for priority, tool_ids in by_priority.items():
+                batch = self.scan_service.create_batch(priority)
+                # 重试需要完整扫描：不复用缓存报告，也不由知识库直接生成报告
+                tasks = self.scan_service.extend_batch(batch, tool_ids, db, force_refresh=True, kb_only=False)
+                submitted += len(tasks)
+                logger.info(f"已提交失败扫描重试: {len(tasks)} 个工具（批次 {batch.batch_id}）")
+        except Exception as e:
+            logger.error(f"提交失败扫描重试失败: {e}")
+        finally:
+            db.close()
+        self.submitted_total += submitted
+        return submitted
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"失败扫描重试检查异常: {e}")
+            self._stop.wait(self.config.check_interval_seconds)
+
+    def start(self) -> None:
+        """启动后台检查线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="scan-retry-scheduler", daemon=True)
+        self._thread.start()
+        logger.info("失败扫描重试调度器已启动")
+
+    def stop(self) -> None:
+        """停止后台检查线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        """重试调度器状态"""
+        return {
+            "enabled": self.config.enabled,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "last_tick": self.last_tick.isoformat() if self.last_tick else None,
+            "submitted_total": self.submitted_total,
+        }
+
+
+# 全局重试调度器实例
+_retry_scheduler: Optional[RetryScheduler] = None
+
+
+def get_retry_scheduler() -> RetryScheduler:
+    """
+    获取失败扫描重试调度器实例（单例模式）
+
+    Returns:
+        RetryScheduler: 重试调度器实例
+    """
+    global _retry_scheduler
+    if _retry_scheduler is None:
+        from src.services.scan_service import get_scan_service
+        _retry_scheduler = RetryScheduler(get_config().scanning.retry_queue, get_scan_service())
+    return _retry_scheduler
@@ -0,0 +1,298 @@
+"""
+SBOM / 依赖清单服务：解析组件清单，按项目计算与上次提交的差异，只扫描新增或变更的组件
+SBOM service: parses component manifests, diffs them per project and scans only new or changed components
+
+支持的格式：
+- cyclonedx：CycloneDX JSON（components，含嵌套组件）
+- spdx：SPDX JSON（packages，跳过文档描述的项目自身）
+- requirements：pip requirements.txt
+- package-json：npm package.json（dependencies/devDependencies/optionalDependencies）
+- package-lock：npm package-lock.json（lockfileVersion 1/2/3）
+"""
+
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from src.logger import get_logger
+from src.models import ProjectComponent
+from src.services.scan_scheduler import ScanPriority
+from src.services.tool_service import bulk_get_or_create_tools
+
+logger = get_logger()
+
+SBOM_FORMATS = ("cyclonedx", "spdx", "requirements", "package-json", "package-lock")
+
+# 组件：(名称, 版本)
+Component = Tuple[str, Optional[str]]
+
+_REQUIREMENT_RE = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)\s*(?:\[[^\]]*\])?\s*(.*)$")
+
+
+# ==================== 解析 ====================
+
+
+def detect_sbom_format(content: str) -> Optional[str]:
+    """
+    根据内容推断清单格式
+
+    Args:
+        content: 清单文本
+
+    Returns:
+        Optional[str]: 格式名称，无法识别返回None
+    """
+    try:
+        doc = json.loads(content)
+    except json.JSONDecodeError:
+        # 非 JSON 内容按 requirements.txt 处理
+        return "requirements" if content.strip() else None
+    if not isinstance(doc, dict):
+        return None
+    if doc.get("bomFormat") == "CycloneDX":
+        return "cyclonedx"
+    if "spdxVersion" in doc:
+        return "spdx"
+    if "lockfileVersion" in doc:
+        return "package-lock"
+    if any(key in doc for key in ("dependencies", "devDependencies", "optionalDependencies")):
+        return "package-json"
+    return None
+
+
+def _parse_cyclonedx(doc: Dict[str, Any]) -> List[Component]:
+    components: List[Component] = []
+    stack = list(doc.get("components") or [])
+    while stack:
+        item = stack.pop(0)
+        if item.get("name"):
+            components.append((item["name"], item.get("version")))
+        stack.extend(item.get("components") or [])
+    return components
+
+
+def _parse_spdx(doc: Dict[str, Any]) -> List[Component]:
+    described = set(doc.get("documentDescribes") or [])
+    return [
+        (package["name"], package.get("versionInfo"))
+        for package in doc.get("packages") or []
+        if package.get("name") and package.get("SPDXID") not in described
+    ]
+
+
+def _parse_requirements(content: str) -> List[Component]:
+    components: List[Component] = []
+    for line in content.splitlines():
+        line = line.split(" #", 1)[0].strip()
+        # 跳过注释、pip 选项（-r/-e/--index-url 等）和直接 URL
+        if not line or line.startswith(("#", "-")) or "://" in line:
+            continue
+        match = _REQUIREMENT_RE.match(line)
+        if not match:
+            continue
+        spec = match.group(2).split(";", 1)[0].strip()
+        if spec.startswith("==="):
+            spec = spec[3:].strip()
+        elif spec.startswith("==") and "," not in spec:
+            spec = spec[2:].strip()
+        components.append((match.group(1), spec or None))
+    return components
+
+
+def _parse_package_json(doc: Dict[str, Any]) -> List[Component]:
+    components: List[Component] = []
+    for key in ("dependencies", "devDependencies", "optionalDependencies"):
+        for name, version in (doc.get(key) or {}).items():
+            components.append((name, version if isinstance(version, str) else None))
+    return components
+
+
+def _parse_package_lock(doc: Dict[str, Any]) -> List[Component]:
+    components: List[Component] = []
+    packages = doc.get("packages")
+    if packages:
+        # lockfileVersion 2/3：键为 node_modules 路径，"" 为项目自身
+        for path, info in packages.items():
+            if not path or "node_modules/" not in path:
+                continue
+            components.append((path.rsplit("node_modules/", 1)[1], (info or {}).get("version")))
+        return components
+    # lockfileVersion 1：嵌套的 dependencies
+    stack = list((doc.get("dependencies") or {}).items())
+    while stack:
+        name, info = stack.pop(0)
+        components.append((name, (info or {}).get("version")))
+        stack.extend(((info or {}).get("dependencies") or {}).items())
+    return components
+
+
+def parse_sbom(content: str, fmt: Optional[str] = None) -> Tuple[str, List[Component]]:
+    """
+    解析 SBOM 或依赖清单
+
+    Args:
+        content: 清单文本
+        fmt: 格式（默认按内容推断）
+
+    Returns:
+        Tuple[str, List[Component]]: (格式, 组件列表)
+
+    Raises:
+        ValueError: 格式无法识别或内容无法解析
+    """
+    fmt = fmt or detect_sbom_format(content)
+    if fmt not in SBOM_FORMATS:
+        raise ValueError("无法识别的清单格式")
+    if fmt == "requirements":
+        return fmt, _parse_requirements(content)
+    try:
+        doc = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"清单不是有效的 JSON: {e}")
+    if not isinstance(doc, dict):
+        raise ValueError("清单不是有效的 JSON 对象")
+    parser = {
+        "cyclonedx": _parse_cyclonedx,
+        "spdx": _parse_spdx,
+        "package-json": _parse_package_json,
+        "package-lock": _parse_package_lock,
+    }[fmt]
+    return fmt, parser(doc)
+
+
+# ==================== 差异 ====================
+
+
+def dedupe_components(components: List[Component]) -> Dict[str, Component]:
+    """按名称（不区分大小写）去重，保留首次出现的组件"""
+    unique: Dict[str, Component] = {}
+    for name, version in components:
+        name = name.strip()
+        if name and name.lower() not in unique:
+            unique[name.lower()] = (name, (version or "").strip() or None)
+    return unique
+
+
+def diff_components(
+    previous: Dict[str, Optional[str]],
+    current: Dict[str, Component]
+) -> Dict[str, List[str]]:
+    """
+    计算组件集合差异
+
+    Args:
+        previous: 上次提交的组件（小写名称 -> 版本）
+        current: 本次提交的组件（小写名称 -> (名称, 版本)）
+
+    Returns:
+        Dict[str, List[str]]: added / changed / unchanged / removed（小写名称列表）
+    """
+    delta: Dict[str, List[str]] = {"added": [], "changed": [], "unchanged": [], "removed": []}
+    for key, (_, version) in current.items():
+        if key not in previous:
+            delta["added"].append(key)
+        elif previous[key] != version:
+            delta["changed"].append(key)
+        else:
+            delta["unchanged"].append(key)
+    delta["removed"] = [key for key in previous if key not in current]
+    return delta
+
+
+def get_project_components(db: Session, project: str) -> Dict[str, Optional[str]]:
+    """获取项目上次提交的组件集合（小写名称 -> 版本）"""
+    rows = db.query(ProjectComponent).filter(ProjectComponent.project == project).all()
+    return {row.name.lower(): row.version for row in rows}
+
+
+def replace_project_components(db: Session, project: str, components: List[ProjectComponent]) -> None:
+    """用本次提交的组件集合替换项目的组件记录"""
+    db.query(ProjectComponent).filter(ProjectComponent.project == project).delete(synchronize_session=False)
+    db.add_all(components)
+    db.commit()
+
+
+# ==================== 提交扫描 ====================
+
+
+async def submit_sbom_scan(
+    db: Session,
+    scan_service,
+    project: str,
+    content: str,
+    fmt: Optional[str] = None,
+    priority: Optional[ScanPriority] = None,
+    source: str = "unknown",
+    client: Optional[str] = None,
+    admit: Optional[Callable[[int], None]] = None,
+) -> Dict[str, Any]:
+    """
+    解析清单并提交差异扫描
+
+    - 新增组件：按新鲜度策略扫描（有效期内已有报告的直接复用）
+    - 版本变更的组件：强制重新扫描
+    - 未变更的组件：直接复用最新报告（从未成功生成报告的仍会扫描）
+
+    Args:
+        db: 数据库会话
+        scan_service: 扫描服务
+        project: 项目标识
+        content: 清单文本
+        fmt: 清单格式（默认按内容推断）
+        priority: 扫描优先级（默认按需要扫描的组件数判断）
+        source: 新建工具的来源
+        client: 提交扫描的客户端（AI 用量计入该客户端的预算）
+        admit: 准入检查（计算差异后、创建工具与提交扫描之前，以新增与版本变更的组件数调用；
+            拒绝时抛出的异常原样传出，不写入任何数据）
+
+    Returns:
+        Dict[str, Any]: 包含 batch、format、delta（各类组件名称）与 skipped（无效组件名）
+
+    Raises:
+        ValueError: 清单无法解析
+    """
+    fmt, parsed = parse_sbom(content, fmt)
+    current = dedupe_components(parsed)
+    previous = get_project_components(db, project)
+    delta = diff_components(previous, current)
+    if admit is not None:
+        admit(len(delta["added"]) + len(delta["changed"]))
+
+    names = [current[key][0] for key in current]
+    # 依赖清单中的 npm 作用域包（@scope/name）按原名创建工具
+    tools, _, invalid_names = bulk_get_or_create_tools(db, names, source, allow_scoped=True)
+    invalid_keys = {name.strip().lower() for name in invalid_names}
+    valid_keys = [key for key in current if key not in invalid_keys]
+    tool_ids = {key: tool.id for key, tool in zip(valid_keys, tools)}
+
+    to_scan = len([key for key in delta["added"] + delta["changed"] if key in tool_ids])
+    batch = scan_service.create_batch(scan_service.resolve_priority(priority, to_scan), client=client)
+    groups = (
+        ("added", {}),
+        ("changed", {"force_refresh": True}),
+        ("unchanged", {"reuse_latest": True}),
+    )
+    for category, options in groups:
+        ids = [tool_ids[key] for key in delta[category] if key in tool_ids]
+        if ids:
+            await scan_service.extend_batch_async(batch, ids, db, **options)
+
+    replace_project_components(db, project, [
+        ProjectComponent(project=project, name=name, version=version, tool_id=tool_ids.get(key))
+        for key, (name, version) in current.items()
+    ])
+    logger.info(
+        f"SBOM 差异扫描已提交: project={project}, format={fmt}, 新增 {len(delta['added'])}, "
+        f"变更 {len(delta['changed'])}, 未变更 {len(delta['unchanged'])}, 移除 {len(delta['removed'])}"
+    )
+    display = {key: name for key, (name, _) in current.items()}
+    return {
+        "batch": batch,
+        "format": fmt,
+        "delta": {
+            category: [display.get(key, key) for key in keys] for category, keys in delta.items()
+        },
+        "skipped": invalid_names,
+    }
@@ -0,0 +1,279 @@
+"""
+扫描流水线模块：以有向无环图（DAG）描述扫描阶段
+Scan pipeline module: expresses scan stages as a small DAG of named stages
+
+每个阶段声明自己依赖的输入阶段；依赖全部完成后即可启动，
+互不依赖的阶段并发执行，每个阶段有独立的超时与执行结果。
+"""
+
+import asyncio
+from contextvars import ContextVar
+from datetime import datetime
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Protocol, Sequence, Tuple
+
+from src.logger import get_logger
+
+logger = get_logger()
+
+# 阶段函数签名：async def stage(context, inputs) -> Any
+#   context: 整条流水线共享的上下文（工具快照、数据库会话工厂等）
+#   inputs:  声明的输入阶段名 -> 该阶段的输出值
+StageFunc = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Any]]
+
+
+class StageStatus(str, Enum):
+    """阶段执行状态"""
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    TIMEOUT = "timeout"
+    CANCELLED = "cancelled"
+
+
+class PipelineStage:
+    """流水线阶段定义"""
+
+    def __init__(
+        self,
+        name: str,
+        func: StageFunc,
+        inputs: Sequence[str] = (),
+        timeout: Optional[float] = None,
+        required: bool = False,
+        checkpoint: bool = False,
+    ):
+        """
+        Args:
+            name: 阶段名称（流水线内唯一）
+            func: 阶段执行函数
+            inputs: 依赖的上游阶段名称
+            timeout: 阶段超时时间（秒），None 表示不限制
+            required: 是否为必需阶段；必需阶段失败会终止整条流水线，
+                非必需阶段失败时输出为 None，下游阶段照常执行
+            checkpoint: 是否保存该阶段的输出（非 None 的输出可在重试时直接复用）
+        """
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.timeout = timeout
+        self.required = required
+        self.checkpoint = checkpoint
+
+
+class StageResult:
+    """阶段执行结果"""
+
+    __slots__ = (
+        "name", "status", "value", "error", "exception", "started_at", "finished_at", "resumed", "attempts", "hit",
+    )
+
+    def __init__(self, name: str):
+        self.name = name
+        self.status: Optional[StageStatus] = None
+        self.value: Any = None
+        self.error: Optional[str] = None
+        self.exception: Optional[BaseException] = None  # 阶段失败时的异常（用于错误分类，不序列化）
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.resumed = False  # 是否直接复用了检查点中的输出
+        self.attempts = 0  # 阶段内发起的外部请求次数（含重试）
+        self.hit: Optional[str] = None  # 命中的缓存来源（checkpoint / kb / cache），离线跳过时为 offline，未命中为None
+
+    @property
+    def duration(self) -> Optional[float]:
+        """阶段耗时（秒）"""
+        if self.started_at and self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可序列化的字典（不包含阶段输出值）"""
+        return {
+            "name": self.name,
+            "status": self.status.value if self.status else None,
+            "error": self.error,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "duration": self.duration,
+            "resumed": self.resumed,
+            "attempts": self.attempts,
+            "hit": self.hit,
+        }
+
+
+# 当前正在执行的阶段（每个阶段在独立的 asyncio 任务中执行，上下文互不干扰）
+_current_stage: ContextVar[Optional[StageResult]] = ContextVar("current_stage", default=None)
+
+
+def record_stage_attempt() -> None:
+    """记录当前阶段发起了一次外部请求（不在流水线阶段中调用时忽略）"""
+    result = _current_stage.get()
+    if result is not None:
+        result.attempts += 1
+
+
+def mark_stage_hit(source: str) -> None:
+    """标记当前阶段命中了缓存或知识库（不在流水线阶段中调用时忽略）"""
+    result = _current_stage.get()
+    if result is not None:
+        result.hit = source
+
+
+class CheckpointStore(Protocol):
+    """阶段检查点存储"""
+
+    def load(self, stage: str, inputs: Dict[str, Any]) -> Tuple[bool, Any]:
+        """读取与当前输入匹配的检查点，返回 (是否命中, 输出)"""
+
+    def save(self, stage: str, inputs: Dict[str, Any], value: Any) -> None:
+        """保存阶段输出"""
+
+
+class PipelineStageError(Exception):
+    """必需阶段执行失败"""
+
+    def __init__(self, result: StageResult):
+        self.result = result
+        super().__init__(f"阶段 {result.name} 执行失败: {result.status.value} - {result.error}")
+
+
+class ScanPipeline:
+    """按依赖关系并发执行阶段的扫描流水线"""
+
+    def __init__(self, stages: List[PipelineStage]):
+        self.stages: Dict[str, PipelineStage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"重复的阶段名称: {stage.name}")
+            self.stages[stage.name] = stage
+        for stage in stages:
+            for dep in stage.inputs:
+                if dep not in self.stages:
+                    raise ValueError(f"阶段 {stage.name} 依赖了不存在的阶段: {dep}")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        """计算拓扑顺序，同时检测循环依赖"""
+        remaining = {name: set(stage.inputs) for name, stage in self.stages.items()}
+        order: List[str] = []
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"阶段之间存在循环依赖: {sorted(remaining)}")
+            for name in ready:
+                order.append(name)
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return order
+
+    async def _run_stage(
+        self,
+        stage: PipelineStage,
+        context: Dict[str, Any],
+        inputs: Dict[str, Any],
+        result: StageResult,
+    ) -> StageResult:
+        result.started_at = datetime.now()
+        _current_stage.set(result)
+        try:
+            coro = stage.func(context, inputs)
+            if stage.timeout:
+                result.value = await asyncio.wait_for(coro, timeout=stage.timeout)
+            else:
+                result.value = await coro
+            result.status = StageStatus.SUCCEEDED
+        except asyncio.TimeoutError:
+            result.status = StageStatus.TIMEOUT
+            result.error = f"阶段超时（{stage.timeout} 秒）"
+            logger.warning(f"扫描阶段超时: {stage.name} ({stage.timeout}s)")
+        except asyncio.CancelledError:
+            result.status = StageStatus.CANCELLED
+            result.error = "阶段已取消"
+            raise
+        except Exception as e:
+            result.status = StageStatus.FAILED
+            result.error = str(e)
+            result.exception = e
+            logger.warning(f"扫描阶段失败: {stage.name} - {e}")
+        finally:
+            result.finished_at = datetime.now()
+        return result
+
+    async def run(
+        self,
+        context: Dict[str, Any],
+        on_stage_start: Optional[Callable[[StageResult], None]] = None,
+        on_stage_end: Optional[Callable[[StageResult], None]] = None,
+        checkpoints: Optional[CheckpointStore] = None,
+    ) -> Dict[str, StageResult]:
+        """
+        执行流水线
+
+        Args:
+            context: 共享上下文
+            on_stage_start: 阶段开始回调（参数为尚未完成的阶段结果对象）
+            on_stage_end: 阶段结束回调
+            checkpoints: 检查点存储；启用检查点的阶段命中时直接复用输出，成功后保存输出
+
+        Returns:
+            Dict[str, StageResult]: 阶段名称到执行结果的映射（按拓扑顺序）
+
+        Raises:
+            PipelineStageError: 必需阶段失败或超时
+        """
+        results: Dict[str, StageResult] = {name: StageResult(name) for name in self.order}
+        pending = list(self.order)
+        running: Dict[asyncio.Task, str] = {}
+        stage_inputs: Dict[str, Dict[str, Any]] = {}
+
+        try:
+            while pending or running:
+                resumed = False
+                for name in list(pending):
+                    stage = self.stages[name]
+                    if all(results[dep].status is not None for dep in stage.inputs):
+                        pending.remove(name)
+                        inputs = stage_inputs[name] = {dep: results[dep].value for dep in stage.inputs}
+                        result = results[name]
+                        if on_stage_start:
+                            on_stage_start(result)
+                        if stage.checkpoint and checkpoints is not None:
+                            hit, value = checkpoints.load(name, inputs)
+                            if hit:
+                                result.started_at = result.finished_at = datetime.now()
+                                result.value, result.status, result.resumed = value, StageStatus.SUCCEEDED, True
+                                result.hit = "checkpoint"
+                                logger.info(f"扫描阶段复用检查点: {name}")
+                                if on_stage_end:
+                                    on_stage_end(result)
+                                resumed = True
+                                continue
+                        task = asyncio.ensure_future(self._run_stage(stage, context, inputs, result))
+                        running[task] = name
+                if resumed:
+                    # 复用检查点的阶段可能使下游阶段就绪，重新检查
+                    continue
+                if not running:
+                    break
+
+                done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    result = task.result()
+                    stage = self.stages[name]
+                    # 保存实际执行或使用缓存结果得到的输出（离线跳过的输出不保存，补全扫描时再执行）
+                    if (stage.checkpoint and checkpoints is not None and result.status == StageStatus.SUCCEEDED
+                            and result.value is not None and result.hit in (None, "cache")):
+                        checkpoints.save(name, stage_inputs[name], result.value)
+                    if on_stage_end:
+                        on_stage_end(result)
+                    if result.status != StageStatus.SUCCEEDED and stage.required:
+                        raise PipelineStageError(result)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running.keys(), return_exceptions=True)
+
+        return results
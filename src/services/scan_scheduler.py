@@ -0,0 +1,303 @@
+"""
+扫描调度模块：按优先级分类的加权公平扫描队列
+Scan scheduler module: weighted fair scan queue with priority classes
+
+- 交互式（interactive）：Web UI 等用户等待中的少量扫描
+- 批量（batch）：CI 等一次提交大量工具的扫描
+- 后台（background）：定期重扫等不紧急的扫描
+
+各优先级按权重（平滑加权轮询）分配空闲的并发槽位，
+并为交互式任务保留固定数量的槽位，批量任务再多也不会占满全部并发。
+"""
+
+import asyncio
+import threading
+from collections import deque
+from enum import Enum
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from src.logger import get_logger
+
+logger = get_logger()
+
+
+class ScanPriority(str, Enum):
+    """扫描优先级"""
+    INTERACTIVE = "interactive"
+    BATCH = "batch"
+    BACKGROUND = "background"
+
+
+class WeightedFairQueue:
+    """按优先级分类的加权公平队列（平滑加权轮询）"""
+
+    def __init__(self, weights: Dict[str, int]):
+        self.weights: Dict[ScanPriority, int] = {
+            priority: max(1, int(weights.get(priority.value, 1))) for priority in ScanPriority
+        }
+        self.queues: Dict[ScanPriority, Deque[Any]] = {priority: deque() for priority in ScanPriority}
+        self._current: Dict[ScanPriority, int] = {priority: 0 for priority in ScanPriority}
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def remove(self, predicate: Callable[[Any], bool]) -> List[Any]:
+        """移除满足条件的排队任务，返回被移除的任务"""
+        removed: List[Any] = []
+        for priority, queue in self.queues.items():
+            kept: Deque[Any] = deque()
+            for item in queue:
+                (removed if predicate(item) else kept).append(item)
+            self.queues[priority] = kept
+        return removed
+
+    def counts(self) -> Dict[str, int]:
+        """各优先级排队数量"""
+        return {priority.value: len(queue) for priority, queue in self.queues.items()}
+
+    def push(self, item: Any, priority: ScanPriority) -> None:
+        """入队"""
+        self.queues[priority].append(item)
+
+    def pop(self, allowed: Optional[Iterable[ScanPriority]] = None) -> Optional[Tuple[ScanPriority, Any]]:
+        """
+        按权重选择下一个出队的任务
+
+        Args:
+            allowed: 允许出队的优先级（默认全部）
+
+        Returns:
+            Optional[Tuple[ScanPriority, Any]]: (优先级, 任务)，没有可出队任务返回None
+        """
+        allowed_set = set(allowed) if allowed is not None else set(ScanPriority)
+        candidates = [p for p in ScanPriority if p in allowed_set and self.queues[p]]
+        if not candidates:
+            return None
+
+        total = 0
+        for priority in candidates:
+            self._current[priority] += self.weights[priority]
+            total += self.weights[priority]
+        chosen = max(candidates, key=lambda p: self._current[p])
+        self._current[chosen] -= total
+        return chosen, self.queues[chosen].popleft()
+
+
+class ScanScheduler:
+    """
+    扫描调度器
+
+    在独立的后台线程事件循环中运行（也可挂接到已有事件循环），
+    submit() 可从任意线程调用。
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[Any], Awaitable[None]],
+        max_concurrent: int,
+        weights: Dict[str, int],
+        interactive_reserved_slots: int = 1,
+        dispatch_gate: Optional[Callable[[ScanPriority], bool]] = None,
+        gate_recheck_seconds: float = 60,
+    ):
+        """
+        Args:
+            runner: 执行单个任务的协程函数
+            max_concurrent: 最大并发数
+            weights: 各优先级权重（键为优先级名称）
+            interactive_reserved_slots: 为交互式任务保留的槽位数
+            dispatch_gate: 出队检查（返回False的优先级暂停出队，如 AI 预算不足时推迟低优先级扫描）
+            gate_recheck_seconds: 有优先级被暂停时重新检查的间隔（秒）
+        """
+        self.runner = runner
+        self.max_concurrent = max(1, max_concurrent)
+        self.interactive_reserved_slots = max(0, interactive_reserved_slots)
+        self.dispatch_gate = dispatch_gate
+        self.gate_recheck_seconds = gate_recheck_seconds
+        self._recheck: Optional[asyncio.TimerHandle] = None
+        self.held: List[ScanPriority] = []  # 被出队检查暂停的优先级
+        self.queue = WeightedFairQueue(weights)
+        self.running: Dict[ScanPriority, int] = {priority: 0 for priority in ScanPriority}
+        self._active: Dict[int, asyncio.Task] = {}  # id(任务) -> 执行中的协程
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    # ---------- 事件循环 ----------
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """挂接到已有事件循环（由调用方负责运行该循环）"""
+        self.loop = loop
+
+    def ensure_started(self) -> asyncio.AbstractEventLoop:
+        """确保调度器的事件循环已启动（默认在后台线程中运行）"""
+        with self._lock:
+            if self.loop is None or self.loop.is_closed():
+                loop = asyncio.new_event_loop()
+
+                def run_loop():
+                    asyncio.set_event_loop(loop)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run_loop, name="scan-scheduler", daemon=True)
+                self._thread.start()
+                self.loop = loop
+                logger.info("扫描调度器已启动")
+            return self.loop
+
+    # ---------- 提交与调度 ----------
+
+    def submit(self, item: Any, priority: ScanPriority) -> None:
+        """提交任务（线程安全）"""
+        loop = self.ensure_started()
+        loop.call_soon_threadsafe(self._enqueue, item, priority)
+
+    def submit_many(self, items: List[Any], priority: ScanPriority) -> None:
+        """批量提交任务（线程安全）"""
+        if not items:
+            return
+        loop = self.ensure_started()
+        loop.call_soon_threadsafe(self._enqueue_many, items, priority)
+
+    def _enqueue(self, item: Any, priority: ScanPriority) -> None:
+        self.queue.push(item, priority)
+        self._dispatch()
+
+    def _enqueue_many(self, items: List[Any], priority: ScanPriority) -> None:
+        for item in items:
+            self.queue.push(item, priority)
+        self._dispatch()
+
+    def set_max_concurrent(self, limit: int) -> None:
+        """
+        调整并发上限（线程安全）
+
+        上限降低时不会中断执行中的任务，只是在其完成前不再启动新任务
+        """
+        self.max_concurrent = max(1, limit)
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._dispatch)
+
+    @property
+    def in_flight(self) -> int:
+        """正在执行的任务数"""
+        return sum(self.running.values())
+
+    def _shared_slots(self) -> int:
+        """非交互式任务可使用的槽位数（至少保留 1 个，避免批量任务饿死）"""
+        return max(1, self.max_concurrent - self.interactive_reserved_slots)
+
+    def _gate(self) -> List[ScanPriority]:
+        """按出队检查确定可出队的优先级；有排队任务被暂停时安排重新检查"""
+        if self.dispatch_gate is None:
+            return list(ScanPriority)
+        self.held = []
+        for priority in ScanPriority:
+            try:
+                if not self.dispatch_gate(priority):
+                    self.held.append(priority)
+            except Exception as e:
+                logger.error(f"扫描出队检查失败: {e}")
+        if any(self.queue.queues[priority] for priority in self.held) and self._recheck is None:
+            self._recheck = self.loop.call_later(self.gate_recheck_seconds, self._recheck_gate)
+        return [priority for priority in ScanPriority if priority not in self.held]
+
+    def _recheck_gate(self) -> None:
+        self._recheck = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """在空闲槽位上按权重启动排队任务（仅在调度器事件循环中调用）"""
+        if self.in_flight >= self.max_concurrent or not len(self.queue):
+            return
+        open_priorities = self._gate()
+        while self.in_flight < self.max_concurrent:
+            non_interactive = self.in_flight - self.running[ScanPriority.INTERACTIVE]
+            allowed = [ScanPriority.INTERACTIVE]
+            if non_interactive < self._shared_slots():
+                allowed += [ScanPriority.BATCH, ScanPriority.BACKGROUND]
+            picked = self.queue.pop([priority for priority in allowed if priority in open_priorities])
+            if picked is None:
+                return
+            priority, item = picked
+            self.running[priority] += 1
+            self._active[id(item)] = self.loop.create_task(self._run(item, priority))
+
+    async def _run(self, item: Any, priority: ScanPriority) -> None:
+        try:
+            await self.runner(item)
+        except asyncio.CancelledError:
+            logger.info("扫描调度任务已取消")
+        except Exception as e:
+            logger.error(f"扫描调度任务执行异常: {e}")
+        finally:
+            self._active.pop(id(item), None)
+            self.running[priority] -= 1
+            self._dispatch()
+
+    def promote(self, items: List[Any], priority: ScanPriority) -> None:
+        """
+        将排队中的任务移到更高优先级的队列（线程安全；执行中或不在队列中的任务不受影响）
+
+        Args:
+            items: 任务
+            priority: 新的优先级
+        """
+        if self.loop is None or self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self._promote, items, priority)
+
+    def _promote(self, items: List[Any], priority: ScanPriority) -> None:
+        targets = {id(item) for item in items}
+        for item in self.queue.remove(lambda item: id(item) in targets):
+            self.queue.push(item, priority)
+        self._dispatch()
+
+    # ---------- 取消 ----------
+
+    def cancel(self, items: List[Any]) -> int:
+        """
+        取消任务（线程安全）：排队中的任务移出队列，执行中的任务取消其协程
+
+        Args:
+            items: 要取消的任务
+
+        Returns:
+            int: 被移出队列或被取消执行的任务数
+        """
+        if self.loop is None or self.loop.is_closed():
+            return 0
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        if current is self.loop:
+            return self._cancel(items)
+
+        async def _cancel_in_loop() -> int:
+            return self._cancel(items)
+
+        future = asyncio.run_coroutine_threadsafe(_cancel_in_loop(), self.loop)
+        return future.result(timeout=5)
+
+    def _cancel(self, items: List[Any]) -> int:
+        targets = {id(item) for item in items}
+        removed = self.queue.remove(lambda item: id(item) in targets)
+        cancelled = 0
+        for key in targets:
+            running_task = self._active.get(key)
+            if running_task is not None and not running_task.done():
+                running_task.cancel()
+                cancelled += 1
+        return len(removed) + cancelled
+
+    def stats(self) -> Dict[str, Any]:
+        """调度器状态"""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "interactive_reserved_slots": self.interactive_reserved_slots,
+            "in_flight": self.in_flight,
+            "running": {priority.value: count for priority, count in self.running.items()},
+            "queued": self.queue.counts(),
+            "held": [priority.value for priority in self.held],
+        }
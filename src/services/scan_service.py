@@ -4,36 +4,314 @@ Scan service module for managing compliance scanning tasks
 """
 
 import asyncio
+import json
+import uuid
 from enum import Enum
-from typing import List, Optional, Dict, Any
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
 from sqlalchemy.orm import Session
-from src.models import Tool, ComplianceReport
+from src.models import Tool, ComplianceReport, ScanTaskRecord
 from src.logger import get_logger
-from src.config import get_config
-from src.services.tool_info_service import get_tool_info
-from src.services.tos_service import get_and_analyze_tos
+from src.config import get_config, ScanningConfig
+from src.database import get_session_for, session_scope
+from src.services.tool_info_service import fetch_tool_version, update_tool_info, tool_info_dict
+from src.services.tool_service import batch_create_tools
+from src.services.report_service import get_report_service
+from src.services.tos_service import search_tos_url, fetch_tos_content, analyze_tos_with_ai, save_tos_analysis
 from src.services.compliance_engine import get_compliance_engine
 from src.services.ai_client import get_ai_client
-from src.services.tool_knowledge_base import merge_tos_analysis_with_knowledge_base
+from src.services.tool_knowledge_base import get_tool_basic_info, get_tool_kb_entry, merge_tos_analysis
+from src.services.scan_pipeline import (
+    ScanPipeline, PipelineStage, PipelineStageError, StageResult, StageStatus, mark_stage_hit
+)
+from src.services.freshness_service import get_fresh_report, get_latest_report, get_trusted_kb_entry
+from src.services.scan_scheduler import ScanScheduler, ScanPriority
+from src.services.concurrency_limiter import get_concurrency_limiter
+from src.services.task_registry import ScanTaskRegistry
+from src.services.checkpoint_service import ScanCheckpointStore
+from src.services.result_writer import ResultWriter, WriteOp
+from src.services.bulkhead import get_bulkheads
+from src.services.trace_service import get_trace_recorder
+from src.services.admission_service import AdmissionController
+from src.services.retry_service import FETCH_STAGES, ScanErrorKind, classify_error, clear_retry, defer_retry, record_failure
+from src.services.budget_service import BudgetDecision, bind_client, get_token_budget, unbind_client
+from src.services.offline_service import get_provider_circuit
 
 logger = get_logger()
 
 
+# ==================== 扫描流水线阶段 ====================
+
+# 流水线上下文：
+#   tool:            工具对象的只读快照（已脱离会话，只读取 id/name 等字段）
+#   session_factory: 数据库会话工厂
+#   writer:          扫描结果写入任务（工具信息、TOS分析、报告的写入合并到批量事务中提交）
+#   circuit:         AI 服务熔断器（离线模式下各 AI 阶段改用已缓存的结果或跳过）
+# 阶段内的数据库读取在 session_scope() 短事务中完成，写入通过 _write() 交给写入任务；
+# 事务不跨越对外部服务的 await
+
+# 阶段名称 -> 进度描述
+STAGE_DESCRIPTIONS = {
+    "tool_info": "获取工具基本信息...",
+    "kb_lookup": "查询工具信息库...",
+    "tos_url": "搜索工具服务条款(TOS)链接...",
+    "tos_fetch": "获取工具服务条款(TOS)内容...",
+    "tos_analysis": "分析工具服务条款(TOS)...",
+    "alternatives": "分析替代方案...",
+    "merge": "合并知识库信息...",
+    "report": "生成合规报告...",
+}
+
+
+async def _stage_tool_info(context: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """获取工具信息（简化：仅获取基本信息，不进行详细分析）"""
+    version = await fetch_tool_version(context["tool"].name)
+    tool_id = context["tool"].id
+    tool_info = await _write(
+        context, lambda db: tool_info_dict(update_tool_info(db, _get_tool(db, tool_id), version, commit=False))
+    )
+    logger.info(f"获取工具信息完成: {context['tool'].name}")
+    return tool_info
+
+
+async def _stage_kb_lookup(context: Dict[str, Any], inputs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """查询知识库（数据库知识库优先，其次内置知识库）"""
+    with session_scope(context["session_factory"]) as db:
+        kb_info = get_tool_basic_info(context["tool"].name, db)
+    if kb_info:
+        mark_stage_hit("kb")
+    return kb_info
+
+
+def _offline(context: Dict[str, Any], probe: bool = True) -> bool:
+    """
+    当前是否处于离线模式（在各阶段开始时检查，扫描中途熔断时后续阶段也不再调用 AI）
+    
+    Args:
+        context: 流水线上下文
+        probe: 调用方是否将调用 AI（熔断时间已过时占用唯一的试探名额）；为 False 时只查询状态
+    """
+    circuit = context.get("circuit")
+    if circuit is None:
+        return False
+    return not circuit.allow_request() if probe else circuit.is_offline
+
+
+def _cached_tos_analysis(tool: Tool) -> Optional[Dict[str, Any]]:
+    """工具已保存的 TOS 分析结果（Tool.tos_info，没有或无法解析时为None）"""
+    if not tool.tos_info:
+        return None
+    try:
+        tos_info = json.loads(tool.tos_info)
+    except ValueError:
+        return None
+    if not isinstance(tos_info, dict):
+        return None
+    # 有 TOS 原文时保存为 {"content": ..., "analysis": ...}，直接分析时保存分析结果本身
+    return tos_info["analysis"] if "analysis" in tos_info else tos_info
+
+
+async def _stage_tos_url(context: Dict[str, Any], inputs: Dict[str, Any]) -> Optional[str]:
+    """搜索TOS链接（离线时使用工具已保存的链接）"""
+    if _offline(context):
+        mark_stage_hit("cache" if context["tool"].tos_url else "offline")
+        return context["tool"].tos_url
+    return await search_tos_url(context["tool"].name, raise_errors=True)
+
+
+async def _stage_tos_fetch(context: Dict[str, Any], inputs: Dict[str, Any]) -> Optional[str]:
+    """获取TOS文档内容（没有链接时跳过；离线时无法分析，也跳过）"""
+    tos_url = inputs["tos_url"]
+    if not tos_url:
+        return None
+    if _offline(context, probe=False):
+        mark_stage_hit("offline")
+        return None
+    return await fetch_tos_content(tos_url, raise_errors=True)
+
+
+async def _stage_tos_analysis(context: Dict[str, Any], inputs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """分析TOS文档；找不到TOS链接时由AI直接分析工具信息；离线时使用工具已保存的分析结果"""
+    tool = context["tool"]
+    tos_url, tos_content = inputs["tos_url"], inputs["tos_fetch"]
+    
+    if _offline(context):
+        analysis = _cached_tos_analysis(tool)
+        mark_stage_hit("cache" if analysis else "offline")
+        return analysis
+    
+    if not tos_url:
+        logger.warning(f"无法找到工具 {tool.name} 的TOS链接，将使用AI直接分析")
+        analysis = await get_ai_client().analyze_tool_directly(tool.name)
+        if analysis and "error" not in analysis:
+            await _write(context, lambda db: save_tos_analysis(_get_tool(db, tool.id), db, analysis, commit=False))
+            logger.info(f"通过AI直接分析工具信息成功: {tool.name}")
+            return analysis
+        logger.warning(f"TOS信息获取失败: {tool.name} - 无法找到TOS链接，且AI分析失败")
+        return None
+    
+    if not tos_content:
+        logger.warning(f"TOS信息获取失败: {tool.name} - 无法获取TOS内容")
+        return None
+    
+    analysis = await analyze_tos_with_ai(tool.name, tos_content, raise_errors=True)
+    if analysis:
+        await _write(context, lambda db: save_tos_analysis(
+            _get_tool(db, tool.id), db, analysis, tos_url=tos_url, tos_content=tos_content, commit=False
+        ))
+        logger.info(f"TOS信息获取和分析完成: {tool.name}")
+    return analysis
+
+
+async def _stage_alternatives(context: Dict[str, Any], inputs: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """独立获取替代方案（不依赖TOS分析；知识库已有替代方案时跳过AI调用）"""
+    kb_info = inputs["kb_lookup"]
+    if kb_info and kb_info.get("alternative_tools"):
+        mark_stage_hit("kb")
+        return None
+    if _offline(context):
+        mark_stage_hit("offline")
+        return None
+    tool = context["tool"]
+    alternative_tools = await get_ai_client().get_alternative_tools(tool.name)
+    if alternative_tools:
+        logger.info(f"独立获取替代方案成功: {tool.name} - 找到 {len(alternative_tools)} 个替代方案")
+    return alternative_tools
+
+
+async def _stage_merge(context: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """合并TOS分析、知识库与替代方案（AI结果优先，知识库用于补充）"""
+    kb_info = inputs["kb_lookup"]
+    tos_analysis = merge_tos_analysis(inputs["tos_analysis"], kb_info)
+    if tos_analysis:
+        logger.info(f"已合并TOS分析和知识库信息: {context['tool'].name}")
+    
+    if not tos_analysis.get("alternative_tools"):
+        alternative_tools = inputs["alternatives"] or (kb_info or {}).get("alternative_tools")
+        if alternative_tools:
+            # 如果TOS分析不存在，得到的是一个仅包含替代方案的最小结构
+            tos_analysis["alternative_tools"] = alternative_tools
+    return tos_analysis
+
+
+async def _stage_report(context: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """生成合规报告（简化模式：仅保存TOS分析和替代方案，跳过多维度评估）"""
+    compliance_engine = get_compliance_engine()
+    # 先完成评估（可能调用AI），再交给写入任务保存报告
+    evaluation = await compliance_engine.evaluate_report(
+        context["tool"], inputs["tool_info"], inputs["merge"], offline=_offline(context)
+    )
+    tool_id = context["tool"].id
+    
+    def write(db: Session) -> Dict[str, Any]:
+        report = compliance_engine.save_report(_get_tool(db, tool_id), db, evaluation, inputs["merge"], commit=False)
+        return {"report_id": report.id, "revision": report.revision}
+    
+    return await _write(context, write)
+
+
+async def _write(context: Dict[str, Any], op) -> Any:
+    """把写入操作交给扫描结果写入任务，等待所在事务提交后返回操作结果"""
+    return await context["writer"].submit(context["session_factory"], op)
+
+
+def _get_tool(db: Session, tool_id: int) -> Tool:
+    """在当前会话中加载工具（不存在时抛出异常）"""
+    tool = db.query(Tool).filter(Tool.id == tool_id).first()
+    if not tool:
+        raise ValueError(f"工具不存在: ID {tool_id}")
+    return tool
+
+
+def load_tool_snapshot(session_factory, tool_id: int) -> Tool:
+    """
+    加载工具的只读快照（脱离会话，供流水线各阶段读取 id/name 等字段）
+    
+    Args:
+        session_factory: 数据库会话工厂
+        tool_id: 工具ID
+    
+    Returns:
+        Tool: 已脱离会话的工具对象
+    
+    Raises:
+        ValueError: 工具不存在
+    """
+    with session_scope(session_factory) as db:
+        tool = _get_tool(db, tool_id)
+        db.expunge(tool)
+    return tool
+
+
+def build_scan_pipeline(scanning_config: ScanningConfig) -> ScanPipeline:
+    """
+    构建扫描流水线
+    
+    阶段依赖关系：
+        tool_info ──────────────────────────────────────┐
+        kb_lookup ──┬─ alternatives ─┐                  ├─ report
+        tos_url ─ tos_fetch ─ tos_analysis ─┴─ merge ───┘
+    
+    tos_url / tos_fetch / tos_analysis / alternatives 的输出保存为检查点，
+    失败后重新扫描时从最后完成的阶段继续。
+    
+    Args:
+        scanning_config: 扫描配置（读取阶段超时）
+    
+    Returns:
+        ScanPipeline: 扫描流水线
+    """
+    def timeout(name: str) -> int:
+        return scanning_config.stage_timeouts.get(name, scanning_config.stage_timeout)
+    
+    return ScanPipeline([
+        PipelineStage("tool_info", _stage_tool_info, timeout=timeout("tool_info"), required=True),
+        PipelineStage("kb_lookup", _stage_kb_lookup, timeout=timeout("kb_lookup")),
+        PipelineStage("tos_url", _stage_tos_url, timeout=timeout("tos_url"), checkpoint=True),
+        PipelineStage("tos_fetch", _stage_tos_fetch, inputs=["tos_url"], timeout=timeout("tos_fetch"), checkpoint=True),
+        PipelineStage(
+            "tos_analysis", _stage_tos_analysis, inputs=["tos_url", "tos_fetch"],
+            timeout=timeout("tos_analysis"), checkpoint=True
+        ),
+        PipelineStage(
+            "alternatives", _stage_alternatives, inputs=["kb_lookup"], timeout=timeout("alternatives"), checkpoint=True
+        ),
+        PipelineStage("merge", _stage_merge, inputs=["tos_analysis", "kb_lookup", "alternatives"], timeout=timeout("merge")),
+        PipelineStage("report", _stage_report, inputs=["tool_info", "merge"], timeout=timeout("report"), required=True),
+    ])
+
+
+def _parse_kb_time(kb_meta: Dict[str, Any]) -> Optional[datetime]:
+    """解析知识库元数据中的更新时间（内置知识库为None）"""
+    return datetime.fromisoformat(kb_meta["updated_at"]) if kb_meta.get("updated_at") else None
+
+
 class ScanTaskStatus(str, Enum):
     """扫描任务状态"""
     PENDING = "pending"
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+# 终态：任务不会再发生变化
+TERMINAL_STATUSES = {ScanTaskStatus.COMPLETED, ScanTaskStatus.FAILED, ScanTaskStatus.CANCELLED}
 
 
 class ScanTask:
     """扫描任务类"""
     
-    def __init__(self, tool_id: int, tool_name: str):
+    __slots__ = (
+        "tool_id", "tool_name", "priority", "status", "created_at", "started_at", "completed_at",
+        "error_message", "error", "result", "progress", "current_step", "stages", "cached",
+        "batch_id", "timed_out_stages", "provisional", "submitted", "subscribers", "error_kind", "client",
+    )
+    
+    def __init__(self, tool_id: int, tool_name: str, priority: ScanPriority = ScanPriority.INTERACTIVE):
         self.tool_id = tool_id
         self.tool_name = tool_name
+        self.priority = priority
         self.status = ScanTaskStatus.PENDING
         self.created_at = datetime.now()
         self.started_at: Optional[datetime] = None
@@ -43,6 +321,68 @@ class ScanTask:
         self.result: Optional[Dict[str, Any]] = None
         self.progress: Optional[float] = None  # 进度（0.0-1.0）
         self.current_step: Optional[str] = None  # 当前步骤描述
+        self.stages: Dict[str, StageResult] = {}  # 各流水线阶段的执行结果
+        self.cached = False  # 是否直接复用了有效期内的已有报告
+        self.batch_id: Optional[str] = None  # 所属扫描批次
+        self.timed_out_stages: List[str] = []  # 任务超时时仍在执行的阶段
+        self.provisional: Optional[Dict[str, Any]] = None  # 由知识库即时生成的临时结果
+        self.submitted = False  # 是否已提交执行（进入扫描队列或由 scan_tools 直接执行）
+        self.subscribers = 0  # 合并到该任务的其他扫描请求数
+        self.error_kind: Optional[ScanErrorKind] = None  # 失败时的错误类型
+        self.client: Optional[str] = None  # 提交扫描的客户端（AI 用量计入该客户端的预算）
+    
+    @property
+    def is_terminal(self) -> bool:
+        """任务是否已结束"""
+        return self.status in TERMINAL_STATUSES
+    
+    async def wait(self, poll_interval: float = 0.05) -> "ScanTask":
+        """
+        等待任务结束（任务可能在扫描调度器线程的事件循环中执行，按间隔轮询状态）
+        
+        Args:
+            poll_interval: 轮询间隔（秒）
+        
+        Returns:
+            ScanTask: 任务本身
+        """
+        while not self.is_terminal:
+            await asyncio.sleep(poll_interval)
+        return self
+    
+    def to_record(self) -> ScanTaskRecord:
+        """转换为归档记录"""
+        return ScanTaskRecord(
+            tool_id=self.tool_id,
+            tool_name=self.tool_name,
+            batch_id=self.batch_id,
+            status=self.status.value,
+            priority=self.priority.value,
+            cached=self.cached,
+            report_id=self.result.get("report_id") if self.result else None,
+            error=self.error_message,
+            timed_out_stages=self.timed_out_stages or None,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            completed_at=self.completed_at,
+        )
+    
+    @classmethod
+    def from_record(cls, record: ScanTaskRecord) -> "ScanTask":
+        """从归档记录重建任务（不包含各阶段明细）"""
+        task = cls(record.tool_id, record.tool_name, priority=ScanPriority(record.priority or ScanPriority.INTERACTIVE))
+        task.status = ScanTaskStatus(record.status)
+        task.batch_id = record.batch_id
+        task.cached = bool(record.cached)
+        task.created_at = record.created_at
+        task.started_at = record.started_at
+        task.completed_at = record.completed_at
+        task.error_message = task.error = record.error
+        task.timed_out_stages = list(record.timed_out_stages or [])
+        if task.status == ScanTaskStatus.COMPLETED:
+            task.progress = 1.0
+            task.result = {"tool_id": record.tool_id, "report_id": record.report_id, "cached": task.cached}
+        return task
     
     def start(self):
         """开始处理任务"""
@@ -65,6 +405,42 @@ class ScanTask:
         self.result = result
         logger.info(f"完成扫描任务: {self.tool_name} (ID: {self.tool_id})")
     
+    def complete_from_cache(self, report: ComplianceReport):
+        """使用有效期内的已有报告直接完成任务"""
+        self.cached = True
+        self.progress = 1.0
+        self.current_step = "复用有效期内的合规报告"
+        generated_at = report.updated_at or report.created_at
+        self.complete({
+            "tool_id": self.tool_id,
+            "report_id": report.id,
+            "message": "复用有效期内的合规报告",
+            "cached": True,
+            "report_generated_at": generated_at.isoformat() if generated_at else None
+        })
+    
+    def complete_from_kb(self, report_id: int, revision: Optional[int]):
+        """使用可信知识库条目直接生成的报告完成任务（跳过全部 AI 阶段）"""
+        self.progress = 1.0
+        self.current_step = "由可信知识库条目生成合规报告"
+        self.complete({
+            "tool_id": self.tool_id,
+            "report_id": report_id,
+            "message": "由可信知识库条目生成合规报告",
+            "cached": False,
+            "kb_only": True,
+            "revision": revision,
+        })
+    
+    def cancel(self):
+        """取消任务"""
+        if self.status in TERMINAL_STATUSES:
+            return
+        self.status = ScanTaskStatus.CANCELLED
+        self.completed_at = datetime.now()
+        self.current_step = "任务已取消"
+        logger.info(f"扫描任务已取消: {self.tool_name} (ID: {self.tool_id})")
+    
     def fail(self, error_message: str):
         """任务失败"""
         self.status = ScanTaskStatus.FAILED
@@ -74,197 +450,931 @@ class ScanTask:
         logger.error(f"扫描任务失败: {self.tool_name} (ID: {self.tool_id}) - {error_message}")
 
 
+class ScanBatch:
+    """扫描批次（一次扫描提交中的所有任务）"""
+    
+    __slots__ = ("batch_id", "tasks", "priority", "created_at", "ingest", "client")
+    
+    def __init__(
+        self,
+        tasks: List[ScanTask],
+        priority: ScanPriority,
+        batch_id: Optional[str] = None,
+        client: Optional[str] = None,
+    ):
+        self.batch_id = batch_id or uuid.uuid4().hex
+        self.tasks: List[ScanTask] = []
+        self.priority = priority
+        self.created_at = datetime.now()
+        self.ingest: Optional[Dict[str, Any]] = None  # 流式导入进度（仅上传导入的批次）
+        self.client = client  # 提交批次的客户端（None 表示定期重扫、失败重试等系统提交）
+        self.add_tasks(tasks)
+    
+    @classmethod
+    def from_tasks(cls, batch_id: str, tasks: List[ScanTask]) -> "ScanBatch":
+        """从归档任务重建批次"""
+        batch = cls(tasks, tasks[0].priority, batch_id=batch_id)
+        batch.created_at = min((task.created_at for task in tasks if task.created_at), default=batch.created_at)
+        return batch
+    
+    def add_tasks(self, tasks: List[ScanTask]):
+        """向批次追加任务（合并到其他批次执行中任务的，保留其原批次ID与客户端）"""
+        for task in tasks:
+            if task.batch_id is None:
+                task.batch_id = self.batch_id
+                task.client = self.client
+        self.tasks.extend(tasks)
+    
+    def status_counts(self) -> Dict[str, int]:
+        """各状态任务数"""
+        counts = {status.value: 0 for status in ScanTaskStatus}
+        for task in self.tasks:
+            counts[task.status.value] += 1
+        return counts
+    
+    @property
+    def finished(self) -> bool:
+        """批次中所有任务是否均已结束（流式导入尚未结束时为False）"""
+        if self.ingest and self.ingest.get("status") in ("running", "throttled"):
+            return False
+        return all(task.status in TERMINAL_STATUSES for task in self.tasks)
+
+
 class ScanService:
     """扫描服务类"""
     
     def __init__(self):
         self.config = get_config()
         self.max_concurrent = self.config.scanning.max_concurrent
-        self.tasks: Dict[int, ScanTask] = {}
-        self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        # 资源隔离：启用时 AI 调用、TOS 获取与结果写入分别限流，扫描本身只受同时进行的扫描数约束
+        self.bulkheads = get_bulkheads()
+        bulkhead_config = self.config.scanning.bulkheads
+        scan_slots = bulkhead_config.max_in_flight_scans if bulkhead_config.enabled else self.max_concurrent
+        self.semaphore = asyncio.Semaphore(scan_slots)
+        self.pipeline = build_scan_pipeline(self.config.scanning)
+        self.writer = ResultWriter(self.config.scanning.result_writer, self.bulkheads.db_write)
+        # 有界任务表：已结束的任务按数量与保留时间归档到数据库（归档交给写入任务合并提交）
+        self.registry = ScanTaskRegistry(self.config.scanning.task_registry, ScanTask, ScanBatch, writer=self.writer)
+        self.admission = AdmissionController(self.config.scanning.admission, self.registry, self.max_concurrent)
+        self.budget = get_token_budget()
+        self.circuit = get_provider_circuit()
+        self.trace = get_trace_recorder()
+        scheduler_config = self.config.scanning.scheduler
+        self.scheduler = ScanScheduler(
+            runner=self._run_scheduled_task,
+            max_concurrent=scan_slots,
+            weights=scheduler_config.weights,
+            interactive_reserved_slots=scheduler_config.interactive_reserved_slots,
+            # AI 预算接近用尽时低优先级扫描留在队列中
+            dispatch_gate=self.budget.allows_dispatch if self.budget.config.enabled else None,
+            gate_recheck_seconds=self.budget.config.recheck_seconds,
+        )
+        if self.config.scanning.adaptive_concurrency.enabled and not bulkhead_config.enabled:
+            # 调度器并发上限跟随 AI 接口的限流/超时信号自适应调整（启用资源隔离时改为调整 AI 调用资源池）
+            get_concurrency_limiter().add_listener(self.scheduler.set_max_concurrent)
+    
+    def resolve_priority(self, requested: Optional[ScanPriority], tool_count: int) -> ScanPriority:
+        """
+        确定扫描优先级
+        
+        Args:
+            requested: 请求中指定的优先级
+            tool_count: 本次提交的工具数量
+        
+        Returns:
+            ScanPriority: 未指定时少量工具视为交互式，大量工具视为批量
+        """
+        if requested:
+            return ScanPriority(requested)
+        if tool_count <= self.config.scanning.scheduler.interactive_max_tools:
+            return ScanPriority.INTERACTIVE
+        return ScanPriority.BATCH
     
-    def create_scan_tasks(self, tool_ids: List[int], db: Session) -> List[ScanTask]:
+    def create_scan_tasks(
+        self,
+        tool_ids: List[int],
+        db: Session,
+        force_refresh: bool = False,
+        priority: ScanPriority = ScanPriority.INTERACTIVE,
+        reuse_latest: bool = False,
+        provisional: bool = False,
+        kb_only: Optional[bool] = None
+    ) -> List[ScanTask]:
         """
         为工具ID列表创建扫描任务
         
+        工具已有未结束（排队中或执行中）的任务时不创建新任务，合并到该任务：
+        执行中的任务总是完整扫描，满足任何新鲜度策略，同一工具同时只执行一次扫描；
+        有效期内已有完整报告的工具直接以缓存结果完成任务，不再进入扫描队列；
+        启用仅知识库扫描时，有可信且近期更新的知识库条目的工具直接由知识库生成报告
+        （阻塞等待这些报告的写入提交，协程中应使用 create_scan_tasks_async）
+        
         Args:
             tool_ids: 工具ID列表
             db: 数据库会话
+            force_refresh: 是否忽略新鲜度策略，强制重新扫描
+            priority: 扫描优先级
+            reuse_latest: 是否不论有效期直接复用最新报告（没有报告时仍会扫描）
+            provisional: 是否为需要扫描的工具即时生成知识库临时报告
+            kb_only: 是否启用仅知识库扫描（None 表示按 scanning.kb_only.enabled 配置）
         
         Returns:
-            List[ScanTask]: 扫描任务列表
+            List[ScanTask]: 扫描任务列表（包含合并到的已有任务，同一任务只出现一次）
         """
+        tasks, kb_writes = self._prepare_scan_tasks(
+            tool_ids, db, force_refresh=force_refresh, priority=priority,
+            reuse_latest=reuse_latest, provisional=provisional, kb_only=kb_only
+        )
+        self._commit_kb_writes(db, kb_writes)
+        return tasks
+    
+    async def create_scan_tasks_async(
+        self,
+        tool_ids: List[int],
+        db: Session,
+        force_refresh: bool = False,
+        priority: ScanPriority = ScanPriority.INTERACTIVE,
+        reuse_latest: bool = False,
+        provisional: bool = False,
+        kb_only: Optional[bool] = None
+    ) -> List[ScanTask]:
+        """
+        为工具ID列表创建扫描任务（协程版本，参数与返回值同 create_scan_tasks）
+        
+        由知识库生成报告的写入以 awaitable 方式等待提交，不阻塞请求所在的事件循环
+        """
+        tasks, kb_writes = self._prepare_scan_tasks(
+            tool_ids, db, force_refresh=force_refresh, priority=priority,
+            reuse_latest=reuse_latest, provisional=provisional, kb_only=kb_only
+        )
+        await self._commit_kb_writes_async(db, kb_writes)
+        return tasks
+    
+    def _prepare_scan_tasks(
+        self,
+        tool_ids: List[int],
+        db: Session,
+        force_refresh: bool = False,
+        priority: ScanPriority = ScanPriority.INTERACTIVE,
+        reuse_latest: bool = False,
+        provisional: bool = False,
+        kb_only: Optional[bool] = None
+    ) -> Tuple[List[ScanTask], List[Tuple[WriteOp, Callable[[bool, Any], None]]]]:
+        """创建扫描任务，返回任务列表与待提交的知识库报告写入（见 create_scan_tasks）"""
         tasks = []
+        seen = set()
+        # 由知识库生成报告的写入，循环结束后一起交给结果写入任务合并提交
+        kb_writes: List[Tuple[WriteOp, Callable[[bool, Any], None]]] = []
+        freshness = self.config.scanning.freshness
+        if kb_only is None:
+            kb_only = self.config.scanning.kb_only.enabled
+        tools_by_id = {tool.id: tool for tool in db.query(Tool).filter(Tool.id.in_(tool_ids)).all()}
         
         for tool_id in tool_ids:
             # 验证工具是否存在
-            tool = db.query(Tool).filter(Tool.id == tool_id).first()
+            tool = tools_by_id.get(tool_id)
             if not tool:
                 logger.warning(f"工具不存在: ID {tool_id}")
                 continue
             
-            # 创建扫描任务
-            task = ScanTask(tool_id=tool.id, tool_name=tool.name)
-            self.tasks[tool_id] = task
+            # 创建扫描任务（工具已有未结束的任务时合并到该任务）
+            new_task = ScanTask(tool_id=tool.id, tool_name=tool.name, priority=priority)
+            task = self.registry.claim(new_task)
+            if id(task) in seen:
+                continue
+            seen.add(id(task))
             tasks.append(task)
-            logger.info(f"创建扫描任务: {tool.name} (ID: {tool_id})")
+            if task is not new_task:
+                self._join_in_flight(task, tool, db, priority, provisional, kb_writes)
+                continue
+            
+            if force_refresh:
+                fresh_report = None
+            elif reuse_latest:
+                fresh_report = get_latest_report(db, tool.id)
+                if fresh_report is not None and fresh_report.provisional:
+                    fresh_report = None
+            else:
+                fresh_report = get_fresh_report(db, tool, freshness)
+            if fresh_report:
+                task.complete_from_cache(fresh_report)
+                logger.info(f"复用有效期内的合规报告: {tool.name} (报告ID: {fresh_report.id})")
+            elif kb_only and self._queue_trusted_kb_report(task, tool, db, kb_writes):
+                continue
+            else:
+                logger.info(f"创建扫描任务: {tool.name} (ID: {tool_id})")
+                if provisional:
+                    self._queue_provisional_report(task, tool, db, kb_writes)
         
-        return tasks
+        return tasks, kb_writes
     
-    def start(self):
+    def _commit_kb_writes(self, db: Session, kb_writes: List[Tuple[WriteOp, Callable[[bool, Any], None]]]) -> None:
         """
-        启动扫描服务（异步处理所有待处理的任务）
+        将由知识库生成报告的写入交给结果写入任务合并提交，并按结果更新对应的任务
+        
+        Args:
+            db: 数据库会话（仅用于确定所绑定的数据库）
+            kb_writes: (写入操作, 结果回调) 列表
         """
-        if not self.tasks:
-            logger.warning("没有待处理的扫描任务")
+        if not kb_writes:
+            return
+        outcomes = self.writer.submit_many_blocking(get_session_for(db), [op for op, _ in kb_writes])
+        self._apply_kb_outcomes(db, kb_writes, outcomes)
+    
+    async def _commit_kb_writes_async(
+        self, db: Session, kb_writes: List[Tuple[WriteOp, Callable[[bool, Any], None]]]
+    ) -> None:
+        """同 _commit_kb_writes，在协程中等待写入提交"""
+        if not kb_writes:
             return
+        outcomes = await self.writer.submit_many(get_session_for(db), [op for op, _ in kb_writes])
+        self._apply_kb_outcomes(db, kb_writes, outcomes)
+    
+    def _apply_kb_outcomes(
+        self,
+        db: Session,
+        kb_writes: List[Tuple[WriteOp, Callable[[bool, Any], None]]],
+        outcomes: List[Tuple[bool, Any]],
+    ) -> None:
+        # 报告已在写入任务的会话中提交，调用方会话中已加载的对象需要重新读取
+        db.expire_all()
+        for (_, on_done), (ok, value) in zip(kb_writes, outcomes):
+            on_done(ok, value)
+    
+    def _join_in_flight(
+        self,
+        task: ScanTask,
+        tool: Tool,
+        db: Session,
+        priority: ScanPriority,
+        provisional: bool,
+        kb_writes: List[Tuple[WriteOp, Callable[[bool, Any], None]]],
+    ) -> None:
+        """
+        将新的扫描请求合并到工具未结束的任务
         
-        # 在新线程中异步处理所有任务
-        import threading
-        import asyncio
-        
-        def run_async_tasks():
-            """在新的事件循环中运行异步任务"""
-            new_loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(new_loop)
-            try:
-                new_loop.run_until_complete(self._process_all_tasks())
-            finally:
-                new_loop.close()
-        
-        # 在后台线程中运行
-        thread = threading.Thread(target=run_async_tasks, daemon=True)
-        thread.start()
-        logger.info(f"已启动扫描服务，待处理任务数: {len(self.tasks)}")
-    
-    async def _process_all_tasks(self):
-        """处理所有扫描任务"""
-        from src.database import get_session
-        SessionLocal = get_session()
+        排队中的任务按更高的请求优先级重新排队；请求需要临时报告而任务没有时补充生成
         
-        tasks_to_process = list(self.tasks.values())
-        logger.info(f"开始处理 {len(tasks_to_process)} 个扫描任务")
+        Args:
+            task: 工具未结束的任务
+            tool: 工具对象
+            db: 数据库会话
+            priority: 新请求的优先级
+            provisional: 新请求是否需要知识库临时报告
+            kb_writes: 待提交的知识库报告写入（需要时追加临时报告的写入）
+        """
+        task.subscribers += 1
+        order = list(ScanPriority)
+        if task.status == ScanTaskStatus.PENDING and order.index(priority) < order.index(task.priority):
+            task.priority = priority
+            self.scheduler.promote([task], priority)
+        if provisional and task.provisional is None:
+            self._queue_provisional_report(task, tool, db, kb_writes)
+        logger.info(f"合并到执行中的扫描任务: {tool.name} (状态: {task.status.value}，合并请求数: {task.subscribers})")
+    
+    def _queue_trusted_kb_report(
+        self, task: ScanTask, tool: Tool, db: Session, kb_writes: List[Tuple[WriteOp, Callable[[bool, Any], None]]]
+    ) -> bool:
+        """
+        仅知识库扫描：工具有可信且近期更新的知识库条目时，追加生成正式报告的写入，写入提交后完成任务
+        （写入失败时任务保持待处理，改为完整扫描）
+        
+        Args:
+            task: 扫描任务
+            tool: 工具对象
+            db: 数据库会话
+            kb_writes: 待提交的知识库报告写入
+        
+        Returns:
+            bool: 是否已追加写入
+        """
+        try:
+            entry = get_trusted_kb_entry(db, tool, self.config.scanning.kb_only)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"仅知识库扫描失败，改为完整扫描: {tool.name} - {e}")
+            return False
+        if entry is None:
+            return False
+        kb_info, kb_meta = entry
+        tool_id, tool_name = tool.id, tool.name
+        tos_analysis, kb_updated_at = merge_tos_analysis(None, kb_info), _parse_kb_time(kb_meta)
         
-        # 并发处理所有任务
-        async def process_task(task):
-            db = SessionLocal()
-            try:
-                await self.scan_tool(task, db)
-            except Exception as e:
-                logger.error(f"处理扫描任务失败: {task.tool_name} - {e}")
-            finally:
-                db.close()
+        def write(session: Session) -> Tuple[int, Optional[int]]:
+            report = get_compliance_engine().save_kb_report(
+                _get_tool(session, tool_id), session, tos_analysis,
+                kb_updated_at=kb_updated_at, provisional=False, commit=False
+            )
+            # 知识库生成的正式报告即扫描结果，清除该工具的重试记录
+            clear_retry(session, tool_id)
+            return report.id, report.revision
         
-        # 使用gather并发执行所有任务
-        await asyncio.gather(*[process_task(task) for task in tasks_to_process])
+        def on_done(ok: bool, value: Any) -> None:
+            if ok:
+                task.complete_from_kb(*value)
+                logger.info(f"仅知识库扫描完成: {tool_name}")
+            else:
+                logger.warning(f"仅知识库扫描失败，改为完整扫描: {tool_name} - {value}")
+        
+        kb_writes.append((write, on_done))
+        return True
     
-    async def scan_tool(self, task: ScanTask, db: Session):
+    def _queue_provisional_report(
+        self, task: ScanTask, tool: Tool, db: Session, kb_writes: List[Tuple[WriteOp, Callable[[bool, Any], None]]]
+    ) -> None:
         """
-        扫描单个工具（异步）
+        两阶段扫描的第一阶段：知识库能回答时生成临时报告，AI 分析仍在后台进行
+        
+        已有正式报告（例如已过期）时不覆盖，直接以其作为临时结果；否则追加生成临时报告的写入。
+        后台扫描完成后报告更新为正式报告，修订号递增
         
         Args:
             task: 扫描任务
+            tool: 工具对象
+            db: 数据库会话
+            kb_writes: 待提交的知识库报告写入
+        """
+        try:
+            entry = get_tool_kb_entry(tool.name, db)
+            if entry is None:
+                return
+            kb_info, kb_meta = entry
+            report = get_latest_report(db, tool.id)
+        except Exception as e:
+            # 临时报告只是加速手段，失败时照常等待完整扫描
+            db.rollback()
+            logger.warning(f"生成临时报告失败: {tool.name} - {e}")
+            return
+        
+        def attach(report_id: int, revision: Optional[int]) -> None:
+            task.provisional = {
+                "report_id": report_id,
+                "revision": revision or 1,
+                "kb_source": kb_meta["source"],
+                "kb_updated_at": kb_meta["updated_at"],
+            }
+        
+        if report is not None and not report.provisional:
+            attach(report.id, report.revision)
+            return
+        tool_id, tool_name = tool.id, tool.name
+        tos_analysis, kb_updated_at = merge_tos_analysis(None, kb_info), _parse_kb_time(kb_meta)
+        
+        def write(session: Session) -> Tuple[int, Optional[int]]:
+            saved = get_compliance_engine().save_kb_report(
+                _get_tool(session, tool_id), session, tos_analysis, kb_updated_at=kb_updated_at, commit=False
+            )
+            return saved.id, saved.revision
+        
+        def on_done(ok: bool, value: Any) -> None:
+            if ok:
+                attach(*value)
+            else:
+                logger.warning(f"生成临时报告失败: {tool_name} - {value}")
+        
+        kb_writes.append((write, on_done))
+    
+    def start(self, tasks: Optional[List[ScanTask]] = None):
+        """
+        启动扫描服务（将待处理的任务按优先级提交到扫描队列）
+        
+        Args:
+            tasks: 要处理的任务列表，默认处理所有待处理（pending）的任务
+        """
+        if tasks is None:
+            tasks = self.registry.active()
+        # 已提交的任务（如合并到的执行中任务）不重复入队
+        tasks = [task for task in tasks if task.status == ScanTaskStatus.PENDING and not task.submitted]
+        if not tasks:
+            logger.info("没有待处理的扫描任务")
+            return
+        
+        for task in tasks:
+            task.submitted = True
+        by_priority: Dict[ScanPriority, List[ScanTask]] = {}
+        for task in tasks:
+            by_priority.setdefault(task.priority, []).append(task)
+        for priority, group in by_priority.items():
+            self.scheduler.submit_many(group, priority)
+        logger.info(f"已提交扫描任务到队列，待处理任务数: {len(tasks)}")
+    
+    def submit_scan(
+        self,
+        tool_ids: List[int],
+        db: Session,
+        force_refresh: bool = False,
+        priority: ScanPriority = ScanPriority.INTERACTIVE,
+        provisional: bool = False,
+        kb_only: Optional[bool] = None,
+        client: Optional[str] = None
+    ) -> ScanBatch:
+        """
+        创建扫描任务批次并提交到扫描队列
+        
+        Args:
+            tool_ids: 工具ID列表
             db: 数据库会话
+            force_refresh: 是否忽略新鲜度策略，强制重新扫描
+            priority: 扫描优先级
+            provisional: 是否为需要扫描的工具即时生成知识库临时报告
+            kb_only: 是否启用仅知识库扫描（None 表示按配置）
+            client: 提交扫描的客户端（AI 用量计入该客户端的预算）
+        
+        Returns:
+            ScanBatch: 扫描批次
+        """
+        batch = self.create_batch(priority, client=client)
+        self.extend_batch(
+            batch, tool_ids, db, force_refresh=force_refresh, provisional=provisional, kb_only=kb_only
+        )
+        return batch
+    
+    async def submit_scan_async(
+        self,
+        tool_ids: List[int],
+        db: Session,
+        force_refresh: bool = False,
+        priority: ScanPriority = ScanPriority.INTERACTIVE,
+        provisional: bool = False,
+        kb_only: Optional[bool] = None,
+        client: Optional[str] = None
+    ) -> ScanBatch:
+        """创建扫描任务批次并提交到扫描队列（协程版本，供请求处理函数调用，参数与返回值同 submit_scan）"""
+        batch = self.create_batch(priority, client=client)
+        await self.extend_batch_async(
+            batch, tool_ids, db, force_refresh=force_refresh, provisional=provisional, kb_only=kb_only
+        )
+        return batch
+    
+    def create_batch(self, priority: ScanPriority, client: Optional[str] = None) -> ScanBatch:
+        """创建空的扫描批次（供流式导入逐块追加任务；client 为提交扫描的客户端）"""
+        batch = ScanBatch([], priority, client=client)
+        self.registry.add_batch(batch)
+        return batch
+    
+    def extend_batch(
+        self,
+        batch: ScanBatch,
+        tool_ids: List[int],
+        db: Session,
+        force_refresh: bool = False,
+        reuse_latest: bool = False,
+        provisional: bool = False,
+        kb_only: Optional[bool] = None
+    ) -> List[ScanTask]:
         """
+        为工具创建扫描任务，追加到批次并提交到扫描队列
+        
+        Args:
+            batch: 扫描批次
+            tool_ids: 工具ID列表
+            db: 数据库会话
+            force_refresh: 是否忽略新鲜度策略，强制重新扫描
+            reuse_latest: 是否不论有效期直接复用最新报告
+            provisional: 是否为需要扫描的工具即时生成知识库临时报告
+            kb_only: 是否启用仅知识库扫描（None 表示按配置）
+        
+        Returns:
+            List[ScanTask]: 新创建的扫描任务
+        """
+        tasks = self.create_scan_tasks(
+            tool_ids, db, force_refresh=force_refresh, priority=batch.priority,
+            reuse_latest=reuse_latest, provisional=provisional, kb_only=kb_only
+        )
+        batch.add_tasks(tasks)
+        self.start(tasks)
+        return tasks
+    
+    async def extend_batch_async(
+        self,
+        batch: ScanBatch,
+        tool_ids: List[int],
+        db: Session,
+        force_refresh: bool = False,
+        reuse_latest: bool = False,
+        provisional: bool = False,
+        kb_only: Optional[bool] = None
+    ) -> List[ScanTask]:
+        """为工具创建扫描任务，追加到批次并提交到扫描队列（协程版本，参数与返回值同 extend_batch）"""
+        tasks = await self.create_scan_tasks_async(
+            tool_ids, db, force_refresh=force_refresh, priority=batch.priority,
+            reuse_latest=reuse_latest, provisional=provisional, kb_only=kb_only
+        )
+        batch.add_tasks(tasks)
+        self.start(tasks)
+        return tasks
+    
+    def get_batch(self, batch_id: str) -> Optional[ScanBatch]:
+        """获取扫描批次"""
+        return self.registry.get_batch(batch_id)
+    
+    def cancel_tasks(self, tasks: List[ScanTask]) -> int:
+        """
+        取消扫描任务：排队中的任务直接移出队列，执行中的任务取消其协程并立即释放槽位
+        
+        Args:
+            tasks: 要取消的任务
+        
+        Returns:
+            int: 实际取消的任务数
+        """
+        active = [task for task in tasks if task.status not in TERMINAL_STATUSES]
+        if not active:
+            return 0
+        self.scheduler.cancel(active)
+        for task in active:
+            task.cancel()
+        return len(active)
+    
+    def cancel_batch(self, batch_id: str) -> Optional[int]:
+        """
+        取消整个扫描批次
+        
+        与其他扫描请求共享的任务只解除本批次的合并，任务继续为其他请求执行
+        
+        Args:
+            batch_id: 批次ID
+        
+        Returns:
+            Optional[int]: 实际取消的任务数，批次不存在返回None
+        """
+        batch = self.get_batch(batch_id)
+        if batch is None:
+            return None
+        owned = []
+        for task in batch.tasks:
+            if not task.is_terminal and task.subscribers > 0:
+                task.subscribers -= 1
+            else:
+                owned.append(task)
+        cancelled = self.cancel_tasks(owned)
+        logger.info(f"扫描批次已取消: {batch_id}（取消 {cancelled} 个任务）")
+        return cancelled
+    
+    async def _run_scheduled_task(self, task: ScanTask):
+        """执行扫描队列分配的任务（并发由调度器控制）"""
+        from src.database import get_session
+        try:
+            await self._scan_tool(task, get_session())
+        except Exception as e:
+            logger.error(f"处理扫描任务失败: {task.tool_name} - {e}")
+    
+    async def scan_tool(self, task: ScanTask, db: Optional[Session] = None):
+        """
+        扫描单个工具（异步）
+        
+        Args:
+            task: 扫描任务
+            db: 数据库会话（仅用于确定所绑定的数据库，各阶段使用独立的短会话；默认使用全局会话工厂）
+        """
+        session_factory = get_session_for(db)
         async with self.semaphore:  # 控制并发数
-            try:
-                task.start()
-                
-                # 1. 获取工具信息（Story 2.4）
-                task.update_progress(0.1, "获取工具基本信息...")
-                tool = db.query(Tool).filter(Tool.id == task.tool_id).first()
-                if not tool:
-                    raise ValueError(f"工具不存在: ID {task.tool_id}")
-                
-                # 1. 获取工具信息（简化：仅获取基本信息，不进行详细分析）
-                tool_info = await get_tool_info(tool, db)
-                logger.info(f"获取工具信息完成: {tool.name}")
-                
-                # 2. 获取和分析TOS信息（核心功能）
-                task.update_progress(0.3, "搜索和分析工具服务条款(TOS)...")
-                tos_result = await get_and_analyze_tos(tool, db)
-                tos_analysis = tos_result.get("tos_analysis") if tos_result["success"] else None
-                
-                if tos_result["success"]:
-                    logger.info(f"TOS信息获取和分析完成: {tool.name}")
+            await self._scan_tool(task, session_factory)
+    
+    async def _scan_tool(self, task: ScanTask, session_factory):
+        """
+        执行单个工具的扫描流水线（整体受 scanning.timeout 截止时间约束）
+        
+        不持有跨越整个扫描的数据库会话：各阶段与检查点在各自的短事务中读写
+        """
+        if task.status in TERMINAL_STATUSES:
+            return
+        timeout = self.config.scanning.timeout
+        client_token = bind_client(task.client)
+        try:
+            task.start()
+            
+            # AI 预算不足时不调用 AI，降级为已有报告或知识库结果
+            # （推迟由调度器出队时检查；不经过调度器的扫描，如 scan_tools、scan_many 与命令行，
+            # 无法留在队列中，被推迟时同样降级）
+            if self.budget.decide(task.priority, task.client) in (BudgetDecision.KB_ONLY, BudgetDecision.DEFER):
+                if not await self._complete_within_budget(task, session_factory):
+                    await self._fail_task(
+                        task, session_factory, "AI 预算已用尽，且没有可用的已有报告或知识库信息",
+                        ScanErrorKind.BUDGET_EXHAUSTED
+                    )
+                return
+            
+            tool = load_tool_snapshot(session_factory, task.tool_id)
+            
+            # 按阶段依赖关系执行扫描流水线（互不依赖的阶段并发执行）
+            pipeline = self.pipeline
+            finished = []
+            
+            def on_stage_start(result: StageResult):
+                task.stages[result.name] = result
+                task.update_progress(
+                    0.9 * len(finished) / len(pipeline.order), STAGE_DESCRIPTIONS.get(result.name, result.name)
+                )
+            
+            def on_stage_end(result: StageResult):
+                finished.append(result.name)
+            
+            checkpoints = None
+            if self.config.scanning.checkpoint.enabled:
+                checkpoints = ScanCheckpointStore(session_factory, tool.id, self.config.scanning.checkpoint)
+            
+            results = await asyncio.wait_for(
+                pipeline.run(
+                    {"tool": tool, "session_factory": session_factory, "writer": self.writer, "circuit": self.circuit},
+                    on_stage_start=on_stage_start,
+                    on_stage_end=on_stage_end,
+                    checkpoints=checkpoints,
+                ),
+                timeout=timeout,
+            )
+            report = results["report"].value
+            # 离线模式下跳过或使用缓存结果的 AI 阶段，待 AI 服务恢复后补全
+            needs_enrichment = any(result.hit in ("offline", "cache") for result in results.values())
+            # 非必需阶段的暂时性失败（限流、AI 服务不可用、网页获取失败等）：报告照常保存，
+            # 同时通过重试队列重新扫描（成功的阶段已保存检查点，重试时只重新执行失败的阶段）
+            retry_config = self.config.scanning.retry_queue
+            transient = [
+                (result.name, classify_error(result.exception, result.name)) for result in results.values()
+                if result.status in (StageStatus.FAILED, StageStatus.TIMEOUT)
+            ]
+            transient = [(stage, kind) for stage, kind in transient if kind.value in retry_config.retryable_kinds]
+            retry_scheduled = bool(transient) and retry_config.enabled
+            # 各阶段耗时随报告保存，用于按阶段统计 p50/p95；扫描成功后清除该工具的重试记录
+            stage_timings = [result.to_dict() for result in results.values()]
+            
+            def finish(db: Session) -> None:
+                db.query(ComplianceReport).filter(ComplianceReport.id == report["report_id"]).update(
+                    {"stage_timings": stage_timings, "needs_enrichment": needs_enrichment}, synchronize_session=False
+                )
+                if retry_scheduled:
+                    stage, kind = transient[0]
+                    record_failure(
+                        db, task.tool_id, kind, f"扫描阶段暂时失败: {'、'.join(name for name, _ in transient)}",
+                        retry_config, stage=stage, priority=task.priority
+                    )
                 else:
-                    logger.warning(f"TOS信息获取失败: {tool.name} - {tos_result.get('error', 'unknown')}")
-                
-                # 2.5. 合并知识库信息（AI结果优先，知识库用于补充）
-                task.update_progress(0.5, "合并知识库信息...")
-                tos_analysis = merge_tos_analysis_with_knowledge_base(tool.name, tos_analysis, db)
-                if tos_analysis and len(tos_analysis) > 0:
-                    logger.info(f"已合并TOS分析和知识库信息: {tool.name}")
-                
-                # 3. 独立获取替代方案（核心功能，不依赖TOS分析）
-                task.update_progress(0.7, "分析替代方案...")
-                alternative_tools = []
-                if not tos_analysis or not tos_analysis.get("alternative_tools"):
-                    try:
-                        ai_client = get_ai_client()
-                        alternative_tools = await ai_client.get_alternative_tools(tool.name)
-                        if alternative_tools:
-                            logger.info(f"独立获取替代方案成功: {tool.name} - 找到 {len(alternative_tools)} 个替代方案")
-                            # 如果TOS分析存在但没有替代方案，补充进去
-                            if tos_analysis:
-                                tos_analysis["alternative_tools"] = alternative_tools
-                            else:
-                                # 如果TOS分析不存在，创建一个包含替代方案的最小结构
-                                tos_analysis = {"alternative_tools": alternative_tools}
-                    except Exception as e:
-                        logger.warning(f"独立获取替代方案失败: {tool.name} - {e}")
-                        # 如果AI获取替代方案也失败，且知识库有替代方案，使用知识库的
-                        if tos_analysis and tos_analysis.get("alternative_tools"):
-                            logger.info(f"使用知识库中的替代方案: {tool.name}")
+                    clear_retry(db, task.tool_id)
+                self.budget.flush(db)
+            
+            await self.writer.submit(session_factory, finish)
+            # 待补全或待重试时保留检查点，之后的扫描只重新执行缺失的阶段
+            if checkpoints is not None and not needs_enrichment and not retry_scheduled:
+                checkpoints.clear()
+            
+            logger.info(f"合规报告生成完成: {tool.name} - 报告ID: {report['report_id']}")
+            
+            # 完成任务
+            task.update_progress(1.0, "扫描完成")
+            task.complete({
+                "tool_id": task.tool_id,
+                "report_id": report["report_id"],
+                "message": "离线模式扫描完成，AI 服务恢复后自动补全" if needs_enrichment else "合规扫描完成",
+                "cached": False,
+                "needs_enrichment": needs_enrichment,
+                "retry_scheduled": retry_scheduled,
+                "revision": report["revision"]
+            })
                 
-                # 4. 生成合规报告（简化模式：仅保存TOS分析和替代方案，跳过多维度评估）
-                task.update_progress(0.9, "生成合规报告...")
-                compliance_engine = get_compliance_engine()
-                report = await compliance_engine.generate_compliance_report(
-                    tool=tool,
-                    db=db,
-                    tool_info=tool_info,
-                    tos_analysis=tos_analysis
+        except asyncio.TimeoutError:
+            # 截止时间到达时仍在执行的阶段即为超时阶段
+            for result in task.stages.values():
+                if result.status in (None, StageStatus.CANCELLED) and result.started_at:
+                    result.status = StageStatus.TIMEOUT
+                    result.error = f"任务超时（{timeout} 秒）时该阶段仍在执行"
+                    task.timed_out_stages.append(result.name)
+            stages_text = "、".join(task.timed_out_stages) or "未知"
+            fetching = FETCH_STAGES.intersection(task.timed_out_stages)
+            kind = ScanErrorKind.FETCH_FAILURE if fetching else ScanErrorKind.PROVIDER_DOWN
+            await self._fail_task(task, session_factory, f"扫描超时（{timeout} 秒），超时阶段: {stages_text}", kind)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        except PipelineStageError as e:
+            logger.error(f"扫描工具失败: {task.tool_name} - {e}")
+            stage = e.result.name
+            if e.result.status == StageStatus.TIMEOUT:
+                task.timed_out_stages.append(stage)
+                await self._fail_task(task, session_factory, f"扫描阶段超时: {stage}", classify_error(None, stage), stage)
+            else:
+                await self._fail_task(
+                    task, session_factory, "扫描失败，请查看服务端日志", classify_error(e.result.exception, stage), stage
                 )
-                
-                logger.info(f"合规报告生成完成: {tool.name} - 报告ID: {report.id}")
-                
-                # 完成任务
-                task.update_progress(1.0, "扫描完成")
-                task.complete({
-                    "tool_id": task.tool_id,
-                    "report_id": report.id,
-                    "message": "合规扫描完成"
-                })
-                    
-            except Exception as e:
-                logger.error(f"扫描工具失败: {task.tool_name} - {e}")
-                task.fail("扫描失败，请查看服务端日志")
-    
-    async def scan_tools(self, tool_ids: List[int], db: Session) -> Dict[int, ScanTask]:
+        except Exception as e:
+            logger.error(f"扫描工具失败: {task.tool_name} - {e}")
+            await self._fail_task(task, session_factory, "扫描失败，请查看服务端日志", classify_error(e))
+        finally:
+            unbind_client(client_token)
+            if self.trace.enabled and task.started_at and task.is_terminal:
+                self.trace.record(task)
+            # 任务结束后只保留阶段状态与耗时，释放各阶段输出（TOS 原文、ORM 对象等）
+            for result in task.stages.values():
+                result.value = None
+                result.exception = None
+    
+    async def _complete_within_budget(self, task: ScanTask, session_factory) -> bool:
+        """
+        AI 预算不足时的降级：以工具的已有正式报告（即使已过期）完成任务，
+        没有时由知识库信息生成临时报告（预算恢复后的完整扫描会将其更新为正式报告）
+        
+        Args:
+            task: 扫描任务
+            session_factory: 数据库会话工厂
+        
+        Returns:
+            bool: 是否已完成任务（既没有已有报告也没有知识库信息时为False）
+        """
+        retry_at = self.budget.resets_at()
+        
+        def write(db: Session) -> Optional[Tuple[int, Optional[int], bool]]:
+            tool = _get_tool(db, task.tool_id)
+            report = get_latest_report(db, tool.id)
+            kb_only = report is None or report.provisional
+            if kb_only:
+                entry = get_tool_kb_entry(tool.name, db)
+                if entry is None:
+                    return None
+                kb_info, kb_meta = entry
+                report = get_compliance_engine().save_kb_report(
+                    tool, db, merge_tos_analysis(None, kb_info), kb_updated_at=_parse_kb_time(kb_meta), commit=False
+                )
+            # 降级结果不是完整扫描：已有的重试推迟到预算重置后，避免在预算不足期间反复提交
+            defer_retry(db, tool.id, retry_at)
+            return report.id, report.revision, kb_only
+        
+        outcome = await self.writer.submit(session_factory, write)
+        if outcome is None:
+            return False
+        report_id, revision, kb_only = outcome
+        self.budget.degraded_total += 1
+        task.update_progress(1.0, "AI 预算不足，使用已有报告或知识库结果")
+        task.complete({
+            "tool_id": task.tool_id,
+            "report_id": report_id,
+            "message": "AI 预算不足，使用已有报告或知识库结果",
+            "cached": False,
+            "kb_only": kb_only,
+            "budget_degraded": True,
+            "revision": revision,
+        })
+        logger.info(f"AI 预算不足，扫描已降级: {task.tool_name} (报告ID: {report_id})")
+        return True
+    
+    async def _fail_task(
+        self,
+        task: ScanTask,
+        session_factory,
+        message: str,
+        kind: ScanErrorKind,
+        stage: Optional[str] = None,
+    ) -> None:
+        """
+        标记任务失败，并按错误类型记录到重试表（可重试时安排退避重试，否则进入死信列表；
+        因 AI 预算用尽失败的在预算重置后重试）
+        
+        Args:
+            task: 扫描任务
+            session_factory: 数据库会话工厂
+            message: 失败原因
+            kind: 错误类型
+            stage: 失败的阶段
+        """
+        task.error_kind = kind
+        task.fail(message)
+        retry_config = self.config.scanning.retry_queue
+        retry_at = self.budget.resets_at() if kind == ScanErrorKind.BUDGET_EXHAUSTED else None
+        
+        def record(db: Session) -> Optional[str]:
+            # 失败的扫描也可能已调用过 AI，一并写入用量
+            self.budget.flush(db)
+            if not retry_config.enabled:
+                return None
+            return record_failure(
+                db, task.tool_id, kind, message, retry_config, stage=stage, priority=task.priority, retry_at=retry_at
+            ).status
+        
+        try:
+            status = await self.writer.submit(session_factory, record)
+            if status is not None:
+                logger.info(f"扫描失败已记录: {task.tool_name} - 错误类型: {kind.value}，重试状态: {status}")
+        except Exception as e:
+            logger.error(f"记录扫描失败重试信息失败: {task.tool_name} - {e}")
+    
+    async def scan_tools(self, tool_ids: List[int], db: Session, force_refresh: bool = False) -> Dict[int, ScanTask]:
         """
         并发扫描多个工具
         
         Args:
             tool_ids: 工具ID列表
             db: 数据库会话
+            force_refresh: 是否忽略新鲜度策略，强制重新扫描
         
         Returns:
             Dict[int, ScanTask]: 工具ID到扫描任务的映射
         """
         # 创建扫描任务
-        tasks = self.create_scan_tasks(tool_ids, db)
+        tasks = self.create_scan_tasks(tool_ids, db, force_refresh=force_refresh)
         
         if not tasks:
             logger.warning("没有有效的扫描任务")
             return {}
         
-        # 并发执行扫描任务
-        scan_coroutines = [self.scan_tool(task, db) for task in tasks]
-        await asyncio.gather(*scan_coroutines)
+        # 并发执行扫描任务（已复用缓存报告的任务无需扫描；各任务使用各自的短会话，不共享 db）
+        # 合并到的已提交任务由原提交方执行，这里只等待其结束
+        own = [task for task in tasks if task.status == ScanTaskStatus.PENDING and not task.submitted]
+        for task in own:
+            task.submitted = True
+        joined = [task.wait() for task in tasks if task not in own and not task.is_terminal]
+        await asyncio.gather(*(self.scan_tool(task, db) for task in own), *joined)
         
         return {task.tool_id: task for task in tasks}
     
+    async def scan_many(
+        self,
+        tool_names: Iterable[str],
+        db: Optional[Session] = None,
+        concurrency: Optional[int] = None,
+        force_refresh: bool = False,
+        priority: Optional[ScanPriority] = None,
+        client: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        按工具名称扫描，按完成顺序逐个产出结果（供在 Python 中直接调用扫描的场景流式获取报告）
+        
+        不存在的工具自动创建；有效期内已有报告的工具立即产出；工具已有其他请求提交的未结束任务时等待该任务。
+        扫描不经过扫描队列，由本次调用的并发上限与全局并发上限共同约束。
+        提前关闭生成器（如 break 或 aclose()）时取消尚未完成的扫描。
+        
+        Args:
+            tool_names: 工具名称
+            db: 数据库会话（仅用于确定所绑定的数据库，默认使用全局会话工厂）
+            concurrency: 本次调用的并发上限（默认 scanning.max_concurrent）
+            force_refresh: 是否忽略新鲜度策略，强制重新扫描
+            priority: 扫描优先级（默认按工具数量判断）
+            client: 提交扫描的客户端（AI 用量计入该客户端的预算）
+        
+        Yields:
+            Dict[str, Any]: 扫描结果（任务状态、错误信息与完整的 JSON 报告）
+        """
+        session_factory = get_session_for(db)
+        names = [name.strip() for name in tool_names if name and name.strip()]
+        if not names:
+            return
+        
+        with session_scope(session_factory) as session:
+            tools, _ = batch_create_tools(session, names)
+            batch = self.create_batch(self.resolve_priority(priority, len(tools)), client=client)
+            tasks = self.create_scan_tasks(
+                [tool.id for tool in tools], session, force_refresh=force_refresh, priority=batch.priority
+            )
+            batch.add_tasks(tasks)
+        
+        # 本次调用创建的任务由本次调用执行；合并到的其他请求的任务只等待其结束
+        own = {id(task) for task in tasks if task.status == ScanTaskStatus.PENDING and not task.submitted}
+        for task in tasks:
+            if id(task) in own:
+                task.submitted = True
+        limit = asyncio.Semaphore(max(1, concurrency or self.max_concurrent))
+        
+        async def run(task: ScanTask) -> ScanTask:
+            if id(task) in own:
+                async with limit:
+                    async with self.semaphore:
+                        await self._scan_tool(task, session_factory)
+            elif not task.is_terminal:
+                await task.wait()
+            return task
+        
+        futures = [asyncio.ensure_future(run(task)) for task in tasks]
+        try:
+            for next_done in asyncio.as_completed(futures):
+                task = await next_done
+                yield self._scan_result(task, session_factory)
+        finally:
+            unfinished = [future for future in futures if not future.done()]
+            if unfinished:
+                # 生成器被提前关闭：取消本次调用的扫描（共享的任务只解除合并），等待协程退出
+                self.cancel_batch(batch.batch_id)
+                for future in unfinished:
+                    future.cancel()
+                await asyncio.gather(*unfinished, return_exceptions=True)
+    
+    def _scan_result(self, task: ScanTask, session_factory) -> Dict[str, Any]:
+        """scan_many 产出的扫描结果（任务已结束）"""
+        result = task.result or {}
+        report_id = result.get("report_id")
+        report = None
+        if report_id is not None:
+            with session_scope(session_factory) as db:
+                record = db.query(ComplianceReport).filter(ComplianceReport.id == report_id).first()
+                if record is not None:
+                    report = get_report_service().generate_json_report(_get_tool(db, task.tool_id), record, db)
+        return {
+            "tool_id": task.tool_id,
+            "tool_name": task.tool_name,
+            "status": task.status.value,
+            "cached": task.cached,
+            "needs_enrichment": bool(result.get("needs_enrichment")),
+            "error": task.error_message,
+            "error_kind": task.error_kind.value if task.error_kind else None,
+            "report": report,
+        }
+    
     def get_task_status(self, tool_id: int) -> Optional[ScanTask]:
         """
         获取任务状态
@@ -275,16 +1385,16 @@ class ScanService:
         Returns:
             Optional[ScanTask]: 扫描任务，如果不存在返回None
         """
-        return self.tasks.get(tool_id)
+        return self.registry.get(tool_id)
     
     def get_all_tasks_status(self) -> Dict[int, ScanTask]:
         """
-        获取所有任务状态
+        获取内存中的任务状态（已归档的任务请通过 get_task_status 按工具查询）
         
         Returns:
-            Dict[int, ScanTask]: 所有扫描任务
+            Dict[int, ScanTask]: 内存中的扫描任务
         """
-        return self.tasks.copy()
+        return self.registry.snapshot()
 
 
 # 全局扫描服务实例
@@ -0,0 +1,79 @@
+"""
+扫描阶段耗时统计服务：汇总最近扫描中各流水线阶段的耗时分位数
+Stage timing statistics service: aggregates per-stage latency percentiles across recent scans
+"""
+
+import math
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from src.models import ComplianceReport
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """
+    计算分位数（线性插值）
+
+    Args:
+        values: 数值列表
+        q: 分位（0-100）
+
+    Returns:
+        Optional[float]: 分位数，列表为空返回None
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def aggregate_stage_timings(runs: Iterable[List[Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """
+    按阶段汇总多次扫描的阶段记录
+
+    Args:
+        runs: 每次扫描的阶段记录列表（StageResult.to_dict() 的结果）
+
+    Returns:
+        Dict[str, Dict[str, Any]]: 阶段名称 -> count / p50 / p95 / max（秒）、
+            avg_attempts（平均外部请求次数）、hit_rate（缓存/知识库命中率）、failures（未成功次数）
+    """
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for stages in runs:
+        for stage in stages or []:
+            grouped.setdefault(stage["name"], []).append(stage)
+
+    stats: Dict[str, Dict[str, Any]] = {}
+    for name, records in grouped.items():
+        durations = [r["duration"] for r in records if r.get("duration") is not None]
+        stats[name] = {
+            "count": len(records),
+            "p50": percentile(durations, 50),
+            "p95": percentile(durations, 95),
+            "max": max(durations) if durations else None,
+            "avg_attempts": sum(r.get("attempts") or 0 for r in records) / len(records),
+            "hit_rate": sum(1 for r in records if r.get("hit")) / len(records),
+            "failures": sum(1 for r in records if r.get("status") != "succeeded"),
+        }
+    return stats
+
+
+def get_stage_timing_stats(db: Session, limit: int = 200) -> Dict[str, Any]:
+    """
+    统计最近生成的报告中各扫描阶段的耗时
+
+    Args:
+        db: 数据库会话
+        limit: 统计的最近报告数
+
+    Returns:
+        Dict[str, Any]: scans（参与统计的扫描数）与 stages（各阶段统计）
+    """
+    rows = db.query(ComplianceReport.stage_timings).filter(
+        ComplianceReport.stage_timings.isnot(None)
+    ).order_by(ComplianceReport.updated_at.desc(), ComplianceReport.id.desc()).limit(limit).all()
+    runs = [row[0] for row in rows if row[0]]
+    return {"scans": len(runs), "stages": aggregate_stage_timings(runs)}
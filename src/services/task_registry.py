@@ -0,0 +1,268 @@
+"""
+扫描任务表模块：有界的内存任务/批次表，已结束的任务按数量与保留时间归档到数据库
+Scan task registry module: bounded in-memory task/batch table with eviction into the database
+
+- 执行中、排队中的任务始终保留在内存中
+- 已结束的任务超过保留时间，或内存任务数超过上限时（最早的先淘汰），写入 scan_task_records 表
+- 被同一工具的新任务替换的已结束任务留到下次清理时一起归档；归档在锁外提交（有写入任务时交给写入任务合并提交）
+- 查询已淘汰的任务/批次时从数据库重建
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from src.config import TaskRegistryConfig
+from src.database import session_scope
+from src.logger import get_logger
+from src.models import ScanTaskRecord
+
+logger = get_logger()
+
+
+class ScanTaskRegistry:
+    """
+    有界扫描任务表
+
+    任务对象需提供 tool_id、batch_id、completed_at、is_terminal 与 to_record()；
+    task_cls.from_record(record) 用于从归档记录重建任务，
+    batch_cls.from_tasks(batch_id, tasks) 用于从归档任务重建批次。
+    """
+
+    def __init__(
+        self,
+        config: TaskRegistryConfig,
+        task_cls: Any,
+        batch_cls: Any,
+        session_factory: Optional[Callable[[], Session]] = None,
+        writer: Optional[Any] = None,
+    ):
+        """
+        Args:
+            config: 任务表配置
+            task_cls: 任务类
+            batch_cls: 批次类
+            session_factory: 数据库会话工厂（默认使用全局会话工厂）
+            writer: 扫描结果写入任务（可选；提供时归档交给写入任务合并提交，不等待确认）
+        """
+        self.config = config
+        self.task_cls = task_cls
+        self.batch_cls = batch_cls
+        self._session_factory = session_factory
+        self._tasks: "OrderedDict[int, Any]" = OrderedDict()  # tool_id -> 最近一次的任务
+        self._batches: "OrderedDict[str, Any]" = OrderedDict()
+        self._replaced: List[Any] = []  # 被替换、等待下次清理时归档的已结束任务
+        self._archiving: List[Any] = []  # 已移出任务表、归档尚未提交的任务（含 _replaced）
+        self.writer = writer
+        self._last_sweep = datetime.now()
+        self._lock = threading.RLock()
+        self.archived_count = 0
+
+    def _factory(self) -> Callable[[], Session]:
+        if self._session_factory is None:
+            from src.database import get_session
+            self._session_factory = get_session()
+        return self._session_factory
+
+    def _new_session(self) -> Session:
+        return self._factory()()
+
+    # ---------- 任务 ----------
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def add(self, task: Any) -> None:
+        """登记任务（同一工具只保留最近一次任务，旧任务如已结束则在下次清理时归档）"""
+        with self._lock:
+            evicted = self._add(task)
+        self._archive(evicted)
+
+    def _add(self, task: Any) -> List[Any]:
+        """登记任务，返回需要归档的任务（调用方需持有锁）"""
+        previous = self._tasks.pop(task.tool_id, None)
+        self._tasks[task.tool_id] = task
+        if previous is not None and previous.is_terminal:
+            self._replaced.append(previous)
+            self._archiving.append(previous)
+        return self._collect_evictable()
+
+    def claim(self, task: Any) -> Any:
+        """
+        登记任务，同一工具已有未结束的任务时不登记而返回该任务（检查与登记是原子的）
+
+        Args:
+            task: 新创建的任务
+
+        Returns:
+            Any: 工具未结束的任务（已存在时）或新登记的任务
+        """
+        with self._lock:
+            current = self._tasks.get(task.tool_id)
+            if current is not None and not current.is_terminal:
+                return current
+            evicted = self._add(task)
+        self._archive(evicted)
+        return task
+
+    def flush(self) -> None:
+        """归档所有等待下次清理的被替换任务（服务关闭时在停止写入任务之前调用）"""
+        with self._lock:
+            replaced, self._replaced = self._replaced, []
+        self._archive(replaced)
+
+    def get(self, tool_id: int) -> Optional[Any]:
+        """获取工具最近一次的任务（内存中没有时从归档记录重建）"""
+        with self._lock:
+            task = self._tasks.get(tool_id)
+            if task is None:
+                task = next((t for t in reversed(self._archiving) if t.tool_id == tool_id), None)
+        if task is not None:
+            return task
+        db = self._new_session()
+        try:
+            record = db.query(ScanTaskRecord).filter(
+                ScanTaskRecord.tool_id == tool_id
+            ).order_by(ScanTaskRecord.id.desc()).first()
+            return self.task_cls.from_record(record) if record else None
+        except Exception as e:
+            logger.error(f"查询归档扫描任务失败: {e}")
+            return None
+        finally:
+            db.close()
+
+    def active(self) -> List[Any]:
+        """内存中的全部任务"""
+        with self._lock:
+            return list(self._tasks.values())
+
+    def snapshot(self) -> Dict[int, Any]:
+        """内存中任务的浅拷贝（先清理过期任务，大小受 max_tasks 约束）"""
+        with self._lock:
+            evicted = self._collect_evictable()
+            tasks = dict(self._tasks)
+        self._archive(evicted)
+        return tasks
+
+    # ---------- 批次 ----------
+
+    def add_batch(self, batch: Any) -> None:
+        """登记批次"""
+        with self._lock:
+            self._batches[batch.batch_id] = batch
+            self._evict_batches()
+
+    def get_batch(self, batch_id: str) -> Optional[Any]:
+        """获取批次（内存中没有时从归档记录重建）"""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            pending = [task for task in self._archiving if task.batch_id == batch_id]
+        if batch is not None:
+            return batch
+        db = self._new_session()
+        try:
+            records = db.query(ScanTaskRecord).filter(
+                ScanTaskRecord.batch_id == batch_id
+            ).order_by(ScanTaskRecord.id).all()
+            # 归档尚未提交的任务直接使用内存中的对象
+            pending_ids = {task.tool_id for task in pending}
+            tasks = [self.task_cls.from_record(r) for r in records if r.tool_id not in pending_ids] + pending
+            if not tasks:
+                return None
+            return self.batch_cls.from_tasks(batch_id, tasks)
+        except Exception as e:
+            logger.error(f"查询归档扫描批次失败: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _evict_batches(self) -> None:
+        expire_before = datetime.now() - timedelta(seconds=self.config.terminal_ttl_seconds)
+        overflow = len(self._batches) - self.config.max_batches
+        for batch_id, batch in list(self._batches.items()):
+            if not batch.finished:
+                continue
+            if overflow > 0 or batch.created_at < expire_before:
+                # 批次中的任务按各自的规则归档，这里只释放批次本身
+                del self._batches[batch_id]
+                overflow -= 1
+
+    # ---------- 淘汰 ----------
+
+    def _collect_evictable(self) -> List[Any]:
+        """
+        选出需要归档的已结束任务（调用方需持有锁）：超过保留时间或数量上限而淘汰的任务，
+        以及定期清理（或累积数达到数量上限）时被替换的任务
+        """
+        now = datetime.now()
+        sweep = (now - self._last_sweep).total_seconds() >= self.config.sweep_interval_seconds
+        overflow = len(self._tasks) - self.config.max_tasks
+        replaced = []
+        if sweep or len(self._replaced) >= self.config.max_tasks:
+            replaced, self._replaced = self._replaced, []
+        if not sweep and overflow <= 0:
+            return replaced
+
+        evicted = []
+        expire_before = now - timedelta(seconds=self.config.terminal_ttl_seconds)
+        # OrderedDict 按登记顺序排列，最早的任务先淘汰
+        for tool_id, task in list(self._tasks.items()):
+            if not sweep and overflow <= 0:
+                break
+            if not task.is_terminal:
+                continue
+            if overflow > 0 or (task.completed_at and task.completed_at < expire_before):
+                evicted.append(self._tasks.pop(tool_id))
+                overflow -= 1
+        self._archiving.extend(evicted)
+        if sweep:
+            self._last_sweep = now
+            self._evict_batches()
+        return replaced + evicted
+
+    def _archive(self, tasks: List[Any]) -> None:
+        """将淘汰的任务写入归档表（一次提交；调用方不能持有锁，有写入任务时不等待提交）"""
+        if not tasks:
+            return
+        records = [task.to_record() for task in tasks]
+
+        def write(db: Session) -> None:
+            db.add_all(records)
+
+        if self.writer is None:
+            try:
+                with session_scope(self._factory()) as db:
+                    write(db)
+                self._archived(tasks, None)
+            except Exception as e:
+                self._archived(tasks, e)
+            return
+        future = self.writer.submit_nowait(self._factory(), write)
+        future.add_done_callback(lambda f: self._archived(tasks, f.exception()))
+
+    def _archived(self, tasks: List[Any], error: Optional[BaseException]) -> None:
+        """归档提交后（或失败后）从待归档列表中移除"""
+        with self._lock:
+            ids = {id(task) for task in tasks}
+            self._archiving = [task for task in self._archiving if id(task) not in ids]
+            if error is None:
+                self.archived_count += len(tasks)
+        if error is None:
+            logger.debug(f"已归档扫描任务: {len(tasks)} 个")
+        else:
+            logger.error(f"归档扫描任务失败: {error}")
+
+    def stats(self) -> Dict[str, Any]:
+        """任务表状态"""
+        with self._lock:
+            return {
+                "tasks": len(self._tasks),
+                "active": sum(1 for task in self._tasks.values() if not task.is_terminal),
+                "batches": len(self._batches),
+                "archived": self.archived_count,
+                "archiving": len(self._archiving),
+                "max_tasks": self.config.max_tasks,
+            }
@@ -0,0 +1,208 @@
+"""
+工具清单导入模块：流式解析 CSV / NDJSON 工具清单，分块创建工具并提交扫描
+Tool import module: streaming CSV / NDJSON ingestion with chunked enqueue
+"""
+
+import codecs
+import csv
+import json
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+
+from src.logger import get_logger
+from src.services.tool_service import parse_tool_names, bulk_get_or_create_tools
+
+logger = get_logger()
+
+SUPPORTED_FORMATS = ("csv", "ndjson")
+
+# CSV 表头中可作为工具名列的列名（不区分大小写，按表头中的位置取第一个），没有表头时取第一列；
+# 其他列名可通过 name_column 指定
+NAME_COLUMNS = ("name", "tool", "tool_name", "component", "component_name", "package", "package_name")
+
+
+class IngestStopped(Exception):
+    """导入被回调主动停止（如扫描队列持续饱和），已导入的部分保留"""
+
+
+def detect_format(content_type: Optional[str]) -> Optional[str]:
+    """
+    根据 Content-Type 推断上传格式
+
+    Args:
+        content_type: 请求的 Content-Type
+
+    Returns:
+        Optional[str]: csv / ndjson，无法识别返回None
+    """
+    content_type = (content_type or "").lower()
+    if "ndjson" in content_type or "jsonl" in content_type or "json-seq" in content_type:
+        return "ndjson"
+    if "csv" in content_type or content_type.startswith("text/plain"):
+        return "csv"
+    return None
+
+
+def _iter_lines(stream: BinaryIO, chunk_size: int = 64 * 1024) -> Iterator[str]:
+    """按行增量解码二进制流（UTF-8，兼容 BOM）"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buffer += decoder.decode(chunk)
+        lines = buffer.split("\n")
+        # 最后一段可能是不完整的行，留到下一块
+        buffer = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+def iter_csv_names(stream: BinaryIO, stats: Dict[str, Any], name_column: Optional[str] = None) -> Iterator[str]:
+    """
+    逐行读取 CSV 中的工具名单元格
+
+    第一个非空行包含 NAME_COLUMNS 中的列名（指定 name_column 时为该列名）时作为表头，取该列；
+    否则视为没有表头，取第一列
+
+    Args:
+        stream: 上传内容（二进制流）
+        stats: 导入进度字典
+        name_column: 工具名所在的列名（不区分大小写）
+
+    Raises:
+        ValueError: 指定了 name_column，但第一个非空行中没有该列
+    """
+    columns = (name_column.strip().lower(),) if name_column else NAME_COLUMNS
+    column = None
+    first = True
+    for row in csv.reader(_iter_lines(stream)):
+        if not any(cell.strip() for cell in row):
+            continue
+        if first:
+            first = False
+            header = [cell.strip().lower() for cell in row]
+            matched = [i for i, cell in enumerate(header) if cell in columns]
+            if matched:
+                column = matched[0]
+                continue
+            if name_column:
+                raise ValueError(f"CSV 表头中没有指定的工具名列: {name_column}")
+        stats["rows"] += 1
+        cell = row[column or 0] if len(row) > (column or 0) else ""
+        yield cell
+
+
+def iter_ndjson_names(stream: BinaryIO, stats: Dict[str, Any]) -> Iterator[str]:
+    """逐行读取 NDJSON 中的工具名（每行为字符串或包含 name/tool 字段的对象）"""
+    for line in _iter_lines(stream):
+        line = line.strip()
+        if not line:
+            continue
+        stats["rows"] += 1
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            stats["invalid"] += 1
+            continue
+        if isinstance(item, dict):
+            item = next((item.get(key) for key in NAME_COLUMNS if item.get(key)), None)
+        if not isinstance(item, str):
+            stats["invalid"] += 1
+            continue
+        yield item
+
+
+def iter_unique_tool_names(cells: Iterator[str], stats: Dict[str, Any]) -> Iterator[str]:
+    """
+    按 parse_tool_names 的规则拆分单元格（逗号/换行分隔）并在整个清单范围内去重（不区分大小写）
+    """
+    seen = set()
+    for cell in cells:
+        for name in parse_tool_names(cell):
+            key = name.lower()
+            if key in seen:
+                stats["duplicates"] += 1
+                continue
+            seen.add(key)
+            yield name
+
+
+def ingest_tool_stream(
+    stream: BinaryIO,
+    fmt: str,
+    session_factory: Callable[[], Session],
+    on_chunk: Callable[[List[int], Session], None],
+    chunk_size: int = 500,
+    source: str = "unknown",
+    stats: Optional[Dict[str, Any]] = None,
+    name_column: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    流式导入工具清单：边解析边按块批量创建工具，每块创建完成后回调（用于提交扫描）
+
+    Args:
+        stream: 上传内容（二进制流）
+        fmt: csv / ndjson
+        session_factory: 数据库会话工厂
+        on_chunk: 每块工具创建完成后的回调，参数为 (工具ID列表, 数据库会话)；抛出 IngestStopped 时停止导入
+        chunk_size: 每块工具数
+        source: 新建工具的来源
+        stats: 导入进度字典（原地更新，便于调用方实时查询）
+        name_column: CSV 中工具名所在的列名（默认按 NAME_COLUMNS 识别表头）
+
+    Returns:
+        Dict[str, Any]: 导入统计（rows/tools/created/existing/duplicates/invalid/status）；
+            status 为 completed / stopped / failed，回调可在导入过程中设置其他状态（如 throttled）
+    """
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValueError(f"不支持的导入格式: {fmt}")
+    if stats is None:
+        stats = {}
+    stats.update({"status": "running", "rows": 0, "tools": 0, "created": 0,
+                  "existing": 0, "duplicates": 0, "invalid": 0, "error": None})
+
+    cells = iter_csv_names(stream, stats, name_column) if fmt == "csv" else iter_ndjson_names(stream, stats)
+    db = session_factory()
+    try:
+        def flush(names: List[str]):
+            tools, existing_count, invalid_names = bulk_get_or_create_tools(db, names, source)
+            stats["invalid"] += len(invalid_names)
+            stats["tools"] += len(tools)
+            stats["existing"] += existing_count
+            stats["created"] += len(tools) - existing_count
+            if tools:
+                on_chunk([tool.id for tool in tools], db)
+
+        chunk: List[str] = []
+        for name in iter_unique_tool_names(cells, stats):
+            chunk.append(name)
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+        stats["status"] = "completed"
+        logger.info(f"工具清单导入完成: {stats}")
+    except IngestStopped as e:
+        stats["status"] = "stopped"
+        stats["error"] = str(e)
+        logger.warning(f"工具清单导入已停止: {e}")
+    except ValueError as e:
+        # 清单内容无效（如指定的列不存在）
+        stats["status"] = "failed"
+        stats["error"] = str(e)
+        logger.warning(f"工具清单导入失败: {e}")
+    except Exception as e:
+        stats["status"] = "failed"
+        stats["error"] = "导入失败，请查看服务端日志"
+        logger.error(f"工具清单导入失败: {e}")
+    finally:
+        db.close()
+        stream.close()
+    return stats
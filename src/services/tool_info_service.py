@@ -33,7 +33,7 @@ async def fetch_tool_version(tool_name: str) -> Optional[str]:
     return None
 
 
-def update_tool_info(db: Session, tool: Tool, version: Optional[str] = None) -> Tool:
+def update_tool_info(db: Session, tool: Tool, version: Optional[str] = None, commit: bool = True) -> Tool:
     """
     更新工具信息
     
@@ -41,6 +41,7 @@ def update_tool_info(db: Session, tool: Tool, version: Optional[str] = None) ->
         db: 数据库会话
         tool: 工具对象
         version: 工具版本（可选）
+        commit: 是否立即提交；为False时只 flush，由调用方（如批量写入任务）统一提交
     
     Returns:
         Tool: 更新后的工具对象
@@ -50,8 +51,11 @@ def update_tool_info(db: Session, tool: Tool, version: Optional[str] = None) ->
     else:
         tool.version = "unknown"
     
-    db.commit()
-    db.refresh(tool)
+    if commit:
+        db.commit()
+        db.refresh(tool)
+    else:
+        db.flush()
     logger.info(f"更新工具信息: {tool.name} (版本: {tool.version})")
     return tool
 
@@ -73,11 +77,24 @@ async def get_tool_info(tool: Tool, db: Session) -> Dict[str, Any]:
     # 更新工具信息
     updated_tool = update_tool_info(db, tool, version)
     
+    return tool_info_dict(updated_tool)
+
+
+def tool_info_dict(tool: Tool) -> Dict[str, Any]:
+    """
+    将工具对象转换为工具信息字典
+    
+    Args:
+        tool: 工具对象
+    
+    Returns:
+        Dict[str, Any]: 工具信息字典
+    """
     return {
-        "tool_id": updated_tool.id,
-        "name": updated_tool.name,
-        "version": updated_tool.version,
-        "source": updated_tool.source,
-        "tos_url": updated_tool.tos_url,
-        "tos_info": updated_tool.tos_info
+        "tool_id": tool.id,
+        "name": tool.name,
+        "version": tool.version,
+        "source": tool.source,
+        "tos_url": tool.tos_url,
+        "tos_info": tool.tos_info
     }
@@ -7,7 +7,7 @@ Tool knowledge base: Provides basic information for common tools (as fallback wh
 2. 数据库知识库（用户可更新）
 """
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from sqlalchemy.orm import Session
 
 # 常见工具的基本信息（开源工具优先）
@@ -136,9 +136,13 @@ TOOL_KNOWLEDGE_BASE: Dict[str, Dict[str, Any]] = {
 }
 
 
-def get_tool_basic_info(tool_name: str, db: Optional[Session] = None) -> Optional[Dict[str, Any]]:
+# 知识库元数据字段（不属于工具信息本身）
+KB_METADATA_FIELDS = ("source", "updated_by", "created_at", "updated_at")
+
+
+def get_tool_kb_entry(tool_name: str, db: Optional[Session] = None) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
     """
-    从知识库获取工具的基本信息
+    从知识库获取工具的基本信息及其元数据
     
     优先从数据库知识库获取，如果不存在则从内置知识库获取
     
@@ -147,7 +151,8 @@ def get_tool_basic_info(tool_name: str, db: Optional[Session] = None) -> Optiona
         db: 数据库会话（可选）
     
     Returns:
-        Optional[Dict[str, Any]]: 工具基本信息，如果不存在返回None
+        Optional[Tuple[Dict[str, Any], Dict[str, Any]]]: (工具基本信息, 元数据)，如果不存在返回None；
+            元数据包含 source（user/ai/system，内置知识库为 builtin）与 updated_at（ISO 时间，内置知识库为None）
     """
     # 1. 优先从数据库知识库获取
     if db:
@@ -155,33 +160,51 @@ def get_tool_basic_info(tool_name: str, db: Optional[Session] = None) -> Optiona
             from src.services.knowledge_base_service import get_knowledge_base_dict
             db_entry = get_knowledge_base_dict(db, tool_name)
             if db_entry:
-                # 移除元数据字段，只返回数据字段
-                result = {k: v for k, v in db_entry.items() 
-                         if k not in ['source', 'updated_by', 'created_at', 'updated_at']}
-                return result
+                # 拆分数据字段与元数据字段
+                info = {k: v for k, v in db_entry.items() if k not in KB_METADATA_FIELDS}
+                meta = {"source": db_entry.get("source"), "updated_at": db_entry.get("updated_at")}
+                return info, meta
         except Exception as e:
             # 如果数据库查询失败，继续使用内置知识库
             pass
     
     # 2. 从内置知识库获取
+    builtin_meta = {"source": "builtin", "updated_at": None}
     # 精确匹配
     if tool_name in TOOL_KNOWLEDGE_BASE:
-        return TOOL_KNOWLEDGE_BASE[tool_name].copy()
+        return TOOL_KNOWLEDGE_BASE[tool_name].copy(), builtin_meta
     
     # 模糊匹配（不区分大小写）
     tool_name_lower = tool_name.lower()
     for key, value in TOOL_KNOWLEDGE_BASE.items():
         if key.lower() == tool_name_lower:
-            return value.copy()
+            return value.copy(), builtin_meta
     
     # 部分匹配（如 "Docker" 匹配 "Docker CE"）
     for key, value in TOOL_KNOWLEDGE_BASE.items():
         if tool_name_lower in key.lower() or key.lower() in tool_name_lower:
-            return value.copy()
+            return value.copy(), builtin_meta
     
     return None
 
 
+def get_tool_basic_info(tool_name: str, db: Optional[Session] = None) -> Optional[Dict[str, Any]]:
+    """
+    从知识库获取工具的基本信息
+    
+    优先从数据库知识库获取，如果不存在则从内置知识库获取
+    
+    Args:
+        tool_name: 工具名称
+        db: 数据库会话（可选）
+    
+    Returns:
+        Optional[Dict[str, Any]]: 工具基本信息，如果不存在返回None
+    """
+    entry = get_tool_kb_entry(tool_name, db)
+    return entry[0] if entry else None
+
+
 def merge_tos_analysis_with_knowledge_base(
     tool_name: str,
     tos_analysis: Optional[Dict[str, Any]],
@@ -202,7 +225,26 @@ def merge_tos_analysis_with_knowledge_base(
     """
     # 获取知识库数据
     kb_info = get_tool_basic_info(tool_name, db)
+    return merge_tos_analysis(tos_analysis, kb_info)
+
+
+def merge_tos_analysis(
+    tos_analysis: Optional[Dict[str, Any]],
+    kb_info: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    合并TOS分析结果和已查询到的知识库信息
+    
+    与 merge_tos_analysis_with_knowledge_base 相同，但由调用方提供知识库数据，
+    便于扫描流水线将知识库查询作为独立阶段并发执行
+    
+    Args:
+        tos_analysis: TOS分析结果（可能为空或部分数据）
+        kb_info: 知识库信息（可能为None）
     
+    Returns:
+        Dict[str, Any]: 合并后的分析结果
+    """
     # 如果TOS分析有数据，优先使用AI结果
     if tos_analysis and len(tos_analysis) > 0 and "error" not in tos_analysis:
         # 如果TOS分析中缺少关键信息（license_type为空、None或"未知"），尝试从知识库补充
@@ -5,6 +5,7 @@ Tool service module for managing tools
 
 import re
 from typing import Optional
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from src.models import Tool
@@ -12,13 +13,17 @@ from src.logger import get_logger
 
 logger = get_logger()
 
+# npm 作用域包名（@scope/name），仅在依赖清单等明确来自包管理器的路径上允许
+_SCOPED_PACKAGE_RE = re.compile(r'^@[a-zA-Z0-9][a-zA-Z0-9_\-\.]*/[a-zA-Z0-9][a-zA-Z0-9_\-\.]*$')
 
-def validate_tool_name(tool_name: str) -> tuple[bool, Optional[str]]:
+
+def validate_tool_name(tool_name: str, allow_scoped: bool = False) -> tuple[bool, Optional[str]]:
     """
     验证工具名是否有效
     
     Args:
         tool_name: 工具名称
+        allow_scoped: 是否允许 npm 作用域包名（如 @babel/core）
     
     Returns:
         tuple: (是否有效, 错误信息)
@@ -36,6 +41,9 @@ def validate_tool_name(tool_name: str) -> tuple[bool, Optional[str]]:
     if len(tool_name) > 100:
         return False, "工具名长度不能超过100个字符"
     
+    if allow_scoped and _SCOPED_PACKAGE_RE.match(tool_name):
+        return True, None
+    
     # 检查字符（允许字母、数字、连字符、下划线、点、空格）
     if not re.match(r'^[a-zA-Z0-9_\-\.\s]+$', tool_name):
         return False, "工具名只能包含字母、数字、连字符、下划线、点和空格"
@@ -43,7 +51,7 @@ def validate_tool_name(tool_name: str) -> tuple[bool, Optional[str]]:
     return True, None
 
 
-def get_or_create_tool(db: Session, tool_name: str, source: str = "unknown") -> Tool:
+def get_or_create_tool(db: Session, tool_name: str, source: str = "unknown", allow_scoped: bool = False) -> Tool:
     """
     获取或创建工具记录
     
@@ -51,12 +59,13 @@ def get_or_create_tool(db: Session, tool_name: str, source: str = "unknown") ->
         db: 数据库会话
         tool_name: 工具名称
         source: 工具来源（internal/external/unknown）
+        allow_scoped: 是否允许 npm 作用域包名（如 @babel/core）
     
     Returns:
         Tool: 工具对象
     """
     # 验证工具名
-    is_valid, error_msg = validate_tool_name(tool_name)
+    is_valid, error_msg = validate_tool_name(tool_name, allow_scoped)
     if not is_valid:
         raise ValueError(error_msg)
     
@@ -168,6 +177,72 @@ def parse_tool_names(input_text: str) -> list[str]:
     return unique_tools
 
 
+def bulk_get_or_create_tools(
+    db: Session, tool_names: list[str], source: str = "unknown", allow_scoped: bool = False
+) -> tuple[list[Tool], int, list[str]]:
+    """
+    批量获取或创建工具记录（一次查询已存在的工具，新工具一次性插入并提交）
+    
+    Args:
+        db: 数据库会话
+        tool_names: 工具名称列表（同名不区分大小写，重复名称返回同一工具）
+        source: 新建工具的来源（internal/external/unknown）
+        allow_scoped: 是否允许 npm 作用域包名（如 @babel/core）
+    
+    Returns:
+        tuple[list[Tool], int, list[str]]: (与有效名称一一对应的工具列表, 已存在的名称数量, 无效的工具名)
+    """
+    valid_names = []
+    invalid_names = []
+    for tool_name in tool_names:
+        is_valid, error_msg = validate_tool_name(tool_name, allow_scoped)
+        if is_valid:
+            valid_names.append(tool_name.strip())
+        else:
+            invalid_names.append(tool_name)
+            logger.warning(f"跳过无效工具名: {tool_name} - {error_msg}")
+    if not valid_names:
+        return [], 0, invalid_names
+    
+    lowered = {name.lower() for name in valid_names}
+    by_name: dict[str, Tool] = {}
+    for tool in db.query(Tool).filter(func.lower(Tool.name).in_(lowered)).order_by(Tool.id).all():
+        by_name.setdefault(tool.name.lower(), tool)
+    
+    new_tools = []
+    for name in valid_names:
+        key = name.lower()
+        if key not in by_name:
+            tool = Tool(name=name, source=source, version=None)
+            by_name[key] = tool
+            new_tools.append(tool)
+    if new_tools:
+        try:
+            db.add_all(new_tools)
+            db.commit()
+            # 一次查询刷新提交后过期的新对象，避免逐个懒加载
+            db.query(Tool).filter(func.lower(Tool.name).in_(lowered)).all()
+        except IntegrityError as e:
+            db.rollback()
+            logger.error(f"批量创建工具失败，逐个重试: {e}")
+            for tool in new_tools:
+                by_name[tool.name.lower()] = get_or_create_tool(db, tool.name, source, allow_scoped)
+        logger.info(f"批量创建新工具: {len(new_tools)} 个")
+    
+    new_keys = {tool.name.lower() for tool in new_tools}
+    tools = []
+    existing_count = 0
+    seen = set()
+    for name in valid_names:
+        key = name.lower()
+        # 重复出现的名称与数据库中已有的工具都计为已存在
+        if key not in new_keys or key in seen:
+            existing_count += 1
+        seen.add(key)
+        tools.append(by_name[key])
+    return tools, existing_count, invalid_names
+
+
 def batch_create_tools(db: Session, tool_names: list[str], source: str = "unknown") -> tuple[list[Tool], int]:
     """
     批量创建或获取工具记录
@@ -180,29 +255,7 @@ def batch_create_tools(db: Session, tool_names: list[str], source: str = "unknow
     Returns:
         tuple[list[Tool], int]: (工具对象列表, 已存在的工具数量)
     """
-    tools = []
-    existing_count = 0
-    errors = []
-    
-    for tool_name in tool_names:
-        try:
-            # 检查工具是否已存在
-            existing_tool = get_tool_by_name(db, tool_name)
-            if existing_tool:
-                tools.append(existing_tool)
-                existing_count += 1
-            else:
-                # 创建新工具
-                tool = get_or_create_tool(db, tool_name, source)
-                tools.append(tool)
-        except ValueError as e:
-            errors.append(f"工具 '{tool_name}': 名称无效")
-            logger.warning(f"跳过无效工具名: {tool_name} - {e}")
-        except Exception as e:
-            errors.append(f"工具 '{tool_name}': 创建失败")
-            logger.error(f"创建工具失败: {tool_name} - {e}")
-    
-    if errors:
-        logger.warning(f"批量创建工具时出现 {len(errors)} 个错误")
-    
+    tools, existing_count, invalid_names = bulk_get_or_create_tools(db, tool_names, source)
+    if invalid_names:
+        logger.warning(f"批量创建工具时出现 {len(invalid_names)} 个错误")
     return tools, existing_count
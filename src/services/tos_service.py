@@ -11,19 +11,25 @@ from src.models import Tool
 from src.logger import get_logger
 from src.config import get_config
 from src.services.ai_client import get_ai_client
+from src.services.scan_pipeline import record_stage_attempt
+from src.services.bulkhead import get_bulkheads
 
 logger = get_logger()
 
 
-async def search_tos_url(tool_name: str) -> Optional[str]:
+async def search_tos_url(tool_name: str, raise_errors: bool = False) -> Optional[str]:
     """
     通过联网搜索获取工具的TOS链接
     
     Args:
         tool_name: 工具名称
+        raise_errors: 是否抛出AI接口异常（扫描流水线据此对失败分类并安排重试）
     
     Returns:
         Optional[str]: TOS文档链接，如果无法获取返回None
+    
+    Raises:
+        Exception: raise_errors 为True时，AI接口调用失败（如 httpx.HTTPStatusError）
     """
     try:
         # 使用AI客户端搜索TOS链接
@@ -39,39 +45,55 @@ async def search_tos_url(tool_name: str) -> Optional[str]:
         
     except Exception as e:
         logger.error(f"搜索TOS链接失败: {tool_name} - {e}")
+        if raise_errors:
+            raise
         return None
 
 
-async def fetch_tos_content(tos_url: str) -> Optional[str]:
+async def fetch_tos_content(tos_url: str, raise_errors: bool = False) -> Optional[str]:
     """
     获取TOS文档内容
     
     Args:
         tos_url: TOS文档链接
+        raise_errors: 是否抛出请求异常（扫描流水线据此对失败分类并安排重试）
     
     Returns:
         Optional[str]: TOS文档内容，如果无法获取返回None
+    
+    Raises:
+        httpx.HTTPError: raise_errors 为True时，请求失败或返回错误状态码
     """
+    record_stage_attempt()
     try:
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-            response = await client.get(tos_url)
-            response.raise_for_status()
-            return response.text
+        async with get_bulkheads().tos_fetch:
+            async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
+                response = await client.get(tos_url)
+                response.raise_for_status()
+                return response.text
     except Exception as e:
         logger.warning(f"获取TOS内容失败: {tos_url} - {e}")
+        if raise_errors:
+            raise
         return None
 
 
-async def analyze_tos_with_ai(tool_name: str, tos_content: str) -> Optional[Dict[str, Any]]:
+async def analyze_tos_with_ai(
+    tool_name: str, tos_content: str, raise_errors: bool = False
+) -> Optional[Dict[str, Any]]:
     """
     使用AI服务分析TOS内容
     
     Args:
         tool_name: 工具名称
         tos_content: TOS文档内容
+        raise_errors: 是否抛出AI接口异常（扫描流水线据此对失败分类并安排重试）
     
     Returns:
         Optional[Dict[str, Any]]: TOS分析结果，如果分析失败返回None
+    
+    Raises:
+        Exception: raise_errors 为True时，AI接口调用失败（如 httpx.HTTPStatusError）
     """
     try:
         # 使用AI客户端分析TOS
@@ -87,9 +109,45 @@ async def analyze_tos_with_ai(tool_name: str, tos_content: str) -> Optional[Dict
             
     except Exception as e:
         logger.error(f"TOS分析异常: {tool_name} - {e}")
+        if raise_errors:
+            raise
         return None
 
 
+def save_tos_analysis(
+    tool: Tool,
+    db: Session,
+    tos_analysis: Dict[str, Any],
+    tos_url: Optional[str] = None,
+    tos_content: Optional[str] = None,
+    commit: bool = True
+) -> None:
+    """
+    将TOS分析结果保存到工具记录
+
+    Args:
+        tool: 工具对象
+        db: 数据库会话
+        tos_analysis: TOS分析结果
+        tos_url: TOS文档链接（直接分析时为None）
+        tos_content: TOS文档内容（直接分析时为None）
+        commit: 是否立即提交；为False时只 flush，由调用方（如批量写入任务）统一提交
+    """
+    if tos_url and tos_content:
+        tool.tos_url = tos_url
+        tool.tos_info = json.dumps({
+            "content": tos_content[:1000],  # 只保存前1000字符
+            "analysis": tos_analysis
+        }, ensure_ascii=False)
+    else:
+        tool.tos_info = json.dumps(tos_analysis, ensure_ascii=False)
+    if commit:
+        db.commit()
+        db.refresh(tool)
+    else:
+        db.flush()
+
+
 async def get_and_analyze_tos(tool: Tool, db: Session) -> Dict[str, Any]:
     """
     获取并分析工具的TOS信息
@@ -133,9 +191,7 @@ async def get_and_analyze_tos(tool: Tool, db: Session) -> Dict[str, Any]:
                     result["tos_analysis"] = analysis_result
                     result["success"] = True
                     # 保存到数据库
-                    tool.tos_info = json.dumps(analysis_result, ensure_ascii=False)
-                    db.commit()
-                    db.refresh(tool)
+                    save_tos_analysis(tool, db, analysis_result)
                     logger.info(f"通过AI直接分析工具信息成功: {tool.name}")
                     return result
             except Exception as e:
@@ -165,13 +221,7 @@ async def get_and_analyze_tos(tool: Tool, db: Session) -> Dict[str, Any]:
             result["success"] = True
             
             # 4. 保存到数据库
-            tool.tos_url = tos_url
-            tool.tos_info = json.dumps({
-                "content": tos_content[:1000],  # 只保存前1000字符
-                "analysis": tos_analysis
-            }, ensure_ascii=False)
-            db.commit()
-            db.refresh(tool)
+            save_tos_analysis(tool, db, tos_analysis, tos_url=tos_url, tos_content=tos_content)
             
             logger.info(f"成功获取并分析工具TOS: {tool.name}")
         else:
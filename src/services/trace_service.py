@@ -0,0 +1,159 @@
+"""
+负载轨迹记录服务：记录实际扫描的提交时间与各阶段耗时，供容量规划回放使用
+Workload trace service: records real scan submissions and per-stage latencies for capacity-planning replay
+
+- 每个执行过的扫描在结束时写入一行 JSON（NDJSON）
+- 只记录时间与状态：提交时间、优先级、排队时间、扫描耗时、结束状态、错误类型，
+  以及各阶段相对扫描开始的偏移、耗时、外部请求次数、命中来源与状态
+- 不记录工具名、工具 ID、TOS 链接或任何阶段输出
+"""
+
+import json
+import os
+import random
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.config import TraceConfig, get_config
+from src.logger import get_logger
+
+logger = get_logger()
+
+# 轨迹格式版本（字段变化时递增，回放时忽略不认识的版本）
+TRACE_VERSION = 1
+
+
+def _seconds(start: Any, end: Any) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return round((end - start).total_seconds(), 4)
+
+
+def build_trace_entry(task: Any) -> Dict[str, Any]:
+    """
+    由已结束的扫描任务生成轨迹记录
+
+    Args:
+        task: 扫描任务（ScanTask）
+
+    Returns:
+        Dict[str, Any]: 轨迹记录（不含工具名等内容）
+    """
+    stages = []
+    for result in task.stages.values():
+        stages.append({
+            "name": result.name,
+            "offset": _seconds(task.started_at, result.started_at),
+            "duration": round(result.duration, 4) if result.duration is not None else None,
+            "attempts": result.attempts,
+            "hit": result.hit,
+            "status": result.status.value if result.status else None,
+        })
+    return {
+        "v": TRACE_VERSION,
+        "submitted_at": round(task.created_at.timestamp(), 4),
+        "priority": task.priority.value,
+        "queue_wait": _seconds(task.created_at, task.started_at),
+        "duration": _seconds(task.started_at, task.completed_at),
+        "status": task.status.value,
+        "error_kind": task.error_kind.value if task.error_kind else None,
+        "stages": stages,
+    }
+
+
+class TraceRecorder:
+    """负载轨迹记录器（线程安全，追加写入轨迹文件）"""
+
+    def __init__(self, config: TraceConfig):
+        """
+        Args:
+            config: 负载轨迹记录配置
+        """
+        self.config = config
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def record(self, task: Any) -> bool:
+        """
+        记录已结束的扫描任务（写入失败只记日志，不影响扫描）
+
+        Args:
+            task: 扫描任务
+
+        Returns:
+            bool: 是否已写入
+        """
+        if not self.config.enabled or random.random() >= self.config.sample_rate:
+            return False
+        try:
+            line = json.dumps(build_trace_entry(task), ensure_ascii=False)
+            with self._lock:
+                self._rotate()
+                with open(self.config.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                self.recorded += 1
+            return True
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"写入负载轨迹失败: {e}")
+            return False
+
+    def _rotate(self) -> None:
+        # 调用方需持有锁
+        path = self.config.path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.config.max_size and os.path.exists(path) and os.path.getsize(path) >= self.config.max_size * 1024 * 1024:
+            os.replace(path, path + ".1")
+
+    def stats(self) -> Dict[str, Any]:
+        """轨迹记录指标"""
+        return {"enabled": self.config.enabled, "path": self.config.path, "recorded": self.recorded, "errors": self.errors}
+
+
+def load_trace(lines: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    读取轨迹记录（跳过空行、无法解析的行与不认识的版本），按提交时间排序
+
+    Args:
+        lines: 轨迹文件的各行
+
+    Returns:
+        List[Dict[str, Any]]: 轨迹记录
+    """
+    entries = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(entry, dict) and entry.get("v") == TRACE_VERSION and entry.get("submitted_at") is not None:
+            entries.append(entry)
+    entries.sort(key=lambda entry: entry["submitted_at"])
+    return entries
+
+
+# 全局轨迹记录器实例
+_trace_recorder: Optional[TraceRecorder] = None
+
+
+def get_trace_recorder() -> TraceRecorder:
+    """
+    获取负载轨迹记录器实例（单例模式）
+
+    Returns:
+        TraceRecorder: 轨迹记录器实例
+    """
+    global _trace_recorder
+    if _trace_recorder is None:
+        _trace_recorder = TraceRecorder(get_config().scanning.trace)
+    return _trace_recorder
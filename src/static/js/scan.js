@@ -96,27 +96,34 @@ function initScan() {
 
       function renderTasks() {
         document.getElementById('taskList').innerHTML = tasks.map(function(t) {
-          var statusText = t.status === 'completed' ? '已完成' : t.status === 'failed' ? '失败' : '扫描中...';
-          return '<div class="task-item ' + (t.status === 'completed' ? 'done' : t.status === 'failed' ? 'error' : 'pending') + '">' +
+          var statusText = t.status === 'completed' ? '已完成' : t.status === 'failed' ? '失败' : t.status === 'cancelled' ? '已取消' : '扫描中...';
+          return '<div class="task-item ' + (t.status === 'completed' ? 'done' : (t.status === 'failed' || t.status === 'cancelled') ? 'error' : 'pending') + '">' +
             '<span class="task-name">' + escapeHtml(t.tool_name) + '</span>' +
             '<span class="task-status">' + statusText + '</span></div>';
         }).join('');
       }
       renderTasks();
 
+      function isDone(status) {
+        return status === 'completed' || status === 'failed' || status === 'cancelled';
+      }
+      // 复用已有报告的任务在提交时即已完成
       var doneCount = 0;
+      tasks.forEach(function(t) {
+        if (isDone(t.status)) doneCount++;
+        if (t.report_id) reportIds[t.tool_id] = t.report_id;
+      });
       var interval = setInterval(async function() {
         for (var i = 0; i < tasks.length; i++) {
           var t = tasks[i];
-          if (t.status === 'completed' || t.status === 'failed') continue;
+          if (isDone(t.status)) continue;
           try {
             var stRes = await fetch(API_BASE + '/api/v1/scan/status/' + t.tool_id);
             if (!stRes.ok) continue;
             var st = await stRes.json();
             t.status = st.status;
             if (st.result && st.result.report_id) reportIds[t.tool_id] = st.result.report_id;
-            if (t.status === 'completed') doneCount++;
-            if (t.status === 'failed') doneCount++;
+            if (isDone(t.status)) doneCount++;
           } catch (_) {}
         }
         renderTasks();
@@ -63,6 +63,10 @@ def client(test_engine, db):
     from fastapi.testclient import TestClient
     from src.main import app
     from src.database import get_db as _get_db
+    from src.services import scan_service as _scan_service_module
+
+    # 每个测试使用新的扫描服务，避免之前测试中未执行的任务（工具ID会在新数据库中复用）被合并
+    _scan_service_module._scan_service = None
 
     def _override_get_db():
         try:
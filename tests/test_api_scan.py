@@ -53,3 +53,365 @@ class TestComplianceScan:
             json={"tools": []},
         )
         assert resp.status_code == 422  # min_items=1
+
+    def test_kb_tool_returns_provisional_report(self, client, monkeypatch):
+        from src.services.scan_service import get_scan_service
+
+        monkeypatch.setattr(get_scan_service(), "start", lambda tasks=None: None)
+        resp = client.post("/api/v1/compliance/scan", json={"tools": ["Postman"], "force_refresh": True})
+        assert resp.status_code == 202
+        task = resp.json()["tasks"][0]
+        assert task["status"] == "pending"
+        assert task["provisional"]["kb_source"] == "builtin"
+
+        report = client.get(f"/api/v1/reports/{task['provisional']['report_id']}").json()
+        assert report["metadata"]["provisional"] is True
+        assert report["metadata"]["revision"] == 1
+        assert report["license_info"]["license_type"] == "商业许可证（免费版有限制）"
+
+
+class TestScanFreshness:
+    """扫描结果新鲜度"""
+
+    def test_scan_start_serves_fresh_report(self, client, db):
+        from src.models import Tool, ComplianceReport
+
+        resp = client.post("/api/v1/tools/batch", json={"tools": ["CachedApiTool"]})
+        tool_id = resp.json()["tools"][0]["id"]
+        tool = db.query(Tool).filter(Tool.id == tool_id).first()
+        tool.tos_info = "{}"
+        report = ComplianceReport(tool_id=tool_id, tos_analysis="{}")
+        db.add(report)
+        db.commit()
+
+        resp = client.post("/api/v1/scan/start", json={"tool_ids": [tool_id]})
+        assert resp.status_code == 202
+        data = resp.json()
+        assert data["cached_count"] == 1
+        assert data["tasks"][0]["status"] == "completed"
+        assert data["tasks"][0]["report_id"] == report.id
+        assert data["tasks"][0]["cached"] is True
+
+
+class TestScanQueue:
+    """扫描队列"""
+
+    def test_queue_stats(self, client):
+        resp = client.get("/api/v1/scan/queue")
+        assert resp.status_code == 200
+        data = resp.json()
+        assert set(data["queued"]) == {"interactive", "batch", "background"}
+
+    def test_invalid_priority(self, client):
+        resp = client.post("/api/v1/scan/start", json={"tool_ids": [1], "priority": "urgent"})
+        assert resp.status_code == 422
+
+
+class TestScanCancellation:
+    """扫描批次与取消"""
+
+    def test_batch_not_found(self, client):
+        assert client.get("/api/v1/scan/batches/missing").status_code == 404
+        assert client.delete("/api/v1/scan/batches/missing").status_code == 404
+
+    def test_cancel_task_not_found(self, client):
+        assert client.delete("/api/v1/scan/tasks/99999").status_code == 404
+
+    def test_batch_status_and_cancel_finished_batch(self, client, db):
+        from src.models import Tool, ComplianceReport
+
+        resp = client.post("/api/v1/tools/batch", json={"tools": ["BatchApiTool"]})
+        tool_id = resp.json()["tools"][0]["id"]
+        tool = db.query(Tool).filter(Tool.id == tool_id).first()
+        tool.tos_info = "{}"
+        db.add(ComplianceReport(tool_id=tool_id, tos_analysis="{}"))
+        db.commit()
+
+        resp = client.post("/api/v1/scan/start", json={"tool_ids": [tool_id]})
+        batch_id = resp.json()["batch_id"]
+        assert batch_id
+
+        resp = client.get(f"/api/v1/scan/batches/{batch_id}")
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["finished"] is True
+        assert data["status_counts"]["completed"] == 1
+
+        # 已完成的任务不会被取消
+        resp = client.delete(f"/api/v1/scan/batches/{batch_id}")
+        assert resp.status_code == 200
+        assert resp.json()["cancelled"] == 0
+
+
+class TestScanMetrics:
+    """扫描指标"""
+
+    def test_metrics_expose_concurrency_limit(self, client):
+        resp = client.get("/api/v1/scan/metrics")
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["concurrency"]["limit"] >= 1
+        assert "max_concurrent" in data["scheduler"]
+        assert data["rescan"]["enabled"] is False
+        assert data["result_writer"]["enabled"] is True
+        assert data["retry_queue"]["enabled"] is True
+        assert data["admission"]["enabled"] is True
+
+    def test_offline_mode_toggle(self, client, monkeypatch):
+        from src.config import OfflineConfig
+        from src.services.offline_service import ProviderCircuit
+
+        monkeypatch.setattr("src.services.offline_service._circuit", ProviderCircuit(OfflineConfig()))
+        assert client.get("/api/v1/scan/offline").json()["offline"] is False
+
+        resp = client.put("/api/v1/scan/offline", json={"offline": True})
+        assert resp.status_code == 200
+        assert resp.json()["offline"] is True and resp.json()["manual"] is True
+        assert client.get("/api/v1/scan/metrics").json()["offline"]["offline"] is True
+
+        assert client.put("/api/v1/scan/offline", json={"offline": False}).json()["offline"] is False
+
+    def test_dead_letters_list_and_replay(self, client, db, monkeypatch):
+        from src.config import RetryQueueConfig
+        from src.services.retry_service import ScanErrorKind, record_failure
+        from src.services.scan_service import get_scan_service
+        from src.services.tool_service import get_or_create_tool
+
+        monkeypatch.setattr(get_scan_service(), "start", lambda tasks=None: None)
+        tool = get_or_create_tool(db, "DeadApiTool")
+        record_failure(db, tool.id, ScanErrorKind.INTERNAL, "bug", RetryQueueConfig())
+        db.commit()
+
+        data = client.get("/api/v1/scan/dead-letters").json()
+        assert data["total"] == 1
+        assert data["items"][0]["tool_id"] == tool.id
+
+        resp = client.post("/api/v1/scan/dead-letters/replay", json={})
+        assert resp.status_code == 202
+        assert resp.json()["tool_ids"] == [tool.id]
+        assert resp.json()["batch_id"]
+        assert client.get("/api/v1/scan/dead-letters").json()["total"] == 0
+        status_data = client.get(f"/api/v1/scan/status/{tool.id}").json()
+        assert status_data["retry"]["status"] == "scheduled"
+
+    def test_saturated_queue_returns_429(self, client, monkeypatch):
+        from src.config import AdmissionConfig
+        from src.services.scan_service import get_scan_service
+
+        scan_service = get_scan_service()
+        monkeypatch.setattr(scan_service, "start", lambda tasks=None: None)
+        monkeypatch.setattr(scan_service.admission, "config", AdmissionConfig(max_queued_per_client=3))
+        headers = {"X-API-Key": "ci-key"}
+
+        resp = client.post("/api/v1/compliance/scan", json={"tools": ["Q1", "Q2"]}, headers=headers)
+        assert resp.status_code == 202
+
+        resp = client.post("/api/v1/compliance/scan", json={"tools": ["Q3", "Q4"]}, headers=headers)
+        assert resp.status_code == 429
+        assert int(resp.headers["Retry-After"]) >= 1
+        assert resp.json()["detail"]["queue_position"] == 3
+        # 其他 API Key 不受影响；单次提交超过上限直接拒绝
+        assert client.post("/api/v1/compliance/scan", json={"tools": ["Q3"]}).status_code == 202
+        resp = client.post("/api/v1/compliance/scan", json={"tools": ["A", "B", "C", "D"]})
+        assert resp.status_code == 413
+
+    def test_idempotent_scan_replays_first_response(self, client, monkeypatch):
+        from src.services.scan_service import get_scan_service
+
+        scan_service = get_scan_service()
+        monkeypatch.setattr(scan_service, "start", lambda tasks=None: None)
+        headers = {"Idempotency-Key": "ci-run-1"}
+
+        first = client.post("/api/v1/compliance/scan", json={"tools": ["I1", "I2"]}, headers=headers)
+        assert first.status_code == 202
+        queued = len(scan_service.registry.active())
+
+        resp = client.post("/api/v1/compliance/scan", json={"tools": ["I1", "I2"]}, headers=headers)
+        assert resp.status_code == 202
+        assert resp.headers["Idempotent-Replayed"] == "true"
+        assert resp.json() == first.json()
+        # 重放不提交新的扫描任务
+        assert len(scan_service.registry.active()) == queued
+
+        # 同一 Key 用于不同的请求内容
+        resp = client.post("/api/v1/compliance/scan", json={"tools": ["I3"]}, headers=headers)
+        assert resp.status_code == 422
+        # Key 按接口区分
+        tool_ids = first.json()["tool_ids"]
+        resp = client.post("/api/v1/scan/start", json={"tool_ids": tool_ids}, headers=headers)
+        assert resp.status_code == 202
+        assert "Idempotent-Replayed" not in resp.headers
+
+    def test_idempotent_duplicate_waits_for_in_flight_request(self, client, test_engine, monkeypatch):
+        import threading
+        import time
+        from sqlalchemy.orm import sessionmaker
+        from src.config import get_config
+        from src.schemas import ComplianceScanRequest
+        from src.services.admission_service import client_key
+        from src.services.idempotency_service import get_in_flight_keys, request_fingerprint, save_response
+
+        config = get_config().scanning.idempotency
+        in_flight = get_in_flight_keys()
+        fingerprint = request_fingerprint(ComplianceScanRequest(tools=["W1"]).model_dump(mode="json"))
+        headers = {"Idempotency-Key": "in-flight-1"}
+        first = {"message": "首次响应", "task_count": 0, "tool_ids": [], "tasks": [], "cached_count": 0}
+
+        # 首次请求仍在处理中：重复请求等待超时返回 409，内容不同返回 422
+        assert in_flight.reserve(client_key(None), "compliance.scan", "in-flight-1", fingerprint) is None
+        try:
+            monkeypatch.setattr(config, "in_flight_wait_seconds", 0)
+            resp = client.post("/api/v1/compliance/scan", json={"tools": ["W1"]}, headers=headers)
+            assert resp.status_code == 409
+            assert resp.headers["Retry-After"] == "1"
+            resp = client.post("/api/v1/compliance/scan", json={"tools": ["W2"]}, headers=headers)
+            assert resp.status_code == 422
+
+            def finish_first():
+                time.sleep(0.2)
+                session = sessionmaker(bind=test_engine)()
+                try:
+                    save_response(
+                        session, config, client_key(None), "compliance.scan", "in-flight-1", fingerprint, 202, first
+                    )
+                finally:
+                    session.close()
+                in_flight.release(client_key(None), "compliance.scan", "in-flight-1")
+
+            monkeypatch.setattr(config, "in_flight_wait_seconds", 10)
+            thread = threading.Thread(target=finish_first)
+            thread.start()
+            resp = client.post("/api/v1/compliance/scan", json={"tools": ["W1"]}, headers=headers)
+            thread.join()
+        finally:
+            in_flight.release(client_key(None), "compliance.scan", "in-flight-1")
+
+        # 等待首次请求结束后重放其响应，不再提交扫描
+        assert resp.status_code == 202
+        assert resp.headers["Idempotent-Replayed"] == "true"
+        assert resp.json() == first
+        assert len(in_flight) == 0
+
+    def test_stage_stats(self, client):
+        resp = client.get("/api/v1/scan/stage-stats?limit=10")
+        assert resp.status_code == 200
+        assert resp.json() == {"scans": 0, "stages": {}}
+
+
+class TestScanUpload:
+    """工具清单流式上传"""
+
+    def test_upload_unknown_format(self, client):
+        resp = client.post(
+            "/api/v1/compliance/scan/upload", content=b"x", headers={"Content-Type": "application/octet-stream"}
+        )
+        assert resp.status_code == 400
+
+    def test_upload_csv_creates_batch(self, client, db, test_engine, monkeypatch):
+        from sqlalchemy.orm import sessionmaker
+        from src.services.scan_service import get_scan_service
+
+        scan_service = get_scan_service()
+        monkeypatch.setattr("src.routers.scan.get_session", lambda: sessionmaker(bind=test_engine))
+        monkeypatch.setattr(scan_service, "start", lambda tasks=None: None)
+
+        resp = client.post(
+            "/api/v1/compliance/scan/upload",
+            content="name\nUploadA\nUploadB\nuploada\n".encode("utf-8"),
+            headers={"Content-Type": "text/csv"},
+        )
+        assert resp.status_code == 202
+        batch_id = resp.json()["batch_id"]
+
+        # 后台任务在 TestClient 中随请求同步执行完毕
+        data = client.get(f"/api/v1/scan/batches/{batch_id}").json()
+        assert data["ingest"]["status"] == "completed"
+        assert data["ingest"]["tools"] == 2
+        assert data["ingest"]["duplicates"] == 1
+        assert data["priority"] == "batch"
+        assert len(data["tasks"]) == 2
+
+    def test_upload_checks_admission_per_chunk(self, client, test_engine, monkeypatch):
+        from sqlalchemy.orm import sessionmaker
+        from src.config import AdmissionConfig
+        from src.services.scan_service import get_scan_service
+
+        scan_service = get_scan_service()
+        monkeypatch.setattr("src.routers.scan.get_session", lambda: sessionmaker(bind=test_engine))
+        monkeypatch.setattr(scan_service, "start", lambda tasks=None: None)
+        monkeypatch.setattr(
+            scan_service.admission, "config",
+            AdmissionConfig(max_queued_per_client=2, ingest_max_wait_seconds=0),
+        )
+
+        resp = client.post(
+            "/api/v1/compliance/scan/upload",
+            content="".join(f"ThrottledTool{i}\n" for i in range(5)).encode("utf-8"),
+            headers={"Content-Type": "text/csv", "X-API-Key": "per-chunk-client"},
+        )
+        assert resp.status_code == 202
+
+        data = client.get(f"/api/v1/scan/batches/{resp.json()['batch_id']}").json()
+        # 第一块在客户端上限内，第二块因客户端排队已满而停止导入
+        assert data["ingest"]["status"] == "stopped"
+        assert data["ingest"]["throttled"]["scope"] == "client"
+        assert len(data["tasks"]) == 2
+        for task in scan_service.registry.active():
+            task.cancel()
+
+
+class TestSbomScan:
+    """SBOM 差异扫描"""
+
+    def test_unrecognized_manifest(self, client):
+        resp = client.post("/api/v1/compliance/scan/sbom?project=p", content=b'{"foo": 1}')
+        assert resp.status_code == 400
+
+    def test_project_required(self, client):
+        resp = client.post("/api/v1/compliance/scan/sbom", content=b"flask==3.0\n")
+        assert resp.status_code == 422
+
+    def test_admission_counts_components_to_scan(self, client, db, monkeypatch):
+        from src.config import AdmissionConfig
+        from src.models import ProjectComponent
+        from src.services.scan_service import get_scan_service
+
+        scan_service = get_scan_service()
+        monkeypatch.setattr(scan_service, "start", lambda tasks=None: None)
+        monkeypatch.setattr(scan_service.admission, "config", AdmissionConfig(max_queued_per_client=3))
+        headers = {"X-API-Key": "sbom-key"}
+        manifest = "".join(f"pkg{i}==1.0\n" for i in range(5)).encode()
+
+        # 需要扫描的组件数超过上限：413，不创建工具、不记录项目组件
+        resp = client.post("/api/v1/compliance/scan/sbom?project=big", content=manifest, headers=headers)
+        assert resp.status_code == 413
+        assert db.query(ProjectComponent).filter(ProjectComponent.project == "big").count() == 0
+
+        resp = client.post("/api/v1/compliance/scan/sbom?project=a", content=b"a1==1\na2==1\n", headers=headers)
+        assert resp.status_code == 202
+        # 客户端排队已满：429 与 Retry-After
+        resp = client.post("/api/v1/compliance/scan/sbom?project=b", content=b"b1==1\nb2==1\n", headers=headers)
+        assert resp.status_code == 429
+        assert int(resp.headers["Retry-After"]) >= 1
+        for task in scan_service.registry.active():
+            task.cancel()
+
+    def test_unchanged_components_resolve_from_reports(self, client, db, monkeypatch):
+        from src.models import ComplianceReport
+        from src.services.scan_service import get_scan_service
+
+        monkeypatch.setattr(get_scan_service(), "start", lambda tasks=None: None)
+        resp = client.post("/api/v1/compliance/scan/sbom?project=ci-app", content=b"flask==3.0\n")
+        assert resp.status_code == 202
+        data = resp.json()
+        assert data["format"] == "requirements"
+        assert data["added"] == ["flask"]
+        # 模拟首次扫描已结束并生成报告
+        get_scan_service().cancel_batch(data["batch_id"])
+        db.add(ComplianceReport(tool_id=data["tasks"][0]["tool_id"], tos_analysis="{}"))
+        db.commit()
+
+        resp = client.post("/api/v1/compliance/scan/sbom?project=ci-app", content=b"flask==3.0\n")
+        data = resp.json()
+        assert data["unchanged"] == ["flask"]
+        assert data["cached_count"] == 1
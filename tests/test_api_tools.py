@@ -54,6 +54,16 @@ class TestBatchCreateTools:
         data = resp.json()
         assert data["existing"] >= 1
 
+    def test_batch_create_idempotent_replay(self, client):
+        """携带相同 Idempotency-Key 的重复提交返回首次响应"""
+        headers = {"Idempotency-Key": "batch-1"}
+        r1 = client.post("/api/v1/tools/batch", json={"tools": ["Vault", "Consul"]}, headers=headers)
+        r2 = client.post("/api/v1/tools/batch", json={"tools": ["Vault", "Consul"]}, headers=headers)
+        assert r2.status_code == 201
+        assert r2.headers["Idempotent-Replayed"] == "true"
+        assert r2.json() == r1.json()
+        assert r2.json()["created"] == 2
+
     def test_batch_create_empty_list(self, client):
         resp = client.post("/api/v1/tools/batch", json={"tools": []})
         assert resp.status_code == 422  # min_items=1 验证
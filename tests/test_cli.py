@@ -0,0 +1,97 @@
+"""
+命令行批量扫描单元测试
+Unit tests for the headless CLI scanner
+"""
+
+import io
+import json
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from src import cli
+from src.models import ComplianceReport
+from src.services.sbom_service import SBOM_FORMATS
+from src.services.tool_service import get_or_create_tool
+
+
+class TestReadToolNames:
+
+    def test_text_lines_and_commas(self):
+        assert cli.read_tool_names("Docker Desktop\nPostman, docker desktop\n\n") == ["Docker Desktop", "Postman"]
+
+    def test_requirements(self):
+        assert cli.read_tool_names("requests==2.0\n# comment\nflask>=2\n", "requirements") == ["requests", "flask"]
+
+    def test_formats_match_sbom_service(self):
+        assert cli.INPUT_FORMATS[2:] == SBOM_FORMATS
+
+    def test_unrecognized_manifest(self):
+        with pytest.raises(ValueError):
+            cli.read_tool_names("[1, 2]", "sbom")
+
+
+class TestRunScan:
+
+    @pytest.fixture(autouse=True)
+    def _isolated(self, test_engine, monkeypatch):
+        from src.services import scan_service
+
+        monkeypatch.setattr("src.database.get_session", lambda: sessionmaker(bind=test_engine))
+        monkeypatch.setattr(scan_service, "_scan_service", None)
+
+    def _report(self, db, name, is_compliant):
+        tool = get_or_create_tool(db, name)
+        tool.tos_info = "{}"
+        db.add(ComplianceReport(tool_id=tool.id, tos_analysis="{}", is_compliant=is_compliant))
+        db.commit()
+
+    def test_writes_ndjson_and_flags_policy_failure(self, db):
+        self._report(db, "CliCompliant", True)
+        self._report(db, "CliViolation", False)
+        out = io.StringIO()
+
+        code = cli.run_scan(["CliCompliant", "CliViolation"], out)
+
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert {r["tool_name"] for r in results} == {"CliCompliant", "CliViolation"}
+        assert all(r["status"] == "completed" and r["cached"] for r in results)
+        assert code == cli.EXIT_POLICY_FAILURE
+
+    def test_all_compliant_exits_zero(self, db):
+        self._report(db, "CliOnly", True)
+        out = io.StringIO()
+
+        assert cli.run_scan(["CliOnly"], out, workers=4) == cli.EXIT_OK
+        assert len(out.getvalue().splitlines()) == 1
+
+
+class TestMain:
+
+    def test_empty_input(self, tmp_path):
+        path = tmp_path / "tools.txt"
+        path.write_text("\n\n", encoding="utf-8")
+        assert cli.main(["scan", str(path)]) == cli.EXIT_USAGE
+
+    def test_missing_file(self, tmp_path):
+        assert cli.main(["scan", str(tmp_path / "missing.txt")]) == cli.EXIT_USAGE
+
+    def test_replay_outputs_one_line_per_setting(self, tmp_path, capsys):
+        stages = [{"name": "tos_analysis", "offset": 0, "duration": 0.5, "attempts": 1, "hit": None, "status": "succeeded"}]
+        trace = tmp_path / "trace.ndjson"
+        trace.write_text(
+            "\n".join(json.dumps({"v": 1, "submitted_at": i, "priority": "batch", "stages": stages}) for i in range(3)),
+            encoding="utf-8",
+        )
+
+        code = cli.main(["replay", str(trace), "--speed", "100", "--max-concurrent", "1", "2", "--no-adaptive"])
+
+        results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert code == cli.EXIT_OK
+        assert [r["settings"]["max_concurrent"] for r in results] == [1, 2]
+        assert all(r["scans"] == 3 and not r["settings"]["adaptive_concurrency"] for r in results)
+
+    def test_replay_empty_trace(self, tmp_path):
+        trace = tmp_path / "trace.ndjson"
+        trace.write_text("", encoding="utf-8")
+        assert cli.main(["replay", str(trace)]) == cli.EXIT_USAGE
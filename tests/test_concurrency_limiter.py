@@ -0,0 +1,93 @@
+"""
+自适应并发上限单元测试
+Unit tests for concurrency_limiter module
+"""
+
+import asyncio
+import httpx
+from src.config import AdaptiveConcurrencyConfig
+from src.services.concurrency_limiter import AIMDLimiter
+
+
+def _limiter(initial=4, **overrides):
+    config = AdaptiveConcurrencyConfig(
+        min_concurrent=1, max_concurrent=8, latency_threshold=1.0, decrease_cooldown=0, **overrides
+    )
+    return AIMDLimiter(initial, config)
+
+
+class TestAIMDLimiter:
+
+    def test_additive_increase_after_full_window(self):
+        limiter = _limiter(initial=4)
+        for _ in range(3):
+            limiter.on_success(0.1)
+        assert limiter.limit == 4
+        limiter.on_success(0.1)
+        assert limiter.limit == 5
+
+    def test_slow_calls_do_not_increase(self):
+        limiter = _limiter(initial=2)
+        for _ in range(10):
+            limiter.on_success(5.0)
+        assert limiter.limit == 2
+        assert limiter.stats()["signals"]["slow"] == 10
+
+    def test_multiplicative_decrease_and_bounds(self):
+        limiter = _limiter(initial=8)
+        limiter.on_rate_limited()
+        assert limiter.limit == 4
+        limiter.on_timeout()
+        limiter.on_timeout()
+        limiter.on_timeout()
+        assert limiter.limit == 1
+
+        for _ in range(100):
+            limiter.on_success(0.1)
+        assert limiter.limit == 8
+
+    def test_cooldown_limits_repeated_decreases(self):
+        limiter = _limiter(initial=8, decrease_factor=0.5)
+        limiter.config.decrease_cooldown = 60
+        for _ in range(5):
+            limiter.on_rate_limited()
+        assert limiter.limit == 4
+        assert limiter.stats()["signals"]["rate_limited"] == 5
+
+    def test_listener_notified(self):
+        limiter = _limiter(initial=4)
+        seen = []
+        limiter.add_listener(seen.append)
+        limiter.on_rate_limited()
+        assert seen == [4, 2]
+
+    def test_disabled_keeps_limit(self):
+        limiter = _limiter(initial=4, enabled=False)
+        limiter.on_rate_limited()
+        assert limiter.limit == 4
+
+
+class TestCallApiSignals:
+
+    def test_rate_limit_reported(self, monkeypatch):
+        from src.services import ai_client
+
+        limiter = _limiter(initial=4)
+        monkeypatch.setattr(ai_client, "get_concurrency_limiter", lambda: limiter)
+        real_sleep = asyncio.sleep
+        monkeypatch.setattr(ai_client.asyncio, "sleep", lambda delay: real_sleep(0))
+
+        responses = iter([httpx.Response(429, json={"error": {"message": "busy"}}),
+                          httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})])
+        transport = httpx.MockTransport(lambda request: next(responses))
+        real_client = httpx.AsyncClient
+        monkeypatch.setattr(ai_client.httpx, "AsyncClient",
+                            lambda **kwargs: real_client(transport=transport, **kwargs))
+
+        client = ai_client.GLMClient()
+        client.api_key = "test-key"
+        content = asyncio.run(client._call_api([{"role": "user", "content": "hi"}]))
+
+        assert content == "ok"
+        assert limiter.limit == 2
+        assert limiter.stats()["signals"] == {"success": 1, "slow": 0, "rate_limited": 1, "timeout": 0}
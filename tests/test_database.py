@@ -11,6 +11,7 @@ from sqlalchemy.orm import Session
 from src.database import (
     get_engine,
     get_session,
+    get_session_for,
     init_database,
     check_database_exists,
     get_db
@@ -173,3 +174,20 @@ def test_foreign_key_relationship(tmp_path):
         
     finally:
         db.close()
+
+
+def test_session_factory_is_shared_per_database(test_engine):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    first = sessionmaker(bind=test_engine)()
+    second = sessionmaker(bind=test_engine)()
+    other = Session(bind=create_engine("sqlite://"))
+    try:
+        # 同一数据库的会话对应同一个会话工厂，写入可以合并提交
+        assert get_session_for(first) is get_session_for(second)
+        assert get_session_for(first).kw["bind"] is test_engine
+        assert get_session_for(other) is not get_session_for(first)
+    finally:
+        for session in (first, second, other):
+            session.close()
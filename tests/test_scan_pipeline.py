@@ -0,0 +1,199 @@
+"""
+扫描流水线单元测试
+Unit tests for scan_pipeline module
+"""
+
+import asyncio
+import pytest
+from src.services.scan_pipeline import (
+    ScanPipeline,
+    PipelineStage,
+    PipelineStageError,
+    StageStatus,
+    mark_stage_hit,
+    record_stage_attempt,
+)
+
+
+def _sleeper(delay, value=None, log=None):
+    async def _stage(context, inputs):
+        if log is not None:
+            log.append(("start", context.get("name")))
+        await asyncio.sleep(delay)
+        return value
+    return _stage
+
+
+class TestPipelineDefinition:
+
+    def test_unknown_input_raises(self):
+        with pytest.raises(ValueError):
+            ScanPipeline([PipelineStage("a", _sleeper(0), inputs=["missing"])])
+
+    def test_duplicate_name_raises(self):
+        with pytest.raises(ValueError):
+            ScanPipeline([PipelineStage("a", _sleeper(0)), PipelineStage("a", _sleeper(0))])
+
+    def test_cycle_raises(self):
+        with pytest.raises(ValueError):
+            ScanPipeline([
+                PipelineStage("a", _sleeper(0), inputs=["b"]),
+                PipelineStage("b", _sleeper(0), inputs=["a"]),
+            ])
+
+    def test_topological_order(self):
+        pipeline = ScanPipeline([
+            PipelineStage("c", _sleeper(0), inputs=["a", "b"]),
+            PipelineStage("a", _sleeper(0)),
+            PipelineStage("b", _sleeper(0), inputs=["a"]),
+        ])
+        assert pipeline.order == ["a", "b", "c"]
+
+
+class TestPipelineRun:
+
+    def test_inputs_passed_to_dependents(self):
+        async def add(context, inputs):
+            return inputs["a"] + inputs["b"]
+
+        pipeline = ScanPipeline([
+            PipelineStage("a", _sleeper(0, 1)),
+            PipelineStage("b", _sleeper(0, 2)),
+            PipelineStage("sum", add, inputs=["a", "b"]),
+        ])
+        results = asyncio.run(pipeline.run({}))
+        assert results["sum"].value == 3
+        assert all(r.status == StageStatus.SUCCEEDED for r in results.values())
+
+    def test_independent_stages_run_concurrently(self):
+        pipeline = ScanPipeline([
+            PipelineStage("slow_a", _sleeper(0.2)),
+            PipelineStage("slow_b", _sleeper(0.2)),
+            PipelineStage("slow_c", _sleeper(0.2)),
+        ])
+
+        async def _run():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await pipeline.run({})
+            return loop.time() - started
+
+        assert asyncio.run(_run()) < 0.5
+
+    def test_optional_stage_timeout_yields_none(self):
+        async def consume(context, inputs):
+            return inputs["slow"]
+
+        pipeline = ScanPipeline([
+            PipelineStage("slow", _sleeper(1, "late"), timeout=0.05),
+            PipelineStage("next", consume, inputs=["slow"]),
+        ])
+        results = asyncio.run(pipeline.run({}))
+        assert results["slow"].status == StageStatus.TIMEOUT
+        assert results["next"].status == StageStatus.SUCCEEDED
+        assert results["next"].value is None
+
+    def test_required_stage_failure_raises(self):
+        async def boom(context, inputs):
+            raise RuntimeError("boom")
+
+        pipeline = ScanPipeline([
+            PipelineStage("boom", boom, required=True),
+            PipelineStage("other", _sleeper(1)),
+        ])
+        with pytest.raises(PipelineStageError) as exc_info:
+            asyncio.run(pipeline.run({}))
+        assert exc_info.value.result.name == "boom"
+        assert exc_info.value.result.status == StageStatus.FAILED
+
+    def test_callbacks_and_durations(self):
+        started, ended = [], []
+        pipeline = ScanPipeline([
+            PipelineStage("a", _sleeper(0.01)),
+            PipelineStage("b", _sleeper(0), inputs=["a"]),
+        ])
+        results = asyncio.run(pipeline.run(
+            {}, on_stage_start=lambda r: started.append(r.name), on_stage_end=ended.append
+        ))
+        assert started == ["a", "b"]
+        assert [r.name for r in ended] == ["a", "b"]
+        assert results["a"].duration >= 0.01
+        assert results["a"].to_dict()["status"] == "succeeded"
+
+    def test_attempts_and_hits_recorded_per_stage(self):
+        async def retrying(context, inputs):
+            record_stage_attempt()
+            await asyncio.sleep(0)
+            record_stage_attempt()
+            return "ok"
+
+        async def cached(context, inputs):
+            mark_stage_hit("kb")
+            return "kb"
+
+        pipeline = ScanPipeline([PipelineStage("a", retrying), PipelineStage("b", cached)])
+        results = asyncio.run(pipeline.run({}))
+        assert results["a"].attempts == 2
+        assert results["a"].hit is None
+        assert results["b"].to_dict()["hit"] == "kb"
+        assert results["b"].attempts == 0
+
+
+class DictCheckpoints:
+    """以内存字典实现的检查点存储"""
+
+    def __init__(self):
+        self.saved = {}
+
+    def load(self, stage, inputs):
+        if stage in self.saved and self.saved[stage][0] == inputs:
+            return True, self.saved[stage][1]
+        return False, None
+
+    def save(self, stage, inputs, value):
+        self.saved[stage] = (inputs, value)
+
+
+class TestPipelineCheckpoints:
+
+    def test_resume_skips_checkpointed_stages(self):
+        calls = []
+
+        def stage(name, value):
+            async def _stage(context, inputs):
+                calls.append(name)
+                return value
+            return _stage
+
+        pipeline = ScanPipeline([
+            PipelineStage("a", stage("a", 1), checkpoint=True),
+            PipelineStage("b", stage("b", 2), inputs=["a"], checkpoint=True),
+            PipelineStage("c", stage("c", 3), inputs=["b"]),
+        ])
+        store = DictCheckpoints()
+        asyncio.run(pipeline.run({}, checkpoints=store))
+        assert calls == ["a", "b", "c"]
+
+        calls.clear()
+        results = asyncio.run(pipeline.run({}, checkpoints=store))
+        assert calls == ["c"]
+        assert results["b"].resumed is True
+        assert results["b"].hit == "checkpoint"
+        assert results["c"].value == 3
+
+    def test_none_output_not_checkpointed(self):
+        pipeline = ScanPipeline([PipelineStage("a", _sleeper(0, None), checkpoint=True)])
+        store = DictCheckpoints()
+        asyncio.run(pipeline.run({}, checkpoints=store))
+        assert store.saved == {}
+
+    def test_changed_inputs_invalidate_checkpoint(self):
+        store = DictCheckpoints()
+        store.saved["b"] = ({"a": "old"}, "stale")
+        pipeline = ScanPipeline([
+            PipelineStage("a", _sleeper(0, "new")),
+            PipelineStage("b", _sleeper(0, "fresh"), inputs=["a"], checkpoint=True),
+        ])
+        results = asyncio.run(pipeline.run({}, checkpoints=store))
+        assert results["b"].value == "fresh"
+        assert results["b"].resumed is False
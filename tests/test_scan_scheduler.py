@@ -0,0 +1,180 @@
+"""
+扫描调度器单元测试
+Unit tests for scan_scheduler module
+"""
+
+import asyncio
+from src.services.scan_scheduler import ScanScheduler, ScanPriority, WeightedFairQueue
+
+
+class TestWeightedFairQueue:
+
+    def test_weighted_interleaving(self):
+        queue = WeightedFairQueue({"interactive": 3, "batch": 1, "background": 1})
+        for i in range(8):
+            queue.push(f"i{i}", ScanPriority.INTERACTIVE)
+            queue.push(f"b{i}", ScanPriority.BATCH)
+        picked = [queue.pop()[0] for _ in range(8)]
+        assert picked.count(ScanPriority.INTERACTIVE) == 6
+        assert picked.count(ScanPriority.BATCH) == 2
+
+    def test_allowed_filter(self):
+        queue = WeightedFairQueue({})
+        queue.push("b", ScanPriority.BATCH)
+        assert queue.pop([ScanPriority.INTERACTIVE]) is None
+        assert queue.pop() == (ScanPriority.BATCH, "b")
+        assert len(queue) == 0
+
+    def test_counts(self):
+        queue = WeightedFairQueue({})
+        queue.push("x", ScanPriority.BACKGROUND)
+        assert queue.counts() == {"interactive": 0, "batch": 0, "background": 1}
+
+
+class TestScanScheduler:
+
+    def test_dispatch_gate_holds_priority(self):
+        async def _run():
+            started = []
+            open_batch = False
+
+            async def runner(item):
+                started.append(item)
+
+            scheduler = ScanScheduler(
+                runner, max_concurrent=2, weights={}, interactive_reserved_slots=0,
+                dispatch_gate=lambda priority: open_batch or priority == ScanPriority.INTERACTIVE,
+                gate_recheck_seconds=0.02,
+            )
+            scheduler.attach(asyncio.get_running_loop())
+            scheduler.submit("batch-0", ScanPriority.BATCH)
+            scheduler.submit("interactive-0", ScanPriority.INTERACTIVE)
+            await asyncio.sleep(0.01)
+            # 被暂停的优先级留在队列中，其他优先级照常出队
+            assert started == ["interactive-0"]
+            assert scheduler.stats()["held"] == ["batch", "background"]
+
+            open_batch = True
+            await asyncio.sleep(0.05)
+            return started
+
+        assert asyncio.run(_run()) == ["interactive-0", "batch-0"]
+
+    def test_interactive_gets_reserved_slot(self):
+        async def _run():
+            release = asyncio.Event()
+            started = []
+
+            async def runner(item):
+                started.append(item)
+                if item.startswith("batch"):
+                    await release.wait()
+
+            scheduler = ScanScheduler(runner, max_concurrent=3, weights={}, interactive_reserved_slots=1)
+            scheduler.attach(asyncio.get_running_loop())
+            scheduler.submit_many([f"batch-{i}" for i in range(10)], ScanPriority.BATCH)
+            await asyncio.sleep(0.01)
+            # 批量任务最多占用 max_concurrent - reserved 个槽位
+            assert scheduler.running[ScanPriority.BATCH] == 2
+
+            scheduler.submit("interactive-0", ScanPriority.INTERACTIVE)
+            await asyncio.sleep(0.01)
+            assert "interactive-0" in started
+
+            release.set()
+            while scheduler.in_flight or len(scheduler.queue):
+                await asyncio.sleep(0.01)
+            return started
+
+        started = asyncio.run(_run())
+        assert len(started) == 11
+
+    def test_never_exceeds_max_concurrent(self):
+        async def _run():
+            peak = 0
+
+            async def runner(item):
+                nonlocal peak
+                peak = max(peak, scheduler.in_flight)
+                await asyncio.sleep(0.001)
+
+            scheduler = ScanScheduler(runner, max_concurrent=2, weights={}, interactive_reserved_slots=0)
+            scheduler.attach(asyncio.get_running_loop())
+            scheduler.submit_many(list(range(10)), ScanPriority.INTERACTIVE)
+            scheduler.submit_many(list(range(10)), ScanPriority.BACKGROUND)
+            await asyncio.sleep(0.01)
+            while scheduler.in_flight or len(scheduler.queue):
+                await asyncio.sleep(0.01)
+            return peak
+
+        assert asyncio.run(_run()) == 2
+
+    def test_runner_errors_free_slot(self):
+        async def _run():
+            async def runner(item):
+                raise RuntimeError("boom")
+
+            scheduler = ScanScheduler(runner, max_concurrent=1, weights={})
+            scheduler.attach(asyncio.get_running_loop())
+            scheduler.submit_many([1, 2, 3], ScanPriority.BATCH)
+            await asyncio.sleep(0.05)
+            return scheduler.stats()
+
+        stats = asyncio.run(_run())
+        assert stats["in_flight"] == 0
+        assert stats["queued"]["batch"] == 0
+
+    def test_cancel_queued_and_running(self):
+        async def _run():
+            release = asyncio.Event()
+            finished = []
+
+            async def runner(item):
+                await release.wait()
+                finished.append(item)
+
+            scheduler = ScanScheduler(runner, max_concurrent=1, weights={}, interactive_reserved_slots=0)
+            scheduler.attach(asyncio.get_running_loop())
+            scheduler.submit_many(["a", "b", "c"], ScanPriority.BATCH)
+            await asyncio.sleep(0.01)
+            assert scheduler.in_flight == 1
+
+            # "a" 执行中、"b" 排队中，均被取消；槽位立即交给 "c"
+            assert scheduler.cancel(["a", "b"]) == 2
+            await asyncio.sleep(0.01)
+            assert len(scheduler.queue) == 0
+            assert scheduler.in_flight == 1
+
+            release.set()
+            await asyncio.sleep(0.01)
+            return finished
+
+        assert asyncio.run(_run()) == ["c"]
+
+    def test_cancel_before_start_is_noop(self):
+        async def runner(item):
+            pass
+
+        scheduler = ScanScheduler(runner, max_concurrent=1, weights={})
+        assert scheduler.cancel(["a"]) == 0
+
+    def test_set_max_concurrent_resizes(self):
+        async def _run():
+            release = asyncio.Event()
+
+            async def runner(item):
+                await release.wait()
+
+            scheduler = ScanScheduler(runner, max_concurrent=1, weights={}, interactive_reserved_slots=0)
+            scheduler.attach(asyncio.get_running_loop())
+            scheduler.submit_many(list(range(5)), ScanPriority.BATCH)
+            await asyncio.sleep(0.01)
+            assert scheduler.in_flight == 1
+
+            scheduler.set_max_concurrent(3)
+            await asyncio.sleep(0.01)
+            in_flight = scheduler.in_flight
+            release.set()
+            return in_flight
+
+        assert asyncio.run(_run()) == 3
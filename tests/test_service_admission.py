@@ -0,0 +1,117 @@
+"""
+扫描准入控制单元测试
+Unit tests for admission_service module
+"""
+
+from datetime import timedelta
+
+import pytest
+
+from src.config import AdmissionConfig, TaskRegistryConfig
+from src.services.admission_service import ANONYMOUS_CLIENT, AdmissionController, AdmissionRejected, client_key
+from src.services.scan_scheduler import ScanPriority
+from src.services.scan_service import ScanBatch, ScanTask
+from src.services.task_registry import ScanTaskRegistry
+
+
+def _controller(max_queued=10, per_client=5, max_concurrent=2):
+    registry = ScanTaskRegistry(TaskRegistryConfig(), ScanTask, ScanBatch)
+    config = AdmissionConfig(max_queued_tasks=max_queued, max_queued_per_client=per_client, default_scan_seconds=30)
+    return AdmissionController(config, registry, max_concurrent), registry
+
+
+def _batch(registry, start_id, count):
+    tasks = [ScanTask(tool_id, f"Tool{tool_id}") for tool_id in range(start_id, start_id + count)]
+    for task in tasks:
+        registry.add(task)
+    return ScanBatch(tasks, ScanPriority.BATCH)
+
+
+class TestClientKey:
+
+    def test_hashes_api_key(self):
+        assert client_key(None) == ANONYMOUS_CLIENT
+        assert client_key("secret") == client_key("secret")
+        assert "secret" not in client_key("secret")
+
+
+class TestAdmission:
+
+    def test_per_client_limit(self):
+        controller, registry = _controller()
+        controller.track("a", _batch(registry, 1, 4))
+
+        controller.admit("a", 1)
+        with pytest.raises(AdmissionRejected) as exc_info:
+            controller.admit("a", 2)
+        assert exc_info.value.scope == "client"
+        assert exc_info.value.queue_position == 5
+        # 其他客户端不受影响
+        controller.admit("b", 5)
+
+    def test_global_limit_and_retry_after(self):
+        controller, registry = _controller(max_queued=6, per_client=0)
+        controller.track("a", _batch(registry, 1, 6))
+
+        with pytest.raises(AdmissionRejected) as exc_info:
+            controller.admit("b", 4)
+        rejected = exc_info.value
+        assert rejected.scope == "global"
+        # 超出 4 个，并发 2，每个扫描默认 30 秒
+        assert rejected.retry_after == 60
+        assert rejected.to_dict()["queued"] == 6
+        assert controller.rejected_total == 1
+
+    def test_retry_after_uses_recent_scan_durations(self):
+        controller, registry = _controller()
+        task = ScanTask(99, "Done")
+        task.complete({})
+        task.started_at = task.completed_at - timedelta(seconds=10)
+        registry.add(task)
+
+        assert controller.retry_after(4) == 20
+
+    def test_finished_batches_release_capacity(self):
+        controller, registry = _controller(per_client=3)
+        batch = _batch(registry, 1, 3)
+        controller.track("a", batch)
+        with pytest.raises(AdmissionRejected):
+            controller.admit("a", 1)
+
+        for task in batch.tasks:
+            task.cancel()
+        controller.admit("a", 3)
+        assert controller.stats()["clients"] == {}
+
+    def test_disabled(self):
+        controller, registry = _controller(max_queued=1)
+        controller.config = AdmissionConfig(enabled=False, max_queued_tasks=1)
+        controller.track("a", _batch(registry, 1, 3))
+        controller.admit("a", 100)
+
+    def test_admit_waiting_pauses_until_capacity_frees(self):
+        controller, registry = _controller(per_client=3)
+        batch = _batch(registry, 1, 3)
+        controller.track("a", batch)
+        throttled, sleeps = [], []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            for task in batch.tasks:
+                task.cancel()
+
+        controller.admit_waiting("a", 2, on_throttled=throttled.append, sleep=sleep)
+
+        assert [rejected.scope for rejected in throttled] == ["client"]
+        assert sleeps == [controller.config.ingest_poll_seconds]
+
+    def test_admit_waiting_gives_up_after_max_wait(self):
+        controller, registry = _controller(per_client=3)
+        controller.config.ingest_max_wait_seconds = 12
+        controller.track("a", _batch(registry, 1, 3))
+        sleeps = []
+
+        with pytest.raises(AdmissionRejected):
+            controller.admit_waiting("a", 1, sleep=sleeps.append)
+        assert sum(sleeps) == 12
+        assert controller.max_request() == 3
@@ -0,0 +1,167 @@
+"""
+AI 预算服务单元测试
+Unit tests for budget_service module
+"""
+
+import asyncio
+from datetime import datetime
+
+from sqlalchemy.orm import sessionmaker
+
+from src.config import BudgetConfig, ResultWriterConfig
+from src.models import LLMUsage
+from src.services.budget_service import (
+    SYSTEM_CLIENT,
+    BudgetDecision,
+    TokenBudget,
+    bind_client,
+    unbind_client,
+)
+from src.services.result_writer import ResultWriter
+from src.services.scan_scheduler import ScanPriority
+
+NOW = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def _usage(tokens):
+    return {"prompt_tokens": tokens - tokens // 4, "completion_tokens": tokens // 4}
+
+
+class TestTokenBudget:
+
+    def test_disabled_always_runs(self):
+        budget = TokenBudget(BudgetConfig(daily_tokens=10))
+        budget.record(_usage(100), now=NOW)
+        assert budget.decide(ScanPriority.BACKGROUND, now=NOW) == BudgetDecision.RUN
+        assert budget.stats(now=NOW)["tokens"] == 0
+
+    def test_reserve_defers_low_priority(self):
+        budget = TokenBudget(BudgetConfig(enabled=True, daily_tokens=1000, interactive_reserve_ratio=0.2))
+        budget.record(_usage(700), now=NOW)
+        assert budget.decide(ScanPriority.BATCH, now=NOW) == BudgetDecision.RUN
+
+        budget.record(_usage(100), now=NOW)
+        # 剩余 20% 留给交互式扫描
+        assert budget.decide(ScanPriority.BATCH, now=NOW) == BudgetDecision.DEFER
+        assert budget.decide(ScanPriority.BACKGROUND, now=NOW) == BudgetDecision.DEFER
+        assert budget.decide(ScanPriority.INTERACTIVE, now=NOW) == BudgetDecision.RUN
+
+        budget.record(_usage(200), now=NOW)
+        assert budget.decide(ScanPriority.INTERACTIVE, now=NOW) == BudgetDecision.KB_ONLY
+
+    def test_exhausted_budget_degrades_all_priorities(self):
+        budget = TokenBudget(BudgetConfig(enabled=True, daily_tokens=100, per_client_daily_tokens=1000))
+        budget.record(_usage(1000), now=NOW)
+        # 预算用尽时不再返回 defer：不经过调度器的扫描也不会调用 AI
+        assert budget.decide(ScanPriority.BATCH, now=NOW) == BudgetDecision.KB_ONLY
+        assert budget.decide(ScanPriority.BACKGROUND, "ci-key", now=NOW) == BudgetDecision.KB_ONLY
+
+    def test_allows_dispatch_holds_low_priority(self):
+        budget = TokenBudget(BudgetConfig(enabled=True, daily_tokens=100, interactive_reserve_ratio=0.2))
+        assert budget.allows_dispatch(ScanPriority.BATCH)
+
+        budget.record(_usage(1000))
+        # 预算用尽后低优先级扫描仍留在队列中，等预算重置
+        assert not budget.allows_dispatch(ScanPriority.BATCH)
+        assert not budget.allows_dispatch(ScanPriority.BACKGROUND)
+        assert budget.allows_dispatch(ScanPriority.INTERACTIVE)
+
+        budget.config.low_priority_action = "kb_only"
+        assert budget.allows_dispatch(ScanPriority.BATCH)
+
+    def test_kb_only_action_and_cost_limit(self):
+        config = BudgetConfig(
+            enabled=True, daily_cost=1.0, prompt_price_per_1k=1.0, completion_price_per_1k=1.0,
+            low_priority_action="kb_only", interactive_reserve_ratio=0.5,
+        )
+        budget = TokenBudget(config)
+        budget.record(_usage(600), now=NOW)
+        assert budget.usage_ratio(now=NOW) == 0.6
+        assert budget.decide(ScanPriority.BACKGROUND, now=NOW) == BudgetDecision.KB_ONLY
+
+    def test_per_client_limit(self):
+        budget = TokenBudget(BudgetConfig(enabled=True, daily_tokens=10000, per_client_daily_tokens=100))
+        token = bind_client("ci-key")
+        try:
+            budget.record(_usage(150), now=NOW)
+        finally:
+            unbind_client(token)
+        budget.record(_usage(500), now=NOW)
+
+        assert budget.decide(ScanPriority.INTERACTIVE, "ci-key", now=NOW) == BudgetDecision.KB_ONLY
+        assert budget.decide(ScanPriority.INTERACTIVE, "other", now=NOW) == BudgetDecision.RUN
+        # 系统提交的扫描不受客户端上限限制
+        assert budget.decide(ScanPriority.INTERACTIVE, SYSTEM_CLIENT, now=NOW) == BudgetDecision.RUN
+        assert set(budget.stats(now=NOW)["clients"]) == {"ci-key", SYSTEM_CLIENT}
+
+    def test_resets_daily(self):
+        budget = TokenBudget(BudgetConfig(enabled=True, daily_tokens=100, reset_hour=16))
+        budget.record(_usage(100), now=NOW)
+        assert budget.decide(ScanPriority.INTERACTIVE, now=NOW) == BudgetDecision.KB_ONLY
+        assert budget.resets_at(NOW) == datetime(2026, 1, 1, 16, 0, 0)
+
+        later = datetime(2026, 1, 1, 16, 30, 0)
+        assert budget.decide(ScanPriority.INTERACTIVE, now=later) == BudgetDecision.RUN
+        assert budget.resets_at(later) == datetime(2026, 1, 2, 16, 0, 0)
+
+    def test_flush_and_load(self, db):
+        config = BudgetConfig(enabled=True, daily_tokens=1000)
+        budget = TokenBudget(config)
+        budget.record(_usage(300), "ci-key", now=NOW)
+        budget.flush(db)
+        budget.record(_usage(100), "ci-key", now=NOW)
+        budget.flush(db)
+        db.commit()
+
+        row = db.query(LLMUsage).one()
+        assert (row.day, row.client, row.prompt_tokens + row.completion_tokens, row.requests) == (
+            "2026-01-01", "ci-key", 400, 2
+        )
+        # 重启后恢复当日用量
+        restarted = TokenBudget(config)
+        restarted.load(db, now=NOW)
+        assert restarted.usage_ratio(now=NOW) == 0.4
+
+    def test_rolled_back_flush_keeps_usage(self, db):
+        budget = TokenBudget(BudgetConfig(enabled=True, daily_tokens=1000))
+        budget.record(_usage(300), "ci-key", now=NOW)
+        budget.flush(db)
+        db.rollback()
+        assert db.query(LLMUsage).count() == 0
+
+        budget.record(_usage(100), "ci-key", now=NOW)
+        budget.flush(db)
+        db.commit()
+        # 提交后不再放回（之后的回滚不影响已写入的用量）
+        db.rollback()
+        budget.flush(db)
+        db.commit()
+
+        row = db.query(LLMUsage).one()
+        assert (row.prompt_tokens + row.completion_tokens, row.requests) == (400, 2)
+
+    def test_failed_group_commit_keeps_usage(self, db, test_engine):
+        budget = TokenBudget(BudgetConfig(enabled=True, daily_tokens=1000))
+        budget.record(_usage(300), "ci-key", now=NOW)
+        writer = ResultWriter(ResultWriterConfig(flush_interval_ms=20))
+        factory = sessionmaker(bind=test_engine)
+
+        def _fail(session):
+            raise ValueError("bad write")
+
+        async def _submit_both():
+            return await asyncio.gather(
+                writer.submit(factory, budget.flush), writer.submit(factory, _fail),
+                return_exceptions=True,
+            )
+
+        try:
+            outcomes = asyncio.run(_submit_both())
+        finally:
+            writer.stop()
+
+        # 合并提交失败后逐条重试，用量仍写入
+        assert outcomes[0] is None and isinstance(outcomes[1], ValueError)
+        assert writer.fallbacks == 1
+        row = db.query(LLMUsage).one()
+        assert (row.prompt_tokens + row.completion_tokens, row.requests) == (300, 1)
@@ -0,0 +1,105 @@
+"""
+资源隔离服务单元测试
+Unit tests for bulkhead module
+"""
+
+import asyncio
+
+import pytest
+
+from src.config import BulkheadConfig
+from src.services.bulkhead import Bulkhead, Bulkheads
+
+
+async def _hold(pool: Bulkhead, started: list, release: asyncio.Event) -> None:
+    async with pool:
+        started.append(pool.stats()["in_use"])
+        await release.wait()
+
+
+class TestBulkhead:
+
+    def test_limits_concurrency_and_records_waits(self):
+        pool = Bulkhead("llm", 2)
+
+        async def run():
+            started, release = [], asyncio.Event()
+            tasks = [asyncio.create_task(_hold(pool, started, release)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            assert len(started) == 2
+            assert pool.stats()["waiting"] == 1
+            release.set()
+            await asyncio.gather(*tasks)
+            return started
+
+        started = asyncio.run(run())
+        stats = pool.stats()
+        assert max(started) <= 2
+        assert stats["in_use"] == 0
+        assert stats["acquired"] == 3
+        assert stats["queued"] == 1
+        assert stats["wait_max"] > 0
+
+    def test_set_limit_wakes_waiters(self):
+        pool = Bulkhead("tos_fetch", 1)
+
+        async def run():
+            started, release = [], asyncio.Event()
+            tasks = [asyncio.create_task(_hold(pool, started, release)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            assert len(started) == 1
+            pool.set_limit(3)
+            await asyncio.sleep(0.01)
+            assert len(started) == 3
+            release.set()
+            await asyncio.gather(*tasks)
+
+        asyncio.run(run())
+        assert pool.stats()["in_use"] == 0
+
+    def test_cancelled_waiter_leaves_queue(self):
+        pool = Bulkhead("db_write", 1)
+
+        async def run():
+            started, release = [], asyncio.Event()
+            holder = asyncio.create_task(_hold(pool, started, release))
+            waiter = asyncio.create_task(_hold(pool, started, release))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert pool.stats()["waiting"] == 0
+            release.set()
+            await holder
+
+        asyncio.run(run())
+        assert pool.stats()["in_use"] == 0
+        assert pool.stats()["acquired"] == 1
+
+    def test_unlimited_pool_only_counts(self):
+        pool = Bulkhead("llm", None)
+
+        async def run():
+            started, release = [], asyncio.Event()
+            release.set()
+            await asyncio.gather(*(_hold(pool, started, release) for _ in range(5)))
+
+        asyncio.run(run())
+        assert pool.stats()["acquired"] == 5
+        assert pool.stats()["queued"] == 0
+
+
+class TestBulkheads:
+
+    def test_limits_from_config(self):
+        bulkheads = Bulkheads(BulkheadConfig(llm=0, tos_fetch=3, db_write=10), max_concurrent=4)
+        pools = bulkheads.stats()["pools"]
+        assert pools["llm"]["limit"] == 4
+        assert pools["tos_fetch"]["limit"] == 3
+        assert pools["db_write"]["limit"] == 10
+
+    def test_disabled_pools_are_unlimited(self):
+        bulkheads = Bulkheads(BulkheadConfig(enabled=False), max_concurrent=4)
+        stats = bulkheads.stats()
+        assert stats["max_in_flight_scans"] is None
+        assert all(pool["limit"] is None for pool in stats["pools"].values())
@@ -0,0 +1,45 @@
+"""
+扫描结果新鲜度服务单元测试
+Unit tests for freshness_service module
+"""
+
+import json
+from datetime import timedelta
+from src.config import FreshnessConfig
+from src.models import ComplianceReport
+from src.services.freshness_service import get_fresh_report, get_latest_report, get_ttl, db_now
+from src.services.tool_service import get_or_create_tool
+
+
+def _tool_with_report(db, name, source="unknown"):
+    tool = get_or_create_tool(db, name, source=source)
+    tool.tos_info = json.dumps({"license_type": "MIT"})
+    report = ComplianceReport(tool_id=tool.id, tos_analysis="{}")
+    db.add(report)
+    db.commit()
+    return tool, report
+
+
+class TestFreshness:
+
+    def test_ttl_by_source(self, db):
+        tool = get_or_create_tool(db, "TtlTool", source="internal")
+        config = FreshnessConfig(default_ttl_hours=24, ttl_hours_by_source={"internal": 2})
+        assert get_ttl(tool, config) == timedelta(hours=2)
+
+    def test_fresh_report(self, db):
+        tool, report = _tool_with_report(db, "Fresh")
+        assert get_fresh_report(db, tool, FreshnessConfig()).id == report.id
+
+    def test_expired_report(self, db):
+        tool, _ = _tool_with_report(db, "Expired")
+        later = db_now() + timedelta(hours=25)
+        assert get_fresh_report(db, tool, FreshnessConfig(), now=later) is None
+
+    def test_disabled(self, db):
+        tool, _ = _tool_with_report(db, "Disabled")
+        assert get_fresh_report(db, tool, FreshnessConfig(enabled=False)) is None
+
+    def test_latest_report_none(self, db):
+        tool = get_or_create_tool(db, "NoReport")
+        assert get_latest_report(db, tool.id) is None
@@ -0,0 +1,104 @@
+"""
+幂等提交服务单元测试
+Unit tests for idempotency_service module
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.config import IdempotencyConfig
+from src.models import IdempotencyRecord
+from src.services.idempotency_service import (
+    IdempotencyConflict,
+    IdempotencyKeyError,
+    InFlightKeys,
+    find_response,
+    request_fingerprint,
+    save_response,
+)
+
+NOW = datetime(2026, 1, 1, 12, 0, 0)
+
+
+class TestIdempotency:
+
+    def _save(self, db, config, key="k1", client="c1", payload=None, now=NOW):
+        fingerprint = request_fingerprint(payload or {"tools": ["A"]})
+        save_response(db, config, client, "compliance.scan", key, fingerprint, 202, {"batch_id": "b1"}, now=now)
+        return fingerprint
+
+    def test_fingerprint_ignores_key_order(self):
+        assert request_fingerprint({"a": 1, "b": [2]}) == request_fingerprint({"b": [2], "a": 1})
+        assert request_fingerprint({"a": 1}) != request_fingerprint({"a": 2})
+
+    def test_replays_saved_response(self, db):
+        config = IdempotencyConfig()
+        fingerprint = self._save(db, config)
+
+        record = find_response(db, config, "c1", "compliance.scan", "k1", fingerprint, now=NOW)
+
+        assert record.status_code == 202
+        assert record.response == {"batch_id": "b1"}
+        # 其他客户端、其他接口或未携带 Key 的请求不重放
+        assert find_response(db, config, "c2", "compliance.scan", "k1", fingerprint, now=NOW) is None
+        assert find_response(db, config, "c1", "scan.start", "k1", fingerprint, now=NOW) is None
+        assert find_response(db, config, "c1", "compliance.scan", None, fingerprint, now=NOW) is None
+
+    def test_expired_record_is_not_replayed_and_purged(self, db):
+        config = IdempotencyConfig(ttl_hours=1)
+        fingerprint = self._save(db, config)
+        later = NOW + timedelta(hours=2)
+
+        assert find_response(db, config, "c1", "compliance.scan", "k1", fingerprint, now=later) is None
+        # 过期后同一 Key 可再次使用，保存时清理过期记录
+        self._save(db, config, now=later)
+        assert db.query(IdempotencyRecord).count() == 1
+
+    def test_key_reused_with_different_payload(self, db):
+        config = IdempotencyConfig()
+        self._save(db, config)
+
+        with pytest.raises(IdempotencyConflict):
+            find_response(db, config, "c1", "compliance.scan", "k1", request_fingerprint({"tools": ["B"]}), now=NOW)
+
+    def test_invalid_key(self, db):
+        config = IdempotencyConfig(max_key_length=8)
+        with pytest.raises(IdempotencyKeyError):
+            find_response(db, config, "c1", "compliance.scan", "  ", "x", now=NOW)
+        with pytest.raises(IdempotencyKeyError):
+            find_response(db, config, "c1", "compliance.scan", "k" * 9, "x", now=NOW)
+
+    def test_duplicate_save_keeps_first(self, db):
+        config = IdempotencyConfig()
+        self._save(db, config)
+        fingerprint = request_fingerprint({"tools": ["A"]})
+        save_response(db, config, "c1", "compliance.scan", "k1", fingerprint, 202, {"batch_id": "b2"}, now=NOW)
+
+        record = find_response(db, config, "c1", "compliance.scan", "k1", fingerprint, now=NOW)
+        assert record.response == {"batch_id": "b1"}
+
+    def test_disabled(self, db):
+        config = IdempotencyConfig(enabled=False)
+        fingerprint = self._save(db, config)
+
+        assert db.query(IdempotencyRecord).count() == 0
+        assert find_response(db, config, "c1", "compliance.scan", "k1", fingerprint, now=NOW) is None
+
+
+class TestInFlightKeys:
+
+    def test_reserve_and_release(self):
+        keys = InFlightKeys()
+        assert keys.reserve("c1", "compliance.scan", "k1", "h1") is None
+        pending = keys.reserve("c1", "compliance.scan", "k1", "h1")
+        assert pending is not None and not pending.is_set()
+        # 不同客户端或接口互不影响
+        assert keys.reserve("c2", "compliance.scan", "k1", "h1") is None
+        assert keys.reserve("c1", "scan.start", "k1", "h1") is None
+        with pytest.raises(IdempotencyConflict):
+            keys.reserve("c1", "compliance.scan", "k1", "h2")
+
+        keys.release("c1", "compliance.scan", "k1")
+        assert pending.is_set()
+        assert keys.reserve("c1", "compliance.scan", "k1", "h2") is None
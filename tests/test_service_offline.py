@@ -0,0 +1,113 @@
+"""
+离线模式服务单元测试
+Unit tests for offline_service module
+"""
+
+from sqlalchemy.orm import sessionmaker
+
+from src.config import OfflineConfig
+from src.models import ComplianceReport
+from src.services.offline_service import CircuitState, EnrichmentReconciler, ProviderCircuit
+from src.services.scan_scheduler import ScanPriority
+from src.services.scan_service import ScanService
+from src.services.tool_service import get_or_create_tool
+
+
+class TestProviderCircuit:
+
+    def test_opens_after_consecutive_failures(self):
+        circuit = ProviderCircuit(OfflineConfig(failure_threshold=3))
+        circuit.on_failure()
+        circuit.on_failure()
+        circuit.on_success()
+        circuit.on_failure()
+        circuit.on_failure()
+        assert not circuit.is_offline
+
+        circuit.on_failure()
+        assert circuit.is_offline
+        assert circuit.state == CircuitState.OPEN
+        assert circuit.stats()["trips"] == 1
+
+    def test_half_open_probe(self):
+        circuit = ProviderCircuit(OfflineConfig(failure_threshold=1, open_seconds=0))
+        circuit.on_failure()
+        # 熔断时间已过：放行试探请求，失败时重新熔断，成功时恢复在线
+        assert circuit.state == CircuitState.HALF_OPEN
+        assert not circuit.is_offline
+        circuit.on_failure()
+        assert circuit.trips == 2
+        circuit.on_success()
+        assert circuit.state == CircuitState.CLOSED
+
+    def test_half_open_lets_one_probe_through(self):
+        circuit = ProviderCircuit(OfflineConfig(failure_threshold=1, open_seconds=0))
+        circuit.on_failure()
+        assert circuit.allow_request()
+        # 试探返回前其余调用方仍按离线处理
+        assert not circuit.allow_request()
+        assert circuit.is_offline
+        assert circuit.stats()["probing"]
+
+        circuit.on_success()
+        assert circuit.allow_request() and circuit.allow_request()
+        assert not circuit.is_offline
+
+    def test_stale_probe_is_replaced(self):
+        circuit = ProviderCircuit(OfflineConfig(failure_threshold=1, open_seconds=0, probe_timeout_seconds=0))
+        circuit.on_failure()
+        # 试探未上报结果（如未实际调用 AI）时不会一直保持离线
+        assert circuit.allow_request()
+        assert circuit.allow_request()
+
+    def test_manual_mode(self):
+        circuit = ProviderCircuit(OfflineConfig(failure_threshold=1, open_seconds=600))
+        circuit.set_manual(True)
+        assert circuit.is_offline
+        circuit.on_failure()
+
+        circuit.set_manual(False)
+        assert not circuit.is_offline
+        assert circuit.state == CircuitState.CLOSED
+
+    def test_disabled(self):
+        circuit = ProviderCircuit(OfflineConfig(enabled=False, manual=True, failure_threshold=1))
+        circuit.on_failure()
+        assert not circuit.is_offline
+        assert circuit.state == CircuitState.CLOSED
+
+
+class TestEnrichmentReconciler:
+
+    def _service(self, monkeypatch):
+        service = ScanService()
+        monkeypatch.setattr(service, "start", lambda tasks=None: None)
+        return service
+
+    def _report(self, db, tool, needs_enrichment):
+        db.add(ComplianceReport(tool_id=tool.id, tos_analysis="{}", needs_enrichment=needs_enrichment))
+        db.commit()
+
+    def test_tick_submits_reports_needing_enrichment(self, db, test_engine, monkeypatch):
+        offline_tool = get_or_create_tool(db, "OfflineTool")
+        complete_tool = get_or_create_tool(db, "CompleteTool")
+        self._report(db, offline_tool, True)
+        self._report(db, complete_tool, False)
+        service = self._service(monkeypatch)
+        circuit = ProviderCircuit(OfflineConfig(manual=True))
+        reconciler = EnrichmentReconciler(
+            OfflineConfig(), service, circuit, session_factory=sessionmaker(bind=test_engine)
+        )
+
+        # 离线时不提交
+        assert reconciler.tick() == 0
+
+        circuit.set_manual(False)
+        assert reconciler.tick() == 1
+        tasks = service.registry.active()
+        assert [task.tool_id for task in tasks] == [offline_tool.id]
+        assert tasks[0].priority == ScanPriority.BACKGROUND
+        # 不强制刷新：待补全的报告不视为有效期内的报告，任务进入扫描队列
+        assert not tasks[0].is_terminal
+        # 已提交的工具仍在扫描中，不会重复提交
+        assert reconciler.tick() == 0
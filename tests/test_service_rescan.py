@@ -0,0 +1,89 @@
+"""
+定期重扫服务单元测试
+Unit tests for rescan_service module
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import sessionmaker
+
+from src.config import RescanConfig, RescanWindowConfig
+from src.models import ComplianceReport
+from src.services.freshness_service import db_now
+from src.services.rescan_service import RescanScheduler, find_stale_tool_ids, window_bounds
+from src.services.scan_scheduler import ScanPriority
+from src.services.scan_service import ScanService
+from src.services.tool_service import get_or_create_tool
+
+
+def _report(db, name, age_hours):
+    tool = get_or_create_tool(db, name)
+    stamp = db_now() - timedelta(hours=age_hours)
+    db.add(ComplianceReport(tool_id=tool.id, tos_analysis="{}", created_at=stamp, updated_at=stamp))
+    db.commit()
+    return tool
+
+
+class TestWindows:
+
+    def test_same_day_window(self):
+        window = RescanWindowConfig(start="01:00", end="05:00")
+        assert window_bounds(window, datetime(2026, 1, 2, 3, 0)) == (
+            datetime(2026, 1, 2, 1, 0), datetime(2026, 1, 2, 5, 0)
+        )
+        assert window_bounds(window, datetime(2026, 1, 2, 5, 0)) is None
+
+    def test_window_across_midnight(self):
+        window = RescanWindowConfig(start="22:00", end="02:00")
+        assert window_bounds(window, datetime(2026, 1, 2, 1, 0)) == (
+            datetime(2026, 1, 1, 22, 0), datetime(2026, 1, 2, 2, 0)
+        )
+        assert window_bounds(window, datetime(2026, 1, 2, 23, 0))[0] == datetime(2026, 1, 2, 22, 0)
+        assert window_bounds(window, datetime(2026, 1, 2, 12, 0)) is None
+
+    def test_quota_released_gradually(self):
+        config = RescanConfig(
+            check_interval_seconds=0, windows=[RescanWindowConfig(start="00:00", end="04:00", quota=100)]
+        )
+        scheduler = RescanScheduler(config, scan_service=None)
+        assert scheduler.allowance(datetime(2026, 1, 2, 1, 0)) == 25
+        assert scheduler.allowance(datetime(2026, 1, 2, 3, 59)) == 100
+        assert scheduler.allowance(datetime(2026, 1, 2, 12, 0)) == 0
+
+
+class TestRescanTick:
+
+    def _scheduler(self, test_engine, monkeypatch, quota=100):
+        service = ScanService()
+        monkeypatch.setattr(service, "start", lambda tasks=None: None)
+        config = RescanConfig(
+            stale_after_hours=24, check_interval_seconds=0,
+            windows=[RescanWindowConfig(start="00:00", end="04:00", quota=quota)],
+        )
+        return RescanScheduler(config, service, session_factory=sessionmaker(bind=test_engine))
+
+    def test_find_stale_tools_oldest_first(self, db):
+        fresh = _report(db, "FreshTool", 1)
+        older = _report(db, "OlderTool", 48)
+        oldest = _report(db, "OldestTool", 96)
+        cutoff = db_now() - timedelta(hours=24)
+
+        assert find_stale_tool_ids(db, cutoff, 10, set()) == [oldest.id, older.id]
+        assert find_stale_tool_ids(db, cutoff, 10, {oldest.id}) == [older.id]
+        assert fresh.id not in find_stale_tool_ids(db, cutoff, 10, set())
+
+    def test_tick_submits_background_batch_within_quota(self, db, test_engine, monkeypatch):
+        for index in range(5):
+            _report(db, f"StaleTool{index}", 48 + index)
+        scheduler = self._scheduler(test_engine, monkeypatch, quota=8)
+
+        # 窗口过去一半，只释放一半配额
+        submitted = scheduler.tick(datetime(2026, 1, 2, 2, 0))
+        assert submitted == 4
+        task = scheduler.scan_service.registry.active()[0]
+        assert task.priority == ScanPriority.BACKGROUND
+
+        # 已提交的工具仍在扫描中，不会重复提交
+        assert scheduler.tick(datetime(2026, 1, 2, 3, 59)) == 1
+        assert scheduler.tick(datetime(2026, 1, 2, 12, 0)) == 0
+        assert scheduler.submitted_total == 5
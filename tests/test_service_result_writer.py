@@ -0,0 +1,136 @@
+"""
+扫描结果写入服务单元测试
+Unit tests for result_writer module
+"""
+
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from src.config import ResultWriterConfig
+from src.models import Tool
+from src.services.result_writer import ResultWriter
+
+
+def _add_tool(name):
+    def op(db):
+        tool = Tool(name=name)
+        db.add(tool)
+        db.flush()
+        return tool.id
+    return op
+
+
+def _fail(db):
+    raise ValueError("bad write")
+
+
+class TestResultWriter:
+
+    def _run(self, writer, factory, ops):
+        async def _submit_all():
+            return await asyncio.gather(
+                *(writer.submit(factory, op) for op in ops), return_exceptions=True
+            )
+        return asyncio.run(_submit_all())
+
+    def test_concurrent_writes_share_one_transaction(self, db, test_engine):
+        writer = ResultWriter(ResultWriterConfig(flush_interval_ms=20))
+        factory = sessionmaker(bind=test_engine)
+
+        ids = self._run(writer, factory, [_add_tool(f"Tool{i}") for i in range(10)])
+
+        assert len(set(ids)) == 10
+        assert writer.flushes == 1
+        assert writer.stats()["avg_batch_size"] == 10
+        assert db.query(Tool).count() == 10
+
+    def test_size_threshold_splits_batches(self, test_engine):
+        writer = ResultWriter(ResultWriterConfig(flush_interval_ms=1000, max_batch_size=3))
+        factory = sessionmaker(bind=test_engine)
+
+        self._run(writer, factory, [_add_tool(f"Tool{i}") for i in range(7)])
+
+        # 达到数量阈值立即提交，无需等待整个间隔
+        assert writer.flushes == 3
+        assert writer.writes == 7
+
+    def test_failed_write_does_not_affect_others(self, db, test_engine):
+        writer = ResultWriter(ResultWriterConfig(flush_interval_ms=20))
+        factory = sessionmaker(bind=test_engine)
+
+        results = self._run(writer, factory, [_add_tool("Good1"), _fail, _add_tool("Good2")])
+
+        assert isinstance(results[1], ValueError)
+        assert all(isinstance(value, int) for value in (results[0], results[2]))
+        assert writer.fallbacks == 1
+        assert {tool.name for tool in db.query(Tool).all()} == {"Good1", "Good2"}
+
+    def test_submit_many_awaits_one_transaction(self, db, test_engine):
+        writer = ResultWriter(ResultWriterConfig(flush_interval_ms=20))
+        factory = sessionmaker(bind=test_engine)
+
+        outcomes = asyncio.run(writer.submit_many(factory, [_add_tool("Many1"), _add_tool("Many2")]))
+
+        assert [ok for ok, _ in outcomes] == [True, True]
+        assert writer.flushes == 1
+        assert db.query(Tool).count() == 2
+
+    def test_disabled_writes_immediately(self, db, test_engine):
+        writer = ResultWriter(ResultWriterConfig(enabled=False))
+        factory = sessionmaker(bind=test_engine)
+
+        tool_id = asyncio.run(writer.submit(factory, _add_tool("Direct")))
+
+        assert db.query(Tool).filter(Tool.id == tool_id).count() == 1
+        with pytest.raises(ValueError):
+            asyncio.run(writer.submit(factory, _fail))
+
+    def test_writer_rebinds_to_new_event_loop(self, test_engine):
+        writer = ResultWriter(ResultWriterConfig(flush_interval_ms=1))
+        factory = sessionmaker(bind=test_engine)
+
+        first = asyncio.run(writer.submit(factory, _add_tool("Loop1")))
+        second = asyncio.run(writer.submit(factory, _add_tool("Loop2")))
+
+        assert first != second
+        assert writer.writes == 2
+
+    def test_concurrent_submissions_from_two_loops(self, db, test_engine):
+        writer = ResultWriter(ResultWriterConfig(flush_interval_ms=20))
+        factory = sessionmaker(bind=test_engine)
+        results = {}
+
+        def run(name):
+            results[name] = self._run(writer, factory, [_add_tool(f"{name}-{i}") for i in range(20)])
+
+        threads = [threading.Thread(target=run, args=(name,)) for name in ("LoopA", "LoopB")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+
+        # 两个事件循环同时提交：所有写入都得到确认，没有被丢弃的写入
+        assert all(isinstance(value, int) for ids in results.values() for value in ids)
+        assert len(results["LoopA"]) == len(results["LoopB"]) == 20
+        assert writer.writes == 40
+        assert db.query(Tool).count() == 40
+
+    def test_stop_commits_pending_writes(self, db, test_engine):
+        writer = ResultWriter(ResultWriterConfig(flush_interval_ms=60000))
+        factory = sessionmaker(bind=test_engine)
+
+        async def submit_then_stop():
+            pending = asyncio.ensure_future(writer.submit(factory, _add_tool("Pending")))
+            await asyncio.sleep(0.05)
+            await asyncio.get_running_loop().run_in_executor(None, writer.stop)
+            return await asyncio.wait_for(pending, timeout=5)
+
+        tool_id = asyncio.run(submit_then_stop())
+
+        assert db.query(Tool).filter(Tool.id == tool_id).count() == 1
+        # 停止后提交的写入会重新启动写入任务
+        writer.config.flush_interval_ms = 1
+        assert asyncio.run(writer.submit(factory, _add_tool("After"))) != tool_id
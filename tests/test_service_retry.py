@@ -0,0 +1,142 @@
+"""
+扫描重试服务单元测试
+Unit tests for retry_service module
+"""
+
+import asyncio
+import json
+from datetime import timedelta
+
+import httpx
+from sqlalchemy.orm import sessionmaker
+
+from src.config import RetryQueueConfig
+from src.models import ScanRetry
+from src.services.freshness_service import db_now
+from src.services.retry_service import (
+    RetryScheduler,
+    ScanErrorKind,
+    backoff_delay,
+    classify_error,
+    list_dead_letters,
+    record_failure,
+    replay_dead_letters,
+)
+from src.services.scan_scheduler import ScanPriority
+from src.services.scan_service import ScanService
+from src.services.tool_service import get_or_create_tool
+
+
+def _http_error(code):
+    request = httpx.Request("POST", "https://example.com")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(code, request=request))
+
+
+class TestClassify:
+
+    def test_provider_errors(self):
+        assert classify_error(_http_error(429)) == ScanErrorKind.RATE_LIMITED
+        assert classify_error(_http_error(503), "report") == ScanErrorKind.PROVIDER_DOWN
+        assert classify_error(httpx.ConnectTimeout("slow")) == ScanErrorKind.PROVIDER_DOWN
+        assert classify_error(None, "tos_analysis") == ScanErrorKind.PROVIDER_DOWN
+
+    def test_fetch_errors(self):
+        assert classify_error(_http_error(404), "tos_fetch") == ScanErrorKind.FETCH_FAILURE
+        assert classify_error(asyncio.TimeoutError(), "tos_fetch") == ScanErrorKind.FETCH_FAILURE
+
+    def test_parse_and_internal(self):
+        assert classify_error(json.JSONDecodeError("bad", "{", 0)) == ScanErrorKind.PARSE_FAILURE
+        assert classify_error(ValueError("工具不存在")) == ScanErrorKind.INTERNAL
+        assert classify_error(_http_error(401), "report") == ScanErrorKind.INTERNAL
+
+
+class TestRecordFailure:
+
+    def test_backoff_grows_and_caps(self):
+        config = RetryQueueConfig(base_delay_seconds=10, backoff_factor=3, max_delay_seconds=60, jitter_ratio=0)
+        assert [backoff_delay(config, n) for n in (1, 2, 3)] == [10, 30, 60]
+
+    def test_transient_failures_until_dead_letter(self, db):
+        tool = get_or_create_tool(db, "FlakyTool")
+        config = RetryQueueConfig(max_attempts=3, base_delay_seconds=10, jitter_ratio=0)
+        now = db_now()
+
+        retry = record_failure(db, tool.id, ScanErrorKind.PROVIDER_DOWN, "down", config, stage="report", now=now)
+        assert (retry.status, retry.attempts) == ("scheduled", 1)
+        assert retry.next_attempt_at == now + timedelta(seconds=10)
+
+        record_failure(db, tool.id, ScanErrorKind.RATE_LIMITED, "429", config, now=now)
+        retry = record_failure(db, tool.id, ScanErrorKind.RATE_LIMITED, "429", config, now=now)
+        db.commit()
+        assert (retry.status, retry.attempts, retry.next_attempt_at) == ("dead", 3, None)
+        assert db.query(ScanRetry).count() == 1
+
+    def test_internal_error_goes_straight_to_dead_letter(self, db):
+        tool = get_or_create_tool(db, "BrokenTool")
+        retry = record_failure(db, tool.id, ScanErrorKind.INTERNAL, "bug", RetryQueueConfig())
+        db.commit()
+
+        assert retry.status == "dead"
+        dead = list_dead_letters(db)
+        assert dead["total"] == 1
+        assert dead["items"][0]["tool_name"] == "BrokenTool"
+        assert dead["items"][0]["error_kind"] == "internal"
+
+
+class TestRetryScheduling:
+
+    def _service(self, monkeypatch):
+        service = ScanService()
+        monkeypatch.setattr(service, "start", lambda tasks=None: None)
+        return service
+
+    def test_tick_submits_due_retries_with_recorded_priority(self, db, test_engine, monkeypatch):
+        due = get_or_create_tool(db, "DueTool")
+        later = get_or_create_tool(db, "LaterTool")
+        config = RetryQueueConfig(base_delay_seconds=60, jitter_ratio=0)
+        now = db_now()
+        record_failure(db, due.id, ScanErrorKind.PROVIDER_DOWN, "down", config,
+                       priority=ScanPriority.INTERACTIVE, now=now - timedelta(minutes=5))
+        record_failure(db, later.id, ScanErrorKind.PROVIDER_DOWN, "down", config, now=now)
+        db.commit()
+        service = self._service(monkeypatch)
+        scheduler = RetryScheduler(config, service, session_factory=sessionmaker(bind=test_engine))
+
+        assert scheduler.tick(now) == 1
+        task = service.get_task_status(due.id)
+        assert task.priority == ScanPriority.INTERACTIVE
+        # 已提交的工具仍在扫描中，不会重复提交
+        assert scheduler.tick(now) == 0
+
+    def test_tick_runs_full_scan_when_kb_only_enabled(self, db, test_engine, monkeypatch):
+        from src.services.knowledge_base_service import create_or_update_knowledge_base
+        from src.services.scan_service import ScanTaskStatus
+
+        create_or_update_knowledge_base(db, "CuratedRetryTool", {"license_type": "MIT"}, source="user")
+        tool = get_or_create_tool(db, "CuratedRetryTool")
+        config = RetryQueueConfig(base_delay_seconds=60, jitter_ratio=0)
+        now = db_now()
+        record_failure(db, tool.id, ScanErrorKind.PROVIDER_DOWN, "down", config, now=now - timedelta(minutes=5))
+        db.commit()
+        service = self._service(monkeypatch)
+        service.config = service.config.model_copy(deep=True)
+        service.config.scanning.kb_only.enabled = True
+        scheduler = RetryScheduler(config, service, session_factory=sessionmaker(bind=test_engine))
+
+        assert scheduler.tick(now) == 1
+        # 重试不由知识库直接完成，进入扫描队列重新执行完整扫描
+        assert service.get_task_status(tool.id).status == ScanTaskStatus.PENDING
+
+    def test_replay_dead_letters(self, db, monkeypatch):
+        tool = get_or_create_tool(db, "DeadTool")
+        record_failure(db, tool.id, ScanErrorKind.INTERNAL, "bug", RetryQueueConfig())
+        db.commit()
+        service = self._service(monkeypatch)
+
+        result = asyncio.run(replay_dead_letters(db, service))
+
+        assert result["replayed"] == [tool.id]
+        assert result["batch"].tasks[0].tool_id == tool.id
+        retry = db.query(ScanRetry).filter(ScanRetry.tool_id == tool.id).first()
+        assert (retry.status, retry.attempts) == ("scheduled", 0)
+        assert list_dead_letters(db)["total"] == 0
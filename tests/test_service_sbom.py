@@ -0,0 +1,143 @@
+"""
+SBOM / 依赖清单服务单元测试
+Unit tests for sbom_service module
+"""
+
+import asyncio
+import json
+import pytest
+from src.models import ComplianceReport, ProjectComponent
+from src.services.sbom_service import detect_sbom_format, parse_sbom, submit_sbom_scan
+from src.services.scan_service import ScanService, ScanTaskStatus
+
+
+CYCLONEDX = json.dumps({
+    "bomFormat": "CycloneDX",
+    "specVersion": "1.5",
+    "components": [
+        {"name": "requests", "version": "2.31.0",
+         "components": [{"name": "urllib3", "version": "2.0.7"}]},
+        {"name": "flask", "version": "3.0.0"},
+    ],
+})
+
+SPDX = json.dumps({
+    "spdxVersion": "SPDX-2.3",
+    "documentDescribes": ["SPDXRef-root"],
+    "packages": [
+        {"SPDXID": "SPDXRef-root", "name": "my-app", "versionInfo": "1.0"},
+        {"SPDXID": "SPDXRef-1", "name": "lodash", "versionInfo": "4.17.21"},
+    ],
+})
+
+
+class TestParsers:
+
+    def test_detect_format(self):
+        assert detect_sbom_format(CYCLONEDX) == "cyclonedx"
+        assert detect_sbom_format(SPDX) == "spdx"
+        assert detect_sbom_format('{"lockfileVersion": 3, "packages": {}}') == "package-lock"
+        assert detect_sbom_format('{"dependencies": {"a": "1"}}') == "package-json"
+        assert detect_sbom_format("flask==3.0\n") == "requirements"
+        assert detect_sbom_format('{"foo": 1}') is None
+
+    def test_cyclonedx_nested(self):
+        _, components = parse_sbom(CYCLONEDX)
+        assert ("urllib3", "2.0.7") in components
+        assert len(components) == 3
+
+    def test_spdx_skips_described_root(self):
+        _, components = parse_sbom(SPDX)
+        assert components == [("lodash", "4.17.21")]
+
+    def test_requirements(self):
+        content = "# deps\nflask==3.0.0\nrequests[socks]>=2.0 ; python_version>'3'\n-r other.txt\n" \
+                  "git+https://example.com/x.git\nuvicorn  # server\n"
+        _, components = parse_sbom(content, "requirements")
+        assert components == [("flask", "3.0.0"), ("requests", ">=2.0"), ("uvicorn", None)]
+
+    def test_package_lock_v3(self):
+        content = json.dumps({"lockfileVersion": 3, "packages": {
+            "": {"name": "app"},
+            "node_modules/express": {"version": "4.18.2"},
+            "node_modules/express/node_modules/debug": {"version": "2.6.9"},
+        }})
+        _, components = parse_sbom(content)
+        assert components == [("express", "4.18.2"), ("debug", "2.6.9")]
+
+    def test_package_lock_scoped_packages(self):
+        content = json.dumps({"lockfileVersion": 3, "packages": {
+            "": {"name": "app"},
+            "node_modules/@babel/core": {"version": "7.24.0"},
+            "node_modules/@babel/core/node_modules/@babel/types": {"version": "7.24.0"},
+        }})
+        _, components = parse_sbom(content)
+        assert components == [("@babel/core", "7.24.0"), ("@babel/types", "7.24.0")]
+
+    def test_invalid_json_raises(self):
+        with pytest.raises(ValueError):
+            parse_sbom("{not json", "cyclonedx")
+
+
+@pytest.fixture()
+def scan_service(monkeypatch):
+    service = ScanService()
+    monkeypatch.setattr(service, "start", lambda tasks=None: None)
+    return service
+
+
+class TestDeltaScan:
+
+    def test_first_submission_scans_everything(self, db, scan_service):
+        result = asyncio.run(submit_sbom_scan(db, scan_service, "proj", "flask==3.0\nrequests==2.31\n"))
+
+        assert sorted(result["delta"]["added"]) == ["flask", "requests"]
+        assert len(result["batch"].tasks) == 2
+        assert db.query(ProjectComponent).filter(ProjectComponent.project == "proj").count() == 2
+
+    def test_second_submission_only_scans_delta(self, db, scan_service):
+        first = asyncio.run(submit_sbom_scan(db, scan_service, "proj", "flask==3.0\nrequests==2.31\nclick==8.0\n"))
+        # 首次扫描已结束：requests 已有报告，flask 没有报告
+        scan_service.cancel_batch(first["batch"].batch_id)
+        requests_id = db.query(ProjectComponent).filter(ProjectComponent.name == "requests").first().tool_id
+        report = ComplianceReport(tool_id=requests_id, tos_analysis="{}")
+        db.add(report)
+        db.commit()
+
+        result = asyncio.run(submit_sbom_scan(db, scan_service, "proj", "flask==3.1\nrequests==2.31\nnumpy==1.26\n"))
+
+        delta = result["delta"]
+        assert delta["added"] == ["numpy"]
+        assert delta["changed"] == ["flask"]
+        assert delta["unchanged"] == ["requests"]
+        assert delta["removed"] == ["click"]
+        tasks = {t.tool_name: t for t in result["batch"].tasks}
+        assert tasks["requests"].status == ScanTaskStatus.COMPLETED
+        assert tasks["requests"].result["report_id"] == report.id
+        assert tasks["flask"].status == ScanTaskStatus.PENDING
+        assert tasks["numpy"].status == ScanTaskStatus.PENDING
+
+    def test_projects_are_independent(self, db, scan_service):
+        asyncio.run(submit_sbom_scan(db, scan_service, "a", "flask==3.0\n"))
+        result = asyncio.run(submit_sbom_scan(db, scan_service, "b", "flask==3.0\n"))
+        assert result["delta"]["added"] == ["flask"]
+
+    def test_invalid_names_skipped(self, db, scan_service):
+        content = json.dumps({"dependencies": {"bad#name": "^1.0.0", "express": "^4.18.0"}})
+        result = asyncio.run(submit_sbom_scan(db, scan_service, "web", content))
+        assert result["skipped"] == ["bad#name"]
+        assert [t.tool_name for t in result["batch"].tasks] == ["express"]
+
+    def test_scoped_packages_are_scanned(self, db, scan_service):
+        content = json.dumps({"lockfileVersion": 3, "packages": {
+            "": {"name": "web"},
+            "node_modules/@babel/core": {"version": "7.24.0"},
+            "node_modules/@types/node": {"version": "20.11.0"},
+            "node_modules/express": {"version": "4.18.2"},
+        }})
+        result = asyncio.run(submit_sbom_scan(db, scan_service, "web", content))
+
+        assert result["skipped"] == []
+        assert sorted(t.tool_name for t in result["batch"].tasks) == ["@babel/core", "@types/node", "express"]
+        components = db.query(ProjectComponent).filter(ProjectComponent.project == "web").all()
+        assert all(component.tool_id is not None for component in components)
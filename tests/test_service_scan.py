@@ -0,0 +1,873 @@
+"""
+扫描服务单元测试
+Unit tests for scan_service module
+"""
+
+import asyncio
+import json
+import pytest
+from src.models import ComplianceReport
+from src.services.scan_service import ScanService, ScanTaskStatus
+from src.services.scan_scheduler import ScanPriority
+from src.services.tool_service import get_or_create_tool
+
+
+ANALYSIS = {
+    "license_type": "MIT",
+    "license_mode": "开源",
+    "company_name": None,
+    "alternative_tools": [{"name": "AltTool", "license": "MIT"}],
+}
+
+
+class FakeAIClient:
+    """不访问网络的 AI 客户端替身"""
+
+    def __init__(self, tos_url=None, delay=0.0):
+        self.tos_url = tos_url
+        self.delay = delay
+        self.calls = []
+
+    async def search_tos_url(self, tool_name):
+        self.calls.append("search_tos_url")
+        await asyncio.sleep(self.delay)
+        return self.tos_url
+
+    async def analyze_tos(self, tool_name, tos_content):
+        self.calls.append("analyze_tos")
+        return dict(ANALYSIS)
+
+    async def analyze_tool_directly(self, tool_name):
+        self.calls.append("analyze_tool_directly")
+        await asyncio.sleep(self.delay)
+        return dict(ANALYSIS)
+
+    async def get_alternative_tools(self, tool_name):
+        self.calls.append("get_alternative_tools")
+        await asyncio.sleep(self.delay)
+        return [{"name": "FromAI"}]
+
+
+@pytest.fixture()
+def fake_ai(monkeypatch):
+    client = FakeAIClient()
+    monkeypatch.setattr("src.services.scan_service.get_ai_client", lambda: client)
+    monkeypatch.setattr("src.services.tos_service.get_ai_client", lambda: client)
+    monkeypatch.setattr("src.services.compliance_engine.get_ai_client", lambda: client)
+    return client
+
+
+class TestScanTool:
+
+    def test_scan_generates_report(self, db, fake_ai):
+        tool = get_or_create_tool(db, "PipelineTool")
+        service = ScanService()
+        task = service.create_scan_tasks([tool.id], db)[0]
+
+        asyncio.run(service.scan_tool(task, db))
+
+        assert task.status == ScanTaskStatus.COMPLETED
+        report = db.query(ComplianceReport).filter(ComplianceReport.id == task.result["report_id"]).first()
+        analysis = json.loads(report.tos_analysis)
+        assert analysis["license_type"] == "MIT"
+        assert analysis["alternative_tools"][0]["name"] == "AltTool"
+        assert set(task.stages) == set(service.pipeline.order)
+        assert "analyze_tool_directly" in fake_ai.calls
+
+    def test_independent_ai_stages_overlap(self, db, fake_ai):
+        fake_ai.delay = 0.2
+        tool = get_or_create_tool(db, "SlowTool")
+        service = ScanService()
+        task = service.create_scan_tasks([tool.id], db)[0]
+
+        asyncio.run(service.scan_tool(task, db))
+
+        stages = task.stages
+        assert task.status == ScanTaskStatus.COMPLETED
+        # 替代方案阶段与 TOS 链接搜索并发执行，而不是排在 TOS 分析之后
+        assert stages["alternatives"].started_at < stages["tos_url"].finished_at
+
+    def test_kb_alternatives_skip_ai_call(self, db, fake_ai):
+        tool = get_or_create_tool(db, "Docker Desktop")
+        service = ScanService()
+        task = service.create_scan_tasks([tool.id], db)[0]
+
+        asyncio.run(service.scan_tool(task, db))
+
+        assert task.status == ScanTaskStatus.COMPLETED
+        assert "get_alternative_tools" not in fake_ai.calls
+
+    def test_stage_timings_persisted_with_report(self, db, fake_ai):
+        tool = get_or_create_tool(db, "Docker Desktop")
+        service = ScanService()
+        task = service.create_scan_tasks([tool.id], db)[0]
+
+        asyncio.run(service.scan_tool(task, db))
+
+        report = db.query(ComplianceReport).filter(ComplianceReport.id == task.result["report_id"]).first()
+        timings = {stage["name"]: stage for stage in report.stage_timings}
+        assert list(timings) == service.pipeline.order
+        assert timings["kb_lookup"]["hit"] == "kb"
+        assert timings["alternatives"]["hit"] == "kb"
+        assert all(stage["duration"] is not None for stage in timings.values())
+
+    def test_no_session_held_across_ai_calls(self, db, test_engine, fake_ai, monkeypatch):
+        from sqlalchemy.orm import Session, sessionmaker
+
+        open_sessions, observed = set(), []
+
+        class TrackedSession(Session):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                open_sessions.add(id(self))
+
+            def close(self):
+                open_sessions.discard(id(self))
+                super().close()
+
+        def observe(method):
+            async def _wrapped(*args, **kwargs):
+                observed.append(len(open_sessions))
+                return await method(*args, **kwargs)
+            return _wrapped
+
+        for name in ("search_tos_url", "analyze_tool_directly", "get_alternative_tools"):
+            monkeypatch.setattr(fake_ai, name, observe(getattr(fake_ai, name)))
+        tool = get_or_create_tool(db, "ShortSessionTool")
+        service = ScanService()
+        task = service.create_scan_tasks([tool.id], db)[0]
+
+        asyncio.run(service._scan_tool(task, sessionmaker(bind=test_engine, class_=TrackedSession)))
+
+        assert task.status == ScanTaskStatus.COMPLETED
+        assert observed and all(count == 0 for count in observed)
+        assert open_sessions == set()
+
+    def test_concurrent_scans_group_commit_results(self, db, test_engine, fake_ai):
+        from sqlalchemy.orm import sessionmaker
+
+        tools = [get_or_create_tool(db, f"GroupTool{i}") for i in range(4)]
+        service = ScanService()
+        tasks = service.create_scan_tasks([tool.id for tool in tools], db)
+        factory = sessionmaker(bind=test_engine)
+
+        async def _scan_all():
+            await asyncio.gather(*(service._scan_tool(task, factory) for task in tasks))
+
+        asyncio.run(_scan_all())
+
+        assert all(task.status == ScanTaskStatus.COMPLETED for task in tasks)
+        # 工具信息、TOS分析、报告与阶段耗时写入被合并到更少的事务中
+        assert service.writer.writes >= 4 * len(tasks)
+        assert service.writer.flushes < service.writer.writes
+        assert db.query(ComplianceReport).filter(ComplianceReport.stage_timings.isnot(None)).count() == 4
+
+    def test_missing_tool_fails_task(self, db, fake_ai):
+        tool = get_or_create_tool(db, "GoneTool")
+        service = ScanService()
+        task = service.create_scan_tasks([tool.id], db)[0]
+        db.delete(tool)
+        db.commit()
+
+        asyncio.run(service.scan_tool(task, db))
+
+        assert task.status == ScanTaskStatus.FAILED
+
+
+def _add_report(db, tool, tos_info=True):
+    if tos_info:
+        tool.tos_info = json.dumps(ANALYSIS)
+    report = ComplianceReport(tool_id=tool.id, tos_analysis=json.dumps(ANALYSIS))
+    db.add(report)
+    db.commit()
+    return report
+
+
+class TestFreshness:
+
+    def test_fresh_report_served_from_cache(self, db, fake_ai):
+        tool = get_or_create_tool(db, "FreshTool")
+        report = _add_report(db, tool)
+        service = ScanService()
+
+        task = service.create_scan_tasks([tool.id], db)[0]
+
+        assert task.status == ScanTaskStatus.COMPLETED
+        assert task.cached is True
+        assert task.result["report_id"] == report.id
+        assert task.result["cached"] is True
+        assert fake_ai.calls == []
+
+    def test_force_refresh_recomputes(self, db, fake_ai):
+        tool = get_or_create_tool(db, "ForcedTool")
+        _add_report(db, tool)
+        service = ScanService()
+
+        task = service.create_scan_tasks([tool.id], db, force_refresh=True)[0]
+        assert task.status == ScanTaskStatus.PENDING
+
+        asyncio.run(service.scan_tool(task, db))
+        assert task.status == ScanTaskStatus.COMPLETED
+        assert task.result["cached"] is False
+
+    def test_report_without_tos_snapshot_is_not_fresh(self, db, fake_ai):
+        tool = get_or_create_tool(db, "ThinTool")
+        _add_report(db, tool, tos_info=False)
+        service = ScanService()
+
+        task = service.create_scan_tasks([tool.id], db)[0]
+        assert task.status == ScanTaskStatus.PENDING
+
+    def test_source_ttl_zero_disables_cache(self, db, fake_ai):
+        tool = get_or_create_tool(db, "InternalTool", source="internal")
+        _add_report(db, tool)
+        service = ScanService()
+        service.config = service.config.model_copy(deep=True)
+        service.config.scanning.freshness.ttl_hours_by_source = {"internal": 0}
+
+        task = service.create_scan_tasks([tool.id], db)[0]
+        assert task.status == ScanTaskStatus.PENDING
+
+
+class TestPriority:
+
+    def test_resolve_priority(self):
+        service = ScanService()
+        assert service.resolve_priority(None, 1) == ScanPriority.INTERACTIVE
+        assert service.resolve_priority(None, 300) == ScanPriority.BATCH
+        assert service.resolve_priority(ScanPriority.BACKGROUND, 1) == ScanPriority.BACKGROUND
+
+    def test_task_carries_priority(self, db, fake_ai):
+        tool = get_or_create_tool(db, "PriorityTool")
+        service = ScanService()
+        task = service.create_scan_tasks([tool.id], db, priority=ScanPriority.BATCH)[0]
+        assert task.priority == ScanPriority.BATCH
+
+
+class TestDeadlineAndCancel:
+
+    def test_deadline_records_timed_out_stages(self, db, fake_ai):
+        fake_ai.delay = 2
+        tool = get_or_create_tool(db, "DeadlineTool")
+        service = ScanService()
+        service.config = service.config.model_copy(deep=True)
+        service.config.scanning.timeout = 1
+        task = service.create_scan_tasks([tool.id], db)[0]
+
+        asyncio.run(service.scan_tool(task, db))
+
+        assert task.status == ScanTaskStatus.FAILED
+        assert "tos_url" in task.timed_out_stages
+        assert task.stages["tos_url"].status.value == "timeout"
+        assert "扫描超时" in task.error
+
+    def test_cancel_running_task(self, db, fake_ai):
+        fake_ai.delay = 5
+        tool = get_or_create_tool(db, "CancelTool")
+        service = ScanService()
+        task = service.create_scan_tasks([tool.id], db)[0]
+
+        async def _run():
+            running = asyncio.ensure_future(service.scan_tool(task, db))
+            await asyncio.sleep(0.05)
+            running.cancel()
+            await asyncio.gather(running, return_exceptions=True)
+
+        asyncio.run(_run())
+        assert task.status == ScanTaskStatus.CANCELLED
+
+    def test_batch_tracks_tasks(self, db, fake_ai):
+        tool = get_or_create_tool(db, "BatchTool")
+        _add_report(db, tool)
+        service = ScanService()
+
+        batch = service.submit_scan([tool.id], db)
+
+        assert service.get_batch(batch.batch_id) is batch
+        assert batch.tasks[0].batch_id == batch.batch_id
+        assert batch.finished
+        assert service.cancel_batch(batch.batch_id) == 0
+        assert service.cancel_batch("missing") is None
+
+
+class TestCheckpoints:
+
+    def test_retry_resumes_after_analysis_timeout(self, db, fake_ai, monkeypatch):
+        from src.models import ScanCheckpoint
+
+        fetches = []
+
+        async def fake_fetch(url, raise_errors=False):
+            fetches.append(url)
+            return "terms of service"
+
+        monkeypatch.setattr("src.services.scan_service.fetch_tos_content", fake_fetch)
+        fake_ai.tos_url = "https://example.com/tos"
+        slow_analysis = FakeAIClient.analyze_tos
+
+        async def hanging_analysis(self, tool_name, tos_content):
+            await asyncio.sleep(5)
+            return await slow_analysis(self, tool_name, tos_content)
+
+        tool = get_or_create_tool(db, "ResumeTool")
+        service = ScanService()
+        service.config = service.config.model_copy(deep=True)
+        service.config.scanning.timeout = 1
+
+        monkeypatch.setattr(FakeAIClient, "analyze_tos", hanging_analysis)
+        task = service.create_scan_tasks([tool.id], db)[0]
+        asyncio.run(service.scan_tool(task, db))
+        assert task.status == ScanTaskStatus.FAILED
+        saved = {c.stage for c in db.query(ScanCheckpoint).filter(ScanCheckpoint.tool_id == tool.id)}
+        assert {"tos_url", "tos_fetch", "alternatives"} <= saved
+
+        monkeypatch.setattr(FakeAIClient, "analyze_tos", slow_analysis)
+        fake_ai.calls.clear()
+        retry = service.create_scan_tasks([tool.id], db)[0]
+        asyncio.run(service.scan_tool(retry, db))
+
+        assert retry.status == ScanTaskStatus.COMPLETED
+        assert fake_ai.calls == ["analyze_tos"]
+        assert fetches == ["https://example.com/tos"]
+        assert retry.stages["tos_url"].resumed is True
+        # 成功后检查点被清除
+        assert db.query(ScanCheckpoint).filter(ScanCheckpoint.tool_id == tool.id).count() == 0
+
+
+class TestProvisionalReports:
+
+    def test_builtin_kb_tool_gets_provisional_report(self, db, fake_ai):
+        tool = get_or_create_tool(db, "Docker Desktop")
+        service = ScanService()
+
+        task = service.create_scan_tasks([tool.id], db, provisional=True)[0]
+
+        assert task.status == ScanTaskStatus.PENDING
+        assert task.provisional["kb_source"] == "builtin"
+        assert task.provisional["revision"] == 1
+        report = db.query(ComplianceReport).filter(ComplianceReport.id == task.provisional["report_id"]).first()
+        assert report.provisional is True
+        assert json.loads(report.tos_analysis)["license_type"]
+        assert fake_ai.calls == []
+
+        asyncio.run(service.scan_tool(task, db))
+
+        db.refresh(report)
+        assert task.result["report_id"] == report.id
+        assert task.result["revision"] == 2
+        assert report.provisional is False
+        assert report.revision == 2
+
+    def test_user_kb_entry_carries_updated_at(self, db, fake_ai):
+        from src.services.knowledge_base_service import create_or_update_knowledge_base
+        create_or_update_knowledge_base(db, "CuratedTool", {"license_type": "Apache-2.0"}, source="user")
+        tool = get_or_create_tool(db, "CuratedTool")
+
+        task = ScanService().create_scan_tasks([tool.id], db, provisional=True)[0]
+
+        assert task.provisional["kb_source"] == "user"
+        assert task.provisional["kb_updated_at"] is not None
+        report = db.query(ComplianceReport).filter(ComplianceReport.id == task.provisional["report_id"]).first()
+        assert report.kb_updated_at is not None
+
+    def test_unknown_tool_has_no_provisional_report(self, db, fake_ai):
+        tool = get_or_create_tool(db, "NoSuchKbTool")
+        task = ScanService().create_scan_tasks([tool.id], db, provisional=True)[0]
+        assert task.provisional is None
+        assert db.query(ComplianceReport).filter(ComplianceReport.tool_id == tool.id).count() == 0
+
+    def test_existing_full_report_not_overwritten(self, db, fake_ai):
+        tool = get_or_create_tool(db, "Postman")
+        report = _add_report(db, tool, tos_info=False)
+
+        task = ScanService().create_scan_tasks([tool.id], db, provisional=True)[0]
+
+        db.refresh(report)
+        assert task.provisional["report_id"] == report.id
+        assert not report.provisional
+        assert json.loads(report.tos_analysis)["license_type"] == "MIT"
+
+    def test_provisional_report_is_not_fresh(self, db, fake_ai):
+        tool = get_or_create_tool(db, "Docker Desktop")
+        service = ScanService()
+        service.create_scan_tasks([tool.id], db, provisional=True)
+        tool.tos_info = json.dumps(ANALYSIS)
+        db.commit()
+
+        task = service.create_scan_tasks([tool.id], db)[0]
+        assert task.status == ScanTaskStatus.PENDING
+
+
+class TestKnowledgeBaseOnly:
+
+    def _curate(self, db, name, source="user"):
+        from src.services.knowledge_base_service import create_or_update_knowledge_base
+        return create_or_update_knowledge_base(db, name, {"license_type": "Apache-2.0"}, source=source)
+
+    def test_trusted_entry_skips_ai(self, db, fake_ai):
+        self._curate(db, "TrustedTool")
+        tool = get_or_create_tool(db, "TrustedTool")
+
+        task = ScanService().create_scan_tasks([tool.id], db, kb_only=True)[0]
+
+        assert task.status == ScanTaskStatus.COMPLETED
+        assert task.result["kb_only"] is True
+        report = db.query(ComplianceReport).filter(ComplianceReport.id == task.result["report_id"]).first()
+        assert report.provisional is False
+        assert json.loads(report.tos_analysis)["license_type"] == "Apache-2.0"
+        assert fake_ai.calls == []
+
+    def test_kb_report_clears_retry(self, db, fake_ai):
+        from src.config import RetryQueueConfig
+        from src.models import ScanRetry
+        from src.services.retry_service import ScanErrorKind, record_failure
+
+        self._curate(db, "RetriedKbTool")
+        tool = get_or_create_tool(db, "RetriedKbTool")
+        record_failure(db, tool.id, ScanErrorKind.PROVIDER_DOWN, "down", RetryQueueConfig())
+        db.commit()
+
+        task = ScanService().create_scan_tasks([tool.id], db, kb_only=True)[0]
+
+        assert task.status == ScanTaskStatus.COMPLETED
+        assert db.query(ScanRetry).filter(ScanRetry.tool_id == tool.id).count() == 0
+
+    def test_async_creation_awaits_kb_reports(self, db, fake_ai):
+        names = [f"AsyncKbTool{i}" for i in range(3)]
+        for name in names:
+            self._curate(db, name)
+        tools = [get_or_create_tool(db, name) for name in names]
+        service = ScanService()
+
+        # 请求处理函数中使用协程版本，等待写入时不阻塞事件循环
+        tasks = asyncio.run(service.create_scan_tasks_async([tool.id for tool in tools], db, kb_only=True))
+
+        assert all(task.status == ScanTaskStatus.COMPLETED for task in tasks)
+        assert service.writer.flushes == 1
+
+    def test_kb_reports_go_through_group_commit(self, db, fake_ai):
+        names = [f"GroupKbTool{i}" for i in range(5)]
+        for name in names:
+            self._curate(db, name)
+        tools = [get_or_create_tool(db, name) for name in names]
+        service = ScanService()
+
+        tasks = service.create_scan_tasks([tool.id for tool in tools], db, kb_only=True)
+
+        assert all(task.status == ScanTaskStatus.COMPLETED for task in tasks)
+        # 各工具的知识库报告由结果写入任务在同一个事务中提交
+        assert service.writer.writes == 5
+        assert service.writer.flushes == 1
+
+    def test_policy_follows_config(self, db, fake_ai):
+        self._curate(db, "ConfiguredTool")
+        tool = get_or_create_tool(db, "ConfiguredTool")
+        service = ScanService()
+        service.config = service.config.model_copy(deep=True)
+
+        pending = service.create_scan_tasks([tool.id], db)[0]
+        assert pending.status == ScanTaskStatus.PENDING
+        pending.cancel()
+        service.config.scanning.kb_only.enabled = True
+        assert service.create_scan_tasks([tool.id], db)[0].status == ScanTaskStatus.COMPLETED
+        # 请求级开关优先于配置
+        assert service.create_scan_tasks([tool.id], db, kb_only=False)[0].status == ScanTaskStatus.PENDING
+
+    def test_untrusted_or_stale_entry_is_scanned(self, db, fake_ai):
+        from datetime import timedelta
+        from src.services.freshness_service import db_now
+
+        self._curate(db, "AiSourcedTool", source="ai")
+        stale = self._curate(db, "StaleTool")
+        stale.updated_at = db_now() - timedelta(days=365)
+        db.commit()
+        tools = [get_or_create_tool(db, name) for name in ("AiSourcedTool", "StaleTool", "Docker Desktop")]
+
+        tasks = ScanService().create_scan_tasks([tool.id for tool in tools], db, kb_only=True)
+
+        # AI 来源、过期条目与内置知识库都不满足仅知识库扫描条件
+        assert [task.status for task in tasks] == [ScanTaskStatus.PENDING] * 3
+
+
+class TestInFlightDedup:
+
+    def test_second_submission_joins_in_flight_task(self, db, fake_ai):
+        tool = get_or_create_tool(db, "DedupTool")
+        service = ScanService()
+        first = service.create_scan_tasks([tool.id], db)[0]
+        first.start()
+
+        second = service.create_scan_tasks([tool.id], db, force_refresh=True)[0]
+
+        assert second is first
+        assert first.subscribers == 1
+        assert service.get_task_status(tool.id) is first
+
+    def test_duplicate_ids_in_one_submission(self, db, fake_ai):
+        tool = get_or_create_tool(db, "DupIdTool")
+        tasks = ScanService().create_scan_tasks([tool.id, tool.id], db)
+        assert len(tasks) == 1
+
+    def test_interactive_request_promotes_queued_task(self, db, fake_ai, monkeypatch):
+        tool = get_or_create_tool(db, "PromoteTool")
+        service = ScanService()
+        promoted = []
+        monkeypatch.setattr(service.scheduler, "promote", lambda items, priority: promoted.append(priority))
+        task = service.create_scan_tasks([tool.id], db, priority=ScanPriority.BACKGROUND)[0]
+
+        service.create_scan_tasks([tool.id], db, priority=ScanPriority.INTERACTIVE)
+
+        assert task.priority == ScanPriority.INTERACTIVE
+        assert promoted == [ScanPriority.INTERACTIVE]
+
+    def test_concurrent_scan_tools_run_once(self, db, fake_ai):
+        fake_ai.delay = 0.05
+        tool = get_or_create_tool(db, "OnceTool")
+        service = ScanService()
+
+        async def _both():
+            return await asyncio.gather(
+                service.scan_tools([tool.id], db), service.scan_tools([tool.id], db)
+            )
+
+        first, second = asyncio.run(_both())
+
+        assert first[tool.id] is second[tool.id]
+        assert first[tool.id].status == ScanTaskStatus.COMPLETED
+        assert fake_ai.calls.count("analyze_tool_directly") == 1
+
+    def test_cancelling_one_batch_keeps_shared_task(self, db, fake_ai, monkeypatch):
+        tool = get_or_create_tool(db, "SharedTool")
+        service = ScanService()
+        monkeypatch.setattr(service, "start", lambda tasks=None: None)
+        first = service.submit_scan([tool.id], db)
+        second = service.submit_scan([tool.id], db)
+
+        assert service.cancel_batch(second.batch_id) == 0
+        task = first.tasks[0]
+        assert task.status == ScanTaskStatus.PENDING
+        assert task.batch_id == first.batch_id
+
+        assert service.cancel_batch(first.batch_id) == 1
+        assert task.status == ScanTaskStatus.CANCELLED
+
+
+class TestRetryQueue:
+
+    def _fail_reports(self, monkeypatch, code):
+        import httpx
+        from src.services.compliance_engine import ComplianceEngine
+
+        async def failing(self, tool, tool_info, tos_analysis, offline=False):
+            request = httpx.Request("POST", "https://ai.example.com")
+            raise httpx.HTTPStatusError("error", request=request, response=httpx.Response(code, request=request))
+
+        monkeypatch.setattr(ComplianceEngine, "evaluate_report", failing)
+
+    def test_failure_classified_and_scheduled(self, db, fake_ai, monkeypatch):
+        from src.models import ScanRetry
+
+        self._fail_reports(monkeypatch, 503)
+        tool = get_or_create_tool(db, "OutageTool")
+        service = ScanService()
+        task = service.create_scan_tasks([tool.id], db)[0]
+
+        asyncio.run(service.scan_tool(task, db))
+
+        assert task.status == ScanTaskStatus.FAILED
+        assert task.error_kind.value == "provider_down"
+        retry = db.query(ScanRetry).filter(ScanRetry.tool_id == tool.id).first()
+        assert (retry.status, retry.error_kind, retry.failed_stage) == ("scheduled", "provider_down", "report")
+        assert retry.next_attempt_at is not None
+
+    def test_tos_fetch_http_error_schedules_retry(self, db, fake_ai, monkeypatch):
+        import httpx
+        from src.models import ScanRetry
+
+        async def unavailable(self, url):
+            request = httpx.Request("GET", url)
+            return httpx.Response(503, request=request)
+
+        monkeypatch.setattr(httpx.AsyncClient, "get", unavailable)
+        fake_ai.tos_url = "https://example.com/tos"
+        tool = get_or_create_tool(db, "UnavailableTosTool")
+        service = ScanService()
+        task = service.create_scan_tasks([tool.id], db)[0]
+
+        asyncio.run(service.scan_tool(task, db))
+
+        # TOS 页面返回 503：获取阶段失败并按错误类型分类，报告照常生成，同时安排重试
+        assert task.status == ScanTaskStatus.COMPLETED
+        assert task.result["retry_scheduled"]
+        assert task.stages["tos_fetch"].status.value == "failed"
+        db.expire_all()
+        retry = db.query(ScanRetry).filter(ScanRetry.tool_id == tool.id).first()
+        assert (retry.status, retry.error_kind, retry.failed_stage) == ("scheduled", "fetch_failure", "tos_fetch")
+
+    def test_transient_optional_stage_failure_schedules_retry(self, db, fake_ai, monkeypatch):
+        import httpx
+        from src.models import ScanCheckpoint, ScanRetry
+
+        async def rate_limited(self, tool_name):
+            self.calls.append("analyze_tool_directly")
+            request = httpx.Request("POST", "https://ai.example.com")
+            raise httpx.HTTPStatusError("429", request=request, response=httpx.Response(429, request=request))
+
+        analyze = FakeAIClient.analyze_tool_directly
+        monkeypatch.setattr(FakeAIClient, "analyze_tool_directly", rate_limited)
+        tool = get_or_create_tool(db, "RateLimitedTool")
+        service = ScanService()
+        task = service.create_scan_tasks([tool.id], db, priority=ScanPriority.BATCH)[0]
+
+        asyncio.run(service.scan_tool(task, db))
+
+        # tos_analysis 不是必需阶段：报告照常生成，同时安排重试
+        assert task.status == ScanTaskStatus.COMPLETED
+        assert task.result["retry_scheduled"]
+        db.expire_all()
+        retry = db.query(ScanRetry).filter(ScanRetry.tool_id == tool.id).first()
+        assert (retry.status, retry.error_kind, retry.failed_stage) == ("scheduled", "rate_limited", "tos_analysis")
+        assert retry.priority == "batch"
+        saved = {c.stage for c in db.query(ScanCheckpoint).filter(ScanCheckpoint.tool_id == tool.id)}
+        assert saved == {"alternatives"}
+
+        monkeypatch.setattr(FakeAIClient, "analyze_tool_directly", analyze)
+        fake_ai.calls.clear()
+        again = service.create_scan_tasks([tool.id], db, force_refresh=True)[0]
+        asyncio.run(service.scan_tool(again, db))
+
+        assert again.status == ScanTaskStatus.COMPLETED
+        assert not again.result["retry_scheduled"]
+        # 成功的阶段复用检查点，只重新执行失败的分析
+        assert again.stages["alternatives"].resumed
+        assert "get_alternative_tools" not in fake_ai.calls
+        assert "analyze_tool_directly" in fake_ai.calls
+        db.expire_all()
+        assert db.query(ScanRetry).filter(ScanRetry.tool_id == tool.id).count() == 0
+        assert db.query(ScanCheckpoint).filter(ScanCheckpoint.tool_id == tool.id).count() == 0
+
+    def test_success_clears_retry(self, db, fake_ai):
+        from src.config import RetryQueueConfig
+        from src.models import ScanRetry
+        from src.services.retry_service import ScanErrorKind, record_failure
+
+        tool = get_or_create_tool(db, "RecoveredTool")
+        record_failure(db, tool.id, ScanErrorKind.RATE_LIMITED, "429", RetryQueueConfig())
+        db.commit()
+        service = ScanService()
+        task = service.create_scan_tasks([tool.id], db, force_refresh=True)[0]
+
+        asyncio.run(service.scan_tool(task, db))
+
+        assert task.status == ScanTaskStatus.COMPLETED
+        db.expire_all()
+        assert db.query(ScanRetry).filter(ScanRetry.tool_id == tool.id).count() == 0
+
+
+class TestBudget:
+
+    def _exhausted(self, service):
+        from src.config import BudgetConfig
+        from src.services.budget_service import TokenBudget
+
+        service.budget = TokenBudget(BudgetConfig(enabled=True, daily_tokens=100))
+        service.budget.record({"prompt_tokens": 80, "completion_tokens": 20})
+
+    def test_exhausted_budget_degrades_to_kb(self, db, fake_ai):
+        tool = get_or_create_tool(db, "Docker Desktop")
+        service = ScanService()
+        self._exhausted(service)
+        task = service.create_scan_tasks([tool.id], db)[0]
+
+        asyncio.run(service.scan_tool(task, db))
+
+        assert task.status == ScanTaskStatus.COMPLETED
+        assert task.result["budget_degraded"] and task.result["kb_only"]
+        assert fake_ai.calls == []
+        report = db.query(ComplianceReport).filter(ComplianceReport.id == task.result["report_id"]).first()
+        assert report.provisional
+
+    def test_degraded_scan_defers_retry_until_reset(self, db, fake_ai):
+        from src.config import RetryQueueConfig
+        from src.models import ScanRetry
+        from src.services.retry_service import ScanErrorKind, record_failure
+
+        tool = get_or_create_tool(db, "Docker Desktop")
+        record_failure(db, tool.id, ScanErrorKind.PROVIDER_DOWN, "down", RetryQueueConfig())
+        db.commit()
+        service = ScanService()
+        self._exhausted(service)
+        task = service.create_scan_tasks([tool.id], db)[0]
+
+        asyncio.run(service.scan_tool(task, db))
+
+        assert task.result["budget_degraded"]
+        db.expire_all()
+        retry = db.query(ScanRetry).filter(ScanRetry.tool_id == tool.id).first()
+        # 降级结果不是完整扫描：保留重试，推迟到预算重置后
+        assert (retry.status, retry.attempts) == ("scheduled", 1)
+        assert retry.next_attempt_at == service.budget.resets_at()
+
+    def test_deferred_batch_scan_outside_scheduler_skips_ai(self, db, fake_ai):
+        from src.config import BudgetConfig
+        from src.services.budget_service import TokenBudget
+
+        tool = get_or_create_tool(db, "Docker Desktop")
+        service = ScanService()
+        # 用量超过保留线但未用尽：批量扫描被推迟，scan_tools 不经过调度器
+        service.budget = TokenBudget(BudgetConfig(enabled=True, daily_tokens=100, interactive_reserve_ratio=0.5))
+        service.budget.record({"prompt_tokens": 50, "completion_tokens": 10})
+        task = service.create_scan_tasks([tool.id], db, priority=ScanPriority.BATCH)[0]
+
+        asyncio.run(service.scan_tool(task, db))
+
+        assert task.status == ScanTaskStatus.COMPLETED
+        assert task.result["budget_degraded"] and task.result["kb_only"]
+        assert fake_ai.calls == []
+
+    def test_exhausted_budget_without_kb_retries_after_reset(self, db, fake_ai):
+        from src.models import LLMUsage, ScanRetry
+
+        tool = get_or_create_tool(db, "UnknownBudgetTool")
+        service = ScanService()
+        self._exhausted(service)
+        task = service.create_scan_tasks([tool.id], db)[0]
+
+        asyncio.run(service.scan_tool(task, db))
+
+        assert task.status == ScanTaskStatus.FAILED
+        assert task.error_kind.value == "budget_exhausted"
+        retry = db.query(ScanRetry).filter(ScanRetry.tool_id == tool.id).first()
+        assert (retry.status, retry.attempts) == ("scheduled", 0)
+        assert retry.next_attempt_at == service.budget.resets_at()
+        # 用量随失败记录写入数据库
+        assert db.query(LLMUsage).one().requests == 1
+
+
+class TestOfflineMode:
+
+    def _offline(self, service, offline=True):
+        from src.config import OfflineConfig
+        from src.services.offline_service import ProviderCircuit
+
+        service.circuit = ProviderCircuit(OfflineConfig(manual=offline))
+
+    def test_offline_scan_completes_without_ai_and_enriches_later(self, db, fake_ai):
+        tool = get_or_create_tool(db, "OfflineScanTool")
+        service = ScanService()
+        self._offline(service)
+        task = service.create_scan_tasks([tool.id], db)[0]
+
+        asyncio.run(service.scan_tool(task, db))
+
+        assert task.status == ScanTaskStatus.COMPLETED
+        assert task.result["needs_enrichment"] is True
+        assert fake_ai.calls == []
+        assert task.stages["tos_analysis"].hit == "offline"
+        report = db.query(ComplianceReport).filter(ComplianceReport.id == task.result["report_id"]).first()
+        assert report.needs_enrichment
+
+        # AI 服务恢复后的补全扫描调用 AI，报告不再待补全
+        service.circuit.set_manual(False)
+        task = service.create_scan_tasks([tool.id], db)[0]
+        asyncio.run(service.scan_tool(task, db))
+
+        assert task.result["needs_enrichment"] is False
+        assert "analyze_tool_directly" in fake_ai.calls
+        db.expire_all()
+        report = db.query(ComplianceReport).filter(ComplianceReport.id == task.result["report_id"]).first()
+        assert not report.needs_enrichment
+
+    def test_offline_scan_uses_cached_analysis(self, db, fake_ai):
+        tool = get_or_create_tool(db, "CachedOfflineTool")
+        service = ScanService()
+        task = service.create_scan_tasks([tool.id], db)[0]
+        asyncio.run(service.scan_tool(task, db))
+        fake_ai.calls.clear()
+
+        self._offline(service)
+        task = service.create_scan_tasks([tool.id], db, force_refresh=True)[0]
+        asyncio.run(service.scan_tool(task, db))
+
+        assert fake_ai.calls == []
+        assert task.stages["tos_analysis"].hit == "cache"
+        assert task.result["needs_enrichment"] is True
+        report = db.query(ComplianceReport).filter(ComplianceReport.id == task.result["report_id"]).first()
+        assert json.loads(report.tos_analysis)["license_type"] == "MIT"
+
+    def test_enrichment_reruns_only_offline_stages(self, db, fake_ai):
+        tool = get_or_create_tool(db, "EnrichOnlyTool")
+        service = ScanService()
+        task = service.create_scan_tasks([tool.id], db)[0]
+        asyncio.run(service.scan_tool(task, db))
+
+        self._offline(service)
+        task = service.create_scan_tasks([tool.id], db, force_refresh=True)[0]
+        asyncio.run(service.scan_tool(task, db))
+        assert task.stages["tos_analysis"].hit == "cache"
+        assert task.stages["alternatives"].hit == "offline"
+
+        service.circuit.set_manual(False)
+        fake_ai.calls.clear()
+        task = service.create_scan_tasks([tool.id], db)[0]
+        asyncio.run(service.scan_tool(task, db))
+
+        # 使用缓存结果的 TOS 分析复用检查点，只重新执行离线时跳过的阶段
+        assert task.result["needs_enrichment"] is False
+        assert task.stages["tos_analysis"].resumed
+        assert "analyze_tool_directly" not in fake_ai.calls
+        assert "get_alternative_tools" in fake_ai.calls
+
+
+class TestScanMany:
+
+    async def _collect(self, results):
+        return [result async for result in results]
+
+    def test_yields_results_as_completed(self, db, fake_ai):
+        fake_ai.delay = 0.1
+        _add_report(db, get_or_create_tool(db, "StreamCachedTool"))
+        service = ScanService()
+
+        results = asyncio.run(self._collect(service.scan_many(["StreamNewTool", "StreamCachedTool", " "], db)))
+
+        # 已有报告的工具先完成
+        assert [r["tool_name"] for r in results] == ["StreamCachedTool", "StreamNewTool"]
+        assert results[0]["cached"] is True
+        assert results[1]["status"] == "completed" and results[1]["cached"] is False
+        assert all(r["report"] is not None for r in results)
+
+    def test_bounded_concurrency(self, db, fake_ai):
+        running = {"now": 0, "max": 0}
+
+        async def analyze(tool_name):
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+            await asyncio.sleep(0.05)
+            running["now"] -= 1
+            return dict(ANALYSIS)
+
+        fake_ai.analyze_tool_directly = analyze
+        service = ScanService()
+
+        results = asyncio.run(self._collect(service.scan_many(["Bound1", "Bound2", "Bound3"], db, concurrency=1)))
+
+        assert len(results) == 3
+        assert running["max"] == 1
+
+    def test_close_cancels_unfinished_scans(self, db, fake_ai):
+        fake_ai.delay = 5
+        _add_report(db, get_or_create_tool(db, "CloseCachedTool"))
+        service = ScanService()
+
+        async def first_then_close():
+            results = service.scan_many(["CloseCachedTool", "CloseSlowTool"], db)
+            first = await results.__anext__()
+            await results.aclose()
+            return first
+
+        first = asyncio.run(asyncio.wait_for(first_then_close(), timeout=3))
+
+        assert first["tool_name"] == "CloseCachedTool"
+        slow = [task for task in service.registry.active() if task.tool_name == "CloseSlowTool"][0]
+        assert slow.status == ScanTaskStatus.CANCELLED
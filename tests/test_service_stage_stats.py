@@ -0,0 +1,51 @@
+"""
+扫描阶段耗时统计单元测试
+Unit tests for stage_stats_service module
+"""
+
+from src.models import ComplianceReport
+from src.services.stage_stats_service import aggregate_stage_timings, get_stage_timing_stats, percentile
+from src.services.tool_service import get_or_create_tool
+
+
+def _stage(name, duration, status="succeeded", attempts=1, hit=None):
+    return {"name": name, "duration": duration, "status": status, "attempts": attempts, "hit": hit}
+
+
+class TestPercentile:
+
+    def test_interpolates(self):
+        assert percentile([1, 2, 3, 4], 50) == 2.5
+        assert percentile([5], 95) == 5
+        assert percentile(list(range(1, 101)), 95) == 95.05
+
+    def test_empty(self):
+        assert percentile([], 50) is None
+
+
+class TestAggregate:
+
+    def test_per_stage_stats(self):
+        runs = [
+            [_stage("tos_url", 1.0, attempts=2), _stage("kb_lookup", 0.01, attempts=0, hit="kb")],
+            [_stage("tos_url", 3.0), _stage("kb_lookup", 0.03, attempts=0)],
+            [_stage("tos_url", None, status="timeout", attempts=3)],
+        ]
+        stats = aggregate_stage_timings(runs)
+        assert stats["tos_url"]["count"] == 3
+        assert stats["tos_url"]["p50"] == 2.0
+        assert stats["tos_url"]["max"] == 3.0
+        assert stats["tos_url"]["avg_attempts"] == 2
+        assert stats["tos_url"]["failures"] == 1
+        assert stats["kb_lookup"]["hit_rate"] == 0.5
+
+    def test_recent_reports_only(self, db):
+        for index in range(3):
+            tool = get_or_create_tool(db, f"TimedTool{index}")
+            db.add(ComplianceReport(tool_id=tool.id, stage_timings=[_stage("report", float(index))]))
+        db.add(ComplianceReport(tool_id=tool.id, stage_timings=None))
+        db.commit()
+
+        stats = get_stage_timing_stats(db, limit=2)
+        assert stats["scans"] == 2
+        assert stats["stages"]["report"]["count"] == 2
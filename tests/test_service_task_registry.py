@@ -0,0 +1,121 @@
+"""
+扫描任务表单元测试
+Unit tests for task_registry module
+"""
+
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy.orm import sessionmaker
+from src.config import TaskRegistryConfig
+from src.models import ScanTaskRecord
+from src.services.scan_service import ScanTask, ScanBatch, ScanTaskStatus
+from src.services.task_registry import ScanTaskRegistry
+
+
+@pytest.fixture()
+def make_registry(test_engine):
+    def _make(**overrides):
+        config = TaskRegistryConfig(**overrides)
+        return ScanTaskRegistry(config, ScanTask, ScanBatch, sessionmaker(bind=test_engine))
+    return _make
+
+
+def _completed(tool_id, report_id=None):
+    task = ScanTask(tool_id, f"tool-{tool_id}")
+    task.complete({"tool_id": tool_id, "report_id": report_id or tool_id})
+    return task
+
+
+class TestScanTaskRegistry:
+
+    def test_tasks_are_slotted(self):
+        task = ScanTask(1, "x")
+        with pytest.raises(AttributeError):
+            task.unexpected = 1
+
+    def test_count_eviction_archives_oldest_terminal(self, make_registry, db):
+        registry = make_registry(max_tasks=3)
+        pending = ScanTask(1, "pending")
+        registry.add(pending)
+        for tool_id in range(2, 7):
+            registry.add(_completed(tool_id))
+
+        assert len(registry) == 3
+        # 未结束的任务不会被淘汰
+        assert registry.get(1) is pending
+        assert db.query(ScanTaskRecord).count() == 3
+        assert sorted(r.tool_id for r in db.query(ScanTaskRecord).all()) == [2, 3, 4]
+
+    def test_archived_task_is_rebuilt(self, make_registry):
+        registry = make_registry(max_tasks=1)
+        task = _completed(1, report_id=42)
+        task.batch_id = "b1"
+        registry.add(task)
+        registry.add(_completed(2))
+
+        rebuilt = registry.get(1)
+        assert rebuilt is not task
+        assert rebuilt.status == ScanTaskStatus.COMPLETED
+        assert rebuilt.result["report_id"] == 42
+        assert rebuilt.batch_id == "b1"
+        assert registry.get(999) is None
+
+    def test_time_based_eviction(self, make_registry):
+        registry = make_registry(terminal_ttl_seconds=60, sweep_interval_seconds=0)
+        old = _completed(1)
+        old.completed_at = datetime.now() - timedelta(hours=1)
+        registry.add(old)
+        registry.add(_completed(2))
+
+        assert set(registry.snapshot()) == {2}
+        assert registry.stats()["archived"] == 1
+
+    def test_archived_batch_is_rebuilt(self, make_registry):
+        registry = make_registry(max_tasks=1, max_batches=0)
+        tasks = [_completed(1), _completed(2)]
+        batch = ScanBatch(tasks, tasks[0].priority)
+        for task in tasks:
+            registry.add(task)
+        registry.add_batch(batch)
+        registry.add(_completed(3))
+
+        rebuilt = registry.get_batch(batch.batch_id)
+        assert rebuilt is not None and rebuilt is not batch
+        assert rebuilt.status_counts()["completed"] == 2
+        assert registry.get_batch("missing") is None
+
+    def test_replaced_tasks_are_archived_on_sweep(self, make_registry, db):
+        registry = make_registry(sweep_interval_seconds=3600)
+        old = _completed(1)
+        old.batch_id = "b-old"
+        registry.add(old)
+        registry.add(_completed(1))
+
+        # 被替换的任务不单独提交，等待下次清理；归档前仍可查询所在批次
+        assert db.query(ScanTaskRecord).count() == 0
+        assert registry.get_batch("b-old").tasks == [old]
+
+        registry.flush()
+        assert db.query(ScanTaskRecord).count() == 1
+        assert registry.stats()["archived"] == 1
+        assert registry.get_batch("b-old").tasks[0] is not old
+
+    def test_archive_goes_through_writer(self, test_engine, db):
+        from src.config import ResultWriterConfig
+        from src.services.result_writer import ResultWriter
+
+        writer = ResultWriter(ResultWriterConfig(flush_interval_ms=20))
+        registry = ScanTaskRegistry(
+            TaskRegistryConfig(sweep_interval_seconds=3600), ScanTask, ScanBatch,
+            sessionmaker(bind=test_engine), writer=writer,
+        )
+        for tool_id in range(1, 4):
+            registry.add(_completed(tool_id))
+            registry.add(_completed(tool_id))
+        registry.flush()
+        writer.stop()
+
+        # 三个被替换的任务在写入任务的一个事务中归档
+        assert writer.flushes == 1
+        assert db.query(ScanTaskRecord).count() == 3
+        assert registry.stats()["archiving"] == 0
@@ -38,6 +38,11 @@ class TestValidateToolName:
         ok, msg = validate_tool_name("tool@#!")
         assert ok is False
 
+    def test_scoped_package_names(self):
+        assert validate_tool_name("@babel/core")[0] is False
+        assert validate_tool_name("@babel/core", allow_scoped=True)[0] is True
+        assert validate_tool_name("@babel/core/extra", allow_scoped=True)[0] is False
+
 
 class TestParseToolNames:
 
@@ -0,0 +1,108 @@
+"""
+工具清单导入服务单元测试
+Unit tests for tool_import_service module
+"""
+
+import io
+import pytest
+from sqlalchemy.orm import sessionmaker
+from src.models import Tool
+from src.services.tool_service import get_or_create_tool
+from src.services.tool_import_service import detect_format, ingest_tool_stream, _iter_lines
+
+
+@pytest.fixture()
+def session_factory(test_engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
+
+
+def _ingest(session_factory, content, fmt, chunk_size=2, name_column=None):
+    chunks = []
+    stats = ingest_tool_stream(
+        io.BytesIO(content.encode("utf-8")),
+        fmt,
+        session_factory,
+        lambda tool_ids, db: chunks.append(tool_ids),
+        chunk_size=chunk_size,
+        name_column=name_column,
+    )
+    return stats, chunks
+
+
+class TestToolImport:
+
+    def test_detect_format(self):
+        assert detect_format("text/csv; charset=utf-8") == "csv"
+        assert detect_format("application/x-ndjson") == "ndjson"
+        assert detect_format("application/octet-stream") is None
+
+    def test_csv_with_header_dedupes_and_chunks(self, db, session_factory):
+        get_or_create_tool(db, "Existing")
+        content = "owner,name\na,Git\nb,git\nc,\"Docker, Existing\"\nd,Node.js\ne,bad$name\n"
+
+        stats, chunks = _ingest(session_factory, content, "csv")
+
+        assert stats["status"] == "completed"
+        assert stats["rows"] == 5
+        assert stats["duplicates"] == 1
+        assert stats["invalid"] == 1
+        assert stats["tools"] == 4
+        assert stats["existing"] == 1
+        assert [len(c) for c in chunks] == [2, 2]
+        names = {t.name for t in db.query(Tool).all()}
+        assert {"Git", "Docker", "Existing", "Node.js"} <= names
+        assert "git" not in names
+
+    def test_csv_without_header_uses_first_column(self, session_factory):
+        stats, chunks = _ingest(session_factory, "Git,internal\nVim,external\n", "csv", chunk_size=10)
+        assert stats["tools"] == 2
+        assert len(chunks) == 1
+
+    def test_csv_header_after_blank_lines(self, db, session_factory):
+        content = "\n,\n\"owner\",\"name\"\na,Git\nb,Vim\n"
+        stats, _ = _ingest(session_factory, content, "csv", chunk_size=10)
+        # 表头在第一个非空行：按 name 列读取，表头本身不作为工具名
+        assert stats["rows"] == 2
+        assert stats["tools"] == 2
+        names = {t.name for t in db.query(Tool).all()}
+        assert {"Git", "Vim"} <= names
+        assert "owner" not in names and "a" not in names
+
+    def test_csv_component_header(self, db, session_factory):
+        stats, _ = _ingest(session_factory, "component,version\nGit,2.44\nVim,9.1\n", "csv", chunk_size=10)
+        assert stats["rows"] == 2
+        names = {t.name for t in db.query(Tool).all()}
+        assert {"Git", "Vim"} <= names
+        assert "component" not in names
+
+    def test_csv_name_column(self, db, session_factory):
+        content = "vendor,Product\nGit SCM,Git\nVim org,Vim\n"
+        stats, _ = _ingest(session_factory, content, "csv", chunk_size=10, name_column="product")
+        assert stats["rows"] == 2
+        assert {t.name for t in db.query(Tool).all()} == {"Git", "Vim"}
+
+        # 指定的列不存在时导入失败，不把表头当作工具名
+        stats, chunks = _ingest(session_factory, "owner,title\na,Emacs\n", "csv", name_column="product")
+        assert stats["status"] == "failed"
+        assert "product" in stats["error"]
+        assert chunks == []
+
+    def test_ndjson(self, session_factory):
+        content = '{"name": "Git"}\n"Vim"\nnot-json\n{"other": 1}\n\n{"tool": "GIT"}\n'
+        stats, chunks = _ingest(session_factory, content, "ndjson")
+        assert stats["rows"] == 5
+        assert stats["invalid"] == 2
+        assert stats["duplicates"] == 1
+        assert stats["tools"] == 2
+
+    def test_chunk_callback_failure_marks_failed(self, session_factory):
+        def boom(tool_ids, db):
+            raise RuntimeError("boom")
+
+        stats = ingest_tool_stream(io.BytesIO(b"Git\n"), "csv", session_factory, boom)
+        assert stats["status"] == "failed"
+
+    def test_iter_lines_handles_split_multibyte(self):
+        data = "工具A\n工具B".encode("utf-8")
+        lines = list(_iter_lines(io.BytesIO(data), chunk_size=4))
+        assert lines == ["工具A\n", "工具B"]
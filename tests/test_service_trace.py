@@ -0,0 +1,116 @@
+"""
+负载轨迹记录与回放单元测试
+Unit tests for trace_service and replay_service modules
+"""
+
+import asyncio
+import json
+from datetime import timedelta
+
+from src.config import ScanningConfig, TraceConfig
+from src.services.replay_service import replay_trace
+from src.services.scan_pipeline import StageResult, StageStatus
+from src.services.scan_scheduler import ScanPriority
+from src.services.scan_service import ScanTask
+from src.services.trace_service import TraceRecorder, build_trace_entry, load_trace
+
+
+def _finished_task() -> ScanTask:
+    task = ScanTask(7, "SecretToolName", ScanPriority.BATCH)
+    task.start()
+    task.started_at = task.created_at + timedelta(seconds=2)
+    result = StageResult("tos_analysis")
+    result.started_at = task.started_at + timedelta(seconds=1)
+    result.finished_at = result.started_at + timedelta(seconds=3)
+    result.status = StageStatus.SUCCEEDED
+    result.attempts = 2
+    task.stages[result.name] = result
+    task.complete({"tool_id": 7})
+    return task
+
+
+def _entry(submitted_at, priority="batch", ai_seconds=1.0):
+    stages = [
+        {"name": "tool_info", "offset": 0, "duration": 0.0, "attempts": 0, "hit": None, "status": "succeeded"},
+        {"name": "tos_analysis", "offset": 0, "duration": ai_seconds, "attempts": 1, "hit": None, "status": "succeeded"},
+        {"name": "report", "offset": ai_seconds, "duration": 0.0, "attempts": 0, "hit": None, "status": "succeeded"},
+    ]
+    return {"v": 1, "submitted_at": submitted_at, "priority": priority, "queue_wait": 0.5, "stages": stages}
+
+
+def _scanning(max_concurrent, max_attempts=3):
+    scanning = ScanningConfig(max_concurrent=max_concurrent)
+    scanning.bulkheads.enabled = False
+    scanning.adaptive_concurrency.enabled = False
+    scanning.retry.max_attempts = max_attempts
+    return scanning
+
+
+class TestTraceRecorder:
+
+    def test_entry_has_timings_but_no_payload(self):
+        entry = build_trace_entry(_finished_task())
+
+        assert "SecretToolName" not in json.dumps(entry)
+        assert "tool_id" not in entry
+        assert entry["priority"] == "batch"
+        assert entry["status"] == "completed"
+        assert entry["queue_wait"] == 2.0
+        assert entry["stages"] == [{
+            "name": "tos_analysis", "offset": 1.0, "duration": 3.0, "attempts": 2, "hit": None, "status": "succeeded",
+        }]
+
+    def test_record_appends_and_rotates(self, tmp_path):
+        path = tmp_path / "trace" / "scan-trace.ndjson"
+        recorder = TraceRecorder(TraceConfig(enabled=True, path=str(path)))
+        assert recorder.record(_finished_task())
+        assert recorder.record(_finished_task())
+        assert len(path.read_text(encoding="utf-8").splitlines()) == 2
+
+        recorder.config.max_size = 1
+        path.write_text("x" * (1024 * 1024), encoding="utf-8")
+        recorder.record(_finished_task())
+        assert (tmp_path / "trace" / "scan-trace.ndjson.1").exists()
+        assert len(path.read_text(encoding="utf-8").splitlines()) == 1
+
+    def test_disabled(self, tmp_path):
+        recorder = TraceRecorder(TraceConfig(enabled=False, path=str(tmp_path / "trace.ndjson")))
+        assert not recorder.record(_finished_task())
+        assert not (tmp_path / "trace.ndjson").exists()
+
+    def test_load_trace_sorts_and_skips_invalid(self):
+        lines = [json.dumps(_entry(20)), "not json", "", json.dumps({"v": 99, "submitted_at": 1}), json.dumps(_entry(10))]
+        assert [entry["submitted_at"] for entry in load_trace(lines)] == [10, 20]
+
+
+class TestTraceReplay:
+
+    def test_queueing_delay_with_limited_concurrency(self):
+        entries = [_entry(0) for _ in range(3)]
+        result = asyncio.run(replay_trace(entries, _scanning(max_concurrent=1), speed=100, provider_capacity=10))
+
+        assert result["completed"] == 3
+        assert result["provider"]["rate_limited"] == 0
+        # 同时提交、串行执行：第三个扫描排队约两个扫描的时间
+        assert result["queue_delay"]["max"] >= 1.5
+        assert result["recorded_queue_delay"]["p50"] == 0.5
+        assert result["throughput_per_minute"] > 0
+
+    def test_provider_capacity_causes_429(self):
+        entries = [_entry(0, ai_seconds=2.0) for _ in range(4)]
+        result = asyncio.run(replay_trace(
+            entries, _scanning(max_concurrent=4, max_attempts=1), speed=100, provider_capacity=1
+        ))
+
+        assert result["provider"]["rate_limited"] == 3
+        assert result["provider"]["exhausted"] == 3
+        assert result["degraded"] == 3
+        # tos_analysis 不是必需阶段：重试用尽时扫描以降级结果完成
+        assert result["completed"] == 4
+
+    def test_priority_breakdown(self):
+        entries = [_entry(0, "interactive"), _entry(0, "batch"), _entry(0, "unknown")]
+        result = asyncio.run(replay_trace(entries, _scanning(max_concurrent=3), speed=100))
+
+        assert set(result["queue_delay_by_priority"]) == {"interactive", "batch", "unknown"}
+        assert result["settings"]["max_concurrent"] == 3